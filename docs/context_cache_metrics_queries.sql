@@ -79,3 +79,14 @@ ORDER BY hour_bucket DESC, cnt DESC;
 --   percentile_cont(0.95) WITHIN GROUP (ORDER BY sent_tokens) AS p95_sent_tokens
 -- FROM context_cache_metrics
 -- WHERE ts >= :since_ts;
+
+-- 8) Доля рендеров блоков без to_sandwich_block() (кеш на блоке + мемо по дайджесту)
+SELECT
+  mode,
+  SUM(render_cache_hits) AS render_hits,
+  SUM(render_cache_misses) AS render_misses,
+  ROUND(1.0 * SUM(render_cache_hits) / NULLIF(SUM(render_cache_hits) + SUM(render_cache_misses), 0), 4) AS render_hit_rate
+FROM context_cache_metrics
+WHERE ts >= :since_ts
+GROUP BY mode
+ORDER BY mode;
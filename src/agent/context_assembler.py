@@ -66,7 +66,33 @@ class ContextAssembler:
         )
 
     def assemble_files(self, attached_files: set, file_map: dict) -> list:
+        return self.build_blocks(self.collect_file_specs(attached_files, file_map), file_map)
+
+    @staticmethod
+    def build_blocks(specs: list, file_map: dict | None = None) -> list:
+        """Блоки SandwichPack из параметров collect_file_specs (парсинг сущностей — в create_block)."""
         content_blocks = []
+        for spec in specs:
+            try:
+                content_block = SandwichPack.create_block(**spec)
+                content_blocks.append(content_block)
+                log.debug(
+                    "Добавлен в сэндвич file_id=%d, file_name=%s, block_class=%s, size=%d chars, content_type=%s",
+                    spec['file_id'],
+                    spec['file_name'],
+                    content_block.__class__.__name__,
+                    len(spec['content_text']),
+                    spec['content_type'],
+                )
+            except Exception as e:
+                log.excpt("Ошибка обработки file_id=%d: ", spec['file_id'], e=e)
+                if file_map is not None:
+                    file_map.pop(spec['file_id'], None)
+        return content_blocks
+
+    def collect_file_specs(self, attached_files: set, file_map: dict) -> list:
+        """Чтение и фильтрация файлов: kwargs для SandwichPack.create_block (picklable, для пула процессов)."""
+        specs = []
         self.t += 1  # чтобы не доставал редактор, типа нужно статик
         log.debug("Сборка файлов для attached_files=%s", str(attached_files))
         unique_files = {}
@@ -103,28 +129,19 @@ class ContextAssembler:
                         )
                         continue
                 try:
-                    content_text = file_data['content']
                     relevance = file_data.get('relevance', 50)
-                    block_ext = extension if sandwich_ok else '.txt'
                     if '.rulz' == extension:
                         relevance = 100
-                    content_block = SandwichPack.create_block(
-                        content_text=content_text,
-                        content_type=block_ext,
-                        file_name=base_name,
-                        timestamp=datetime.utcfromtimestamp(file_data['ts']).strftime(g.SQL_TIMESTAMP + "Z"),
-                        file_id=file_id,
-                        relevance=relevance,
-                        revision_ts=file_data['ts'],
-                    )
-                    content_blocks.append(content_block)
-                    log.debug(
-                        "Добавлен в сэндвич file_id=%d, file_name=%s, block_class=%s, size=%d chars, content_type=%s",
-                        file_id,
-                        base_name,
-                        content_block.__class__.__name__,
-                        len(content_text),
-                        block_ext,
+                    specs.append(
+                        dict(
+                            content_text=file_data['content'],
+                            content_type=extension if sandwich_ok else '.txt',
+                            file_name=base_name,
+                            timestamp=datetime.utcfromtimestamp(file_data['ts']).strftime(g.SQL_TIMESTAMP + "Z"),
+                            file_id=file_id,
+                            relevance=relevance,
+                            revision_ts=file_data['ts'],
+                        )
                     )
                     file_map[file_id] = base_name
                 except Exception as e:
@@ -132,7 +149,7 @@ class ContextAssembler:
                     continue
             else:
                 log.warn("Файл file_id=%d не найден в attached_files", file_id)
-        return content_blocks
+        return specs
 
     def assemble_posts(self, chat_id: int, exclude_source_id: int, attached_files: set, file_map: dict) -> list:
         content_blocks = []
@@ -138,20 +138,33 @@ def with_session_tag(request: Request, fmt: str) -> str:
     return f"~C34{tag}~C00 {fmt}"
 
 
-def check_session(request: Request) -> int:
-    """Проверяет сессию и возвращает user_id или вызывает HTTPException."""
-    log = get_logger('session')
+def _request_session_id(request: Request) -> str:
     session_id = request.cookies.get("session_id")
     if not session_id:
-        log.info(f"Отсутствует session_id для IP={request.client.host}")
+        get_logger('session').info(f"Отсутствует session_id для IP={request.client.host}")
         raise HTTPException(status_code=401, detail="No session")
+    return session_id
 
-    row = sessions_table.select_row(columns=['user_id'], conditions={'session_id': session_id})
+
+def _session_row_uid(request: Request, row) -> int:
     if not row:
-        log.info(f"Неверный session_id для IP={request.client.host}")
+        get_logger('session').info(f"Неверный session_id для IP={request.client.host}")
         raise HTTPException(status_code=401, detail="Invalid session")
-    uid = row[0]
-    return uid
+    return row[0]
+
+
+def check_session(request: Request) -> int:
+    """Проверяет сессию и возвращает user_id или вызывает HTTPException."""
+    session_id = _request_session_id(request)
+    row = sessions_table.select_row(columns=['user_id'], conditions={'session_id': session_id})
+    return _session_row_uid(request, row)
+
+
+async def acheck_session(request: Request) -> int:
+    """Асинхронный вариант check_session: те же проверки, запрос к sessions — в пуле AsyncDatabase."""
+    session_id = _request_session_id(request)
+    row = await sessions_table.aselect_row(columns=['user_id'], conditions={'session_id': session_id})
+    return _session_row_uid(request, row)
 
 
 def handle_exception(message: str, e: Exception, _raise: bool = True):  # TODO: надо будет куда-то переместить
@@ -0,0 +1,97 @@
+# chat_change_hub.py — уведомления об изменениях чатов для long-poll /chat/get и SSE /chat/stream.
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any
+
+
+class ChatChangeHub:
+    """Потокобезопасный хаб: chat_id → монотонная версия + очередь ожидающих future.
+
+    notify() вызывается из любого потока (PostManager.add_change работает в пуле БД),
+    пробуждение ожидающих выполняется через call_soon_threadsafe их event loop.
+    Ожидающий сначала снимает version(), затем проверяет состояние и вызывает wait(since) —
+    изменение между снятием версии и wait() не теряется. Сами изменения хранятся в журнале
+    chat_changes (PostManager); хаб только будит ожидающих внутри процесса.
+    """
+
+    __slots__ = ("_lock", "_versions", "_waiters", "_notify_count")
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+        # chat_id → set[asyncio.Future]
+        self._waiters: dict[int, set[asyncio.Future]] = {}
+        self._notify_count = 0
+
+    @staticmethod
+    def _wake(fut: asyncio.Future) -> None:
+        if not fut.done():
+            fut.set_result(True)
+
+    def _wake_all(self, futures) -> None:
+        for fut in futures:
+            try:
+                fut.get_loop().call_soon_threadsafe(self._wake, fut)
+            except RuntimeError:
+                pass  # loop уже закрыт
+
+    def version(self, chat_id: int) -> int:
+        with self._lock:
+            return self._versions.get(int(chat_id), 0)
+
+    def notify(self, chat_id: int) -> int:
+        """Регистрирует изменение чата (пост, busy/free, смена активного чата) и будит его ожидающих."""
+        cid = int(chat_id)
+        with self._lock:
+            ver = self._versions.get(cid, 0) + 1
+            self._versions[cid] = ver
+            self._notify_count += 1
+            waiters = self._waiters.pop(cid, None)
+        if waiters:
+            self._wake_all(waiters)
+        return ver
+
+    async def wait(self, chat_id: int, since_version: int, timeout: float) -> bool:
+        """Ждёт изменения чата после since_version не дольше timeout; True — если изменение было."""
+        cid = int(chat_id)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            if self._versions.get(cid, 0) != since_version:
+                return True
+            self._waiters.setdefault(cid, set()).add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout=max(0.0, float(timeout)))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                bucket = self._waiters.get(cid)
+                if bucket is not None:
+                    bucket.discard(fut)
+                    if not bucket:
+                        self._waiters.pop(cid, None)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "chats": len(self._versions),
+                "waiters": sum(len(b) for b in self._waiters.values()),
+                "notifications": self._notify_count,
+            }
+
+
+_hub: ChatChangeHub | None = None
+_hub_guard = threading.Lock()
+
+
+def get_chat_change_hub() -> ChatChangeHub:
+    global _hub
+    if _hub is None:
+        with _hub_guard:
+            if _hub is None:
+                _hub = ChatChangeHub()
+    return _hub
@@ -0,0 +1,123 @@
+# chat_change_journal.py — журнал chat_changes с курсором в порядке commit: счётчик на чат под блокировкой строки.
+from __future__ import annotations
+
+import time
+
+
+class ChatChangeJournal:
+    """Изменения чатов (add/edit/delete) с курсором chat_seq, монотонным в порядке commit внутри чата.
+
+    Общий AUTOINCREMENT seq на Postgres выдаётся до commit: транзакция с меньшим seq может
+    закоммититься после того, как читатель уже увидел больший, и курсор клиента её перепрыгнет.
+    Поэтому номер берётся из строки chat_change_seq (upsert last_seq + 1) в транзакции самого
+    изменения: блокировка строки держится до commit, следующий писатель того же чата ждёт её,
+    и видимый читателю last_seq никогда не опережает закоммиченные записи журнала.
+
+    db — managers.db.Database (execute / fetch_one / fetch_all / transaction / is_postgres).
+    """
+
+    def __init__(self, db, *, fetch_limit: int = 1000) -> None:
+        self.db = db
+        self.fetch_limit = int(fetch_limit)
+
+    def ensure_schema(self) -> None:
+        """Таблицы счётчиков и границ подрезки, индекс (chat_id, chat_seq) и перенос старых строк без chat_seq.
+
+        Старым строкам chat_seq = seq: в пределах чата общий seq возрастал, курсоры клиентов остаются валидны.
+        """
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_change_seq (chat_id INTEGER PRIMARY KEY, last_seq INTEGER NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_change_floor (chat_id INTEGER PRIMARY KEY, pruned_seq INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_chat_changes_chat_cseq ON chat_changes (chat_id, chat_seq)")
+        self.db.execute("DROP INDEX IF EXISTS idx_chat_changes_chat_seq")
+        if self.db.fetch_one("SELECT 1 FROM chat_changes WHERE chat_seq IS NULL LIMIT 1") is None:
+            return
+        with self.db.transaction():
+            self.db.execute("UPDATE chat_changes SET chat_seq = seq WHERE chat_seq IS NULL")
+            self.db.execute(
+                "INSERT INTO chat_change_seq (chat_id, last_seq)"
+                " SELECT chat_id, MAX(chat_seq) FROM chat_changes"
+                " WHERE chat_id NOT IN (SELECT chat_id FROM chat_change_seq) GROUP BY chat_id"
+            )
+            self.db.execute(
+                "UPDATE chat_change_seq SET last_seq = ("
+                " SELECT MAX(c.chat_seq) FROM chat_changes c WHERE c.chat_id = chat_change_seq.chat_id)"
+                " WHERE last_seq < (SELECT MAX(c.chat_seq) FROM chat_changes c WHERE c.chat_id = chat_change_seq.chat_id)"
+            )
+
+    def record(self, chat_id: int, post_id: int, action: str, ts: int | None = None) -> int:
+        """Записать изменение в транзакции вызывающего (или собственной); возвращает chat_seq записи."""
+        params = {'chat_id': int(chat_id)}
+        with self.db.transaction():
+            self.db.execute(
+                "INSERT INTO chat_change_seq (chat_id, last_seq) VALUES (:chat_id, 1)"
+                " ON CONFLICT (chat_id) DO UPDATE SET last_seq = chat_change_seq.last_seq + 1",
+                params,
+            )
+            row = self.db.fetch_one("SELECT last_seq FROM chat_change_seq WHERE chat_id = :chat_id", params)
+            chat_seq = int(row[0])
+            self.db.execute(
+                "INSERT INTO chat_changes (chat_id, chat_seq, post_id, action, ts)"
+                " VALUES (:chat_id, :chat_seq, :post_id, :action, :ts)",
+                {
+                    'chat_id': int(chat_id),
+                    'chat_seq': chat_seq,
+                    'post_id': int(post_id),
+                    'action': action,
+                    'ts': int(time.time()) if ts is None else int(ts),
+                },
+            )
+        return chat_seq
+
+    def last_seq(self, chat_id: int) -> int:
+        """Последний закоммиченный chat_seq чата (0 — изменений не было)."""
+        row = self.db.fetch_one(
+            "SELECT last_seq FROM chat_change_seq WHERE chat_id = :chat_id", {'chat_id': int(chat_id)}
+        )
+        return int(row[0]) if row and row[0] is not None else 0
+
+    def changes_since(self, chat_id: int, since_seq: int = 0) -> tuple[list, int]:
+        """(post_id изменений с chat_seq > since_seq, отрицательный — удаление; последний chat_seq выборки)."""
+        since = int(since_seq or 0)
+        rows = self.db.fetch_all(
+            "SELECT chat_seq, post_id, action FROM chat_changes WHERE chat_id = :chat_id AND chat_seq > :since"
+            " ORDER BY chat_seq LIMIT :lim",
+            {'chat_id': int(chat_id), 'since': since, 'lim': self.fetch_limit},
+        )
+        if not rows:
+            return [], since
+        changes = [-int(r[1]) if r[2] == "delete" else int(r[1]) for r in rows]
+        return changes, int(rows[-1][0])
+
+    def pruned_seq(self, chat_id: int) -> int:
+        """Наибольший chat_seq чата, удалённый prune (0 — журнал чата не подрезался)."""
+        row = self.db.fetch_one(
+            "SELECT pruned_seq FROM chat_change_floor WHERE chat_id = :chat_id", {'chat_id': int(chat_id)}
+        )
+        return int(row[0]) if row and row[0] is not None else 0
+
+    def cursor_expired(self, chat_id: int, since_seq: int) -> bool:
+        """Курсор since_seq старше подрезанной части журнала: часть изменений после него удалена."""
+        return int(since_seq or 0) < self.pruned_seq(chat_id)
+
+    def prune(self, older_than_ts: int) -> int:
+        """Удалить записи старше older_than_ts; счётчики чатов не сбрасываются.
+
+        Наибольший удалённый chat_seq каждого чата запоминается в chat_change_floor: курсор ниже него
+        больше не восстановить по журналу (cursor_expired), такому клиенту нужна полная история.
+        """
+        params = {'ts': int(older_than_ts)}
+        with self.db.transaction():
+            self.db.execute(
+                "INSERT INTO chat_change_floor (chat_id, pruned_seq)"
+                " SELECT chat_id, MAX(chat_seq) FROM chat_changes WHERE ts < :ts AND chat_seq IS NOT NULL"
+                " GROUP BY chat_id"
+                " ON CONFLICT (chat_id) DO UPDATE SET pruned_seq = excluded.pruned_seq"
+                " WHERE chat_change_floor.pruned_seq < excluded.pruned_seq",
+                params,
+            )
+            result = self.db.execute("DELETE FROM chat_changes WHERE ts < :ts", params)
+        return result.rowcount or 0
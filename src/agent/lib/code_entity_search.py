@@ -0,0 +1,131 @@
+# code_entity_search.py — поиск определений (entities) в кеше code_index на стороне ядра (для cq_grep_entity).
+from __future__ import annotations
+
+import re
+from typing import Any, Iterable
+
+from lib.code_index_store import CodeIndexView
+
+try:  # Python 3.11+: sre_parse переехал в re._parser
+    from re import _parser as _sre_parse
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre_parse
+
+MATCH_FIELDS = ("name", "parent", "qualified")
+_SPAN_RE = re.compile(r"^(\d+)-(\d+)$")
+
+
+def parse_entity_row(line: str) -> dict[str, Any] | None:
+    """Строка entities: vis,type,parent,name,file_id,start-end,tokens → dict (формат ответа cq_grep_entity)."""
+    if not isinstance(line, str) or not line.strip():
+        return None
+    parts = line.split(",")
+    if len(parts) < 7:
+        return None
+    try:
+        file_id = int(parts[4].strip())
+    except ValueError:
+        return None
+    m = _SPAN_RE.match(parts[5].strip())
+    if not m:
+        return None
+    try:
+        tokens = int(parts[6].strip())
+    except ValueError:
+        tokens = 0
+    return {
+        "vis": parts[0],
+        "type": parts[1],
+        "parent": parts[2],
+        "name": parts[3],
+        "file_id": file_id,
+        "start_line": int(m.group(1)),
+        "end_line": int(m.group(2)),
+        "tokens": tokens,
+    }
+
+
+def anchored_prefix(pattern: str, flags: int = 0) -> str | None:
+    """Литеральный префикс regex вида ``^abc…`` (None — якоря/литерала нет, нужен полный проход)."""
+    try:
+        items = list(_sre_parse.parse(pattern, flags))
+    except Exception:
+        return None
+    if not items or items[0] != (_sre_parse.AT, _sre_parse.AT_BEGINNING):
+        return None
+    out = []
+    for op, av in items[1:]:
+        if op is not _sre_parse.LITERAL:
+            break
+        out.append(chr(av))  # ^abc? разбирается как a, b, REPEAT(c) — необязательный хвост сюда не попадает
+    return "".join(out) or None
+
+
+def _candidate_ids(view: CodeIndexView, patterns: list[str], flags: int, match_field: str) -> Iterable[int]:
+    """Номера сущностей для проверки: по отсортированным именам, если у всех шаблонов есть ^префикс."""
+    if match_field == "name":
+        prefixes = [anchored_prefix(p, flags) for p in patterns]
+        if all(prefixes):
+            ids: set[int] = set()
+            for pref in prefixes:
+                ids.update(view.find_entity_ids(pref, prefix=True))
+            return sorted(ids)
+    return range(view.entities_count)
+
+
+def search_entities(
+    view: CodeIndexView,
+    patterns: list[str],
+    *,
+    match_field: str = "name",
+    type_allow: set[str] | None = None,
+    is_regex: bool = True,
+    case_sensitive: bool = False,
+    max_results: int = 100,
+) -> tuple[list[dict[str, Any]], bool]:
+    """(matches, truncated): строки entities, где любой шаблон находит совпадение в выбранном поле.
+
+    Сущности перебираются в порядке индекса (как раньше в MCP), совпадения дополняются file_name.
+    Для шаблонов ``^литерал`` кандидаты берутся бинарным поиском по именам, иначе — проход по колонкам.
+    Бросает re.error на некорректном шаблоне.
+    """
+    flags = 0 if case_sensitive else re.IGNORECASE
+    sources = [p if is_regex else re.escape(p) for p in patterns]
+    compiled = [re.compile(p, flags) for p in sources]
+    candidates = _candidate_ids(view, sources, flags, match_field)
+    if isinstance(candidates, range):
+        types, parents, names = view.columns()
+
+        def _fields(i: int) -> tuple[str, str, str]:
+            return types[i], parents[i], names[i]
+    else:
+        def _fields(i: int) -> tuple[str, str, str]:
+            parts = view.entity(i).split(",", 4) + ["", "", ""]
+            return parts[1], parts[2], parts[3]
+
+    matches: list[dict[str, Any]] = []
+    truncated = False
+    for i in candidates:
+        e_type, parent, name = _fields(i)
+        if type_allow is not None and e_type not in type_allow:
+            continue
+        if match_field == "parent":
+            text = parent
+        elif match_field == "qualified":
+            text = f"{parent}::{name}" if parent else name
+        else:
+            text = name
+        if not any(c.search(text) for c in compiled):
+            continue
+        row = parse_entity_row(view.entity(i))
+        if row is None:
+            continue
+        file_row = view.file_row(row["file_id"])
+        parts = file_row.split(",", 2) if file_row else []
+        row["file_name"] = parts[1] if len(parts) > 1 else None
+        matches.append(row)
+        if len(matches) >= max_results:
+            truncated = True
+            break
+    matches.sort(key=lambda r: (r.get("file_id", 0), r.get("start_line", 0), r.get("name", "")))
+    return matches, truncated
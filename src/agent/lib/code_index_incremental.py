@@ -2,10 +2,13 @@
 from __future__ import annotations
 
 import copy
+import hashlib
 import json
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Callable
 
 # Версия формата индекса на диске (совпадает с SandwichPack после bump).
 INDEX_PACKER_VERSION = "0.7"
@@ -24,13 +27,16 @@ def env_incremental_enabled() -> bool:
 def env_max_inc_revs() -> int:
     """Макс. число инкрементальных ребилдов подряд до принудительного full.
 
-    Читает ``CORE_INDEX_INCREMENTAL_MAX_REVISION`` (целое, по умолчанию 50);
-    значения < 1 приводятся к 1. При невалидной строке — 50.
+    Читает ``CORE_INDEX_INCREMENTAL_MAX_REVISION`` (целое); значения < 1 приводятся к 1.
+    По умолчанию 50, а при хэшировании всех файлов (CORE_INDEX_DIRTY_DIGEST=all) — 500: правки с
+    сохранённым mtime ловит содержимое, а не периодический full. В режиме ``changed`` хэшируются только
+    файлы со сменой ts/size, такие правки видит лишь full — предел прежний. При невалидной строке — по умолчанию.
     """
+    default = 500 if env_dirty_digest() == "all" else 50
     try:
-        return max(1, int(os.environ.get("CORE_INDEX_INCREMENTAL_MAX_REVISION", "50")))
+        return max(1, int(os.environ.get("CORE_INDEX_INCREMENTAL_MAX_REVISION", str(default))))
     except ValueError:
-        return 50
+        return default
 
 
 def env_dirty_use_size() -> bool:
@@ -38,6 +44,25 @@ def env_dirty_use_size() -> bool:
     return v in ("1", "true", "yes", "on")
 
 
+def env_dirty_digest() -> str:
+    """Сверка содержимого по digest: ``changed`` (по умолчанию — хэш только у файлов со сменой ts/size),
+    ``all`` (хэш всех файлов: ловит правки с сохранённым mtime) или ``off``."""
+    v = (os.environ.get("CORE_INDEX_DIRTY_DIGEST") or "changed").strip().lower()
+    return v if v in ("all", "off") else "changed"
+
+
+def file_digest(path: Any) -> str | None:
+    """blake2b-128 содержимого файла (hex); None — файл не прочитан."""
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
 def env_incremental_mode() -> str:
     """Режим инкрементального ребилда: ``fast`` (по умолчанию) или ``refresh``."""
     v = (os.environ.get("CORE_INDEX_INCREMENTAL_MODE") or "fast").strip().lower()
@@ -87,7 +112,7 @@ def need_fingerprint_seed(payload: dict[str, Any]) -> bool:
 
 
 def build_fingerprints(file_entries: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
-    """По строкам file_index: ts обязателен; size_bytes — если есть в записи."""
+    """По строкам file_index: ts обязателен; size_bytes и digest — если есть в записи."""
     out: dict[str, dict[str, Any]] = {}
     for e in file_entries:
         fid = int(e["id"])
@@ -97,6 +122,8 @@ def build_fingerprints(file_entries: list[dict[str, Any]]) -> dict[str, dict[str
                 rec["size_bytes"] = int(e["size_bytes"])
             except (TypeError, ValueError):
                 pass
+        if e.get("digest"):
+            rec["digest"] = str(e["digest"])
         out[str(fid)] = rec
     return out
 
@@ -111,16 +138,42 @@ def should_force_full(payload: dict[str, Any], max_rev: int) -> bool:
     return rev >= max_rev
 
 
+def _meta_changed(old: dict[str, Any], entry: dict[str, Any], ts: int, use_size: bool) -> bool:
+    """Сменились ts / (опц.) size относительно отпечатка."""
+    try:
+        old_ts = int(old.get("ts", -1))
+    except (TypeError, ValueError):
+        old_ts = -1
+    if old_ts != ts:
+        return True
+    if use_size:
+        cur_sz = entry.get("size_bytes")
+        old_sz = old.get("size_bytes")
+        if cur_sz is not None and old_sz is not None:
+            try:
+                return int(cur_sz) != int(old_sz)
+            except (TypeError, ValueError):
+                return True
+        return cur_sz is not None or old_sz is not None
+    return False
+
+
 def compute_dirty(
     cache: dict[str, Any],
     file_entries: list[dict[str, Any]],
     *,
     use_size: bool,
+    digest_of: Callable[[dict[str, Any]], str | None] | None = None,
+    digest_all: bool = False,
 ) -> tuple[set[int], set[int]]:
     """
     Возвращает (dirty_ids, removed_ids) относительно file_fingerprints в cache.
     dirty: новый файл или изменились ts / (опц.) size.
     removed: id был в отпечатках, но нет в текущем file_entries.
+
+    С ``digest_of`` решает содержимое: файл со сменой ts/size, но прежним digest — не dirty
+    (touch без правки); при ``digest_all`` хэшируются и файлы с прежним ts (правка с сохранённым mtime).
+    Записям file_entries проставляется ``digest`` (новый или прежний) — его сохранит build_fingerprints.
     """
     prev_fp = cache.get("file_fingerprints")
     if not isinstance(prev_fp, dict):
@@ -143,26 +196,26 @@ def compute_dirty(
         ts = int(e["ts"])
         old = prev_fp.get(str(fid))
         if old is None:
+            if digest_of is not None:
+                e["digest"] = digest_of(e)
             dirty.add(fid)
             continue
-        try:
-            old_ts = int(old.get("ts", -1))
-        except (TypeError, ValueError):
-            old_ts = -1
-        if old_ts != ts:
-            dirty.add(fid)
-            continue
-        if use_size:
-            cur_sz = e.get("size_bytes")
-            old_sz = old.get("size_bytes")
-            if cur_sz is not None and old_sz is not None:
-                try:
-                    if int(cur_sz) != int(old_sz):
-                        dirty.add(fid)
-                except (TypeError, ValueError):
+        if digest_of is not None:
+            changed = _meta_changed(old, e, ts, use_size)
+            if not old.get("digest"):
+                # отпечаток до включения digest: решают ts/size, digest только засевается
+                e["digest"] = digest_of(e)
+                if changed:
                     dirty.add(fid)
-            elif cur_sz is not None or old_sz is not None:
-                dirty.add(fid)
+            elif changed or digest_all:
+                e["digest"] = digest_of(e)
+                if not e["digest"] or e["digest"] != old["digest"]:
+                    dirty.add(fid)
+            else:
+                e["digest"] = old["digest"]
+            continue
+        if _meta_changed(old, e, ts, use_size):
+            dirty.add(fid)
 
     return dirty, removed
 
@@ -212,15 +265,23 @@ def merge_index(
     file_entries: list[dict[str, Any]],
     new_revision: int,
     duration_sec: float | None = None,
+    prefiltered: bool = False,
 ) -> dict[str, Any]:
     """
     partial — результат pack() только по dirty file_ids (или None, если только удаления).
     Удаляем строки с file_id ∈ dirty ∪ removed, добавляем строки из partial.
+    prefiltered — previous уже без этих строк (CodeIndexView.without_files) и принадлежит вызывающему:
+    без deepcopy и повторного разбора каждой строки.
     """
     drop = dirty_ids | removed_ids
-    merged = copy.deepcopy(previous)
-    merged["entities"] = _filter_entity_lines(previous.get("entities") or [], drop)
-    merged["files"] = _filter_file_lines(previous.get("files") or [], drop)
+    if prefiltered:
+        merged = previous
+        merged["entities"] = list(previous.get("entities") or [])
+        merged["files"] = list(previous.get("files") or [])
+    else:
+        merged = copy.deepcopy(previous)
+        merged["entities"] = _filter_entity_lines(previous.get("entities") or [], drop)
+        merged["files"] = _filter_file_lines(previous.get("files") or [], drop)
     prev_code_ids = _as_int_set(previous.get("code_base_files"))
     merged_code_ids = {fid for fid in prev_code_ids if fid not in drop}
 
@@ -248,6 +309,113 @@ def merge_index(
     return merged
 
 
+class ParsedFileCache:
+    """Результаты pack() по отдельным файлам: (digest, content_type, file_name) → строки entities/filelist без file_id.
+
+    Файл с тем же именем и содержимым не перепаковывается (откат правки, touch, повторное добавление под
+    новым file_id): строки берутся из кеша с подстановкой file_id и timestamp. Имя входит в ключ, потому что
+    парсеры выводят из пути модуль/пакет (parent сущностей), и копия под другим путём дала бы чужие строки.
+    Запись делается, только если timestamp в строке filelist совпал с переданным в create_block — иначе
+    формат строки неизвестен и подстановка небезопасна.
+    """
+
+    def __init__(self, max_files: int | None = None) -> None:
+        if max_files is None:
+            try:
+                max_files = int(os.environ.get("CORE_INDEX_PARSE_CACHE_FILES", "20000"))
+            except ValueError:
+                max_files = 20000
+        self.max_files = max(0, max_files)
+        self._data: OrderedDict[str, tuple[list[tuple[str, str]], str, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(digest: str | None, spec: dict[str, Any]) -> str | None:
+        return f"{digest}:{spec.get('content_type') or ''}:{spec.get('file_name') or ''}" if digest else None
+
+    def record(self, index_part: dict[str, Any], specs: list[dict[str, Any]], digests: dict[int, str | None]) -> None:
+        if not self.max_files or not index_part:
+            return
+        by_fid: dict[int, list[tuple[str, str]]] = {}
+        for line in index_part.get("entities") or []:
+            parts = line.split(",") if isinstance(line, str) else []
+            if len(parts) < 7:
+                continue
+            fid = _file_id_entity_line(line)
+            if fid is not None:
+                by_fid.setdefault(fid, []).append((",".join(parts[:4]), ",".join(parts[5:])))
+        rows: dict[int, list[str]] = {}
+        for line in index_part.get("files") or []:
+            fid = _file_id_file_row(line)
+            if fid is not None:
+                rows[fid] = line.rsplit(",", 3)
+        code_ids = _as_int_set(index_part.get("code_base_files"))
+        with self._lock:
+            for spec in specs:
+                fid = int(spec["file_id"])
+                key = self._key(digests.get(fid), spec)
+                row = rows.get(fid)
+                if key is None or row is None or len(row) != 4 or row[3] != str(spec.get("timestamp")):
+                    continue
+                self._data[key] = (by_fid.get(fid, []), f"{row[1]},{row[2]}", fid in code_ids)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_files:
+                self._data.popitem(last=False)
+
+    def take(
+        self, specs: list[dict[str, Any]], digests: dict[int, str | None]
+    ) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+        """(готовая часть индекса из кеша, specs для pack)."""
+        part: dict[str, Any] = {"entities": [], "files": [], "code_base_files": []}
+        rest: list[dict[str, Any]] = []
+        with self._lock:
+            for spec in specs:
+                fid = int(spec["file_id"])
+                key = self._key(digests.get(fid), spec)
+                ent = self._data.get(key) if key is not None else None
+                if ent is None:
+                    self.misses += 1
+                    rest.append(spec)
+                    continue
+                self._data.move_to_end(key)
+                self.hits += 1
+                lines, row_tail, is_code = ent
+                part["entities"].extend(f"{head},{fid},{tail}" for head, tail in lines)
+                part["files"].append(f"{fid},{spec['file_name']},{row_tail},{spec.get('timestamp')}")
+                if is_code:
+                    part["code_base_files"].append(fid)
+        return part, rest
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"files": len(self._data), "max_files": self.max_files, "hits": self.hits, "misses": self.misses}
+
+
+def combine_partials(packed: dict[str, Any] | None, reused: dict[str, Any]) -> dict[str, Any] | None:
+    """Слить результат pack() по части dirty-файлов с частью, взятой из ParsedFileCache."""
+    if not reused.get("files"):
+        return packed
+    out = dict(packed or {})
+    for key in ("entities", "files", "code_base_files"):
+        out[key] = list(out.get(key) or []) + list(reused.get(key) or [])
+    return out
+
+
+_parsed_cache: ParsedFileCache | None = None
+_parsed_guard = threading.Lock()
+
+
+def get_parsed_file_cache() -> ParsedFileCache:
+    global _parsed_cache
+    if _parsed_cache is None:
+        with _parsed_guard:
+            if _parsed_cache is None:
+                _parsed_cache = ParsedFileCache()
+    return _parsed_cache
+
+
 def attach_full_metadata(
     index_dict: dict[str, Any],
     file_entries: list[dict[str, Any]],
@@ -0,0 +1,117 @@
+# code_index_shards.py — полный ребилд code_index по шардам: create_block + pack() в пуле процессов, сводка через merge_index.
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+import globals as g
+from lib.code_index_incremental import merge_index
+from lib.worker_pool import get_worker_pool
+
+log = g.get_logger("code_index")
+
+_DEFAULT_SHARD_MIN_FILES = 64
+
+
+def env_index_workers() -> int:
+    """``CORE_INDEX_WORKERS``: число шардов полного ребилда (по умолчанию — число CPU; 1 — без пула).
+
+    Параллельность ограничена размером общего пула процессов (lib/worker_pool, CQDS_WORKER_POOL_SIZE).
+    """
+    try:
+        return max(1, int(os.environ.get("CORE_INDEX_WORKERS") or (os.cpu_count() or 1)))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def env_shard_min_files() -> int:
+    """``CORE_INDEX_SHARD_MIN_FILES``: минимум файлов на шард, мелкие проекты пакуются в одном процессе."""
+    try:
+        return max(1, int(os.environ.get("CORE_INDEX_SHARD_MIN_FILES", str(_DEFAULT_SHARD_MIN_FILES))))
+    except ValueError:
+        return _DEFAULT_SHARD_MIN_FILES
+
+
+def plan_shards(specs: list[dict[str, Any]], shards: int) -> list[list[dict[str, Any]]]:
+    """Жадная раскладка по объёму текста: крупные файлы первыми в наименее загруженный шард.
+
+    Внутри шарда исходный порядок (по file_id) сохраняется.
+    """
+    shards = max(1, min(int(shards), len(specs)))
+    if shards <= 1:
+        return [list(specs)]
+    load = [0] * shards
+    slot_of: dict[int, int] = {}
+    for pos in sorted(range(len(specs)), key=lambda i: -len(specs[i].get("content_text") or "")):
+        k = load.index(min(load))
+        slot_of[pos] = k
+        load[k] += len(specs[pos].get("content_text") or "") + 1
+    out: list[list[dict[str, Any]]] = [[] for _ in range(shards)]
+    for pos, spec in enumerate(specs):
+        out[slot_of[pos]].append(spec)
+    return [s for s in out if s]
+
+
+def pack_shard(project_name: str, specs: list[dict[str, Any]]) -> tuple[dict[str, Any] | None, int, int]:
+    """(index_dict, blocks, entities) одного шарда; выполняется в процессе пула.
+
+    Классы блоков грузятся один раз на воркер: пул долгоживущий, следующие ребилды их застают.
+    """
+    from context_assembler import ContextAssembler
+    from lib.sandwich_pack import SandwichPack
+
+    if not SandwichPack._block_classes:
+        SandwichPack.load_block_classes()
+    blocks = ContextAssembler.build_blocks(specs)
+    if not blocks:
+        return None, 0, 0
+    packer = SandwichPack(project_name, max_size=10_000_000, compression=True)
+    result = packer.pack(blocks)
+    entities_count = len(packer.entities) if packer.entities is not None else 0
+    return json.loads(result["index"]), len(blocks), entities_count
+
+
+def _merge_shards(parts: list[dict[str, Any]]) -> dict[str, Any]:
+    merged = parts[0]
+    for part in parts[1:]:
+        # шарды не пересекаются по file_id: удалять из накопленного нечего, строки части дописываются
+        merged = merge_index(merged, part, dirty_ids=set(), removed_ids=set(), file_entries=[], new_revision=0)
+    return merged
+
+
+def pack_sharded(
+    project_name: str,
+    specs: list[dict[str, Any]],
+    *,
+    workers: int | None = None,
+) -> tuple[dict[str, Any] | None, int, int]:
+    """Полный pack по specs (ContextAssembler.collect_file_specs): (index_dict, blocks, entities).
+
+    Файлы независимы (один блок на файл), поэтому разбор и извлечение сущностей идут по шардам
+    параллельно; метаданные полной сборки (отпечатки, revision) вызывающий навешивает после.
+    """
+    workers = env_index_workers() if workers is None else max(1, int(workers))
+    shards = min(workers, len(specs) // env_shard_min_files())
+    if shards <= 1:
+        return pack_shard(project_name, specs)
+
+    plan = plan_shards(specs, shards)
+    pool = get_worker_pool()
+    try:
+        # общий пул с smart_grep: шарды встают в очередь к тем же воркерам, процессы не создаются на ребилд
+        results = list(pool.executor().map(pack_shard, [project_name] * len(plan), plan))
+    except BrokenProcessPool as e:
+        pool.reset()
+        log.excpt("code_index: пул процессов упал на шардах (%d), сборка в одном процессе", len(plan), e=e)
+        return pack_shard(project_name, specs)
+    except Exception as e:
+        log.excpt("code_index: ошибка пула шардов (%d), сборка в одном процессе", len(plan), e=e)
+        return pack_shard(project_name, specs)
+
+    parts = [r[0] for r in results if r[0]]
+    if not parts:
+        return None, 0, 0
+    log.debug("code_index: %s собран из %d шардов, файлов %d", project_name, len(parts), len(specs))
+    return _merge_shards(parts), sum(r[1] for r in results), sum(r[2] for r in results)
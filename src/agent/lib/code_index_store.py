@@ -0,0 +1,274 @@
+# code_index_store.py — бинарный кеш проектного code_index (sandwiches_index) с mmap и ленивыми запросами.
+#
+# Раскладка файла (little-endian):
+#   заголовок  <4sIIIQQQQQQ: magic, версия, n_entities, n_files, смещения секций meta/offsets/fids/order/file_ids/file_order
+#   meta       JSON всех полей индекса, кроме entities/files (шаблоны, отпечатки, revision ...)
+#   offsets    uint64[n_entities + n_files + 1] — границы строк в пуле
+#   fids       int32[n_entities] — file_id сущности (колонка 5 CSV)
+#   order      int32[n_entities] — номера сущностей, отсортированные по casefold(name)
+#   file_ids   int32[n_files] — file_id строк filelist
+#   file_order int32[n_files] — номера строк filelist по возрастанию file_id
+#   pool       UTF-8 строки entities, затем files (без разделителей)
+from __future__ import annotations
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterator
+
+_MAGIC = b"CQIX"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIIQQQQQQ")
+_MAX_OPEN_VIEWS = 16
+
+
+def _entity_field(line: str, pos: int) -> str:
+    parts = line.split(",", pos + 1)
+    return parts[pos] if len(parts) > pos else ""
+
+
+def _as_int(value: str) -> int:
+    try:
+        return int(value.strip())
+    except (TypeError, ValueError):
+        return -1
+
+
+def _int32_array(values: list[int]) -> array:
+    arr = array("i", values)
+    if arr.itemsize != 4:  # pragma: no cover — на всех поддерживаемых платформах int 32-битный
+        raise RuntimeError("array('i') is not 32-bit")
+    return arr
+
+
+def write_index_store(path: str | Path, index_dict: dict[str, Any]) -> str:
+    """Атомарно записать индекс в бинарный формат; возвращает путь."""
+    path = Path(path)
+    entities = [str(x) for x in (index_dict.get("entities") or []) if isinstance(x, str)]
+    files = [str(x) for x in (index_dict.get("files") or []) if isinstance(x, str)]
+    meta = {k: v for k, v in index_dict.items() if k not in ("entities", "files")}
+    meta_raw = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    offsets = array("Q", [0])
+    chunks: list[bytes] = []
+    pos = 0
+    for line in entities + files:
+        raw = line.encode("utf-8")
+        chunks.append(raw)
+        pos += len(raw)
+        offsets.append(pos)
+
+    fids = _int32_array([_as_int(_entity_field(e, 4)) for e in entities])
+    names = [_entity_field(e, 3).casefold() for e in entities]
+    order = _int32_array(sorted(range(len(entities)), key=names.__getitem__))
+    file_ids = _int32_array([_as_int(f.split(",", 1)[0]) for f in files])
+    file_order = _int32_array(sorted(range(len(files)), key=file_ids.__getitem__))
+
+    sections = [meta_raw, offsets.tobytes(), fids.tobytes(), order.tobytes(), file_ids.tobytes(), file_order.tobytes()]
+    starts = []
+    cur = _HEADER.size
+    for sec in sections:
+        cur = (cur + 7) & ~7
+        starts.append(cur)
+        cur += len(sec)
+    pool_start = (cur + 7) & ~7
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(_MAGIC, _VERSION, len(entities), len(files), *starts))
+        for start, sec in zip(starts, sections):
+            fh.write(b"\0" * (start - fh.tell()))
+            fh.write(sec)
+        fh.write(b"\0" * (pool_start - fh.tell()))
+        for raw in chunks:
+            fh.write(raw)
+    os.replace(tmp, path)
+    return str(path)
+
+
+class CodeIndexView:
+    """Индекс поверх mmap: строки декодируются только по запросу, целиком JSON — через to_dict()."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        with open(self.path, "rb") as fh:
+            st = os.fstat(fh.fileno())
+            self.stat_key = (st.st_mtime_ns, st.st_size)
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_ent, n_files, *starts = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise ValueError(f"not a code index store: {self.path}")
+        self.entities_count = n_ent
+        self.files_count = n_files
+        buf = memoryview(self._mm)
+        meta_off, off_off, fids_off, order_off, fid_off, forder_off = starts
+        n_lines = n_ent + n_files
+        self._meta_raw = bytes(buf[meta_off:off_off]).rstrip(b"\0")
+        self._offsets = buf[off_off:off_off + 8 * (n_lines + 1)].cast("Q")
+        self._fids = buf[fids_off:fids_off + 4 * n_ent].cast("i")
+        self._order = buf[order_off:order_off + 4 * n_ent].cast("i")
+        self._file_ids = buf[fid_off:fid_off + 4 * n_files].cast("i")
+        self._file_order = buf[forder_off:forder_off + 4 * n_files].cast("i")
+        self._pool = (forder_off + 4 * n_files + 7) & ~7
+        self._meta: dict[str, Any] | None = None
+        self._columns: tuple[list[str], list[str], list[str]] | None = None
+
+    @property
+    def meta(self) -> dict[str, Any]:
+        if self._meta is None:
+            self._meta = json.loads(self._meta_raw.decode("utf-8"))
+        return self._meta
+
+    def _line(self, n: int) -> str:
+        a = self._pool + self._offsets[n]
+        b = self._pool + self._offsets[n + 1]
+        return self._mm[a:b].decode("utf-8")
+
+    def entity(self, i: int) -> str:
+        return self._line(i)
+
+    def file_line(self, i: int) -> str:
+        return self._line(self.entities_count + i)
+
+    def iter_entities(self) -> Iterator[str]:
+        for i in range(self.entities_count):
+            yield self._line(i)
+
+    def find_entity_ids(self, name: str, *, prefix: bool = False, limit: int = 0) -> list[int]:
+        """Номера сущностей по имени (casefold, точное или префиксное совпадение) — бинарный поиск по order."""
+        key = name.casefold()
+        order = self._order
+
+        def _name(k: int) -> str:
+            return _entity_field(self._line(order[k]), 3).casefold()
+
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        out: list[int] = []
+        for k in range(lo, len(order)):
+            n = _name(k)
+            if not (n.startswith(key) if prefix else n == key):
+                break
+            out.append(order[k])
+            if limit and len(out) >= limit:
+                break
+        return out
+
+    def find_entities(self, name: str, *, prefix: bool = False, limit: int = 0) -> list[str]:
+        return [self._line(i) for i in self.find_entity_ids(name, prefix=prefix, limit=limit)]
+
+    def columns(self) -> tuple[list[str], list[str], list[str]]:
+        """(types, parents, names) всех сущностей — декодируются один раз на view, для полного regex-прохода."""
+        cols = self._columns
+        if cols is None:
+            types: list[str] = []
+            parents: list[str] = []
+            names: list[str] = []
+            for line in self.iter_entities():
+                parts = line.split(",", 4)
+                parts += [""] * (4 - len(parts))
+                types.append(parts[1])
+                parents.append(parts[2])
+                names.append(parts[3])
+            cols = self._columns = (types, parents, names)
+        return cols
+
+    def entities_for_file(self, file_id: int) -> list[str]:
+        fid = int(file_id)
+        return [self._line(i) for i, v in enumerate(self._fids) if v == fid]
+
+    def file_row(self, file_id: int) -> str | None:
+        fid = int(file_id)
+        keys = _FileIdKeys(self._file_ids, self._file_order)
+        k = bisect.bisect_left(keys, fid)
+        if k < len(keys) and keys[k] == fid:
+            return self.file_line(self._file_order[k])
+        return None
+
+    def to_dict(self) -> dict[str, Any]:
+        out = json.loads(self._meta_raw.decode("utf-8"))
+        out["entities"] = list(self.iter_entities())
+        out["files"] = [self.file_line(i) for i in range(self.files_count)]
+        return out
+
+    def without_files(self, drop_ids: set[int]) -> dict[str, Any]:
+        """Индекс без строк файлов drop_ids (и строк без file_id) — база инкрементального merge.
+
+        Отбор по колонкам fids/file_ids, декодируются только оставшиеся строки; результат — новый dict.
+        """
+        drop = {int(x) for x in drop_ids}
+        out = json.loads(self._meta_raw.decode("utf-8"))
+        out["entities"] = [self._line(i) for i, fid in enumerate(self._fids) if fid >= 0 and fid not in drop]
+        out["files"] = [self.file_line(i) for i, fid in enumerate(self._file_ids) if fid >= 0 and fid not in drop]
+        return out
+
+    def iter_json(self, extra: dict[str, Any] | None = None, *, chunk_lines: int = 4096) -> Iterator[bytes]:
+        """JSON индекса (как to_dict() с полями extra) кусками для StreamingResponse, без dict всех строк."""
+        meta = json.loads(self._meta_raw.decode("utf-8"))
+        meta.update(extra or {})
+        head = json.dumps(meta, ensure_ascii=False)[:-1]
+        yield (head + ("," if meta else "") + '"entities":[').encode("utf-8")
+        for start, count, tail in ((0, self.entities_count, '],"files":['), (self.entities_count, self.files_count, "]}")):
+            for lo in range(0, count, chunk_lines):
+                lines = (self._line(start + i) for i in range(lo, min(count, lo + chunk_lines)))
+                yield (("," if lo else "") + ",".join(json.dumps(x, ensure_ascii=False) for x in lines)).encode("utf-8")
+            yield tail.encode("utf-8")
+
+
+class _FileIdKeys:
+    """Отсортированная проекция file_ids через file_order — для bisect без копии массива."""
+
+    def __init__(self, ids: memoryview, order: memoryview) -> None:
+        self._ids = ids
+        self._order = order
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, k: int) -> int:
+        return self._ids[self._order[k]]
+
+
+_views: OrderedDict[str, CodeIndexView] = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def open_index_view(path: str | Path) -> CodeIndexView | None:
+    """Открытый view кеша (переиспользуется, пока mtime/size файла не изменились); None — файла нет."""
+    key = str(path)
+    try:
+        st = os.stat(key)
+    except OSError:
+        with _views_lock:
+            _views.pop(key, None)
+        return None
+    with _views_lock:
+        view = _views.get(key)
+        if view is not None and view.stat_key == (st.st_mtime_ns, st.st_size):
+            _views.move_to_end(key)
+            return view
+    view = CodeIndexView(key)
+    with _views_lock:
+        _views[key] = view
+        _views.move_to_end(key)
+        while len(_views) > _MAX_OPEN_VIEWS:
+            _views.popitem(last=False)
+    return view
+
+
+def index_store_stats() -> dict[str, Any]:
+    with _views_lock:
+        return {"open_views": len(_views), "mapped_bytes": sum(v.stat_key[1] for v in _views.values())}
@@ -0,0 +1,315 @@
+# context_reference_backend.py — хранение слоёв ContextReferenceStore: ограниченный LRU с TTL в памяти
+# и необязательный общий бэкенд (SQLite-файл) — снимки и префиксы переживают рестарт и видны всем воркерам API.
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+_DEFAULT_SNAPSHOT_MAX_MB = 32
+_DEFAULT_PREFIX_MAX_MB = 256
+_DEFAULT_TTL_SEC = 86400
+_DEFAULT_DB_PATH = "/app/data/context_reference.db"
+# Очистка бэкенда от просроченных и лишних строк — не чаще раза в столько секунд.
+_PRUNE_INTERVAL_SEC = 60.0
+
+
+def _env_int(name: str, default: int, lo: int, hi: int) -> int:
+    try:
+        return max(lo, min(hi, int(os.environ.get(name) or default)))
+    except ValueError:
+        return default
+
+
+def reference_limits() -> dict[str, int]:
+    """``CQDS_CONTEXT_REFERENCE_MAX_MB`` (слой A), ``CQDS_CONTEXT_PREFIX_MAX_MB`` (слой B),
+    ``CQDS_CONTEXT_REFERENCE_TTL_SEC`` (0 — без TTL)."""
+    return {
+        "snapshot_max_bytes": _env_int("CQDS_CONTEXT_REFERENCE_MAX_MB", _DEFAULT_SNAPSHOT_MAX_MB, 0, 65536) * 1024 * 1024,
+        "prefix_max_bytes": _env_int("CQDS_CONTEXT_PREFIX_MAX_MB", _DEFAULT_PREFIX_MAX_MB, 0, 65536) * 1024 * 1024,
+        "ttl_sec": _env_int("CQDS_CONTEXT_REFERENCE_TTL_SEC", _DEFAULT_TTL_SEC, 0, 365 * 86400),
+    }
+
+
+def approx_bytes(obj: Any) -> int:
+    """Оценка занимаемой памяти для JSON-подобных структур (строки, числа, dict/list)."""
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_bytes(k) + approx_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(approx_bytes(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def scope_match(cache_key: str, chat_id: int, actor_id: int | None) -> bool:
+    """Ключ ``actor_id:chat_id:session_id`` относится к чату (и актёру, если задан)."""
+    parts = str(cache_key).split(":", 2)
+    if len(parts) < 3:
+        return False
+    try:
+        ka = int(parts[0])
+        kc = int(parts[1])
+    except (TypeError, ValueError):
+        return False
+    return kc == int(chat_id) and (actor_id is None or ka == int(actor_id))
+
+
+class BoundedLayer:
+    """Ключ → (значение, вес, версия, время доступа); LRU по суммарному весу и TTL с последнего доступа.
+
+    Версия — метка записи в общем бэкенде: по ней вызывающий проверяет, не обновил ли запись другой воркер.
+    """
+
+    def __init__(self, name: str, *, max_bytes: int, ttl_sec: int) -> None:
+        self.name = name
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_sec = max(0, int(ttl_sec))
+        self._data: OrderedDict[str, list] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def _pop_unlocked(self, key: str) -> list | None:
+        ent = self._data.pop(key, None)
+        if ent is not None:
+            self._bytes -= ent[1]
+        return ent
+
+    def _expire_unlocked(self, now: float) -> None:
+        if not self.ttl_sec:
+            return
+        while self._data:
+            key, ent = next(iter(self._data.items()))
+            if now - ent[3] <= self.ttl_sec:
+                break
+            self._pop_unlocked(key)
+            self.expired += 1
+
+    def get(self, key: str) -> tuple[Any, int] | None:
+        """(значение, версия) или None; доступ продлевает TTL."""
+        now = time.time()
+        with self._lock:
+            self._expire_unlocked(now)
+            ent = self._data.get(key)
+            if ent is None:
+                self.misses += 1
+                return None
+            ent[3] = now
+            self._data.move_to_end(key)
+            self.hits += 1
+            return ent[0], ent[2]
+
+    def put(self, key: str, value: Any, *, version: int = 0, weight: int | None = None) -> bool:
+        """False — запись тяжелее всего лимита слоя и не хранится (прежняя запись ключа удаляется)."""
+        weight = approx_bytes(value) if weight is None else int(weight)
+        now = time.time()
+        with self._lock:
+            self._pop_unlocked(key)
+            if weight > self.max_bytes:
+                self.evictions += 1
+                return False
+            self._data[key] = [value, weight, int(version), now]
+            self._bytes += weight
+            self._expire_unlocked(now)
+            while self._bytes > self.max_bytes and self._data:
+                _, ent = self._data.popitem(last=False)
+                self._bytes -= ent[1]
+                self.evictions += 1
+            return True
+
+    def pop(self, key: str) -> bool:
+        with self._lock:
+            return self._pop_unlocked(key) is not None
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._expire_unlocked(time.time())
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
+
+
+class SqliteReferenceBackend:
+    """Общий для процессов файл SQLite (WAL): строка на (слой, ключ) с JSON и версией (time_ns записи).
+
+    Просроченные по TTL строки и превышение max_bytes на слой чистятся при записи (не чаще _PRUNE_INTERVAL_SEC).
+    Ключи dict после JSON становятся строками — читатели снимков уже принимают оба вида (map_get).
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path: str, *, ttl_sec: int = 0, max_bytes: dict[str, int] | None = None) -> None:
+        self.path = path
+        self.ttl_sec = max(0, int(ttl_sec))
+        self.max_bytes = dict(max_bytes or {})
+        self._tls = threading.local()
+        self._prune_lock = threading.Lock()
+        self._last_prune = 0.0
+        self.reads = 0
+        self.writes = 0
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS context_reference ("
+            " layer TEXT NOT NULL, cache_key TEXT NOT NULL, payload TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL, version INTEGER NOT NULL, touched_at REAL NOT NULL,"
+            " PRIMARY KEY (layer, cache_key))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_context_reference_touched ON context_reference (layer, touched_at)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._tls.conn = conn
+        return conn
+
+    def version(self, layer: str, key: str) -> int | None:
+        row = self._conn().execute(
+            "SELECT version, touched_at FROM context_reference WHERE layer = ? AND cache_key = ?", (layer, key)
+        ).fetchone()
+        if row is None:
+            return None
+        if self.ttl_sec and time.time() - float(row[1]) > self.ttl_sec:
+            return None
+        return int(row[0])
+
+    def load(self, layer: str, key: str) -> tuple[Any, int, int] | None:
+        """(значение, версия, размер JSON) или None; чтение продлевает TTL строки."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT payload, version, bytes, touched_at FROM context_reference WHERE layer = ? AND cache_key = ?",
+            (layer, key),
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if self.ttl_sec and now - float(row[3]) > self.ttl_sec:
+            return None
+        conn.execute(
+            "UPDATE context_reference SET touched_at = ? WHERE layer = ? AND cache_key = ?", (now, layer, key)
+        )
+        self.reads += 1
+        return json.loads(row[0]), int(row[1]), int(row[2])
+
+    def store(self, layer: str, key: str, value: Any) -> int:
+        """Записать значение; возвращает его новую версию."""
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+        version = time.time_ns()
+        self._conn().execute(
+            "INSERT INTO context_reference (layer, cache_key, payload, bytes, version, touched_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(layer, cache_key) DO UPDATE SET payload = excluded.payload, bytes = excluded.bytes,"
+            " version = excluded.version, touched_at = excluded.touched_at",
+            (layer, key, payload, len(payload), version, time.time()),
+        )
+        self.writes += 1
+        self._maybe_prune()
+        return version
+
+    def delete(self, layer: str | None, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        if not keys:
+            return 0
+        conn = self._conn()
+        removed = 0
+        for key in keys:
+            if layer is None:
+                cur = conn.execute("DELETE FROM context_reference WHERE cache_key = ?", (key,))
+            else:
+                cur = conn.execute("DELETE FROM context_reference WHERE layer = ? AND cache_key = ?", (layer, key))
+            removed += cur.rowcount or 0
+        return removed
+
+    def keys(self) -> list[str]:
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT cache_key FROM context_reference")]
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM context_reference")
+
+    def _maybe_prune(self) -> None:
+        now = time.time()
+        with self._prune_lock:
+            if now - self._last_prune < _PRUNE_INTERVAL_SEC:
+                return
+            self._last_prune = now
+        conn = self._conn()
+        if self.ttl_sec:
+            conn.execute("DELETE FROM context_reference WHERE touched_at < ?", (now - self.ttl_sec,))
+        for layer, limit in self.max_bytes.items():
+            total = conn.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM context_reference WHERE layer = ?", (layer,)
+            ).fetchone()[0]
+            if total <= limit:
+                continue
+            drop: list[str] = []
+            for key, size in conn.execute(
+                "SELECT cache_key, bytes FROM context_reference WHERE layer = ? ORDER BY touched_at", (layer,)
+            ).fetchall():
+                if total <= limit:
+                    break
+                drop.append(key)
+                total -= int(size)
+            self.delete(layer, drop)
+
+    def stats(self) -> dict[str, Any]:
+        rows = self._conn().execute(
+            "SELECT layer, COUNT(*), COALESCE(SUM(bytes), 0) FROM context_reference GROUP BY layer"
+        ).fetchall()
+        return {
+            "kind": self.kind,
+            "path": self.path,
+            "layers": {r[0]: {"entries": int(r[1]), "bytes": int(r[2])} for r in rows},
+            "reads": self.reads,
+            "writes": self.writes,
+        }
+
+
+def make_reference_backend(limits: dict[str, int] | None = None) -> SqliteReferenceBackend | None:
+    """``CQDS_CONTEXT_REFERENCE_BACKEND=sqlite`` — общий файл ``CQDS_CONTEXT_REFERENCE_DB``; иначе только память."""
+    kind = (os.environ.get("CQDS_CONTEXT_REFERENCE_BACKEND") or "memory").strip().lower()
+    if kind in ("", "memory", "none", "off"):
+        return None
+    if kind != "sqlite":
+        raise ValueError(f"unknown CQDS_CONTEXT_REFERENCE_BACKEND={kind!r}")
+    limits = limits or reference_limits()
+    path = os.environ.get("CQDS_CONTEXT_REFERENCE_DB") or _DEFAULT_DB_PATH
+    return SqliteReferenceBackend(
+        path,
+        ttl_sec=limits["ttl_sec"],
+        max_bytes={"snapshot": limits["snapshot_max_bytes"], "prefix": limits["prefix_max_bytes"]},
+    )
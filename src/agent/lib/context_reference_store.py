@@ -3,6 +3,7 @@
 
 Отключение расширенного референса (post_digest, file_rev_ts, context_patch): переменная окружения
 `CQDS_CONTEXT_REFERENCE_STORE=0` — остаётся «узкий» снимок как в schema_ver≈4 без дайджестов постов.
+Лимиты памяти, TTL и общий бэкенд — lib/context_reference_backend.py (`CQDS_CONTEXT_REFERENCE_BACKEND`).
 """
 from __future__ import annotations
 
@@ -10,14 +11,26 @@ import hashlib
 import os
 from typing import Any
 import time
+import weakref
 
 import globals as g
 from lib.content_block import ContextPatchBlock
-from lib.sandwich_pack import estimate_tokens
+from lib.context_reference_backend import (
+    BoundedLayer,
+    make_reference_backend,
+    reference_limits,
+    scope_match,
+)
+from lib.sandwich_render import render_tokens
 
 log = g.get_logger("context_reference_store")
 
 CONTEXT_REFERENCE_ENV = "CQDS_CONTEXT_REFERENCE_STORE"
+# Маркер «бэкенд по env» для ContextReferenceStore(backend=...); None — явно только память.
+_ENV_BACKEND = object()
+_BACKEND_FAILED = object()
+# Живые экземпляры — для сводки в /core/status.
+_stores: "weakref.WeakSet[ContextReferenceStore]" = weakref.WeakSet()
 
 _SLIM_FP_KEYS = frozenset(
     {
@@ -211,7 +224,7 @@ def append_incremental_patches(
     )
     t = total_tokens
     for pb in patches:
-        tk = estimate_tokens(pb.to_sandwich_block())
+        tk = render_tokens(pb)
         if t + tk >= tokens_limit:
             log.warn("Пропуск context_patch: лимит токенов context (%d)", tokens_limit)
             break
@@ -221,21 +234,44 @@ def append_incremental_patches(
 
 
 class ContextReferenceStore:
-    """Хранилище in-memory состояния контекста для одного процесса ядра.
+    """Хранилище состояния контекста для процесса ядра (и, с общим бэкендом, для всех его воркеров).
 
     Держит два независимых слоя:
     - Layer A (`_snapshots`): fingerprint/референс для решения FULL vs DELTA_SAFE.
     - Layer B (`_materialized_prefixes`): материализованный префикс, который можно
       переиспользовать в DELTA_SAFE-цепочке сборки.
 
-    Ключ доступа: строка `actor_id:chat_id:session_id`.
+    Ключ доступа: строка `actor_id:chat_id:session_id`. Оба слоя в памяти ограничены по объёму
+    (LRU) и TTL с последнего доступа (`reference_limits`); вытесненный снимок означает лишь FULL
+    на следующем ходе. С бэкендом (`CQDS_CONTEXT_REFERENCE_BACKEND=sqlite`) память — кеш перед
+    общим файлом: запись сквозная, чтение сверяет версию строки, сбой бэкенда — работа только в памяти.
     """
 
-    def __init__(self, enabled: bool | None = None):
+    def __init__(
+        self,
+        enabled: bool | None = None,
+        *,
+        limits: dict[str, int] | None = None,
+        backend: Any = _ENV_BACKEND,
+    ):
         self._enabled = context_reference_store_enabled(enabled)
-        self._snapshots: dict[str, dict[str, Any]] = {}
+        limits = limits or reference_limits()
+        self._snapshots = BoundedLayer(
+            "snapshot", max_bytes=limits["snapshot_max_bytes"], ttl_sec=limits["ttl_sec"]
+        )
         # Материализованный префикс (слой B): короткоживущий и подлежит eviction при FULL.
-        self._materialized_prefixes: dict[str, dict[str, Any]] = {}
+        self._materialized_prefixes = BoundedLayer(
+            "prefix", max_bytes=limits["prefix_max_bytes"], ttl_sec=limits["ttl_sec"]
+        )
+        if backend is _ENV_BACKEND:
+            try:
+                backend = make_reference_backend(limits)
+            except Exception as e:
+                log.excpt("Бэкенд ContextReferenceStore недоступен, только память", e=e)
+                backend = None
+        self._backend = backend
+        self.backend_errors = 0
+        _stores.add(self)
         if not self._enabled:
             log.debug(
                 "%s=0 — узкий fingerprint (без post_digest/file_rev_ts и без context_patch)",
@@ -246,6 +282,42 @@ class ContextReferenceStore:
     def enabled(self) -> bool:
         return self._enabled
 
+    def _backend_call(self, what: str, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            self.backend_errors += 1
+            log.warn("ContextReferenceStore backend %s: %s", what, str(e))
+            return _BACKEND_FAILED
+
+    def _layer_get(self, layer: BoundedLayer, cache_key: str) -> dict[str, Any] | None:
+        hit = layer.get(cache_key)
+        if self._backend is None:
+            return hit[0] if hit is not None else None
+        ver = self._backend_call("version", self._backend.version, layer.name, cache_key)
+        if ver is _BACKEND_FAILED:
+            return hit[0] if hit is not None else None
+        if ver is None:
+            if hit is not None:
+                layer.pop(cache_key)  # строку удалил, вытеснил или состарил другой воркер
+            return None
+        if hit is not None and hit[1] == ver:
+            return hit[0]
+        loaded = self._backend_call("load", self._backend.load, layer.name, cache_key)
+        if loaded is _BACKEND_FAILED or loaded is None:
+            return hit[0] if hit is not None and loaded is _BACKEND_FAILED else None
+        value, ver, _size = loaded
+        layer.put(cache_key, value, version=ver)
+        return value
+
+    def _layer_put(self, layer: BoundedLayer, cache_key: str, value: dict[str, Any]) -> None:
+        ver = 0
+        if self._backend is not None:
+            ver = self._backend_call("store", self._backend.store, layer.name, cache_key, value)
+            if ver is _BACKEND_FAILED:
+                ver = 0
+        layer.put(cache_key, value, version=ver)
+
     def get(self, cache_key: str) -> dict[str, Any] | None:
         """Вернуть snapshot Layer A.
 
@@ -255,7 +327,7 @@ class ContextReferenceStore:
         Returns:
             Снимок fingerprint или ``None``.
         """
-        return self._snapshots.get(cache_key)
+        return self._layer_get(self._snapshots, cache_key)
 
     def put(self, cache_key: str, fingerprint: dict[str, Any]) -> None:
         """Сохранить snapshot Layer A.
@@ -269,16 +341,17 @@ class ContextReferenceStore:
             полей (`_SLIM_FP_KEYS`) без `post_digest`/`file_rev_ts`.
         """
         if self._enabled:
-            self._snapshots[cache_key] = dict(fingerprint)
+            snap = dict(fingerprint)
         else:
-            self._snapshots[cache_key] = {
-                k: fingerprint[k] for k in _SLIM_FP_KEYS if k in fingerprint
-            }
+            snap = {k: fingerprint[k] for k in _SLIM_FP_KEYS if k in fingerprint}
+        self._layer_put(self._snapshots, cache_key, snap)
 
     def clear(self) -> None:
-        """Очистить оба слоя in-memory кэша для всех ключей."""
+        """Очистить оба слоя кэша (и общий бэкенд) для всех ключей."""
         self._snapshots.clear()
         self._materialized_prefixes.clear()
+        if self._backend is not None:
+            self._backend_call("clear", self._backend.clear)
 
     # --- Layer B: materialized prefix cache ---
     def get_mp(self, cache_key: str) -> dict[str, Any] | None:
@@ -290,7 +363,7 @@ class ContextReferenceStore:
         Returns:
             Словарь payload префикса или ``None``.
         """
-        return self._materialized_prefixes.get(cache_key)
+        return self._layer_get(self._materialized_prefixes, cache_key)
 
     def put_mp(self, cache_key: str, payload: dict[str, Any]) -> None:
         """Сохранить payload материализованного префикса (Layer B).
@@ -300,7 +373,7 @@ class ContextReferenceStore:
             payload: Данные префикса для потенциального переиспользования.
         """
         # Храним копию, чтобы снаружи не было неявной мутации.
-        self._materialized_prefixes[cache_key] = dict(payload or {})
+        self._layer_put(self._materialized_prefixes, cache_key, dict(payload or {}))
 
     def evict_mp(self, cache_key: str) -> None:
         """Идемпотентно удалить payload Layer B для одного ключа.
@@ -308,7 +381,9 @@ class ContextReferenceStore:
         Args:
             cache_key: Композитный ключ `actor_id:chat_id:session_id`.
         """
-        self._materialized_prefixes.pop(cache_key, None)
+        self._materialized_prefixes.pop(cache_key)
+        if self._backend is not None:
+            self._backend_call("delete", self._backend.delete, self._materialized_prefixes.name, [cache_key])
 
     def evict_scope(self, *, chat_id: int, actor_id: int | None = None) -> int:
         """Удалить Layer A/B по области actor/chat (все session_id).
@@ -320,25 +395,35 @@ class ContextReferenceStore:
         Returns:
             Количество удалённых ключей.
         """
-        cid = int(chat_id)
-        aid = None if actor_id is None else int(actor_id)
         keys = set(self._snapshots.keys()) | set(self._materialized_prefixes.keys())
-        victims: list[str] = []
-        for k in keys:
-            parts = str(k).split(":", 2)
-            if len(parts) < 3:
-                continue
-            try:
-                ka = int(parts[0])
-                kc = int(parts[1])
-            except (TypeError, ValueError):
-                continue
-            if kc != cid:
-                continue
-            if aid is not None and ka != aid:
-                continue
-            victims.append(k)
+        if self._backend is not None:
+            stored = self._backend_call("keys", self._backend.keys)
+            if stored is not _BACKEND_FAILED:
+                keys |= set(stored)
+        victims = [k for k in keys if scope_match(k, chat_id, actor_id)]
         for k in victims:
-            self._snapshots.pop(k, None)
-            self._materialized_prefixes.pop(k, None)
+            self._snapshots.pop(k)
+            self._materialized_prefixes.pop(k)
+        if victims and self._backend is not None:
+            self._backend_call("delete", self._backend.delete, None, victims)
         return len(victims)
+
+    def stats(self) -> dict[str, Any]:
+        out: dict[str, Any] = {
+            "snapshots": self._snapshots.stats(),
+            "materialized_prefixes": self._materialized_prefixes.stats(),
+            "backend": None,
+        }
+        if self._backend is not None:
+            bstats = self._backend_call("stats", self._backend.stats)
+            out["backend"] = None if bstats is _BACKEND_FAILED else bstats
+            out["backend_errors"] = self.backend_errors
+        return out
+
+
+def context_reference_stats() -> dict[str, Any]:
+    """Память и бэкенд всех живых ContextReferenceStore процесса (для /core/status)."""
+    stores = [s.stats() for s in list(_stores)]
+    if len(stores) == 1:
+        return stores[0]
+    return {"stores": stores}
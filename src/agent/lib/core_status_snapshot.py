@@ -9,6 +9,14 @@ from typing import Any
 
 import globals as g
 from lib import maint_pool as mp
+from lib.file_content_cache import get_file_content_cache
+from lib.smart_grep_trigram_index import trigram_index_stats
+from lib.code_index_store import index_store_stats
+from lib.file_type_detector import get_file_type_cache
+from lib.code_index_incremental import get_parsed_file_cache
+from lib.llm_http_pool import llm_client_pool_stats
+from lib.sandwich_render import get_block_render_memo
+from lib.context_reference_store import context_reference_stats
 from managers.db import Database
 
 log = g.get_logger("core_status")
@@ -198,4 +206,14 @@ def build_core_status_payload(maint_child: dict[str, Any]) -> dict[str, Any]:
             "maint_pool_running_by_kind": by_kind_running,
         },
         "scheduled_nightly_restart": _nightly_restart_row(db),
+        "caches": {
+            "file_content": get_file_content_cache().stats(),
+            "smart_grep_trigram": trigram_index_stats(),
+            "code_index_store": index_store_stats(),
+            "code_index_parsed_files": get_parsed_file_cache().stats(),
+            "file_type": get_file_type_cache().stats(),
+            "llm_http_clients": llm_client_pool_stats(),
+            "sandwich_render": get_block_render_memo().stats(),
+            "context_reference": context_reference_stats(),
+        },
     }
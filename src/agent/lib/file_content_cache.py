@@ -0,0 +1,108 @@
+# file_content_cache.py — LRU кэш декодированного содержимого файлов для FileManager.get_file
+from __future__ import annotations
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from managers.runtime_config import get_int
+
+_DEFAULT_MAX_MB = 256
+_DEFAULT_MAX_ENTRY_KB = 4096
+
+
+class FileContentCache:
+    """Ключ: file_id → (path, mtime_ns, size, content, encoding, eol).
+
+    Запись валидна, только пока совпадают путь и stat (mtime_ns, size) файла на диске —
+    вызывающий делает stat и передаёт его в get/put. content=None — файл не текстовый
+    (кэшируется, чтобы не перечитывать бинарники). Лимит — суммарный объём строк в памяти.
+    """
+
+    def __init__(self, *, max_bytes: int | None = None, max_entry_bytes: int | None = None) -> None:
+        self._max_bytes = max_bytes if max_bytes is not None else get_int(
+            "CORE_FILE_CACHE_MAX_MB", _DEFAULT_MAX_MB, 0, 65536
+        ) * 1024 * 1024
+        self._max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else get_int(
+            "CORE_FILE_CACHE_MAX_ENTRY_KB", _DEFAULT_MAX_ENTRY_KB, 16, 1024 * 1024
+        ) * 1024
+        self._data: OrderedDict[int, tuple] = OrderedDict()
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _weight(content: str | None) -> int:
+        return sys.getsizeof(content) if content is not None else 64
+
+    def _drop_unlocked(self, file_id: int) -> None:
+        ent = self._data.pop(file_id, None)
+        if ent is not None:
+            self._bytes -= ent[6]
+
+    def get(self, file_id: int, path: str, mtime_ns: int, size: int) -> tuple[str | None, str | None, str | None] | None:
+        """(content, encoding, eol) при совпадении stat, иначе None (промах)."""
+        with self._lock:
+            ent = self._data.get(file_id)
+            if ent is not None and ent[0] == path and ent[1] == mtime_ns and ent[2] == size:
+                self._data.move_to_end(file_id)
+                self._hits += 1
+                return ent[3], ent[4], ent[5]
+            if ent is not None:
+                self._drop_unlocked(file_id)
+            self._misses += 1
+            return None
+
+    def put(self, file_id: int, path: str, mtime_ns: int, size: int,
+            content: str | None, encoding: str | None, eol: str | None) -> None:
+        weight = self._weight(content)
+        with self._lock:
+            self._drop_unlocked(file_id)
+            if weight > self._max_entry_bytes or weight > self._max_bytes:
+                return
+            self._data[file_id] = (path, mtime_ns, size, content, encoding, eol, weight)
+            self._bytes += weight
+            while self._bytes > self._max_bytes and self._data:
+                _, ent = self._data.popitem(last=False)
+                self._bytes -= ent[6]
+                self._evictions += 1
+
+    def invalidate(self, file_id: int) -> None:
+        with self._lock:
+            self._drop_unlocked(file_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "max_entry_bytes": self._max_entry_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / total, 4) if total else None,
+            }
+
+
+_global_content_cache: FileContentCache | None = None
+_global_guard = threading.Lock()
+
+
+def get_file_content_cache() -> FileContentCache:
+    # ленивое создание: runtime_config читает таблицу настроек, БД к моменту первого get_file уже поднята
+    global _global_content_cache
+    if _global_content_cache is None:
+        with _global_guard:
+            if _global_content_cache is None:
+                _global_content_cache = FileContentCache()
+    return _global_content_cache
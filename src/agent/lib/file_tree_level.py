@@ -0,0 +1,138 @@
+# file_tree_level.py — SQL среза дерева файлов по attached_files (FileManager.list_tree_level, file_index path_prefix).
+from __future__ import annotations
+
+from lib.file_link_prefix import REF
+
+
+def like_escape(value: str) -> str:
+    """% _ \\ для шаблона LIKE с ESCAPE '\\' (PostgreSQL, SQLite)."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def prefix_sql(path_prefix: str) -> tuple[str, dict]:
+    """Фрагмент WHERE: ссылка ®path или @path под префиксом; плюс legacy без маркера."""
+    pn = str(path_prefix).replace("\\", "/").strip("/")
+    if not pn:
+        return "", {}
+    esc = like_escape(pn)
+    return (
+        "("
+        "(file_name LIKE :_tree_pfx_like_ref ESCAPE '\\' OR file_name = :_tree_pfx_eq_ref OR "
+        "file_name LIKE :_tree_pfx_like_at ESCAPE '\\' OR file_name = :_tree_pfx_eq_at) OR "
+        "("
+        "file_name NOT LIKE :_pfxscan_ref AND file_name NOT LIKE :_pfxscan_at "
+        "AND (file_name LIKE :_tree_pfx_like_plain ESCAPE '\\' OR file_name = :_tree_pfx_eq_plain)"
+        ")"
+        ")",
+        {
+            "_tree_pfx_like_ref": f"{REF}{esc}/%",
+            "_tree_pfx_eq_ref": f"{REF}{pn}",
+            "_tree_pfx_like_at": f"@{esc}/%",
+            "_tree_pfx_eq_at": f"@{pn}",
+            "_pfxscan_ref": f"{REF}%",
+            "_pfxscan_at": "@%",
+            "_tree_pfx_like_plain": f"{esc}/%",
+            "_tree_pfx_eq_plain": pn,
+        },
+    )
+
+
+def level_query(
+    project_id: int | None,
+    path: str,
+    *,
+    cursor: str | None,
+    limit: int,
+    ttl_max: int,
+    postgres: bool,
+) -> tuple[str, dict, str]:
+    """(запрос, параметры, нормализованный path) одного уровня дерева под path.
+
+    Строки отбираются по project_id + path_seg_count > глубины path + префиксу (prefix_sql), имя потомка
+    вырезается в SQL и группируется. GROUP BY читает все строки под path (не только уровень base + 1):
+    число файлов в подкаталоге считается по ним же; индекс (project_id, path_seg_count, file_name)
+    делает это чтением только индекса. Запрос возвращает до limit + 1 строк — признак следующей страницы.
+    """
+    pn = str(path or "").replace("\\", "/").strip("/")
+    base = len([p for p in pn.split("/") if p])
+    params: dict = {
+        "_lvl_base": base,
+        "_lvl_next": base + 1,
+        "_lvl_ttl": int(ttl_max),
+        "_lvl_limit": int(limit) + 1,
+    }
+    clauses = [
+        "path_seg_count > :_lvl_base",
+        "COALESCE(missing_ttl, :_lvl_ttl) > 0",
+    ]
+    if project_id is None:
+        clauses.append("project_id IS NULL")
+    else:
+        clauses.append("project_id = :project_id")
+        params["project_id"] = int(project_id)
+    if pn:
+        frag, extra = prefix_sql(pn)
+        clauses.append(frag)
+        params.update(extra)
+    # Позиция имени потомка: после маркера ссылки (один символ) и "path/".
+    skip = len(pn) + 1 if pn else 0
+    params["_lvl_off_plain"] = skip + 1
+    params["_lvl_off_mark"] = skip + 2
+    params["_lvl_mark_ref"] = f"{REF}%"
+    params["_lvl_mark_at"] = "@%"
+    rest = (
+        "CASE WHEN file_name LIKE :_lvl_mark_ref OR file_name LIKE :_lvl_mark_at "
+        "THEN substr(file_name, :_lvl_off_mark) ELSE substr(file_name, :_lvl_off_plain) END"
+    )
+    if postgres:
+        child = f"split_part({rest}, '/', 1)"
+    else:
+        child = f"substr({rest}, 1, instr({rest} || '/', '/') - 1)"
+    outer = ""
+    if cursor:
+        kind, _, name = str(cursor).partition(":")
+        params["_cur_dir"] = 1 if kind == "d" else 0
+        params["_cur_name"] = name
+        outer = "WHERE is_dir < :_cur_dir OR (is_dir = :_cur_dir AND child > :_cur_name) "
+    query = (
+        "SELECT is_dir, child, COUNT(*), MIN(id), MAX(ts) FROM ("
+        f"SELECT CASE WHEN path_seg_count > :_lvl_next THEN 1 ELSE 0 END AS is_dir, {child} AS child, id, ts "
+        f"FROM attached_files WHERE {' AND '.join(clauses)}"
+        f") lvl {outer}"
+        "GROUP BY is_dir, child ORDER BY is_dir DESC, child "
+        "LIMIT :_lvl_limit"
+    )
+    return query, params, pn
+
+
+def level_entries(rows: list, path: str, limit: int) -> dict:
+    """Строки level_query → {'path', 'entries', 'next_cursor'}: каталоги (с числом файлов), затем файлы."""
+    more = len(rows) > limit
+    rows = rows[:limit]
+    prefix = f"{path}/" if path else ""
+    entries = []
+    for is_dir, name, count, min_id, max_ts in rows:
+        name = str(name or "")
+        if not name:
+            continue
+        if int(is_dir):
+            entries.append({
+                "type": "directory",
+                "name": name,
+                "path": f"{prefix}{name}/",
+                "files": int(count or 0),
+                "ts": int(max_ts or 0),
+            })
+        else:
+            entries.append({
+                "type": "file",
+                "name": name,
+                "path": f"{prefix}{name}",
+                "id": int(min_id),
+                "ts": int(max_ts or 0),
+            })
+    next_cursor = None
+    if more and rows:
+        last_dir, last_name = rows[-1][0], str(rows[-1][1] or "")
+        next_cursor = f"{'d' if int(last_dir) else 'f'}:{last_name}"
+    return {"path": path, "entries": entries, "next_cursor": next_cursor}
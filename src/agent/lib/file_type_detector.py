@@ -6,7 +6,10 @@ from __future__ import annotations
 import os
 import re
 import shutil
+import stat
 import subprocess
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 # Non-code text groups (single source of truth).
@@ -344,21 +347,103 @@ def mime_file(path: Path, timeout_sec: float = 2.0) -> str | None:
     """MIME через `file -b --mime-type` (Unix). Нет `file` в PATH — None."""
     if not path.is_file():
         return None
-    if not shutil.which("file"):
-        return None
-    try:
-        r = subprocess.run(
-            ["file", "-b", "--mime-type", str(path)],
-            capture_output=True,
-            text=True,
-            timeout=timeout_sec,
-            check=False,
-        )
-        if r.returncode != 0 or not r.stdout:
-            return None
-        return r.stdout.strip()
-    except (OSError, subprocess.TimeoutExpired):
+    found = mime_files([path], timeout_sec=timeout_sec)
+    return found.get(str(path))
+
+
+_MIME_BATCH = 200
+
+
+def mime_files(paths: list[Path], timeout_sec: float = 2.0) -> dict[str, str]:
+    """MIME пачкой: один `file -b --mime-type --` на _MIME_BATCH путей (строка вывода на путь, по порядку)."""
+    if not paths or not shutil.which("file"):
+        return {}
+    out: dict[str, str] = {}
+    names = [str(p) for p in paths]
+    for i in range(0, len(names), _MIME_BATCH):
+        part = names[i:i + _MIME_BATCH]
+        try:
+            r = subprocess.run(
+                ["file", "-b", "--mime-type", "--", *part],
+                capture_output=True,
+                text=True,
+                timeout=timeout_sec + 0.05 * len(part),
+                check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        lines = r.stdout.splitlines() if r.stdout else []
+        if r.returncode != 0 or len(lines) != len(part):
+            continue
+        for name, line in zip(part, lines):
+            if line.strip():
+                out[name] = line.strip()
+    return out
+
+
+# Сигнатуры начала файла → MIME (встроенный сниффер вместо libmagic/`file` для частых двоичных форматов).
+_MAGIC_PREFIXES: tuple[tuple[bytes, str], ...] = (
+    (b"\x7fELF", "application/x-executable"),
+    (b"MZ", "application/x-dosexec"),
+    (b"\xcf\xfa\xed\xfe", "application/x-mach-binary"),
+    (b"\xce\xfa\xed\xfe", "application/x-mach-binary"),
+    (b"\xca\xfe\xba\xbe", "application/x-java-applet"),
+    (b"\x00asm", "application/wasm"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"\x00\x00\x01\x00", "image/vnd.microsoft.icon"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"PK\x05\x06", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"BZh", "application/x-bzip2"),
+    (b"\xfd7zXZ\x00", "application/x-xz"),
+    (b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (b"Rar!\x1a\x07", "application/x-rar-compressed"),
+    (b"\x28\xb5\x2f\xfd", "application/zstd"),
+    (b"SQLite format 3\x00", "application/vnd.sqlite3"),
+    (b"OggS", "audio/ogg"),
+    (b"fLaC", "audio/flac"),
+    (b"ID3", "audio/mpeg"),
+    (b"\x1aE\xdf\xa3", "video/webm"),
+    (b"wOFF", "font/woff"),
+    (b"wOF2", "font/woff2"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/vnd.ms-office"),
+)
+
+_PRINTABLE_MAGIC: dict[bytes, bool] = {m: all(32 <= c < 127 for c in m) for m, _mime in _MAGIC_PREFIXES}
+
+_TEXT_BOMS: tuple[bytes, ...] = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+
+
+def sniff_mime(sample: bytes) -> str | None:
+    """MIME по первым байтам без внешних утилит; None — сэмпл не распознан (есть NUL, сигнатуры нет)."""
+    if not sample:
+        return "inode/x-empty"
+    texty: bool | None = None
+    for magic, mime in _MAGIC_PREFIXES:
+        if sample.startswith(magic):
+            if _PRINTABLE_MAGIC.get(magic, False):
+                # «BM», «MZ», «%PDF-»… бывают началом обычного текста — сигнатура решает только для двоичного сэмпла
+                if texty is None:
+                    texty = bytes_txt(sample)
+                if texty:
+                    continue
+            return mime
+    if sample[:4] == b"RIFF":
+        return "audio/x-wav" if sample[8:12] == b"WAVE" else "image/webp" if sample[8:12] == b"WEBP" else "video/x-msvideo"
+    if sample[4:8] == b"ftyp":
+        return "video/mp4"
+    if any(sample.startswith(bom) for bom in _TEXT_BOMS):
+        return "text/plain"  # UTF-8/16 с BOM — `file` тоже считает их текстом
+    if b"\x00" in sample[:32768]:
         return None
+    return "text/plain" if bytes_txt(sample) else "application/octet-stream"
 
 
 def bytes_txt(sample: bytes, min_ratio: float = 0.88) -> bool:
@@ -391,39 +476,207 @@ def bhead(path: Path, max_bytes: int = 32768) -> bytes | None:
         return None
 
 
-def is_acceptable_file(path: Path) -> bool:
+def _mime_verdict(mime: str | None, sample: bytes) -> bool:
+    """Текст ли файл по MIME; octet-stream и неизвестные MIME — по bytes_txt сэмпла."""
+    if mime:
+        m = mime.strip().lower()
+        if _mime_txt(m):
+            return True
+        if _mime_bin(m) and m != "application/octet-stream":
+            return False
+    return bytes_txt(sample)
+
+
+def _external_mime_enabled() -> bool:
+    """FILE_TYPE_EXTERNAL_MIME=0 — не звать `file` даже для нераспознанных сэмплов (тогда они двоичные)."""
+    return os.environ.get("FILE_TYPE_EXTERNAL_MIME", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class FileTypeCache:
+    """Вердикт «текст/двоичный» по содержимому: путь → (size, mtime_ns, verdict), LRU.
+
+    Нужен только файлам без расширения из BL/WL SP; инвалидируется сменой размера или mtime.
+    Сигнатура ``size:mtime_ns:t|b`` сохраняется в attached_files.file_type_sig и подгружается при скане.
     """
-    Укладывается ли файл в scan/index проекта (attached_files при scan_project_files).
-    BL (blacklist) ext → нет; SP WL → да; иначе MIME (`file`) либо bytes_txt по сэмплу.
+
+    def __init__(self, max_entries: int | None = None) -> None:
+        if max_entries is None:
+            try:
+                max_entries = int(os.environ.get("FILE_TYPE_CACHE_ENTRIES", "200000"))
+            except ValueError:
+                max_entries = 200000
+        self.max_entries = max(0, max_entries)
+        self._data: OrderedDict[str, tuple[int, int, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sniffed = 0
+        self.external = 0
+
+    def get(self, path: str, st: os.stat_result) -> bool | None:
+        with self._lock:
+            rec = self._data.get(path)
+            if rec is not None and rec[0] == st.st_size and rec[1] == st.st_mtime_ns:
+                self._data.move_to_end(path)
+                self.hits += 1
+                return rec[2]
+            self.misses += 1
+            return None
+
+    def put(self, path: str, st: os.stat_result, verdict: bool) -> None:
+        self._store(path, (int(st.st_size), int(st.st_mtime_ns), bool(verdict)))
+
+    def _store(self, path: str, rec: tuple[int, int, bool]) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._data[path] = rec
+            self._data.move_to_end(path)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def signature(self, path: str) -> str | None:
+        with self._lock:
+            rec = self._data.get(path)
+        if rec is None:
+            return None
+        return f"{rec[0]}:{rec[1]}:{'t' if rec[2] else 'b'}"
+
+    def seed(self, items) -> int:
+        """Подгрузить сигнатуры из БД: [(абсолютный путь, 'size:mtime_ns:t|b'), ...]."""
+        n = 0
+        for path, sig in items:
+            parts = str(sig or "").split(":")
+            if len(parts) != 3 or parts[2] not in ("t", "b"):
+                continue
+            try:
+                rec = (int(parts[0]), int(parts[1]), parts[2] == "t")
+            except ValueError:
+                continue
+            with self._lock:
+                if path in self._data:
+                    continue
+            self._store(str(path), rec)
+            n += 1
+        return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "sniffed": self.sniffed,
+                "external_mime": self.external,
+            }
+
+
+_type_cache: FileTypeCache | None = None
+_type_cache_guard = threading.Lock()
+
+
+def get_file_type_cache() -> FileTypeCache:
+    global _type_cache
+    if _type_cache is None:
+        with _type_cache_guard:
+            if _type_cache is None:
+                _type_cache = FileTypeCache()
+    return _type_cache
+
+
+def _stat_file(path: Path) -> os.stat_result | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+
+def classify_text_files(items: list[tuple[Path, os.stat_result | None]]) -> dict[str, bool]:
+    """Текст ли файлы по содержимому (пачкой): кеш → встроенный сниффер → один `file` на нераспознанные.
+
+    items — (путь, stat или None); нет файла — вердикт False. Ключ результата — str(путь).
     """
-    if not path.is_file():
-        return False
+    cache = get_file_type_cache()
+    out: dict[str, bool] = {}
+    unknown: list[tuple[Path, os.stat_result, bytes]] = []
+    for path, st in items:
+        key = str(path)
+        if st is None:
+            st = _stat_file(path)
+        if st is None:
+            out[key] = False
+            continue
+        cached = cache.get(key, st)
+        if cached is not None:
+            out[key] = cached
+            continue
+        sample = bhead(path)
+        if sample is None:
+            out[key] = False
+            continue
+        cache.sniffed += 1
+        mime = sniff_mime(sample)
+        if mime is None and _external_mime_enabled():
+            unknown.append((path, st, sample))
+            continue
+        out[key] = _mime_verdict(mime, sample)
+        cache.put(key, st, out[key])
+    if unknown:
+        found = mime_files([p for p, _st, _s in unknown])
+        cache.external += len(unknown)
+        for path, st, sample in unknown:
+            key = str(path)
+            out[key] = _mime_verdict(found.get(key), sample)
+            cache.put(key, st, out[key])
+    return out
+
+
+def _needs_content_check(path: Path) -> bool | None:
+    """Решение по пути/расширению: False — отказ, True — принять, None — нужен анализ содержимого."""
     if path_subpath_excluded(path):
         return False
     ext = _norm_ext(path)
     if ext and ext in bl_exts():
         return False
-    name = path.name
     wl = sp_ext_wl()
     if ext and ext.lower() in wl:
         return True
     from lib.sandwich_pack import SandwichPack
 
-    if SandwichPack.supported_type(ext) or SandwichPack.supported_type(name):
+    if SandwichPack.supported_type(ext) or SandwichPack.supported_type(path.name):
         return True
-    mime = mime_file(path)
-    if mime:
-        if _mime_bin(mime) and not _mime_txt(mime):
-            if mime.strip().lower() == "application/octet-stream":
-                sample = bhead(path)
-                return bool(sample is not None and bytes_txt(sample))
-            return False
-        if _mime_txt(mime):
-            return True
-    sample = bhead(path)
-    if sample is None:
+    return None
+
+
+def accept_files(items: list[tuple[Path, os.stat_result | None]]) -> list[bool]:
+    """Пакетный is_acceptable_file для результатов обхода (stat уже есть) — один `file` на всю пачку."""
+    verdicts: list[bool | None] = []
+    pending: list[tuple[Path, os.stat_result | None]] = []
+    for path, st in items:
+        v = _needs_content_check(path)
+        verdicts.append(v)
+        if v is None:
+            pending.append((path, st))
+    by_content = classify_text_files(pending) if pending else {}
+    return [v if v is not None else by_content.get(str(path), False) for v, (path, _st) in zip(verdicts, items)]
+
+
+def is_acceptable_file(path: Path) -> bool:
+    """
+    Укладывается ли файл в scan/index проекта (attached_files при scan_project_files).
+    BL (blacklist) ext → нет; SP WL → да; иначе вердикт по содержимому (кеш, сниффер, `file` для нераспознанных).
+    """
+    st = _stat_file(path)
+    if st is None:
         return False
-    return bytes_txt(sample)
+    v = _needs_content_check(path)
+    if v is not None:
+        return v
+    return classify_text_files([(path, st)]).get(str(path), False)
 
 
 def ctx_allows_text(
@@ -434,27 +687,18 @@ def ctx_allows_text(
 ) -> bool:
     """
     LLM ctx (контекст): расширение вне SP — можно ли вшить текст.
-    BL ext → нет; иначе MIME по диску или bytes_txt по уже декодированной строке.
+    BL ext → нет; иначе вердикт по содержимому на диске (как в скане) или bytes_txt по уже декодированной строке.
     """
     ext = extension.lower() if extension else ""
     if not ext.startswith("."):
         ext = "." + ext if ext else ""
     if ext in bl_exts():
         return False
-    if path is not None and path.is_file():
+    st = _stat_file(path) if path is not None else None
+    if path is not None and st is not None:
         if path_subpath_excluded(path):
             return False
-        mime = mime_file(path)
-        if mime:
-            if _mime_txt(mime):
-                return True
-            if _mime_bin(mime) and mime.strip().lower() != "application/octet-stream":
-                return False
-            if mime.strip().lower() == "application/octet-stream":
-                sample = bhead(path)
-                return bool(sample is not None and bytes_txt(sample))
-        sample = bhead(path)
-        return bool(sample is not None and bytes_txt(sample))
+        return classify_text_files([(path, st)]).get(str(path), False)
     if utf8_content is not None:
         data = utf8_content.encode("utf-8", errors="replace")
         return bytes_txt(data[:32768])
@@ -0,0 +1,207 @@
+# inotify_watcher.py — рекурсивный inotify в процессе (ctypes, без inotifywait) для живого индекса файлов maint.
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+from typing import Callable, NamedTuple
+
+from lib.file_type_detector import subpath_exclude_patterns
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# Как у прежнего `inotifywait -e create,delete,move,close_write`; IN_MODIFY не нужен — ждём закрытия записи.
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+PRESENT_MASK = IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE
+GONE_MASK = IN_DELETE | IN_MOVED_FROM
+
+_EVENT_HDR = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 256 * 1024
+
+
+class InotifyEvent(NamedTuple):
+    mask: int
+    path: str  # абсолютный путь (каталог наблюдения + имя)
+    is_dir: bool
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class InotifyWatcher:
+    """Наблюдение за деревом каталогов: watch на каждый каталог, новые подкаталоги подхватываются сами.
+
+    dir_excluded(abs_path) — каталоги, которые не наблюдаются (вместе с поддеревом); маркеры SUBPATH_EXCLUDE
+    (/.git/ …) отсекаются всегда. overflowed — ядро потеряло события (IN_Q_OVERFLOW), incomplete — не хватило
+    лимита fs.inotify.max_user_watches: в обоих случаях вызывающему нужен полный reconcile.
+    Бросает OSError, если inotify недоступен (не Linux, нет libc, лимит экземпляров).
+    """
+
+    def __init__(self, *, dir_excluded: Callable[[str], bool] | None = None, log=None) -> None:
+        try:
+            self._libc = _load_libc()
+        except (OSError, AttributeError) as e:
+            raise OSError(errno.ENOSYS, f"inotify unavailable: {e}") from e
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        self.fd = fd
+        self.dir_excluded = dir_excluded
+        self.log = log
+        self.markers = subpath_exclude_patterns()
+        self._wds: dict[int, str] = {}
+        self._paths: dict[str, int] = {}
+        self.overflowed = False
+        self.incomplete = False
+        self.events_total = 0
+
+    @property
+    def watch_count(self) -> int:
+        return len(self._wds)
+
+    def _pruned(self, path: str) -> bool:
+        probe = path.lower() + "/"
+        if any(m in probe for m in self.markers):
+            return True
+        return bool(self.dir_excluded and self.dir_excluded(path))
+
+    def _add(self, path: str) -> bool:
+        if path in self._paths:
+            return True
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+        )
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                if not self.incomplete and self.log is not None:
+                    self.log.warn("inotify: исчерпан fs.inotify.max_user_watches на %d каталогах, %s", len(self._wds), path)
+                self.incomplete = True
+            elif err not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES) and self.log is not None:
+                self.log.warn("inotify_add_watch %s: %s", path, os.strerror(err))
+            return False
+        old = self._wds.get(wd)
+        if old is not None and old != path:
+            self._paths.pop(old, None)  # тот же inode после переименования каталога
+        self._wds[wd] = path
+        self._paths[path] = wd
+        return True
+
+    def add_tree(self, root: str) -> int:
+        """Поставить watch на root и все его подкаталоги (кроме отсечённых); возвращает число новых watch."""
+        root = os.path.abspath(root)
+        if self._pruned(root):
+            return 0
+        before = len(self._wds)
+        stack = [root]
+        while stack:
+            cur = stack.pop()
+            if not self._add(cur):
+                if self.incomplete:
+                    break
+                continue
+            try:
+                with os.scandir(cur) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False) and not self._pruned(entry.path):
+                                stack.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return len(self._wds) - before
+
+    def _drop_prefix(self, path: str) -> None:
+        pfx = path.rstrip("/") + "/"
+        for p in [p for p in self._paths if p == path or p.startswith(pfx)]:
+            wd = self._paths.pop(p)
+            self._wds.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> list[InotifyEvent]:
+        """События, накопившиеся за timeout секунд (пустой список — тишина). Подкаталоги отслеживаются сами."""
+        try:
+            ready, _w, _x = select.select([self.fd], [], [], max(0.0, timeout))
+        except InterruptedError:
+            return []
+        if not ready:
+            return []
+        chunks: list[bytes] = []
+        while True:
+            try:
+                buf = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            chunks.append(buf)
+            if len(buf) < _READ_SIZE:
+                break
+        return self._parse(b"".join(chunks))
+
+    def _parse(self, data: bytes) -> list[InotifyEvent]:
+        out: list[InotifyEvent] = []
+        pos, n = 0, len(data)
+        while pos + _EVENT_HDR.size <= n:
+            wd, mask, _cookie, length = _EVENT_HDR.unpack_from(data, pos)
+            pos += _EVENT_HDR.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            base = self._wds.get(wd)
+            if mask & IN_IGNORED:
+                if base is not None:
+                    self._wds.pop(wd, None)
+                    if self._paths.get(base) == wd:
+                        self._paths.pop(base, None)
+                continue
+            if base is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue  # сам каталог: событие уже пришло родителю как DELETE/MOVED_FROM с IN_ISDIR
+            path = os.path.join(base, os.fsdecode(name)) if name else base
+            is_dir = bool(mask & IN_ISDIR)
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            elif is_dir and mask & GONE_MASK:
+                self._drop_prefix(path)
+            out.append(InotifyEvent(mask, path, is_dir))
+        self.events_total += len(out)
+        return out
+
+    def reset_flags(self) -> None:
+        self.overflowed = False
+        self.incomplete = False
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+            self._wds.clear()
+            self._paths.clear()
@@ -0,0 +1,90 @@
+# live_missing_links.py — ссылки активного проекта без файла на диске: шаги TTL (деградация/purge) для живого индекса maint.
+from __future__ import annotations
+
+import datetime as dt
+from pathlib import Path
+from typing import Any
+
+
+def degrade_or_purge_missing(
+    fm: Any,
+    db_links: dict[str, tuple[int, int]],
+    db_only: list[str],
+    *,
+    project_id: int,
+    purge: bool,
+    log: Any,
+) -> tuple[int, int]:
+    """Пакетный шаг TTL для ссылок без файла: UPDATE по группам TTL и DELETE исчерпанных. Возвращает (degraded, purged)."""
+    ttl_max = fm.missing_ttl_max
+    by_ttl: dict[int, list[int]] = {}
+    purge_ids: list[int] = []
+    for rel in db_only:
+        fid, ttl_prev = db_links[rel]
+        ttl_next = max(0, min(int(ttl_prev), ttl_max) - 1)
+        if purge and ttl_next == 0:
+            purge_ids.append(int(fid))
+            log.info(
+                "CORE_MAINT purged TTL-exhausted link project_id=%d file_id=%d rel=%s",
+                int(project_id),
+                int(fid),
+                rel,
+            )
+            continue
+        by_ttl.setdefault(ttl_next, []).append(int(fid))
+    now_ts = int(dt.datetime.now(dt.timezone.utc).timestamp())
+    degraded = fm.bulk_set_missing_ttl(by_ttl, now_ts) if by_ttl else 0
+    purged = fm.bulk_purge_links(int(project_id), purge_ids) if purge_ids else 0
+    return degraded, purged
+
+
+class MissingLinks:
+    """Ссылки проекта, чьих файлов нет на диске и чей TTL ещё не исчерпан.
+
+    Набор заполняется при seed/reseed проекта (все ссылки attached_files без файла в снимке диска —
+    в том числе пропавшие до старта живого индекса), пополняется путями с событием удаления и сокращается
+    вернувшимися файлами и ссылками с исчерпанным TTL. Без этого ссылка, чей файл пропал до seed,
+    после базового run_tick больше не деградировала бы: полный тик при здоровом heartbeat не запускается.
+    """
+
+    def __init__(self, fm: Any, project_id: int, root: Path, *, log: Any) -> None:
+        self.fm = fm
+        self.project_id = int(project_id)
+        self.root = root
+        self.log = log
+        self.rels: set[str] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self.rels)
+
+    def __len__(self) -> int:
+        return len(self.rels)
+
+    def __contains__(self, rel: str) -> bool:
+        return rel in self.rels
+
+    def seed(self, db_links: dict[str, tuple[int, int]], files: set[str]) -> None:
+        """Все ссылки проекта без файла в снимке диска (TTL ещё не 0, либо purge снимет их первым шагом)."""
+        self.rels = {rel for rel in db_links if rel not in files}
+
+    def discard(self, rel: str) -> None:
+        self.rels.discard(rel)
+
+    def degrade(self, rels: list[str], *, purge: bool) -> tuple[int, int]:
+        """Шаг TTL для rels; не исчерпавшие TTL остаются в наборе до следующей проверки."""
+        db_links = self.fm.links_missing_ttl(self.project_id, rels)
+        degraded, purged = degrade_or_purge_missing(
+            self.fm, db_links, sorted(db_links), project_id=self.project_id, purge=purge, log=self.log
+        )
+        ttl_max = self.fm.missing_ttl_max
+        self.rels.difference_update(rels)
+        self.rels.update(rel for rel, (_fid, ttl) in db_links.items() if max(0, min(ttl, ttl_max) - 1) > 0)
+        return degraded, purged
+
+    def recheck(self, *, purge: bool) -> set[str]:
+        """Вернувшиеся на диск файлы убираются из набора и возвращаются; остальные делают шаг TTL."""
+        back = {rel for rel in self.rels if (self.root / rel).is_file()}
+        self.rels.difference_update(back)
+        if self.rels:
+            self.degrade(sorted(self.rels), purge=purge)
+        return back
@@ -0,0 +1,132 @@
+# llm_http_pool.py — общие на процесс HTTP-клиенты LLM-провайдеров: keep-alive и ограниченный пул соединений.
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+
+import aiohttp
+
+_DEFAULT_POOL_MAX = 32
+_DEFAULT_KEEPALIVE_MAX = 16
+_DEFAULT_KEEPALIVE_SEC = 60.0
+
+_lock = threading.Lock()
+# (id(loop), base_url, sha(api_key), total, connect) -> (loop, AsyncOpenAI)
+_openai_clients: dict[tuple, tuple[asyncio.AbstractEventLoop, object]] = {}
+# id(loop) -> (loop, ClientSession)
+_sessions: dict[int, tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession]] = {}
+_counters = {"created": 0, "reused": 0}
+
+
+def _env_int(name: str, default: int, lo: int, hi: int) -> int:
+    try:
+        return max(lo, min(hi, int(os.environ.get(name) or default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float, lo: float, hi: float) -> float:
+    try:
+        return max(lo, min(hi, float(os.environ.get(name) or default)))
+    except ValueError:
+        return default
+
+
+def pool_limits() -> tuple[int, int, float]:
+    """``LLM_HTTP_POOL_MAX`` (соединений на клиента), ``LLM_HTTP_KEEPALIVE_MAX``, ``LLM_HTTP_KEEPALIVE_SEC``."""
+    pool_max = _env_int("LLM_HTTP_POOL_MAX", _DEFAULT_POOL_MAX, 1, 1000)
+    keep_max = _env_int("LLM_HTTP_KEEPALIVE_MAX", _DEFAULT_KEEPALIVE_MAX, 0, pool_max)
+    keep_sec = _env_float("LLM_HTTP_KEEPALIVE_SEC", _DEFAULT_KEEPALIVE_SEC, 1.0, 3600.0)
+    return pool_max, keep_max, keep_sec
+
+
+def _prune_closed_loops() -> None:
+    for key in [k for k, (loop, _c) in _openai_clients.items() if loop.is_closed()]:
+        _openai_clients.pop(key, None)
+    for key in [k for k, (loop, _s) in _sessions.items() if loop.is_closed()]:
+        _sessions.pop(key, None)
+
+
+def get_openai_client(base_url: str, api_key: str | None, *, timeout: float, connect: float):
+    """AsyncOpenAI на (провайдер, ключ, таймауты) в текущем event loop; создаётся один раз и переиспользуется.
+
+    Соединения httpx привязаны к loop, поэтому loop входит в ключ; клиенты закрытых loop выбрасываются.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256(str(api_key or "").encode("utf-8")).hexdigest()[:16]
+    key = (id(loop), str(base_url), digest, float(timeout), float(connect))
+    with _lock:
+        hit = _openai_clients.get(key)
+        if hit is not None and hit[0] is loop:
+            _counters["reused"] += 1
+            return hit[1]
+        _prune_closed_loops()
+    pool_max, keep_max, keep_sec = pool_limits()
+    limits = httpx.Limits(max_connections=pool_max, max_keepalive_connections=keep_max, keepalive_expiry=keep_sec)
+    http_timeout = httpx.Timeout(timeout, connect=connect)
+    try:
+        from openai import DefaultAsyncHttpxClient  # сохраняет умолчания SDK (redirects и т.п.)
+        http_client = DefaultAsyncHttpxClient(limits=limits, timeout=http_timeout)
+    except ImportError:
+        http_client = httpx.AsyncClient(limits=limits, timeout=http_timeout)
+    client = AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=http_timeout, http_client=http_client)
+    with _lock:
+        hit = _openai_clients.get(key)
+        if hit is not None and hit[0] is loop:
+            _counters["reused"] += 1
+            return hit[1]  # гонка создания: лишний клиент без соединений просто отбрасывается
+        _openai_clients[key] = (loop, client)
+        _counters["created"] += 1
+    return client
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """Общая aiohttp-сессия текущего event loop (прямые POST к провайдерам, call_debug)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        hit = _sessions.get(id(loop))
+        if hit is not None and hit[0] is loop and not hit[1].closed:
+            _counters["reused"] += 1
+            return hit[1]
+        _prune_closed_loops()
+        pool_max, _keep_max, keep_sec = pool_limits()
+        connector = aiohttp.TCPConnector(limit=pool_max, keepalive_timeout=keep_sec)
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[id(loop)] = (loop, session)
+        _counters["created"] += 1
+        return session
+
+
+async def close_llm_clients() -> None:
+    """Закрыть клиенты текущего loop (shutdown ядра)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        keys = [k for k, (lp, _c) in _openai_clients.items() if lp is loop]
+        clients = [_openai_clients.pop(k)[1] for k in keys]
+        hit = _sessions.pop(id(loop), None)
+    for client in clients:
+        try:
+            await client.close()
+        except Exception:
+            pass
+    if hit is not None and not hit[1].closed:
+        await hit[1].close()
+
+
+def llm_client_pool_stats() -> dict:
+    pool_max, keep_max, keep_sec = pool_limits()
+    with _lock:
+        return {
+            "openai_clients": len(_openai_clients),
+            "aiohttp_sessions": len(_sessions),
+            "created": _counters["created"],
+            "reused": _counters["reused"],
+            "pool_max": pool_max,
+            "keepalive_max": keep_max,
+            "keepalive_sec": keep_sec,
+        }
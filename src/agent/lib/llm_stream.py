@@ -0,0 +1,65 @@
+# llm_stream.py — потоковый ответ chat.completions: сборка чанков в обычный результат и распознавание отказа от stream.
+from __future__ import annotations
+
+import inspect
+import json
+
+import globals as g
+
+log = g.get_logger("llm_api")
+
+_STREAM_REJECT_STATUS = (400, 404, 422)
+
+
+def stream_rejected(e: Exception) -> bool:
+    """True, если провайдер отклонил именно потоковый режим (stream / stream_options).
+
+    Смотрит код ответа и текст ошибки вместе с телом: 400/422 про messages, max_tokens или модель
+    не повторяются без stream — такой повтор только удвоил бы неудачный запрос.
+    """
+    if getattr(e, "status_code", 0) not in _STREAM_REJECT_STATUS:
+        return False
+    body = getattr(e, "body", None)
+    if not isinstance(body, str):
+        try:
+            body = json.dumps(body, ensure_ascii=False) if body is not None else ""
+        except (TypeError, ValueError):
+            body = str(body)
+    text = f"{getattr(e, 'message', '') or ''} {e} {body}".lower()
+    return "stream" in text
+
+
+async def assemble_stream(stream, on_delta) -> dict:
+    """Чанки потока (объекты с to_dict()) → dict как у обычного ответа; текст уходит в on_delta(piece) по мере прихода.
+
+    id/model/provider берутся из первого чанка, где они есть, usage — из последнего (include_usage).
+    Сбой обработчика on_delta логируется и не прерывает поток.
+    """
+    parts: list[str] = []
+    choice: dict = {"index": 0, "finish_reason": None}
+    result: dict = {"usage": {}}
+    async for chunk in stream:
+        data = chunk.to_dict()
+        for key in ("id", "model", "provider"):
+            if data.get(key) and key not in result:
+                result[key] = data[key]
+        if data.get("usage"):
+            result["usage"] = data["usage"]
+        for ch in data.get("choices") or []:
+            if ch.get("error"):
+                choice["error"] = ch["error"]
+            if ch.get("finish_reason"):
+                choice["finish_reason"] = ch["finish_reason"]
+            piece = (ch.get("delta") or {}).get("content") or ""
+            if not piece:
+                continue
+            parts.append(piece)
+            try:
+                ret = on_delta(piece)
+                if inspect.isawaitable(ret):
+                    await ret
+            except Exception as e:
+                log.excpt("on_delta: ошибка обработчика потока", e=e)
+    choice["message"] = {"role": "assistant", "content": "".join(parts)}
+    result["choices"] = [choice]
+    return result
@@ -0,0 +1,194 @@
+# log_tail.py — хвост текстового лога без чтения файла целиком: обратный обход блоками от EOF и курсор по смещению.
+from __future__ import annotations
+
+import mmap
+import os
+import re
+import time
+from typing import Iterator
+
+# "[2026-01-02 10:11:12,345]. #WARNING(chatman): текст" (logging, LOG_FORMAT) и "[... .345]. #WARN: текст" (BasicLogger).
+_HEADER_RE = re.compile(
+    r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:[,.](\d{1,6}))?\]\.?\s+(?:~C\d{2})?#(\w+)(?:\(([^)]*)\))?:(?:~C\d{2})?\s?(.*)$"
+)
+_COLOR_RE = re.compile(r"~C\d{2}")
+_LEVEL_ALIASES = {"WARN": "WARNING", "DBG": "DEBUG", "ERR": "ERROR", "EXCEPTION": "ERROR", "CRITICAL": "ERROR"}
+
+_BLOCK_SIZE = 64 * 1024
+# Сколько байт максимум просматривается за один запрос: остальное считается пропущенным (skipped в ответе).
+_MAX_SCAN_BYTES = 8 * 1024 * 1024
+# С этого размера файла обратный обход идёт по mmap (rfind без копирования блоков).
+_MMAP_MIN_SIZE = 4 * 1024 * 1024
+
+
+def normalize_level(level: str) -> str:
+    lvl = str(level or "").strip().upper()
+    return _LEVEL_ALIASES.get(lvl, lvl)
+
+
+def parse_log_line(line: str) -> dict | None:
+    """Заголовок записи лога → {timestamp (float, сек), level, logger, message}; None — строка-продолжение."""
+    m = _HEADER_RE.match(line)
+    if not m:
+        return None
+    stamp, frac, level, logger, message = m.groups()
+    try:
+        ts = time.mktime(time.strptime(stamp, "%Y-%m-%d %H:%M:%S"))
+    except ValueError:
+        return None
+    if frac:
+        ts += int(frac) / (10 ** len(frac))
+    return {
+        "timestamp": round(ts, 3),
+        "level": normalize_level(level),
+        "logger": logger or "",
+        "message": _COLOR_RE.sub("", message).rstrip(),
+    }
+
+
+def reverse_lines(path: str, end: int, *, start: int = 0, block_size: int = _BLOCK_SIZE,
+                  use_mmap: bool | None = None) -> Iterator[tuple[int, bytes]]:
+    """Строки файла в обратном порядке из диапазона [start, end): (смещение начала строки, байты без \\n).
+
+    Читается блоками от конца (os.pread) или через mmap (use_mmap=None — для файлов от _MMAP_MIN_SIZE).
+    Первая строка диапазона может оказаться обрезанной, если start не на границе строки.
+    """
+    if end <= start:
+        return
+    with open(path, "rb") as f:
+        if use_mmap is None:
+            use_mmap = end >= _MMAP_MIN_SIZE
+        mm = None
+        if use_mmap:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                mm = None
+        if mm is not None:
+            with mm:
+                pos = min(end, len(mm))
+                if pos > start and mm[pos - 1] == 0x0A:
+                    pos -= 1
+                while True:
+                    nl = mm.rfind(b"\n", start, pos)
+                    if nl < 0:
+                        yield start, mm[start:pos]
+                        return
+                    yield nl + 1, mm[nl + 1:pos]
+                    pos = nl
+        fd = f.fileno()
+        pos = end
+        carry = b""
+        trim = True
+        while pos > start:
+            size = min(block_size, pos - start)
+            pos -= size
+            chunk = os.pread(fd, size, pos) + carry
+            if trim and chunk.endswith(b"\n"):
+                chunk = chunk[:-1]
+            trim = False
+            hi = len(chunk)
+            nl = chunk.rfind(b"\n", 0, hi)
+            while nl >= 0:
+                yield pos + nl + 1, chunk[nl + 1:hi]
+                hi = nl
+                nl = chunk.rfind(b"\n", 0, hi)
+            carry = chunk[:hi]
+        yield start, carry
+
+
+class _Collector:
+    """Сборка записей из строк: строки без заголовка (трейсбэки) приклеиваются к предыдущей записи."""
+
+    def __init__(self, levels: set[str] | None) -> None:
+        self.levels = levels
+        self.entries: list[dict] = []
+
+    def accept(self, entry: dict, extra: list[str]) -> None:
+        if self.levels and entry["level"] not in self.levels:
+            return
+        if extra:
+            entry["message"] = "\n".join([entry["message"], *extra])
+        self.entries.append(entry)
+
+
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace").rstrip("\r")
+
+
+def _parse_cursor(cursor: str | None) -> tuple[int, int] | None:
+    if not cursor:
+        return None
+    ino, _, off = str(cursor).partition(":")
+    try:
+        return int(ino), int(off)
+    except ValueError:
+        return None
+
+
+def tail_log(
+    path: str,
+    *,
+    limit: int = 100,
+    levels: set[str] | list[str] | None = None,
+    cursor: str | None = None,
+    max_scan_bytes: int = _MAX_SCAN_BYTES,
+) -> dict:
+    """Последние записи лога (не более limit, в хронологическом порядке) и курсор для следующего запроса.
+
+    cursor — «inode:смещение» конца прочитанного; с ним возвращаются только записи, дописанные после него
+    (если их больше limit — последние limit). Файл пересоздан или усечён (другой inode, размер меньше
+    смещения) — курсор игнорируется. Просматривается не больше max_scan_bytes с конца; skipped — байты
+    между курсором (или началом файла) и окном просмотра. Строка, которую логгер ещё не дописал до \\n,
+    не возвращается: курсор останавливается перед ней.
+    """
+    want = {normalize_level(lv) for lv in levels} if levels else None
+    limit = max(1, int(limit))
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as f:
+            partial = st.st_size > 0 and os.pread(f.fileno(), 1, st.st_size - 1) != b"\n"
+    except OSError:
+        return {"entries": [], "cursor": None, "skipped": 0}
+    end = st.st_size
+    start = 0
+    parsed = _parse_cursor(cursor)
+    if parsed is not None and parsed[0] == st.st_ino and 0 <= parsed[1] <= end:
+        start = parsed[1]
+    skipped = 0
+    cut_head = False
+    if end - start > max_scan_bytes:
+        skipped = end - max_scan_bytes - start
+        start = end - max_scan_bytes
+        cut_head = _byte_at(path, start - 1) != b"\n"
+
+    coll = _Collector(want)
+    extra: list[str] = []
+    done_end = end
+    for off, raw in reverse_lines(path, end, start=start):
+        if partial:
+            partial = False
+            done_end = off
+            continue
+        if cut_head and off == start:
+            break  # обрезанная первая строка окна
+        line = _decode(raw)
+        entry = parse_log_line(line)
+        if entry is None:
+            if line:
+                extra.append(line)
+            continue
+        extra.reverse()
+        coll.accept(entry, extra)
+        extra = []
+        if len(coll.entries) >= limit:
+            break
+    coll.entries.reverse()
+    return {"entries": coll.entries, "cursor": f"{st.st_ino}:{done_end}", "skipped": skipped}
+
+
+def _byte_at(path: str, offset: int) -> bytes:
+    if offset < 0:
+        return b"\n"
+    with open(path, "rb") as f:
+        return os.pread(f.fileno(), 1, offset)
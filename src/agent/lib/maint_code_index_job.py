@@ -37,18 +37,17 @@ def execute_code_index_maint_job(
     scan_sec = round(time.monotonic() - t0, 3)
     _p("code_index_scan_done", force=True, scan_files=len(scanned), scan_sec=scan_sec)
 
-    cache_probe = pr.read_project_cached_index(str(project_name))
+    # метаданные из mmap-view: открытый view — валидный кеш, строки индекса не декодируются
+    cache_probe = pr.read_project_index_view(str(project_name))
     try:
-        from lib.code_index_incremental import validate_cache as _validate_idx_cache
-
-        ok = cache_probe is not None and _validate_idx_cache(cache_probe)
-        rev = int(cache_probe.get("rebuild_revision", 0)) if isinstance(cache_probe, dict) else None
+        ok = cache_probe is not None
+        rev = int(cache_probe.meta.get("rebuild_revision", 0)) if ok else None
     except (TypeError, ValueError, AttributeError):
         ok, rev = False, None
     _p(
         "code_index_cache_probe",
         force=True,
-        cache_present=bool(cache_probe),
+        cache_present=cache_probe is not None,
         cache_valid=ok,
         rebuild_revision=rev,
     )
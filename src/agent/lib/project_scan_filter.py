@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import os
 import re
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 from lib.basic_logger import BasicLogger
@@ -10,44 +13,268 @@ def _normalize_rel_path(rel_path: str) -> str:
     return str(rel_path).replace("\\", "/").lstrip("/")
 
 
-class ProjectScanFilter:
-    """Shared project scan filters based on `.scan_ignore.txt` regex rules."""
+# Якоря конца/границы и отрицательные проверки: совпадение на "dir/" не гарантирует совпадения на "dir/file".
+_DIR_UNSAFE = re.compile(r"\$|\\[ZbB]|\(\?<?[!=]")
+# Ссылки на группы и inline-флаги не переживают объединение в одну альтернативу — такие паттерны идут отдельно.
+_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)")
+_SYNTAX_RE = re.compile(r"^#\s*syntax:\s*(glob|regexp?)\s*$", re.IGNORECASE)
 
-    def __init__(self, project_dir: Path, logger: BasicLogger | None = None):
-        self.project_dir = Path(project_dir)
-        self._log = logger
-        self._patterns: list[re.Pattern[str]] = []
-        self._load_patterns()
+_MAX_CACHED_MATCHERS = 64
 
-    @property
-    def pattern_count(self) -> int:
-        return len(self._patterns)
 
-    def _load_patterns(self) -> None:
-        ignore_file = self.project_dir / ".scan_ignore.txt"
-        if not ignore_file.exists():
-            return
+def glob_to_regex(pattern: str) -> tuple[str, bool]:
+    """gitignore-шаблон (без «!») → (regex для posix-пути относительно корня, только каталоги).
+
+    Результат совпадает и с самим путём, и с любым путём под ним (``build`` → ``build/x.o``), поэтому
+    годится для отсечения каталогов. Без «/» внутри шаблон ищется на любой глубине, с «/» — от корня.
+    Компонента пути не бывает пустой: «*» во всю компоненту и «**» в конце требуют хотя бы символ,
+    иначе ``foo/*`` совпал бы с пробой каталога ``foo/`` и отсёк бы сам foo (вместе с ``!foo/bar``).
+    """
+    dir_only = pattern.endswith("/")
+    body = pattern.rstrip("/")
+    anchored = "/" in body
+    body = body.lstrip("/")
+    out: list[str] = ["^" if anchored else "(?:^|/)"]
+    i, n = 0, len(body)
+    while i < n:
+        c = body[i]
+        if body.startswith("**/", i) and (i == 0 or body[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif body.startswith("**", i) and i + 2 == n and (i == 0 or body[i - 1] == "/"):
+            out.append(".+")
+            i += 2
+        elif c == "*":
+            whole = (i == 0 or body[i - 1] == "/") and (i + 1 == n or body[i + 1] == "/")
+            out.append("[^/]+" if whole else "[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            j = body.find("]", i + 2 if body[i + 1:i + 2] in ("!", "^", "]") else i + 1)
+            if j < 0:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            cls = body[i + 1:j]
+            if cls[:1] in ("!", "^"):
+                cls = "^" + cls[1:]
+            out.append("[" + cls.replace("\\", "\\\\").replace("/", "") + "]")
+            i = j + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(body[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    out.append("/" if dir_only else "(?:/|$)")
+    return "".join(out), dir_only
+
+
+class _Rule:
+    __slots__ = ("source", "regex", "negate", "dir_safe")
+
+    def __init__(self, source: str, regex: re.Pattern[str], *, negate: bool, dir_safe: bool) -> None:
+        self.source = source
+        self.regex = regex
+        self.negate = negate
+        self.dir_safe = dir_safe
+
+
+class IgnoreMatcher:
+    """Скомпилированные правила ``.scan_ignore.txt``: regex-строки (как раньше) и gitignore-шаблоны.
+
+    Синтаксис переключается строкой ``# syntax: glob`` / ``# syntax: regexp`` (по умолчанию regexp) или
+    префиксом строки ``glob:`` / ``re:``. В glob-режиме «!» возвращает путь (последнее совпавшее правило
+    решает), но не внутри уже исключённого каталога — как в git.
+
+    Без «!»: литеральные имена (``node_modules/``, ``*.pyc`` — нет) проверяются по множеству компонент пути,
+    остальные правила объединены в одну альтернативу — один search на путь вместо цикла по паттернам.
+    """
+
+    def __init__(self, lines: list[str], log: BasicLogger | None = None, origin: str = "") -> None:
+        self.rules: list[_Rule] = []
+        self._log = log
+        syntax = "regexp"
+        for raw in lines:
+            line = raw.strip()
+            m = _SYNTAX_RE.match(line)
+            if m:
+                syntax = "glob" if m.group(1).lower() == "glob" else "regexp"
+                continue
+            if not line or line.startswith("#"):
+                continue
+            kind = syntax
+            if line.startswith("glob:"):
+                kind, line = "glob", line[5:].strip()
+            elif line.startswith("re:"):
+                kind, line = "regexp", line[3:].strip()
+            if line:
+                self._add(kind, line, origin)
+        self.negations = any(r.negate for r in self.rules)
+        self._build_fast_paths()
+
+    def _add(self, kind: str, line: str, origin: str) -> None:
+        negate = False
+        if kind == "glob":
+            if line.startswith("!"):
+                negate, line = True, line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            if not line.strip("/"):
+                return
+            source, _dir_only = glob_to_regex(line)
+            dir_safe = True
+        else:
+            source = line
+            dir_safe = not _DIR_UNSAFE.search(line)
         try:
-            lines = ignore_file.read_text(encoding="utf-8").splitlines()
-        except OSError as e:
+            compiled = re.compile(source)
+        except re.error as e:
             if self._log is not None:
-                self._log.warn("Не удалось прочитать .scan_ignore.txt для %s: %s", self.project_dir.name, str(e))
+                self._log.error("Некорректный паттерн '%s' в .scan_ignore.txt%s: %s", line, origin, str(e))
             return
-        for raw in lines:
-            pattern = raw.strip()
-            if not pattern or pattern.startswith("#"):
+        self.rules.append(_Rule(source, compiled, negate=negate, dir_safe=dir_safe))
+
+    def _build_fast_paths(self) -> None:
+        self._names: set[str] = set()  # литеральное имя компоненты: файл или каталог
+        self._dir_names: set[str] = set()  # литеральное имя каталога (шаблон с «/» в конце)
+        self._file_regexes: list[re.Pattern[str]] = []
+        self._dir_regexes: list[re.Pattern[str]] = []
+        if self.negations:
+            return
+        file_sources: list[str] = []
+        dir_sources: list[str] = []
+        for rule in self.rules:
+            literal = _literal_component(rule.source)
+            if literal is not None:
+                name, dir_only = literal
+                (self._dir_names if dir_only else self._names).add(name)
+                continue
+            if _NOT_COMBINABLE.search(rule.source):
+                self._file_regexes.append(rule.regex)
+                if rule.dir_safe:
+                    self._dir_regexes.append(rule.regex)
+                continue
+            file_sources.append(rule.source)
+            if rule.dir_safe:
+                dir_sources.append(rule.source)
+        for sources, target in ((file_sources, self._file_regexes), (dir_sources, self._dir_regexes)):
+            if not sources:
                 continue
             try:
-                self._patterns.append(re.compile(pattern))
-            except re.error as e:
-                if self._log is not None:
-                    self._log.error("Некорректный regex паттерн '%s' в .scan_ignore.txt: %s", pattern, str(e))
+                target.insert(0, re.compile("|".join(f"(?:{s})" for s in sources)))
+            except re.error:
+                target[:0] = [re.compile(s) for s in sources]
 
-    def is_excluded(self, rel_path: str) -> bool:
-        rel = _normalize_rel_path(rel_path)
+    def _last_match(self, path: str) -> bool:
+        hit = False
+        for rule in self.rules:
+            if rule.regex.search(path):
+                hit = not rule.negate
+        return hit
+
+    def _dir_hit(self, rel: str) -> bool:
+        """Каталог rel (без «/» в конце) исключён правилом; с «!» — без учёта родителей (их проверяет dir_excluded)."""
+        probe = rel + "/"
+        if self.negations:
+            hit = False
+            for rule in self.rules:
+                if rule.dir_safe and rule.regex.search(probe):
+                    hit = not rule.negate
+            return hit
+        if self._names or self._dir_names:
+            for part in rel.split("/"):
+                if part in self._names or part in self._dir_names:
+                    return True
+        return any(r.search(probe) for r in self._dir_regexes)
+
+    def dir_excluded(self, rel: str) -> bool:
         if not rel:
             return False
-        for pattern in self._patterns:
-            if pattern.search(rel):
+        if self.negations:
+            parts = rel.split("/")
+            return any(self._dir_hit("/".join(parts[:k])) for k in range(1, len(parts) + 1))
+        return self._dir_hit(rel)
+
+    def excluded(self, rel: str) -> bool:
+        if not rel:
+            return False
+        if self.negations:
+            head = rel.rsplit("/", 1)[0] if "/" in rel else ""
+            return self.dir_excluded(head) or self._last_match(rel)
+        if self._names or self._dir_names:
+            parts = rel.split("/")
+            if parts[-1] in self._names:
                 return True
-        return False
+            for part in parts[:-1]:
+                if part in self._names or part in self._dir_names:
+                    return True
+        return any(r.search(rel) for r in self._file_regexes)
+
+
+def _literal_component(source: str) -> tuple[str, bool] | None:
+    """Правило из glob_to_regex вида «имя на любой глубине» без спецсимволов → (имя, только каталог)."""
+    for head, tail, dir_only in (("(?:^|/)", "(?:/|$)", False), ("(?:^|/)", "/", True)):
+        if source.startswith(head) and source.endswith(tail):
+            body = source[len(head):len(source) - len(tail)]
+            plain = re.sub(r"\\(.)", r"\1", body)
+            if plain and re.escape(plain) == body and "/" not in plain:
+                return plain, dir_only
+    return None
+
+
+_matchers: OrderedDict[str, tuple[tuple[int, int], IgnoreMatcher]] = OrderedDict()
+_matchers_lock = threading.Lock()
+_EMPTY = IgnoreMatcher([])
+
+
+def load_ignore_matcher(ignore_file: Path, log: BasicLogger | None = None) -> IgnoreMatcher:
+    """Правила файла; компилируются один раз и переиспользуются, пока mtime/size файла не изменились."""
+    key = str(ignore_file)
+    try:
+        st = os.stat(key)
+    except OSError:
+        with _matchers_lock:
+            _matchers.pop(key, None)
+        return _EMPTY
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _matchers_lock:
+        cached = _matchers.get(key)
+        if cached is not None and cached[0] == stamp:
+            _matchers.move_to_end(key)
+            return cached[1]
+    try:
+        lines = Path(key).read_text(encoding="utf-8").splitlines()
+    except OSError as e:
+        if log is not None:
+            log.warn("Не удалось прочитать %s: %s", key, str(e))
+        return _EMPTY
+    matcher = IgnoreMatcher(lines, log, origin=f" ({ignore_file.parent.name})")
+    with _matchers_lock:
+        _matchers[key] = (stamp, matcher)
+        _matchers.move_to_end(key)
+        while len(_matchers) > _MAX_CACHED_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+class ProjectScanFilter:
+    """Shared project scan filters based on `.scan_ignore.txt` rules (regex lines, optional gitignore globs)."""
+
+    def __init__(self, project_dir: Path, logger: BasicLogger | None = None):
+        self.project_dir = Path(project_dir)
+        self._log = logger
+        self._matcher = load_ignore_matcher(self.project_dir / ".scan_ignore.txt", logger)
+
+    @property
+    def pattern_count(self) -> int:
+        return len(self._matcher.rules)
+
+    def is_excluded(self, rel_path: str) -> bool:
+        return self._matcher.excluded(_normalize_rel_path(rel_path))
+
+    def is_dir_excluded(self, rel_dir: str) -> bool:
+        """Каталог можно не обходить: правило совпало с ``rel_dir/``, значит совпадёт и с любым файлом внутри."""
+        return self._matcher.dir_excluded(_normalize_rel_path(rel_dir).rstrip("/"))
@@ -0,0 +1,182 @@
+# project_walker.py — общий обход дерева проекта на os.scandir для scan_project_files и maint-reconcile.
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+from lib.file_type_detector import subpath_exclude_patterns
+
+_DEFAULT_WORKERS = 4
+
+
+class WalkedFile(NamedTuple):
+    rel: str  # путь относительно корня проекта, posix
+    path: str  # абсолютный путь
+    st: os.stat_result
+
+
+class WalkResult:
+    """Итог обхода: файлы, счётчик отфильтрованных, время по поддеревьям верхнего уровня."""
+
+    def __init__(self) -> None:
+        self.files: list[WalkedFile] = []
+        self.ignored = 0
+        self.errors = 0
+        self.subtrees: dict[str, float] = {}
+        self.time_limited = False
+
+    def slowest(self, limit: int = 5) -> list[tuple[str, float]]:
+        return sorted(self.subtrees.items(), key=lambda kv: -kv[1])[:limit]
+
+
+def env_scan_workers() -> int:
+    """``CQDS_SCAN_WORKERS``: потоки обхода поддеревьев верхнего уровня (1 — последовательно)."""
+    try:
+        return max(1, min(32, int(os.environ.get("CQDS_SCAN_WORKERS") or _DEFAULT_WORKERS)))
+    except ValueError:
+        return _DEFAULT_WORKERS
+
+
+class _Walker:
+    def __init__(
+        self,
+        root: str,
+        *,
+        file_excluded: Callable[[str], bool] | None,
+        dir_excluded: Callable[[str], bool] | None,
+        accept: Callable[[str], bool] | None,
+        deadline: float,
+        coop: tuple[float, float],
+        log=None,
+    ) -> None:
+        self.root = root.rstrip("/") or "/"
+        self.file_excluded = file_excluded
+        self.dir_excluded = dir_excluded
+        self.accept = accept
+        self.deadline = deadline
+        self.coop_interval, self.coop_sleep = coop
+        self.markers = subpath_exclude_patterns()
+        self.log = log
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+
+    def _rel(self, path: str) -> str:
+        return path[len(self.root) + 1:] if self.root != "/" else path.lstrip("/")
+
+    def prune(self, dir_path: str, rel: str) -> bool:
+        probe = dir_path.lower() + "/"
+        if any(m in probe for m in self.markers):
+            return True
+        return bool(self.dir_excluded and self.dir_excluded(rel))
+
+    def walk(self, top: str, out: WalkResult, *, files_only: bool = False) -> list[str]:
+        """Обход top в глубину; при files_only — только файлы top, подкаталоги возвращаются списком."""
+        stack = [top]
+        subdirs: list[str] = []
+        next_yield = time.monotonic() + self.coop_interval if self.coop_interval > 0 and self.coop_sleep > 0 else 0.0
+        found: list[WalkedFile] = []
+        ignored = errors = 0
+        while stack and not self.stop.is_set():
+            cur = stack.pop()
+            try:
+                it = os.scandir(cur)
+            except OSError as e:
+                errors += 1
+                if self.log is not None:
+                    self.log.warn("project_walker: пропуск каталога %s: %s", cur, e)
+                continue
+            with it:
+                for entry in it:
+                    now = time.monotonic()
+                    if now >= self.deadline:
+                        self.stop.set()
+                        out.time_limited = True
+                        break
+                    if next_yield and now >= next_yield:
+                        # Кооперативная уступка CPU/GIL: снижает «монополию» длительного скана.
+                        time.sleep(self.coop_sleep)
+                        next_yield = time.monotonic() + self.coop_interval
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            rel = self._rel(entry.path)
+                            if self.prune(entry.path, rel):
+                                ignored += 1
+                            elif files_only:
+                                subdirs.append(entry.path)
+                            else:
+                                stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        rel = self._rel(entry.path)
+                        if self.file_excluded is not None and self.file_excluded(rel):
+                            ignored += 1
+                            continue
+                        if self.accept is not None and not self.accept(entry.path):
+                            continue
+                        found.append(WalkedFile(rel, entry.path, entry.stat()))
+                    except Exception as e:
+                        errors += 1
+                        if self.log is not None:
+                            self.log.warn("project_walker: пропуск %s: %s", entry.path, e)
+        with self.lock:
+            out.files.extend(found)
+            out.ignored += ignored
+            out.errors += errors
+        return subdirs
+
+
+def walk_project_files(
+    root: str | os.PathLike,
+    *,
+    start: str | os.PathLike | None = None,
+    file_excluded: Callable[[str], bool] | None = None,
+    dir_excluded: Callable[[str], bool] | None = None,
+    accept: Callable[[str], bool] | None = None,
+    workers: int | None = None,
+    deadline: float | None = None,
+    coop: tuple[float, float] = (0.0, 0.0),
+    log=None,
+) -> WalkResult:
+    """Файлы под start (по умолчанию root) с путями относительно root.
+
+    Каталоги с маркерами SUBPATH_EXCLUDE (/.git/ …) и dir_excluded(rel) не обходятся вовсе; симлинки на
+    каталоги не разворачиваются, на файлы — учитываются (как Path.rglob). stat берётся из DirEntry один раз.
+    Поддеревья верхнего уровня обходятся параллельно в workers потоках; accept (например is_acceptable_file)
+    вызывается там же. deadline — time.monotonic(), после него обход останавливается (time_limited).
+    """
+    root_s = os.path.abspath(os.fspath(root))
+    top = os.path.abspath(os.fspath(start)) if start is not None else root_s
+    walker = _Walker(
+        root_s,
+        file_excluded=file_excluded,
+        dir_excluded=dir_excluded,
+        accept=accept,
+        deadline=deadline if deadline is not None else float("inf"),
+        coop=coop,
+        log=log,
+    )
+    out = WalkResult()
+    t0 = time.monotonic()
+    subdirs = walker.walk(top, out, files_only=True)
+    out.subtrees["."] = time.monotonic() - t0
+
+    def _subtree(path: str) -> None:
+        t = time.monotonic()
+        walker.walk(path, out)
+        with walker.lock:
+            out.subtrees[walker._rel(path)] = time.monotonic() - t
+
+    n = min(env_scan_workers() if workers is None else max(1, int(workers)), len(subdirs))
+    if n <= 1:
+        for path in sorted(subdirs):
+            _subtree(path)
+    else:
+        with ThreadPoolExecutor(max_workers=n, thread_name_prefix="scan-walk") as pool:
+            list(pool.map(_subtree, sorted(subdirs)))
+    out.files.sort(key=lambda f: f.rel)
+    return out
+
@@ -0,0 +1,129 @@
+# reply_progress.py — прогресс-пост генерирующегося ответа LLM: склейка потоковых правок и отмена с проверкой прав.
+from __future__ import annotations
+
+import asyncio
+import time
+
+import globals as g
+
+log = g.get_logger("replication")
+
+
+class ProgressStream:
+    """Прогресс-пост ответа LLM: heartbeat и потоковый текст, правки склеиваются по времени и объёму.
+
+    feed() — on_delta провайдера, вызывается в event loop; запись (edit_post → журнал изменений → хаб
+    long-poll/SSE) выполняется в пуле БД, одновременно не больше одной. Новый текст пишется, когда
+    накопилось flush_chars символов (но не чаще min_gap) или прошло interval_s с прошлой записи.
+    """
+
+    def __init__(self, post_id: int, actor, *, chat_id: int, trigger_user_id: int | None,
+                 interval_s: float, flush_chars: int, min_gap: float) -> None:
+        self.post_id = post_id
+        self.actor = actor
+        self.chat_id = chat_id
+        self.trigger_user_id = trigger_user_id
+        self.interval_s = interval_s
+        self.flush_chars = flush_chars
+        self.min_gap = min_gap
+        self.started = time.time()
+        self.parts: list[str] = []
+        self.chars = 0
+        self.written_chars = 0
+        self.last_write = 0.0
+        self.last_text = None
+        self.writes = 0
+        self.cancelled = False
+        self.closed = False
+        self._inflight: asyncio.Task | None = None
+
+    def render(self) -> str:
+        elapsed = max(0, int(time.time() - self.started))
+        head = f"⏳ @{self.actor.user_name} response in progress... {elapsed}s"
+        if not self.parts:
+            return head + f" (update interval {int(self.interval_s * 1000)}ms)"
+        return head + "\n" + "".join(self.parts)
+
+    def feed(self, piece: str) -> None:
+        if self.closed or not piece:
+            return
+        self.parts.append(piece)
+        self.chars += len(piece)
+        now = time.monotonic()
+        pending = self.chars - self.written_chars
+        since = now - self.last_write
+        if since >= self.interval_s or (pending >= self.flush_chars and since >= self.min_gap):
+            self._kick()
+
+    def tick(self) -> None:
+        """Шаг heartbeat: обновить счётчик секунд и дописать застрявший хвост потока."""
+        if time.monotonic() - self.last_write >= self.interval_s:
+            self._kick()
+
+    def _kick(self) -> None:
+        if self.closed or (self._inflight is not None and not self._inflight.done()):
+            return
+        self._inflight = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self) -> None:
+        text = self.render()
+        if text == self.last_text:
+            return
+        self.written_chars = self.chars
+        self.last_write = time.monotonic()
+        self.last_text = text
+        adb = g.post_manager.db.get_async()
+        try:
+            await adb.run(g.post_manager.edit_post, self.post_id, text, self.actor.user_id)
+            self.writes += 1
+        except Exception as e:
+            log.warn("Прогресс-пост post_id=%d не обновлён: %s", self.post_id, str(e))
+
+    async def close(self) -> None:
+        """Больше не писать и дождаться записи в полёте — чтобы она не перетёрла итоговый ответ."""
+        self.closed = True
+        if self._inflight is not None:
+            try:
+                await self._inflight
+            except Exception:
+                pass
+
+
+class ActiveReplies:
+    """post_id прогресс-поста → ProgressStream генерирующегося ответа (для cancel_reply)."""
+
+    def __init__(self) -> None:
+        self._streams: dict[int, ProgressStream] = {}
+
+    def add(self, stream: ProgressStream) -> None:
+        self._streams[int(stream.post_id)] = stream
+
+    def discard(self, post_id: int) -> None:
+        self._streams.pop(int(post_id), None)
+
+    def __contains__(self, post_id) -> bool:
+        return int(post_id) in self._streams
+
+    @staticmethod
+    def can_cancel(stream: ProgressStream, user_id: int) -> bool:
+        """Автор поста, запустившего ответ, владелец чата или admin — как права edit_post/delete_post."""
+        if stream.trigger_user_id is not None and int(user_id) == int(stream.trigger_user_id):
+            return True
+        if g.user_manager.get_user_role(user_id) == 'admin':
+            return True
+        return g.chat_manager.is_chat_owner(stream.chat_id, user_id)
+
+    def cancel(self, post_id: int, user_id: int) -> dict:
+        """Прервать генерацию ответа, идущего в прогресс-пост post_id.
+
+        Returns:
+            dict: {'status': 'ok'} или {'error': str}
+        """
+        stream = self._streams.get(int(post_id))
+        if stream is None:
+            return {"error": "No active reply for this post"}
+        if not self.can_cancel(stream, user_id):
+            log.info("Пользователь user_id=%d не имеет прав для отмены ответа в post_id=%d", user_id, post_id)
+            return {"error": "Permission denied"}
+        stream.cancelled = True
+        return {"status": "ok"}
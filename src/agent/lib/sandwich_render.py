@@ -0,0 +1,219 @@
+# sandwich_render.py — однократный рендер блоков контекста: сэндвич-текст и оценка токенов кешируются на самом блоке
+# и в общем на процесс мемо по дайджесту содержимого (ContextAssembler пересоздаёт блоки на каждом ходе).
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+_ATTR = "_cq_sandwich"
+_DEFAULT_MEMO_MAX_MB = 64
+
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0}
+# Счётчики текущего потока: окно одной сборки контекста (begin_render_window → render_window).
+_tls = threading.local()
+
+
+class BlockRenderMemo:
+    """Дайджест (класс блока + все поля, включая content_text) → (сэндвич-текст, токены).
+
+    Новый экземпляр неизменившегося поста или файла получает рендер словарным поиском вместо
+    to_sandwich_block() + estimate_tokens. Лимит — суммарный объём текстов, вытеснение LRU.
+    """
+
+    def __init__(self, max_bytes: int | None = None) -> None:
+        if max_bytes is None:
+            try:
+                max_bytes = int(os.environ.get("CORE_RENDER_MEMO_MAX_MB") or _DEFAULT_MEMO_MAX_MB) * 1024 * 1024
+            except ValueError:
+                max_bytes = _DEFAULT_MEMO_MAX_MB * 1024 * 1024
+        self.max_bytes = max(0, max_bytes)
+        self._data: OrderedDict[str, tuple[str, int, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> tuple[str, int] | None:
+        with self._lock:
+            ent = self._data.get(key)
+            if ent is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return ent[0], ent[1]
+
+    def put(self, key: str, text: str, tokens: int) -> None:
+        weight = sys.getsizeof(text)
+        if weight > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (text, tokens, weight)
+            self._bytes += weight
+            while self._bytes > self.max_bytes and self._data:
+                _, ent = self._data.popitem(last=False)
+                self._bytes -= ent[2]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
+
+
+_memo: BlockRenderMemo | None = None
+_memo_guard = threading.Lock()
+
+
+def get_block_render_memo() -> BlockRenderMemo:
+    global _memo
+    if _memo is None:
+        with _memo_guard:
+            if _memo is None:
+                _memo = BlockRenderMemo()
+    return _memo
+
+
+def _memo_key(block, estimate: Callable[[str], int] | None) -> str | None:
+    """Дайджест всех полей блока: что бы ни читал to_sandwich_block(), изменение любого поля — новый ключ."""
+    fields = getattr(block, "__dict__", None)
+    if fields is None:
+        return None
+    h = hashlib.sha256()
+    cls = type(block)
+    h.update(f"{cls.__module__}.{cls.__qualname__}".encode())
+    if estimate is not None:
+        h.update(f"|est:{getattr(estimate, '__module__', '')}.{getattr(estimate, '__qualname__', '')}:{id(estimate)}".encode())
+    for name in sorted(fields):
+        if name == _ATTR:
+            continue
+        value = fields[name]
+        raw = value if isinstance(value, str) else repr(value)
+        h.update(f"|{name}:{type(value).__name__}:{len(raw)}:".encode())
+        h.update(raw.encode("utf-8", errors="surrogatepass"))
+    return h.hexdigest()
+
+
+def _window_add(hit: bool) -> None:
+    if hit:
+        _tls.hits = getattr(_tls, "hits", 0) + 1
+    else:
+        _tls.misses = getattr(_tls, "misses", 0) + 1
+
+
+def begin_render_window() -> None:
+    """Обнулить счётчики рендера текущего потока (начало build_context)."""
+    _tls.hits = 0
+    _tls.misses = 0
+
+
+def render_window() -> dict:
+    """Рендеры в потоке с begin_render_window(): hits — без to_sandwich_block(), misses — с ним."""
+    return {"hits": getattr(_tls, "hits", 0), "misses": getattr(_tls, "misses", 0)}
+
+
+def _stamp(block) -> tuple:
+    """Отпечаток полей, от которых зависит to_sandwich_block(); hash(str) CPython кеширует в самой строке."""
+    text = getattr(block, "content_text", None)
+    body = (len(text), hash(text)) if isinstance(text, str) else (-1, id(text))
+    return (
+        getattr(block, "content_type", None),
+        getattr(block, "post_id", None),
+        getattr(block, "file_id", None),
+        getattr(block, "file_name", None),
+        getattr(block, "timestamp", None),
+        getattr(block, "block_hash", None),
+        body,
+    )
+
+
+def _default_estimate(text: str) -> int:
+    from lib.sandwich_pack import estimate_tokens
+
+    return estimate_tokens(text)
+
+
+def _entry(block, estimate: Callable[[str], int] | None) -> list:
+    stamp = _stamp(block)
+    cached = getattr(block, "__dict__", {}).get(_ATTR)
+    if cached is not None and cached[0] == stamp:
+        with _lock:
+            _counters["hits"] += 1
+        _window_add(True)
+        return cached
+    memo = get_block_render_memo()
+    key = _memo_key(block, estimate) if memo.max_bytes else None
+    found = memo.get(key) if key is not None else None
+    if found is not None:
+        text, tokens = found
+    else:
+        text = block.to_sandwich_block()
+        tokens = (estimate or _default_estimate)(text)
+        if key is not None:
+            memo.put(key, text, tokens)
+    entry = [stamp, text, tokens, None]  # [3] — sha256 текста, считается лениво (block_digest)
+    try:
+        setattr(block, _ATTR, entry)
+    except AttributeError:
+        pass  # блок со __slots__: без кеша, но результат тот же
+    with _lock:
+        _counters["hits" if found is not None else "misses"] += 1
+    _window_add(found is not None)
+    return entry
+
+
+def render_text(block, *, estimate: Callable[[str], int] | None = None) -> str:
+    """block.to_sandwich_block(), вычисленный один раз, пока не изменились поля блока."""
+    return _entry(block, estimate)[1]
+
+
+def render_tokens(block, *, estimate: Callable[[str], int] | None = None) -> int:
+    """estimate_tokens(сэндвич-текста блока) без повторного рендера."""
+    return _entry(block, estimate)[2]
+
+
+def block_digest(block, *, estimate: Callable[[str], int] | None = None) -> str:
+    entry = _entry(block, estimate)
+    if entry[3] is None:
+        entry[3] = hashlib.sha256(entry[1].encode("utf-8", errors="replace")).hexdigest()
+    return entry[3]
+
+
+def blocks_digest(blocks: Iterable, *, estimate: Callable[[str], int] | None = None) -> str:
+    """Отпечаток упорядоченного набора блоков по их сэндвич-тексту и метаданным (ключ мемо упаковки)."""
+    h = hashlib.sha256()
+    for b in blocks:
+        h.update(
+            f"{getattr(b, 'content_type', '')}|{getattr(b, 'post_id', '')}|{getattr(b, 'file_id', '')}|"
+            f"{getattr(b, 'file_name', '')}|{getattr(b, 'timestamp', '')}|{block_digest(b, estimate=estimate)}\n".encode(
+                "utf-8", errors="replace"
+            )
+        )
+    return h.hexdigest()
+
+
+def render_stats() -> dict:
+    with _lock:
+        return dict(_counters)
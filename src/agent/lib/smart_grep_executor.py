@@ -0,0 +1,116 @@
+# smart_grep_executor.py — пул процессов для smart_grep: чтение и поиск вне event loop, результаты потоком.
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator
+
+import globals as g
+from lib.smart_grep_worker import grep_batch
+from lib.worker_pool import WorkerPool, get_worker_pool
+from managers.runtime_config import get_int
+
+log = g.get_logger("smart_grep")
+
+_DEFAULT_BATCH_FILES = 32
+
+
+class SmartGrepExecutor:
+    """Пакеты файлов (по batch_files) уходят в общий пул процессов (lib/worker_pool); ответы — в порядке подачи.
+
+    В полёте держится не больше 2×workers пакетов, поэтому ранний выход вызывающего
+    (набран max_hits/max_results) отменяет всё, что ещё не начато. CQDS_SMART_GREP_WORKERS=0 —
+    поиск в отдельном потоке (для отладки и окружений без forkserver/spawn).
+    """
+
+    def __init__(
+        self, workers: int | None = None, batch_files: int | None = None, pool: WorkerPool | None = None
+    ) -> None:
+        self.pool = pool or get_worker_pool()
+        self.workers = workers if workers is not None else get_int(
+            "CQDS_SMART_GREP_WORKERS", self.pool.workers, 0, 64
+        )
+        self.batch_files = batch_files if batch_files is not None else get_int(
+            "CQDS_SMART_GREP_BATCH_FILES", _DEFAULT_BATCH_FILES, 1, 1024
+        )
+        self._threads: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> Executor:
+        if self.workers > 0:
+            return self.pool.executor()
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smart-grep")
+            return self._threads
+
+    def shutdown(self) -> None:
+        """Пул процессов общий (lib/worker_pool) и гасится отдельно; здесь только поток workers=0."""
+        with self._lock:
+            threads, self._threads = self._threads, None
+        if threads is not None:
+            threads.shutdown(wait=False, cancel_futures=True)
+
+    async def scan(
+        self,
+        items: list[dict],
+        *,
+        query: str,
+        is_regex: bool,
+        case_sensitive: bool,
+        context_lines: int,
+        max_hits: int,
+    ) -> AsyncIterator[tuple[dict, list[dict] | None]]:
+        """items: [{'id', 'file_name', 'path', ...}] → (item, hits | None) в исходном порядке."""
+        pending = deque(items[i : i + self.batch_files] for i in range(0, len(items), self.batch_files))
+        inflight: deque = deque()
+        max_inflight = max(1, self.workers) * 2
+        found = 0
+
+        def _submit() -> None:
+            while pending and len(inflight) < max_inflight:
+                batch = pending.popleft()
+                tasks = [(int(it["id"]), str(it["file_name"]), str(it["path"])) for it in batch]
+                fut = self._executor().submit(
+                    grep_batch, tasks, query, is_regex, case_sensitive, context_lines, max(1, max_hits - found)
+                )
+                inflight.append((batch, asyncio.wrap_future(fut)))
+
+        try:
+            _submit()
+            while inflight:
+                batch, fut = inflight.popleft()
+                try:
+                    results = await fut
+                except BrokenProcessPool as e:
+                    log.warn("smart_grep: пул процессов упал (%s), пересоздание", str(e))
+                    self.pool.reset()
+                    raise
+                for item, hits in zip(batch, results):
+                    yield item, hits
+                    found += len(hits or ())
+                if found >= max_hits:
+                    return
+                _submit()
+        finally:
+            for _, fut in inflight:
+                fut.cancel()
+
+    def stats(self) -> dict[str, Any]:
+        return {"workers": self.workers, "batch_files": self.batch_files, "pool": self.pool.stats()}
+
+
+_executor: SmartGrepExecutor | None = None
+_executor_guard = threading.Lock()
+
+
+def get_smart_grep_executor() -> SmartGrepExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_guard:
+            if _executor is None:
+                _executor = SmartGrepExecutor()
+    return _executor
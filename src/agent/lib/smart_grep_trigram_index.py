@@ -0,0 +1,253 @@
+# smart_grep_trigram_index.py — триграммные сигнатуры файлов проекта для отбора кандидатов smart_grep
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable
+
+from managers.runtime_config import get_bool, get_int
+
+try:  # Python 3.11+: sre_parse переехал в re._parser
+    from re import _parser as _sre_parse
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre_parse
+
+_BITS_MIN = 1024
+_DEFAULT_BITS_MAX = 16384
+_DEFAULT_MAX_PROJECTS = 8
+_HASH_MUL = 2654435761
+
+Loader = Callable[[dict], "str | None"]
+
+
+def _bits_max() -> int:
+    return get_int("CQDS_SMART_GREP_TRIGRAM_MAX_BITS", _DEFAULT_BITS_MAX, _BITS_MIN, 1 << 20)
+
+
+def trigram_enabled() -> bool:
+    return get_bool("CQDS_SMART_GREP_TRIGRAM", default=True)
+
+
+def _ascii_lower(text: str) -> bytes:
+    # не-ASCII символы → '?': триграммы запроса берутся только из ASCII, так что замена даёт лишь лишних кандидатов
+    return text.casefold().encode("ascii", "replace")
+
+
+def text_trigrams(text: str) -> set[bytes]:
+    data = _ascii_lower(text)
+    return {data[i:i + 3] for i in range(len(data) - 2)}
+
+
+def _bit(tri: bytes, bits: int) -> int:
+    code = (tri[0] << 14) | (tri[1] << 7) | tri[2]
+    return ((code * _HASH_MUL) >> 7) & (bits - 1)
+
+
+def text_signature(text: str, bits_max: int | None = None) -> tuple[int, int]:
+    """(bits, mask): битовая сигнатура множества триграмм текста (casefold).
+
+    Размер растёт с числом различных триграмм (≈2 бита на триграмму, степень двойки), ограничен bits_max.
+    """
+    tris = text_trigrams(text)
+    cap = bits_max or _bits_max()
+    bits = _BITS_MIN
+    while bits < 2 * len(tris) and bits < cap:
+        bits <<= 1
+    buf = bytearray(bits >> 3)
+    for tri in tris:
+        pos = _bit(tri, bits)
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return bits, int.from_bytes(buf, "little")
+
+
+def _literal_runs(items) -> list[str]:
+    """Обязательные литеральные фрагменты верхнего уровня разобранного regex."""
+    runs: list[str] = []
+    cur: list[str] = []
+    for op, av in items:
+        if op is _sre_parse.LITERAL:
+            cur.append(chr(av))
+            continue
+        if cur:
+            runs.append("".join(cur))
+            cur = []
+        if op is _sre_parse.SUBPATTERN:
+            runs.extend(_literal_runs(av[-1]))
+        elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) and av[0] >= 1:
+            # x{1,}: тело встречается хотя бы раз, но не стыкуется с соседями
+            runs.extend(_literal_runs(av[2]))
+    if cur:
+        runs.append("".join(cur))
+    return runs
+
+
+def query_trigrams(query: str, is_regex: bool, flags: int = 0) -> list[bytes]:
+    """Триграммы, обязательно присутствующие в файле с совпадением; [] — отбор невозможен."""
+    if is_regex:
+        try:
+            runs = _literal_runs(_sre_parse.parse(query, flags))
+        except Exception:
+            return []
+    else:
+        runs = [query]
+    out: set[bytes] = set()
+    for run in runs:
+        low = run.casefold()
+        for i in range(len(low) - 2):
+            part = low[i:i + 3]
+            if part.isascii():
+                out.add(part.encode("ascii"))
+    return sorted(out)
+
+
+def disk_stamp(path: str | None) -> tuple[int, int] | None:
+    """(st_mtime_ns, st_size) файла на диске; None — пути нет или stat не удался."""
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class TrigramIndex:
+    """Сигнатуры файлов одного проекта в памяти процесса: file_id → ((mtime_ns, size), bits, mask).
+
+    Актуальность — по stat файла на диске в момент отбора (entry['path']), а не по attached_files.ts:
+    правка вне приложения без пересканирования тоже делает сигнатуру устаревшей. Файлы без актуальной
+    сигнатуры (или без stat) всегда считаются кандидатами и дозаполняются фоновым потоком, так что
+    поиск никогда не теряет совпадений, а только постепенно ускоряется. После рестарта индекс пуст.
+    """
+
+    def __init__(self, project_id: int) -> None:
+        self.project_id = int(project_id)
+        self._sigs: dict[int, tuple[tuple[int, int], int, int]] = {}
+        self._lock = threading.RLock()
+        self._pending: dict[int, dict] = {}
+        self._builder: threading.Thread | None = None
+        self._built_files = 0
+        self._build_sec = 0.0
+
+    def shortlist(self, entries: Iterable[dict], required: list[bytes], loader: Loader | None = None) -> list[dict]:
+        """Оставить записи, сигнатура которых содержит все required; порядок сохраняется.
+
+        entries: dict с 'id' и 'path' (абсолютный путь на диске, по нему stat на каждый отбор).
+        """
+        entries = list(entries)
+        if not required:
+            return entries
+        stamps = [disk_stamp(entry.get("path")) for entry in entries]  # stat вне блокировки
+        qmasks: dict[int, int] = {}
+        out = []
+        stale: list[dict] = []
+        with self._lock:
+            sigs = self._sigs
+            for entry, stamp in zip(entries, stamps):
+                fid = int(entry["id"])
+                sig = sigs.get(fid)
+                if stamp is None or sig is None or sig[0] != stamp:
+                    if stamp is not None:
+                        stale.append(entry)
+                    out.append(entry)
+                    continue
+                bits, mask = sig[1], sig[2]
+                qmask = qmasks.get(bits)
+                if qmask is None:
+                    qmask = 0
+                    for tri in required:
+                        qmask |= 1 << _bit(tri, bits)
+                    qmasks[bits] = qmask
+                if mask & qmask == qmask:
+                    out.append(entry)
+        if stale and loader is not None:
+            self.schedule(stale, loader)
+        return out
+
+    def update(self, file_id: int, stamp: tuple[int, int], text: str | None) -> None:
+        """stamp — disk_stamp(), снятый до чтения text: правка во время чтения даст другой stat и пересборку."""
+        if text is None:
+            with self._lock:
+                self._sigs.pop(int(file_id), None)
+            return
+        bits, mask = text_signature(text)
+        with self._lock:
+            self._sigs[int(file_id)] = (tuple(stamp), bits, mask)
+
+    def forget(self, keep_ids: Iterable[int]) -> None:
+        keep = {int(x) for x in keep_ids}
+        with self._lock:
+            for fid in [f for f in self._sigs if f not in keep]:
+                self._sigs.pop(fid, None)
+
+    def schedule(self, entries: Iterable[dict], loader: Loader) -> None:
+        """Поставить файлы в очередь фоновой индексации (один поток на проект)."""
+        with self._lock:
+            for entry in entries:
+                self._pending[int(entry["id"])] = dict(entry)
+            if self._builder is not None and self._builder.is_alive():
+                return
+            self._builder = threading.Thread(
+                target=self._build_loop, args=(loader,), name=f"trigram-{self.project_id}", daemon=True
+            )
+            self._builder.start()
+
+    def _build_loop(self, loader: Loader) -> None:
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._builder = None
+                    return
+                fid, entry = self._pending.popitem()
+            t0 = time.monotonic()
+            stamp = disk_stamp(entry.get("path"))
+            if stamp is None:
+                continue  # файла нет на диске — остаётся кандидатом, скан сам сообщит об ошибке
+            try:
+                text = loader(entry)
+            except Exception:
+                continue  # сигнатуры нет — файл остаётся кандидатом до следующей попытки
+            if text is None:
+                # бинарный файл: пустая сигнатура — кандидатом не будет, пока не сменится stat
+                text = ""
+            self.update(fid, stamp, text)
+            with self._lock:
+                self._built_files += 1
+                self._build_sec += time.monotonic() - t0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "project_id": self.project_id,
+                "files": len(self._sigs),
+                "pending": len(self._pending),
+                "bytes": sum(bits >> 3 for _, bits, _ in self._sigs.values()),
+                "built_files": self._built_files,
+                "build_sec": round(self._build_sec, 3),
+            }
+
+
+_indexes: OrderedDict[int, TrigramIndex] = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_trigram_index(project_id: int) -> TrigramIndex:
+    pid = int(project_id)
+    with _indexes_lock:
+        idx = _indexes.get(pid)
+        if idx is None:
+            idx = TrigramIndex(pid)
+            _indexes[pid] = idx
+        _indexes.move_to_end(pid)
+        limit = get_int("CQDS_SMART_GREP_TRIGRAM_PROJECTS", _DEFAULT_MAX_PROJECTS, 1, 256)
+        while len(_indexes) > limit:
+            _indexes.popitem(last=False)
+        return idx
+
+
+def trigram_index_stats() -> list[dict[str, Any]]:
+    with _indexes_lock:
+        items = list(_indexes.values())
+    return [idx.stats() for idx in items]
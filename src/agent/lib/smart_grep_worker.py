@@ -0,0 +1,88 @@
+# smart_grep_worker.py — построчный поиск smart_grep; выполняется в процессах пула (lib/smart_grep_executor.py).
+# Модуль импортируется дочерними процессами: только стандартная библиотека и lib.text_bytes, без БД/globals.
+from __future__ import annotations
+
+import functools
+import re
+
+from lib.text_bytes import decode_file_bytes
+
+
+@functools.lru_cache(maxsize=64)
+def _compile(query: str, flags: int) -> re.Pattern:
+    return re.compile(query, flags)
+
+
+def grep_text(
+    text: str,
+    file_id: int,
+    file_name: str,
+    query: str,
+    pattern: re.Pattern | None,
+    case_sensitive: bool,
+    context_lines: int,
+) -> list[dict]:
+    """Совпадения по строкам текста в формате hits /project/smart_grep."""
+    lines = text.splitlines()
+    needle = query if case_sensitive else query.lower()
+    hits = []
+    for i, line in enumerate(lines, start=1):
+        if pattern is not None:
+            m = pattern.search(line)
+            matched = m is not None
+            matched_text = m.group(0)[:200] if m else ""
+        else:
+            haystack = line if case_sensitive else line.lower()
+            matched = needle in haystack
+            matched_text = query[:200] if matched else ""
+        if not matched:
+            continue
+        before = lines[max(0, i - 1 - context_lines) : i - 1] if context_lines else []
+        after = lines[i : i + context_lines] if context_lines else []
+        hits.append(
+            {
+                "file_id": file_id,
+                "file_name": file_name,
+                "line": i,
+                "line_text": line[:400],
+                "match": matched_text,
+                "context_before": before,
+                "context_after": after,
+            }
+        )
+    return hits
+
+
+def grep_batch(
+    tasks: list[tuple[int, str, str]],
+    query: str,
+    is_regex: bool,
+    case_sensitive: bool,
+    context_lines: int,
+    max_hits: int,
+) -> list[list[dict] | None]:
+    """tasks: [(file_id, file_name, abs_path)] → hits по каждому файлу (None — не прочитан/не текст).
+
+    Файлы читаются напрямую с диска. Обработка прекращается, как только набрано max_hits
+    совпадений: результат тогда короче tasks, хвост пакета вызывающий не учитывает.
+    """
+    pattern = _compile(query, 0 if case_sensitive else re.IGNORECASE) if is_regex else None
+    out: list[list[dict] | None] = []
+    total = 0
+    for file_id, file_name, path in tasks:
+        try:
+            with open(path, "rb") as fh:
+                raw = fh.read()
+        except OSError:
+            out.append(None)
+            continue
+        decoded = decode_file_bytes(raw)
+        if decoded is None:
+            out.append(None)
+            continue
+        hits = grep_text(decoded[0], file_id, file_name, query, pattern, case_sensitive, context_lines)
+        out.append(hits)
+        total += len(hits)
+        if total >= max_hits:
+            break
+    return out
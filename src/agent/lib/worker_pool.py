@@ -0,0 +1,90 @@
+# worker_pool.py — общий долгоживущий пул процессов ядра (smart_grep, шарды code_index); forkserver/spawn вместо fork.
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+import globals as g
+from managers.runtime_config import get_int
+
+log = g.get_logger("core")
+
+# Модули, которые forkserver импортирует один раз и раздаёт воркерам через fork уже загруженными.
+# Без БД/роутов: воркеру нужны только функции задач (grep_batch, pack_shard) и их зависимости.
+_PRELOAD = ["lib.smart_grep_worker", "lib.code_index_shards"]
+
+
+def start_method() -> str:
+    """``CQDS_WORKER_MP_START``: forkserver по умолчанию (spawn, где его нет).
+
+    fork из многопоточного ядра (uvicorn, пулы БД, to_thread) копирует блокировки, захваченные другими
+    потоками в момент fork, и воркер может повиснуть на первой же из них; fork — только явным выбором.
+    """
+    method = (os.environ.get("CQDS_WORKER_MP_START") or "").strip()
+    available = multiprocessing.get_all_start_methods()
+    if method in available:
+        return method
+    if method:
+        log.warn("worker_pool: неизвестный CQDS_WORKER_MP_START=%s, используется forkserver/spawn", method)
+    return "forkserver" if "forkserver" in available else "spawn"
+
+
+class WorkerPool:
+    """Один ProcessPoolExecutor на процесс ядра, создаётся лениво и живёт до shutdown().
+
+    Воркеры запускаются один раз (forkserver/spawn импортирует модуль сервера как __mp_main__ без
+    запуска, см. server.py), поэтому задачи не платят за старт процессов.
+    После BrokenProcessPool вызывающий делает reset() — следующий executor() поднимет пул заново.
+    """
+
+    def __init__(self, workers: int | None = None) -> None:
+        cpu = os.cpu_count() or 1
+        self.workers = workers if workers is not None else get_int("CQDS_WORKER_POOL_SIZE", cpu, 1, 64)
+        self.method = start_method()
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._starts = 0
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                ctx = multiprocessing.get_context(self.method)
+                if self.method == "forkserver":
+                    ctx.set_forkserver_preload(_PRELOAD)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+                self._starts += 1
+                log.debug("worker_pool: пул %d процессов (%s)", self.workers, self.method)
+            return self._pool
+
+    def reset(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        self.reset()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "start_method": self.method,
+            "started": self._pool is not None,
+            "starts": self._starts,
+        }
+
+
+_worker_pool: WorkerPool | None = None
+_worker_pool_guard = threading.Lock()
+
+
+def get_worker_pool() -> WorkerPool:
+    global _worker_pool
+    if _worker_pool is None:
+        with _worker_pool_guard:
+            if _worker_pool is None:
+                _worker_pool = WorkerPool()
+    return _worker_pool
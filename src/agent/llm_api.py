@@ -12,8 +12,10 @@ import urllib.error
 import urllib.request
 # from typing import dict, Optional  PROHIBITED OBSOLETE CODE, NEVER USE!
 from managers.db import Database
-from managers.runtime_config import get_int
-from openai import AsyncOpenAI, RateLimitError, APIStatusError, APIConnectionError
+from managers.runtime_config import get_bool, get_int
+from lib.llm_http_pool import get_aiohttp_session, get_openai_client
+from lib.llm_stream import assemble_stream, stream_rejected
+from openai import RateLimitError, APIStatusError, APIConnectionError
 import globals
 import datetime
 
@@ -191,17 +193,47 @@ class LLMConnection:
                     "usage": {},
                     "search_results": []}
 
-    async def call(self) -> dict:
-        """Calls the LLM API using OpenAI SDK, overriding in subclasses for specific APIs."""
+    def _client(self):
+        """Общий на процесс AsyncOpenAI для (base_url, api_key): keep-alive вместо TCP/TLS на каждый ход."""
+        return get_openai_client(self.base_url, self.api_key, timeout=self.timeout.total, connect=self.timeout.connect)
+
+    def _stream_allowed(self, payload: dict) -> bool:
+        # web_search приходит в tool_calls целиком — с инструментами остаёмся на обычном ответе.
+        return get_bool("LLM_STREAMING", default=True) and not payload.get("tools")
+
+    async def _create(self, payload: dict, on_delta=None) -> dict:
+        client = self._client()
+        if on_delta is not None and self._stream_allowed(payload):
+            return await self._create_stream(client, payload, on_delta)
+        comp = await client.chat.completions.create(**payload)
+        return self._process_result(comp.to_dict())
+
+    async def _create_stream(self, client, payload: dict, on_delta) -> dict:
+        """Потоковый ответ: фрагменты текста уходят в on_delta(piece) по мере прихода, итог — как у обычного вызова."""
+        try:
+            stream = await client.chat.completions.create(
+                **payload, stream=True, stream_options={"include_usage": True}
+            )
+        except APIStatusError as e:
+            if not stream_rejected(e):
+                raise
+            log.warn("%s: потоковый режим отклонён (%s), повтор без stream", self.name, str(e))
+            comp = await client.chat.completions.create(**payload)
+            return self._process_result(comp.to_dict())
+        return self._process_result(await assemble_stream(stream, on_delta))
+
+    async def call(self, on_delta=None) -> dict:
+        """Calls the LLM API using OpenAI SDK, overriding in subclasses for specific APIs.
+
+        on_delta(piece) — приём частичного текста: при нём запрос идёт потоком (LLM_STREAMING, без tools).
+        """
         _void = {"choices": []}
         try:
             messages = self.payload.get("messages", [])
             if not messages:
                 log.error("Нет сообщений для запроса к API")
                 return {"text": "<llm_error>No messages in payload\nError code: InvalidRequest\nProvider: %s</llm_error>" % self.name, "usage": {}}
-            client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, timeout=self.timeout.total)
-            comp = await client.chat.completions.create(**self.payload)
-            return self._process_result(comp.to_dict())
+            return await self._create(self.payload, on_delta)
         except TypeError as e:
             # Some providers/models reject reasoning args; retry once without them.
             err = str(e)
@@ -210,10 +242,9 @@ class LLMConnection:
                 payload.pop('reasoning', None)
                 payload.pop('reasoning_effort', None)
                 try:
-                    client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, timeout=self.timeout.total)
-                    comp = await client.chat.completions.create(**payload)
+                    result = await self._create(payload, on_delta)
                     self.payload = payload
-                    return self._process_result(comp.to_dict())
+                    return result
                 except Exception as inner_e:
                     return self.api_error_result('Unknown', inner_e, 500)
             return self.api_error_result('Unknown', e, 500)
@@ -234,20 +265,20 @@ class LLMConnection:
             else:
                 log.error(" Нет сообщений для запроса к API")
                 return {}
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                        f"{self.base_url}/chat/completions",
-                        headers={
-                            "Authorization": f"Bearer {self.api_key}",
-                            "Content-Type": "application/json; charset=utf-8",
-                            "Accept": "application/json; charset=UTF-8",
-                            "Accept-Charset": "UTF-8"
-                        },
-                        json=self.payload,
-                        timeout=self.timeout
-                ) as response:
-                    result = await response.json()
-                    return self._process_result(result, response.status)
+            session = get_aiohttp_session()
+            async with session.post(
+                    f"{self.base_url}/chat/completions",
+                    headers={
+                        "Authorization": f"Bearer {self.api_key}",
+                        "Content-Type": "application/json; charset=utf-8",
+                        "Accept": "application/json; charset=UTF-8",
+                        "Accept-Charset": "UTF-8"
+                    },
+                    json=self.payload,
+                    timeout=self.timeout
+            ) as response:
+                result = await response.json()
+                return self._process_result(result, response.status)
         except Exception as e:
             log.excpt(f"Ошибка {self.name} API: ", e=e)
             return {}
@@ -8,6 +8,7 @@ from lib.context_reference_store import file_rev_ts_map, map_get, post_digest_ma
 from lib.cache_rollout import cache_rollout_enabled
 from lib.session_context import get_session_id
 from lib.relevance_window_anchor import set_anchor_on_full
+from lib.sandwich_render import render_text
 import globals as g
 
 log = g.get_logger("llm_cached_interactor")
@@ -70,6 +71,9 @@ class LLMCachedInteractor(LLMInteractor):
                 "usage_cache_read_input_tokens INTEGER DEFAULT 0",
                 "usage_cache_creation_input_tokens INTEGER DEFAULT 0",
                 "usage_details_json TEXT DEFAULT ''",
+                # Рендер блоков за сборку: hits — из кеша/мемо, misses — с to_sandwich_block().
+                "render_cache_hits INTEGER DEFAULT 0",
+                "render_cache_misses INTEGER DEFAULT 0",
             ]
         )
         # Runtime state для расчёта инкрементального sent_tokens по кэш-циклу.
@@ -297,13 +301,13 @@ class LLMCachedInteractor(LLMInteractor):
         for b in filtered_blocks:
             ct = getattr(b, "content_type", None)
             if ct == ":context_patch":
-                tail_parts.append(b.to_sandwich_block())
+                tail_parts.append(render_text(b))
                 continue
             if ct != ":post":
                 continue
             pid = int(getattr(b, "post_id", 0) or 0)
             if pid > p_prev:
-                tail_parts.append(b.to_sandwich_block())
+                tail_parts.append(render_text(b))
         if not tail_parts:
             return ""
         tail_text = "".join(tail_parts)
@@ -5,7 +5,9 @@ import hashlib
 import json
 import random
 import re
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
 from lib.sandwich_pack import SandwichPack, estimate_tokens
 from lib.context_reference_store import (
@@ -16,6 +18,7 @@ from context_assembler import ContextAssembler
 from managers.db import DataTable
 from chat_actor import ChatActor
 from lib.relevance_window_anchor import set_anchor_on_full
+from lib.sandwich_render import begin_render_window, blocks_digest, render_text, render_tokens, render_window
 from lib.session_context import get_session_id
 from lib.cache_rollout import (
     context_cache_metrics_sample_pct,
@@ -27,6 +30,9 @@ import os
 
 log = g.get_logger("interactor")
 
+# Мемо index по не-пост блокам (fingerprint индекса): между ходами файлы обычно те же, а pack() дорогой.
+_FP_INDEX_MEMO_MAX = 32
+
 
 class ContextInput:
     def __init__(self, content_blocks: list, users: list, chat_id: int, actor: ChatActor, exclude_source_id: int = None):
@@ -41,6 +47,10 @@ class ContextInput:
         self.context_meta = {}
         #: Только :context_patch (сэндвич-текст) для отладочного дампа .upgrade.llm
         self.context_upgrade_text_for_debug: str = ""
+        #: Приём частичного ответа провайдера (стриминг): on_delta(piece); None — ответ целиком.
+        self.on_delta = None
+        #: Автор поста, запустившего ответ (право прервать ответ через /chat/cancel_reply).
+        self.trigger_user_id = None
 
 
 def _normalize_user_name(user_name: str) -> str:
@@ -136,6 +146,8 @@ class LLMInteractor(ContextAssembler):
         self.last_sandwich_idx = None
         self.entities_idx = {}   # index per chat
         self._context_ref_store = context_reference_store or ContextReferenceStore()
+        self._fp_index_memo: OrderedDict[str, str] = OrderedDict()
+        self._fp_index_lock = threading.Lock()
         self.tokens_limit = 131072
         self.llm_usage_table = DataTable(
             table_name="llm_usage",
@@ -183,7 +195,7 @@ class LLMInteractor(ContextAssembler):
             pid = int(getattr(b, "post_id", 0) or 0)
             if pid <= 0 or pid > int(p_prev or 0):
                 continue
-            new_block = b.to_sandwich_block()
+            new_block = render_text(b)
             pat = rf'<post post_id="{pid}"[^>]*>.*?</post>'
             # Строка замены не должна проходить через синтаксис repl шаблона re
             # (иначе «\x», «\1» из текста поста дают re.error: bad escape).
@@ -484,6 +496,8 @@ class LLMInteractor(ContextAssembler):
                 "prefix_reuse_probe_enabled": 1 if bool(context_meta.get("prefix_reuse_probe_enabled", False)) else 0,
                 "prefix_reuse_probe_candidate": 1 if bool(context_meta.get("prefix_reuse_probe_candidate", False)) else 0,
                 "prefix_reuse_probe_match": 1 if bool(context_meta.get("prefix_reuse_probe_match", False)) else 0,
+                "render_cache_hits": int(context_meta.get("render_cache_hits", 0) or 0),
+                "render_cache_misses": int(context_meta.get("render_cache_misses", 0) or 0),
             })
         except Exception as e:
             log.warn("Не удалось записать context_cache_metrics: %s", str(e))
@@ -584,8 +598,7 @@ class LLMInteractor(ContextAssembler):
         })
         unique_file_names = set()
         for block in content_blocks:
-            block_text = block.to_sandwich_block()
-            token_count = estimate_tokens(block_text)
+            token_count = render_tokens(block)
             block_id = block.post_id or block.file_id or getattr(block, 'quote_id', None) or "N/A"
             file_name = block.file_name or "N/A"
             if file_name != "N/A" and file_name in unique_file_names:
@@ -662,6 +675,24 @@ class LLMInteractor(ContextAssembler):
     def entity_index(self, chat_id: int):
         return self.entities_idx.get(chat_id, None)
 
+    def _fp_index_json(self, project_name: str, blocks: list, users: list) -> str:
+        """index упаковки не-пост блоков (для index_hash); повторный pack только при изменении набора/текста."""
+        key = self._hash_text(
+            f"{project_name}\n{json.dumps(users, sort_keys=True, default=str)}\n{blocks_digest(blocks)}"
+        )
+        with self._fp_index_lock:
+            cached = self._fp_index_memo.get(key)
+            if cached is not None:
+                self._fp_index_memo.move_to_end(key)
+                return cached
+        fp_packer = SandwichPack(project_name, max_size=1_000_000, compression=True)
+        index_json = fp_packer.pack(blocks, users=users)["index"]
+        with self._fp_index_lock:
+            self._fp_index_memo[key] = index_json
+            while len(self._fp_index_memo) > _FP_INDEX_MEMO_MAX:
+                self._fp_index_memo.popitem(last=False)
+        return index_json
+
     def build_context(self, ci: ContextInput, rql: int=1):
         """ TODO: need extract from interact """
         filtered_blocks = []
@@ -670,19 +701,19 @@ class LLMInteractor(ContextAssembler):
         total_tokens = estimate_tokens(self.pre_prompt)
         last_post_id = 0
         log.debug("Упаковка %d блоков контента для rql=%d", len(ci.blocks), rql)
+        begin_render_window()
         try:
             proj_man = g.current_project_manager.get() or g.project_manager  # TODO(pre-release): remove g.project_manager fallback after ContextVar adoption is verified
             project_name = proj_man.project_name
             packer = SandwichPack(project_name, max_size=1_000_000, compression=True)
-            result = packer.pack(ci.blocks, users=ci.users)
+            result = full_result = packer.pack(ci.blocks, users=ci.users)
             self.entities_idx[ci.chat_id] = list(packer.entities).copy()
             self.last_sandwich_idx = full_idx = result['index']  # Запомнить индекс, это уже JSON в строке
             self._write_chat_index(ci.chat_id, full_idx)  # сохранение отдельного файла с индексом, для перекрестного взаимодействия в разных чатах
 
             non_post_blocks = [b for b in ci.blocks if getattr(b, "content_type", None) != ":post"]
             if non_post_blocks:
-                fp_packer = SandwichPack(project_name, max_size=1_000_000, compression=True)
-                index_fp_json = fp_packer.pack(non_post_blocks, users=ci.users)["index"]
+                index_fp_json = self._fp_index_json(project_name, non_post_blocks, ci.users)
             else:
                 index_fp_json = "{}"
 
@@ -691,8 +722,7 @@ class LLMInteractor(ContextAssembler):
             files_passed = []
             # пере-сборка блоков, с контентом актуальных файлов, до наступления переполнения контекста
             for block in ci.blocks:
-                block_text = block.to_sandwich_block()
-                block_tokens = estimate_tokens(block_text)
+                block_tokens = render_tokens(block)
                 if total_tokens + block_tokens >= self.tokens_limit:
                     log.debug("Пропуск блока post_id=%s, file_id=%s из-за лимита токенов %d",
                               str(block.post_id or 'N/A'), str(block.file_id or 'N/A'), self.tokens_limit)
@@ -723,9 +753,15 @@ class LLMInteractor(ContextAssembler):
                 reference_enabled=self._incremental_patches_enabled(ci),
             )
             patch_blocks = filtered_blocks[idx_before_patches:]
-            upgrade_sandwich_text = "\n".join(
-                b.to_sandwich_block() for b in patch_blocks
-            )
+            upgrade_sandwich_text = "\n".join(render_text(b) for b in patch_blocks)
+
+            def _pack_filtered() -> dict:
+                # Все блоки прошли фильтр без патчей — упаковка та же, что у полного списка выше.
+                if len(filtered_blocks) == len(ci.blocks) and all(
+                    a is b for a, b in zip(filtered_blocks, ci.blocks)
+                ):
+                    return full_result
+                return packer.pack(filtered_blocks, users=ci.users)
 
             log.debug("Отфильтровано %d блоков из %d, добавлено %d файлов из %s ", len(filtered_blocks), len(ci.blocks), len(files_passed), str(self.fresh_files))
             mode, reason, fp = self._log_context_fingerprint(
@@ -777,7 +813,7 @@ class LLMInteractor(ContextAssembler):
                     reuse_apply = True
                 else:
                     # Базовый путь: компактный сэндвич с ограниченным детализированным индексом.
-                    result = packer.pack(filtered_blocks, users=ci.users)
+                    result = _pack_filtered()
                     deep_index_body = result["deep_index"]
                     sandwich_body = "".join(result["sandwiches"])
                     context_body = deep_index_body + "\n" + sandwich_body
@@ -821,7 +857,7 @@ class LLMInteractor(ContextAssembler):
                 reuse_probe_candidate = False
                 reuse_probe_match = False
                 reuse_apply = False
-                result = packer.pack(filtered_blocks, users=ci.users)
+                result = _pack_filtered()
                 deep_index_body = result["deep_index"]
                 sandwich_body = "".join(result["sandwiches"])
                 context_body = deep_index_body + "\n" + sandwich_body
@@ -848,6 +884,7 @@ class LLMInteractor(ContextAssembler):
             )
             dbg_ctx = self.debug_mode or getattr(ci, "debug_mode", False)
             ci.context_upgrade_text_for_debug = upgrade_sandwich_text if dbg_ctx else ""
+            renders = render_window()
             ci.context_meta = {
                 "cache_mode": mode,
                 "cache_reason": reason,
@@ -865,6 +902,8 @@ class LLMInteractor(ContextAssembler):
                 "prefix_reuse_probe_enabled": reuse_probe_enabled,
                 "prefix_reuse_probe_candidate": reuse_probe_candidate,
                 "prefix_reuse_probe_match": reuse_probe_match,
+                "render_cache_hits": renders["hits"],
+                "render_cache_misses": renders["misses"],
             }
             self._write_context_stats(
                 filtered_blocks,
@@ -1000,10 +1039,10 @@ class LLMInteractor(ContextAssembler):
             conn.make_payload(prompt=context, extra={"cache_hint": cache_hint} if cache_hint else None)
             if search_params.get("mode", 'off') == "off":
                 log.debug("Поиск отключён для user_id=%d", actor.user_id)
-                response = await conn.call()
+                response = await conn.call(on_delta=ci.on_delta)
             else:
                 conn.add_search_tool(search_params)
-                response = await conn.call()
+                response = await conn.call(on_delta=ci.on_delta)
             if response:
                 usage = response.get('usage', {})
                 metrics = self._extract_usage_metrics(usage)
@@ -1,6 +1,7 @@
 # /agent/managers/chats.py, updated 2025-07-20 15:45 EEST
 from .db import Database, DataTable
 from lib.file_link_prefix import strip_storage_prefix
+from lib.chat_change_hub import get_chat_change_hub
 from datetime import datetime
 import globals as g
 import asyncio
@@ -87,11 +88,18 @@ class ChatManager:
 
     @staticmethod
     def select_chat(session_id: int, user_id: int, chat_id: int):
+        row = g.sessions_table.select_row(columns=['active_chat'], conditions={'session_id': session_id})
+        prev_chat = row[0] if row and row[0] is not None else None
         g.sessions_table.insert_or_replace({
             'session_id': session_id,
             'user_id': user_id,
             'active_chat': chat_id
         })
+        # long-poll этой сессии ждёт прежний чат: будим только прежний и новый, не все чаты
+        hub = get_chat_change_hub()
+        if prev_chat is not None and int(prev_chat) != int(chat_id):
+            hub.notify(prev_chat)
+        hub.notify(chat_id)
         log.debug("Выбран активный чат id=%d для session_id=%s, user_id=%d", chat_id, session_id, user_id)
 
     @staticmethod
@@ -206,6 +214,7 @@ class ChatManager:
             log.debug("Повторный захват пользователем %s", user_name)
         else:
             busy[user_name] = now
+            get_chat_change_hub().notify(chat_id)
         self.chats_busy[chat_id] = busy
         log.debug("Чат %d занят пользователями %s ", chat_id, str(busy.keys))
 
@@ -213,6 +222,7 @@ class ChatManager:
         busy = self.chats_busy.get(chat_id, {})
         if user_name in busy:
             busy.pop(user_name)
+            get_chat_change_hub().notify(chat_id)
             log.debug("Чат %d разблокирован пользователем %s", chat_id, user_name)
 
     def sw_event(self, user_id: int, chat_id: int, action=None):
@@ -250,6 +260,16 @@ class ChatManager:
         log.debug("Возвращено %d чатов для user_id=%d", len(result), user_id)
         return result
 
+    def is_chat_owner(self, chat_id: int, user_id: int) -> bool:
+        """user_id явно указан в user_list чата (create_chat пишет туда создателя); 'all' владельцем не делает."""
+        row = self.chats_table.select_row(
+            columns=['user_list'],
+            conditions={'chat_id': chat_id}
+        )
+        if not row or not row[0]:
+            return False
+        return str(user_id) in [p.strip() for p in str(row[0]).split(',')]
+
     def create_chat(self, description, user_id, parent_msg_id=None):
         try:
             chat_id = self.chats_table.insert_into(
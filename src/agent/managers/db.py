@@ -1,4 +1,9 @@
 # /agent/managers/db.py, updated 2025-07-26 15:30 EEST
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.engine import URL
@@ -9,6 +14,28 @@ import toml
 
 log = globals.get_logger("db")
 
+# Размер кэша разобранных text()-выражений (разбор :bind-параметров выполняется один раз на текст запроса).
+_STMT_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=_STMT_CACHE_SIZE)
+def _stmt(query: str):
+    """Кэшированный TextClause: повторные запросы используют тот же объект и общий compiled cache SQLAlchemy."""
+    return text(query)
+
+
+def _env_int(key: str, default: int, lo: int, hi: int) -> int:
+    # runtime_config здесь недоступен (ConfigStore сам строится поверх Database) — только env.
+    try:
+        v = int(os.getenv(key, str(default)))
+    except ValueError:
+        v = default
+    return max(lo, min(v, hi))
+
+
+def _short_query(query: str) -> str:
+    return query[:50] + "..." if len(query) > 50 else query
+
 class Database:
     _instance = None
 
@@ -19,10 +46,46 @@ class Database:
         return cls._instance
 
     def __init__(self):
-        self.engine = create_engine(self._build_db_url(), echo=False)
+        db_url = self._build_db_url()
+        self.engine = create_engine(db_url, echo=False, **self._engine_options(db_url))
+        self._async = None
+        self._async_lock = threading.Lock()
+        self._tx_local = threading.local()
         self._init_tables()
         log.info("Инициализирована БД: %s", str(self.engine.url))
 
+    @staticmethod
+    def _engine_options(db_url: str) -> dict:
+        """Параметры пула соединений: CORE_DB_POOL_SIZE / CORE_DB_POOL_OVERFLOW / CORE_DB_POOL_RECYCLE_SEC."""
+        opts = {
+            "pool_size": _env_int("CORE_DB_POOL_SIZE", 8, 1, 64),
+            "max_overflow": _env_int("CORE_DB_POOL_OVERFLOW", 8, 0, 128),
+            "pool_timeout": _env_int("CORE_DB_POOL_TIMEOUT_SEC", 30, 1, 600),
+        }
+        if db_url.startswith("postgresql"):
+            opts["pool_pre_ping"] = True
+            opts["pool_recycle"] = _env_int("CORE_DB_POOL_RECYCLE_SEC", 1800, 60, 86_400)
+        elif ":memory:" in db_url:
+            return {}
+        else:
+            # Файловая SQLite: соединения из пула используются разными потоками (AsyncDatabase, to_thread).
+            opts["connect_args"] = {"check_same_thread": False, "timeout": 30}
+        return opts
+
+    def pool_size(self) -> int:
+        try:
+            return int(self.engine.pool.size())
+        except Exception:
+            return 1
+
+    def get_async(self) -> "AsyncDatabase":
+        """Асинхронный фасад над этим экземпляром (создаётся лениво, один на процесс)."""
+        if self._async is None:
+            with self._async_lock:
+                if self._async is None:
+                    self._async = AsyncDatabase(self)
+        return self._async
+
     @staticmethod
     def _load_runtime_config() -> dict:
         cfg_file = globals.CONFIG_FILE
@@ -212,47 +275,168 @@ class Database:
             )
         """)
 
+    @contextmanager
+    def transaction(self):
+        """Unit-of-work: все execute/fetch_* этого потока внутри блока идут через одно соединение
+        с одним commit в конце (rollback при исключении). Вложенные блоки присоединяются к внешнему.
+
+        Пример::
+
+            with db.transaction():
+                table.insert_into(...)
+                table.update(...)
+        """
+        conn = getattr(self._tx_local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        with self.engine.connect() as conn:
+            self._tx_local.conn = conn
+            self._tx_local.after_commit = []
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._tx_local.conn = None
+                callbacks, self._tx_local.after_commit = self._tx_local.after_commit, []
+            for cb in callbacks:  # только после успешного commit
+                try:
+                    cb()
+                except Exception as e:
+                    log.excpt("after_commit callback failed: ", e=e)
+
+    def in_transaction(self) -> bool:
+        return getattr(self._tx_local, "conn", None) is not None
+
+    def after_commit(self, callback):
+        """Вызвать callback после commit текущей транзакции потока (вне транзакции — сразу).
+        При rollback отложенные callback отбрасываются."""
+        if self.in_transaction():
+            self._tx_local.after_commit.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def _session(self):
+        """Соединение текущей транзакции (без commit) либо отдельное соединение с commit на выходе."""
+        conn = getattr(self._tx_local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        with self.engine.connect() as conn:
+            yield conn
+            conn.commit()
+
     def execute(self, query, params=None):
         try:
-            with self.engine.connect() as conn:
+            with self._session() as conn:
                 params = params if params is not None else {}
-                result = conn.execute(text(query), params)
-                conn.commit()
+                result = conn.execute(_stmt(query), params)
                 return result
         except SQLAlchemyError as e:
             log.excpt("Ошибка выполнения запроса: %s, params=~%s, error=%s",
-                      query[:50] + "..." if len(query) > 50 else query, str(params), str(e))
+                      _short_query(query), str(params), str(e))
             raise
 
     def fetch_one(self, query, params=None):
         try:
-            with self.engine.connect() as conn:
+            with self._session() as conn:
                 params = params if params is not None else {}
-                result = conn.execute(text(query), params)
-                row = result.fetchone()
-                conn.commit()
-                return row
+                result = conn.execute(_stmt(query), params)
+                return result.fetchone()
         except SQLAlchemyError as e:
             log.excpt("Ошибка fetch_one: %s, params=~%s, error=%s",
-                      query[:50] + "..." if len(query) > 50 else query, str(params), str(e))
+                      _short_query(query), str(params), str(e))
             raise
 
     def fetch_all(self, query, params=None):
         try:
-            with self.engine.connect() as conn:
+            with self._session() as conn:
                 params = params if params is not None else {}
-                result = conn.execute(text(query), params)
+                result = conn.execute(_stmt(query), params)
                 try:
                     rows = result.fetchall()
                 except Exception:
                     rows = []  # DDL/DML statements that don't return rows
-                conn.commit()
                 return rows
         except SQLAlchemyError as e:
             log.excpt("Ошибка fetch_all: %s, params=~%s, error=%s",
-                      query[:50] + "..." if len(query) > 50 else query, str(params), str(e))
+                      _short_query(query), str(params), str(e))
             raise
 
+    def execute_many(self, query, params_list) -> int:
+        """Один запрос для списка наборов параметров (executemany): одно соединение, один commit.
+
+        Returns:
+            int: число затронутых строк (если драйвер его сообщает), иначе len(params_list).
+        """
+        params_list = list(params_list or [])
+        if not params_list:
+            return 0
+        try:
+            with self._session() as conn:
+                result = conn.execute(_stmt(query), params_list)
+                rc = result.rowcount
+                return int(rc) if rc is not None and rc >= 0 else len(params_list)
+        except SQLAlchemyError as e:
+            log.excpt("Ошибка execute_many: %s, rows=%d, error=%s",
+                      _short_query(query), len(params_list), str(e))
+            raise
+
+    def fetch_batch(self, queries) -> list:
+        """Несколько SELECT по одному соединению: [(query, params), ...] → [rows, ...] в том же порядке."""
+        out = []
+        query = ""
+        try:
+            with self._session() as conn:
+                for query, params in queries:
+                    result = conn.execute(_stmt(query), params if params is not None else {})
+                    out.append(result.fetchall())
+            return out
+        except SQLAlchemyError as e:
+            log.excpt("Ошибка fetch_batch: %s, error=%s", _short_query(query), str(e))
+            raise
+
+
+class AsyncDatabase:
+    """Асинхронный фасад Database для корутин (routes/*, async-методы менеджеров).
+
+    Запросы выполняются в выделенном пуле потоков по размеру пула соединений, поэтому event loop
+    Uvicorn не блокируется, а БД-нагрузка не конкурирует с прочими задачами asyncio.to_thread.
+    Синхронный API Database остаётся основным для фоновых воркеров и скриптов.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        workers = _env_int("CORE_DB_ASYNC_WORKERS", db.pool_size(), 1, 64)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-async")
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить произвольный синхронный вызов (метод менеджера/DataTable) в пуле БД."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def execute(self, query, params=None):
+        return await self.run(self.db.execute, query, params)
+
+    async def fetch_one(self, query, params=None):
+        return await self.run(self.db.fetch_one, query, params)
+
+    async def fetch_all(self, query, params=None):
+        return await self.run(self.db.fetch_all, query, params)
+
+    async def execute_many(self, query, params_list) -> int:
+        return await self.run(self.db.execute_many, query, params_list)
+
+    async def fetch_batch(self, queries) -> list:
+        return await self.run(self.db.fetch_batch, queries)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
 
 class DataTable:
     def __init__(self, table_name: str, template: list):
@@ -262,6 +446,10 @@ class DataTable:
         self.create()
         self.upgrade()
 
+    def transaction(self):
+        """См. Database.transaction: несколько операций таблицы в одном соединении и одном commit."""
+        return self.db.transaction()
+
     def create(self):
         try:
             fields = ", ".join(self._normalized_template())
@@ -367,8 +555,11 @@ class DataTable:
 
             insert_type = "INSERT OR IGNORE" if ignore else "INSERT"
             query = f"{insert_type} INTO {self.table_name} ({fields}) VALUES ({placeholders})"
-            self.db.execute(query, values)
-            return self.db.fetch_one(f"SELECT last_insert_rowid()")[0]
+            result = self.db.execute(query, values)
+            # lastrowid того же курсора: без второго запроса через другое соединение пула.
+            if ignore and result.rowcount == 0:
+                return None
+            return result.lastrowid
         except Exception as e:
             log.excpt("Не удалось вставить в %s: %s", self.table_name, str(e))
             raise
@@ -401,8 +592,7 @@ class DataTable:
                 return row[0] if row else values.get(returning_pk)
 
             query = f"INSERT OR REPLACE INTO {self.table_name} ({fields}) VALUES ({placeholders})"
-            self.db.execute(query, values)
-            return self.db.fetch_one(f"SELECT last_insert_rowid()")[0]
+            return self.db.execute(query, values).lastrowid
         except Exception as e:
             log.excpt("Не удалось вставить или заменить в %s: %s", self.table_name, str(e))
             raise
@@ -487,4 +677,14 @@ class DataTable:
             raise
 
     def select_row(self, columns: list = None, conditions=None, order_by: str = None, joins: list = None):
-        return self.select_from(columns, conditions, order_by, limit=1, joins=joins, fetch_all=False)
\ No newline at end of file
+        return self.select_from(columns, conditions, order_by, limit=1, joins=joins, fetch_all=False)
+
+    async def aselect_from(self, columns: list = None, conditions=None, order_by: str = None,
+                           limit: int = None, joins: list = None, fetch_all: bool = True):
+        """select_from через AsyncDatabase (не блокирует event loop)."""
+        return await self.db.get_async().run(
+            self.select_from, columns, conditions, order_by, limit, joins, fetch_all
+        )
+
+    async def aselect_row(self, columns: list = None, conditions=None, order_by: str = None, joins: list = None):
+        return await self.aselect_from(columns, conditions, order_by, limit=1, joins=joins, fetch_all=False)
\ No newline at end of file
@@ -19,14 +19,21 @@ from lib.text_bytes import (
     normalize_codec_name,
     normalize_eol_label,
 )
-from lib.file_type_detector import NON_CODE_TEXT_EXTENSIONS
+from lib.file_type_detector import NON_CODE_TEXT_EXTENSIONS, get_file_type_cache
+from lib.file_tree_level import level_entries, level_query, prefix_sql
 from lib.file_attr import FA_CODE_FILE, FA_UNIX_MODE_DEFAULT
+from lib.file_content_cache import get_file_content_cache
 
 log = globals.get_logger("fileman")
 
 # Минимум строк выборки, после которого при verify_links логируем #PERF (только если notify_heavy_ops).
 _PERF_VERIFY_LINKS_ROW_WARN = 80
 
+# Размеры пачек для bulk_* (IN-списки имён и id, executemany вставок).
+_BULK_NAMES_CHUNK = 400
+_BULK_IDS_CHUNK = 900
+_BULK_INSERT_CHUNK = 1000
+
 
 def _mark_project_scan_stale(project_id: int, reason: str):
     try:
@@ -56,11 +63,6 @@ def _mod_time(file_name: str, project_id: int):
     return os.path.getmtime(qfn)
 
 
-def _like_escape(value: str) -> str:
-    """% _ \\ для шаблона LIKE с ESCAPE '\\' (PostgreSQL, SQLite)."""
-    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
-
-
 def _calc_segments(path: str) -> int:
     """Сегментов в пути после снятия маркера ссылки (®/@) и нормализации слэшей (как в file_tree)."""
     s = strip_storage_prefix(str(path)).replace("\\", "/").strip("/")
@@ -70,38 +72,12 @@ def _calc_segments(path: str) -> int:
 
 
 _seg_lock = threading.Lock()
+_type_seed_lock = threading.Lock()
+_type_seeded: set[int] = set()
 _seg_ready = False
 _seg_idx_ok = False
 
 
-def _prefix_sql(path_prefix: str) -> tuple[str, dict]:
-    """Фрагмент WHERE: ссылка ®path или @path под префиксом; плюс legacy без маркера."""
-    pn = str(path_prefix).replace("\\", "/").strip("/")
-    if not pn:
-        return "", {}
-    esc = _like_escape(pn)
-    return (
-        "("
-        "(file_name LIKE :_tree_pfx_like_ref ESCAPE '\\' OR file_name = :_tree_pfx_eq_ref OR "
-        "file_name LIKE :_tree_pfx_like_at ESCAPE '\\' OR file_name = :_tree_pfx_eq_at) OR "
-        "("
-        "file_name NOT LIKE :_pfxscan_ref AND file_name NOT LIKE :_pfxscan_at "
-        "AND (file_name LIKE :_tree_pfx_like_plain ESCAPE '\\' OR file_name = :_tree_pfx_eq_plain)"
-        ")"
-        ")",
-        {
-            "_tree_pfx_like_ref": f"{REF}{esc}/%",
-            "_tree_pfx_eq_ref": f"{REF}{pn}",
-            "_tree_pfx_like_at": f"@{esc}/%",
-            "_tree_pfx_eq_at": f"@{pn}",
-            "_pfxscan_ref": f"{REF}%",
-            "_pfxscan_at": "@%",
-            "_tree_pfx_like_plain": f"{esc}/%",
-            "_tree_pfx_eq_plain": pn,
-        },
-    )
-
-
 class FileManager:
     """Хранилище ссылок на файлы проектов. Параметр ``notify_heavy_ops`` задаёт хост-приложение:
     при ``True`` (типично HTTP-ядро) при тяжёлых операциях (крупный ``file_index`` с ``verify_links``, далее — прочие
@@ -117,6 +93,28 @@ class FileManager:
 
         return file_type_detector.is_acceptable_file(file_path)
 
+    def seed_file_type_cache(self, project_id: int, projects_dir: Path) -> int:
+        """Один раз на проект и процесс: сигнатуры file_type_sig из attached_files → кеш вердиктов по содержимому."""
+        pid = int(project_id)
+        with _type_seed_lock:
+            if pid in _type_seeded:
+                return 0
+            _type_seeded.add(pid)
+        try:
+            rows = self.db.fetch_all(
+                "SELECT file_name, file_type_sig FROM attached_files "
+                "WHERE project_id = :pid AND file_type_sig IS NOT NULL",
+                {"pid": pid},
+            )
+        except Exception as e:
+            log.warn("seed_file_type_cache: project_id=%d: %s", pid, str(e))
+            return 0
+        items = ((str(projects_dir / strip_storage_prefix(str(fn)).lstrip("/")), sig) for fn, sig in rows)
+        n = get_file_type_cache().seed(items)
+        if n:
+            log.debug("seed_file_type_cache: project_id=%d сигнатур=%d", pid, n)
+        return n
+
     def __init__(self, *, notify_heavy_ops: bool = False):
         self.notify_heavy_ops = bool(notify_heavy_ops)
         self.db = Database.get_database()
@@ -135,6 +133,7 @@ class FileManager:
                 "file_encoding TEXT",
                 "file_eol TEXT",
                 f"file_attr INTEGER DEFAULT {FA_UNIX_MODE_DEFAULT}",
+                "file_type_sig TEXT",
                 "FOREIGN KEY (project_id) REFERENCES projects(id)"
             ]
         )
@@ -254,16 +253,45 @@ class FileManager:
             if updated:
                 log.info("path_seg_count: заполнено столбцов для дерева файлов, строк=%d", updated)
             if not _seg_idx_ok:
+                # file_name третьей колонкой: срез одного уровня (list_tree_level) читается из индекса целиком;
+                # прежний (project_id, path_seg_count) — его префикс и больше не нужен.
                 try:
                     self.db.execute(
-                        "CREATE INDEX IF NOT EXISTS idx_attached_files_project_path_seg "
-                        "ON attached_files (project_id, path_seg_count)"
+                        "CREATE INDEX IF NOT EXISTS idx_attached_files_project_seg_name "
+                        "ON attached_files (project_id, path_seg_count, file_name)"
                     )
+                    self.db.execute("DROP INDEX IF EXISTS idx_attached_files_project_path_seg")
                 except Exception as e:
                     log.debug("CREATE INDEX path_seg_count: %s", e)
                 _seg_idx_ok = True
             _seg_ready = True
 
+    def list_tree_level(
+        self,
+        project_id: int | None,
+        path: str = "",
+        *,
+        cursor: str | None = None,
+        limit: int = 500,
+    ) -> dict:
+        """Один уровень дерева под path: подкаталоги (с числом файлов внутри) и файлы, одним запросом к БД.
+
+        SQL — lib/file_tree_level.level_query (без выгрузки всего индекса проекта). Порядок: каталоги, затем
+        файлы, по имени. cursor — значение ``next_cursor`` предыдущей страницы («d:имя» / «f:имя»).
+        """
+        self.ensure_tree_segments()
+        limit = max(1, int(limit))
+        query, params, pn = level_query(
+            project_id, path, cursor=cursor, limit=limit, ttl_max=self.missing_ttl_max, postgres=self.db.is_postgres()
+        )
+        t0 = time.monotonic()
+        rows = self.db.fetch_all(query, params)
+        elapsed = time.monotonic() - t0
+        if self.notify_heavy_ops and elapsed >= 1.0:
+            log.warn("#PERF list_tree_level project_id=%s path=%s took=%.2fs rows=%d",
+                     str(project_id), pn or "/", elapsed, len(rows))
+        return level_entries(rows, pn, limit)
+
     @property
     def missing_ttl_max(self) -> int:
         return get_int("FILE_LINK_TTL_MAX", 3, 1, 10_000)
@@ -566,16 +594,24 @@ class FileManager:
         content = None
         if file_data['content'] is None:
             file_path = _qfn(file_name, project_id)
-            if not file_path.exists():
-                log.warn("Реальный файл %s не существует", str(file_path))
-                return None
+            cache = get_file_content_cache()
             try:
-                raw = file_path.read_bytes()
-            except OSError as e:
-                log.warn("Не удалось прочитать %s: %s", str(file_path), e)
+                st = file_path.stat()
+            except OSError:
+                cache.invalidate(file_id)
+                log.warn("Реальный файл %s не существует", str(file_path))
                 return None
-            decoded = decode_file_bytes(raw)
+            path_key = str(file_path)
+            decoded = cache.get(file_id, path_key, st.st_mtime_ns, st.st_size)
             if decoded is None:
+                try:
+                    raw = file_path.read_bytes()
+                except OSError as e:
+                    log.warn("Не удалось прочитать %s: %s", str(file_path), e)
+                    return None
+                decoded = decode_file_bytes(raw) or (None, None, None)
+                cache.put(file_id, path_key, st.st_mtime_ns, st.st_size, *decoded)
+            if decoded[0] is None:
                 log.debug("Файл не текст или бинарный, пропуск %s (file_id=%d)", file_name, file_id)
                 return None
             content, src_enc, src_eol = decoded
@@ -620,12 +656,13 @@ class FileManager:
         if len(file_name) > 300:
             raise ValueError(f"Слишком длинное имя файла {len(file_name)}")
         # exists() returns bool, but add_file must work with numeric id.
-        file_id = self.find(file_name, project_id=project_id)
-        if file_id is not None:
-            # Preserve file_id and re-activate degraded link during scan/update paths.
-            self._mark_link_healthy(file_id)
-            self._refresh_file_attr_mode(file_id, file_name, project_id)
-            return file_id
+        with self.db.transaction():
+            file_id = self.find(file_name, project_id=project_id)
+            if file_id is not None:
+                # Preserve file_id and re-activate degraded link during scan/update paths.
+                self._mark_link_healthy(file_id)
+                self._refresh_file_attr_mode(file_id, file_name, project_id)
+                return file_id
         if timestamp is None:
             timestamp = int(time.time())
 
@@ -635,10 +672,11 @@ class FileManager:
         if timestamp is None:
             timestamp = _mod_time(file_name, project_id)
 
-        file_id = self._add_link(file_name, project_id, timestamp)
-        if file_id is None:
-            # On PostgreSQL with conflict-ignore, insert may return None; reuse existing link id.
-            file_id = self.find(file_name, project_id=project_id)
+        with self.db.transaction():
+            file_id = self._add_link(file_name, project_id, timestamp)
+            if file_id is None:
+                # With conflict-ignore, insert may return None; reuse existing link id.
+                file_id = self.find(file_name, project_id=project_id)
         _mark_project_scan_stale(project_id, reason='file_added')
         log.debug("Добавлен файл id=%s, file_name=%s, project_id=%s", str(file_id), file_name, str(project_id))
         return file_id
@@ -662,6 +700,208 @@ class FileManager:
             ignore=True
         )
 
+    def _fetch_links_by_names(self, project_id: int, names: list[str]) -> dict[str, tuple[int, int, int, str | None]]:
+        """Существующие ссылки проекта для набора путей: clean_name → (id, missing_ttl, file_attr, file_type_sig)."""
+        ttl_max = self.missing_ttl_max
+        found: dict[str, tuple[int, int, int, str | None]] = {}
+        for i in range(0, len(names), _BULK_NAMES_CHUNK):
+            part = names[i:i + _BULK_NAMES_CHUNK]
+            params = {"pid": int(project_id), "ttl": ttl_max, "dflt": int(FA_UNIX_MODE_DEFAULT)}
+            keys = []
+            for j, fn in enumerate(part):
+                params[f"r{j}"] = store_storage_path(fn)
+                params[f"a{j}"] = LEGACY_AT + fn
+                keys.append(f":r{j}, :a{j}")
+            rows = self.db.fetch_all(
+                "SELECT id, file_name, COALESCE(missing_ttl, :ttl), COALESCE(file_attr, :dflt), file_type_sig "
+                f"FROM attached_files WHERE project_id = :pid AND file_name IN ({', '.join(keys)}) ORDER BY id",
+                params,
+            )
+            legacy: set[str] = set()
+            for fid, stored, ttl, attr, sig in rows:
+                clean = strip_storage_prefix(str(stored))
+                is_ref = str(stored).startswith(REF)
+                # как find(): ® предпочтительнее legacy @, среди равных — минимальный id
+                if clean in found and not (is_ref and clean in legacy):
+                    continue
+                found[clean] = (int(fid), int(ttl), int(attr), sig)
+                if is_ref:
+                    legacy.discard(clean)
+                else:
+                    legacy.add(clean)
+        return found
+
+    def links_missing_ttl(self, project_id: int, names: list[str]) -> dict[str, tuple[int, int]]:
+        """Существующие ссылки проекта для путей: clean_name → (id, missing_ttl); отсутствующих в БД нет в ответе."""
+        return {fn: (rec[0], rec[1]) for fn, rec in self._fetch_links_by_names(project_id, names).items()}
+
+    def bulk_set_missing_ttl(self, ids_by_ttl: dict[int, list[int]], checked_ts: int | None = None) -> int:
+        """Массовое обновление missing_ttl: {ttl: [id, ...]} → UPDATE ... WHERE id IN (...) пачками."""
+        checked_value = int(time.time()) if checked_ts is None else int(checked_ts)
+        total = 0
+        with self.db.transaction():
+            for ttl, ids in ids_by_ttl.items():
+                ttl_v = max(0, min(int(ttl), self.missing_ttl_max))
+                for i in range(0, len(ids), _BULK_IDS_CHUNK):
+                    part = ids[i:i + _BULK_IDS_CHUNK]
+                    safe_ids = ",".join(str(int(x)) for x in part)
+                    self.db.execute(
+                        "UPDATE attached_files SET missing_ttl = :ttl, missing_checked_ts = :checked "
+                        f"WHERE id IN ({safe_ids})",
+                        {"ttl": ttl_v, "checked": checked_value},
+                    )
+                    total += len(part)
+        return total
+
+    def bulk_touch_links(self, project_id: int, stamps: dict[str, int]) -> int:
+        """Обновить ts существующих ссылок по mtime с диска: {file_name: ts}. Возвращает число изменённых строк.
+
+        ts в attached_files — вход compute_dirty инкрементального code_index; без этого правка файла
+        без смены размера не попадает в dirty до полного scan.
+        """
+        if not stamps:
+            return 0
+        pid = int(project_id)
+        rows: list[dict] = []
+        for fn, (fid, _ttl, _attr, _sig) in self._fetch_links_by_names(pid, list(stamps.keys())).items():
+            rows.append({"id": fid, "ts": int(stamps[fn])})
+        if not rows:
+            return 0
+        changed = self.db.execute_many("UPDATE attached_files SET ts = :ts WHERE id = :id AND COALESCE(ts, 0) <> :ts", rows)
+        if changed:
+            _mark_project_scan_stale(pid, reason="file_updated")
+        return changed
+
+    def bulk_purge_links(self, project_id: int, file_ids: list[int]) -> int:
+        """Пакетный unlink: file_spans и attached_files по списку id, одна транзакция."""
+        ids = sorted({int(x) for x in (file_ids or []) if int(x) > 0})
+        if not ids:
+            return 0
+        with self.db.transaction():
+            for i in range(0, len(ids), _BULK_IDS_CHUNK):
+                safe_ids = ",".join(str(x) for x in ids[i:i + _BULK_IDS_CHUNK])
+                self.db.execute(f"DELETE FROM file_spans WHERE file_id IN ({safe_ids})")
+                self.db.execute(f"DELETE FROM attached_files WHERE id IN ({safe_ids})")
+        cache = get_file_content_cache()
+        for fid in ids:
+            cache.invalidate(fid)
+        log.debug("bulk_purge_links: project_id=%s удалено строк=%d", str(project_id), len(ids))
+        _mark_project_scan_stale(int(project_id), reason="stale_link_ttl_purged")
+        return len(ids)
+
+    def bulk_reconcile_links(self, project_id: int, entries: list[dict]) -> dict:
+        """Пакетный аналог add_file(name, None, ts, project_id) для путей, уже прошедших is_acceptable_file.
+
+        entries: [{'file_name': str, 'ts': int|float, 'mode': int | None, 'type_sig': str | None}, ...];
+        ``mode`` — биты st_mode из уже сделанного stat (иначе stat выполняется здесь), ``type_sig`` —
+        сигнатура вердикта по содержимому (FileTypeCache.signature) для file_type_sig. Существующим ссылкам
+        восстанавливается TTL и биты режима в file_attr, новые вставляются через executemany.
+
+        Returns:
+            dict: {'existing', 'recovered', 'attr_updated', 'sig_updated', 'added', 'ids': {file_name: id}}
+        """
+        stats = {"existing": 0, "recovered": 0, "attr_updated": 0, "sig_updated": 0, "added": 0, "ids": {}}
+        if project_id is None:
+            for ent in entries:
+                fid = self.add_file(ent["file_name"], None, ent.get("ts"), project_id)
+                stats["ids"][str(ent["file_name"]).lstrip("/")] = fid
+                stats["added"] += 1
+            return stats
+        pid = int(project_id)
+        by_name: dict[str, dict] = {}
+        for ent in entries:
+            fn = str(ent["file_name"]).lstrip("/")
+            if len(fn) > 300:
+                log.warn("bulk_reconcile_links: слишком длинное имя файла %d, пропуск", len(fn))
+                continue
+            by_name[fn] = ent
+        if not by_name:
+            return stats
+        ttl_max = self.missing_ttl_max
+        now_ts = int(time.time())
+        existing = self._fetch_links_by_names(pid, list(by_name.keys()))
+        healthy_ids: list[int] = []
+        attr_rows: list[dict] = []
+        sig_rows: list[dict] = []
+        insert_rows: list[dict] = []
+        for fn, ent in by_name.items():
+            mode_bits = ent.get("mode")
+            if mode_bits is None:
+                mode_bits = self._disk_mode_bits(fn, pid)
+            mode_bits = int(mode_bits) & 0xFFFF
+            rec = existing.get(fn)
+            if rec is not None:
+                fid, ttl, attr, sig = rec
+                stats["ids"][fn] = fid
+                new_sig = ent.get("type_sig")
+                if new_sig and new_sig != sig:
+                    sig_rows.append({"id": fid, "sig": new_sig})
+                # как _mark_link_healthy: TTL и missing_checked_ts обновляются у всех найденных ссылок
+                healthy_ids.append(fid)
+                if ttl < ttl_max:
+                    stats["recovered"] += 1
+                    log.info("TTL-recover link id=%d ttl=%d->%d", fid, ttl, ttl_max)
+                _old_mode, high_bits = self._split_file_attr(attr)
+                merged = int(high_bits | mode_bits)
+                if merged != attr:
+                    attr_rows.append({"id": fid, "attr": merged})
+                continue
+            stored = store_storage_path(fn)
+            ext = Path(fn).suffix.lower()
+            flags = 0 if ext in NON_CODE_TEXT_EXTENSIONS else FA_CODE_FILE
+            ts = ent.get("ts")
+            insert_rows.append({
+                "content": None,
+                "ts": ts if ts is not None else now_ts,
+                "file_name": stored,
+                "path_seg_count": _calc_segments(stored),
+                "missing_ttl": ttl_max,
+                "missing_checked_ts": now_ts,
+                "project_id": pid,
+                "file_encoding": "utf-8",
+                "file_eol": "lf",
+                "file_attr": int(mode_bits | flags),
+                "file_type_sig": ent.get("type_sig"),
+            })
+        stats["existing"] = len(existing)
+        with self.db.transaction():
+            if healthy_ids:
+                self.bulk_set_missing_ttl({ttl_max: healthy_ids}, now_ts)
+            if attr_rows:
+                self.db.execute_many("UPDATE attached_files SET file_attr = :attr WHERE id = :id", attr_rows)
+                stats["attr_updated"] = len(attr_rows)
+            if sig_rows:
+                self.db.execute_many("UPDATE attached_files SET file_type_sig = :sig WHERE id = :id", sig_rows)
+                stats["sig_updated"] = len(sig_rows)
+            if insert_rows:
+                # Параллельный scan мог вставить те же ссылки после выборки выше: перепроверка внутри
+                # транзакции и те же insert-ignore семантики, что у _add_link (insert_into(ignore=True)).
+                raced = self._fetch_links_by_names(pid, [strip_storage_prefix(r["file_name"]) for r in insert_rows])
+                if raced:
+                    insert_rows = [r for r in insert_rows if strip_storage_prefix(r["file_name"]) not in raced]
+                    stats["existing"] += len(raced)
+            if insert_rows:
+                cols = list(insert_rows[0].keys())
+                values = f"VALUES ({', '.join(':' + c for c in cols)})"
+                if self.db.is_postgres():
+                    query = f"INSERT INTO attached_files ({', '.join(cols)}) {values} ON CONFLICT DO NOTHING"
+                else:
+                    query = f"INSERT OR IGNORE INTO attached_files ({', '.join(cols)}) {values}"
+                added = 0
+                for i in range(0, len(insert_rows), _BULK_INSERT_CHUNK):
+                    added += int(self.db.execute_many(query, insert_rows[i:i + _BULK_INSERT_CHUNK]) or 0)
+                stats["added"] = added
+        if insert_rows:
+            added_names = [strip_storage_prefix(r["file_name"]) for r in insert_rows]
+            for fn, rec in self._fetch_links_by_names(pid, added_names).items():
+                stats["ids"][fn] = rec[0]
+            _mark_project_scan_stale(pid, reason="file_added")
+        log.debug(
+            "bulk_reconcile_links: project_id=%d entries=%d existing=%d recovered=%d attr_updated=%d added=%d",
+            pid, len(by_name), stats["existing"], stats["recovered"], stats["attr_updated"], stats["added"],
+        )
+        return stats
+
     def update_file(self, file_id: int, content: str, timestamp=None, project_id=None):
         if not self.link_valid(file_id):
             log.error("Файл id=%d не найден для обновления", file_id)
@@ -742,6 +982,7 @@ class FileManager:
             try:
                 os.makedirs(new_path.parent, exist_ok=True)
                 os.rename(old_path, new_path)
+                get_file_content_cache().invalidate(int(file_id))
                 os.chown(new_path, pwd.getpwnam('agent').pw_uid, -1)
                 log.debug("Moved file_id=%d from %s to %s", file_id, old_file_name, new_name)
             except Exception as e:
@@ -771,8 +1012,10 @@ class FileManager:
     def unlink(self, file_id: int):
         if file_id > 0:
             fid = int(file_id)
-            self.db.execute("DELETE FROM file_spans WHERE file_id = :fid", {"fid": fid})
-            self.files_table.delete_from(conditions={"id": fid})
+            with self.db.transaction():
+                self.db.execute("DELETE FROM file_spans WHERE file_id = :fid", {"fid": fid})
+                self.files_table.delete_from(conditions={"id": fid})
+            get_file_content_cache().invalidate(fid)
             log.debug("Удалена запись файла id=%d через unlink", file_id)
 
     def purge_stale_attached_row(self, file_id: int, project_id: int) -> None:
@@ -893,6 +1136,10 @@ class FileManager:
             except Exception as e:
                 log.excpt("Ошибка записи в %s: ", str(safe_path), e=e)
                 return 0
+            finally:
+                if file_id is not None:
+                    # запись в пределах шага mtime без смены размера stat-ключ кэша не отличит
+                    get_file_content_cache().invalidate(int(file_id))
             try:
                 os.chown(safe_path, pwd.getpwnam('agent').pw_uid, -1)
                 log.debug("Установлен владелец agent для файла: %s", file_name)
@@ -997,7 +1244,7 @@ class FileManager:
             params['file_attr_default'] = int(FA_UNIX_MODE_DEFAULT)
             params['code_file_bit'] = int(FA_CODE_FILE)
         if path_prefix:
-            frag, extra = _prefix_sql(path_prefix)
+            frag, extra = prefix_sql(path_prefix)
             if frag:
                 clauses.append(frag)
                 params.update(extra)
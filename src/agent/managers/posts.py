@@ -1,15 +1,26 @@
 # /app/agent/managers/posts.py, updated 2025-07-27 14:00 EEST
 import json
+import os
 import time
 import re
 import asyncio
+import threading
+from collections import OrderedDict
 from managers.db import Database, DataTable
 from managers.project import ProjectManager
 import globals as g
 from lib.basic_logger import BasicLogger
+from lib.chat_change_hub import get_chat_change_hub
+from lib.chat_change_journal import ChatChangeJournal
 
 log = g.get_logger("postman")
 
+# Журнал chat_changes: хранение и выборка
+_CHANGES_TTL_SEC = max(3600, int(os.environ.get("CORE_CHAT_CHANGES_TTL_SEC", str(7 * 86400))))
+_CHANGES_PRUNE_EVERY = 500
+_CHANGES_FETCH_LIMIT = 1000
+_HISTORY_CACHE_CHATS = max(4, int(os.environ.get("CORE_CHAT_HISTORY_CACHE_CHATS", "64")))
+
 
 class PostManager:
     """Управляет сообщениями и их историей в чат-приложении."""
@@ -21,7 +32,11 @@ class PostManager:
         """
         self.user_manager = user_manager
         self.db = Database.get_database()
-        self.changes_history = {}
+        self._changes_added = 0
+        # Кэш собственных постов чатов для scan_history: chat_id → запись (LRU), см. _chat_posts_entry
+        self._history_cache = OrderedDict()
+        self._history_lock = threading.RLock()
+        self._history_stats = {'hits': 0, 'incremental': 0, 'misses': 0}
         self.posts_table = DataTable(
             table_name="posts",
             template=[
@@ -39,6 +54,20 @@ class PostManager:
                 "FOREIGN KEY (user_id) REFERENCES users(id)"
             ]
         )
+        # Журнал изменений чатов: курсор клиентов — chat_seq (счётчик чата в порядке commit, см. ChatChangeJournal)
+        self.changes_table = DataTable(
+            table_name="chat_changes",
+            template=[
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT",
+                "chat_id INTEGER",
+                "post_id INTEGER",
+                "action TEXT",
+                "ts INTEGER",
+                "chat_seq INTEGER"
+            ]
+        )
+        self.journal = ChatChangeJournal(self.db, fetch_limit=_CHANGES_FETCH_LIMIT)
+        self._ensure_changes_index()
         self.users_table = DataTable(
             table_name="users",
             template=[
@@ -49,43 +78,80 @@ class PostManager:
             ]
         )
 
-    def add_change(self, chat_id: int, post_id: int, action: str):
-        """Добавляет изменение (add/edit/delete) в историю изменений чата.
+    def _ensure_changes_index(self):
+        try:
+            self.journal.ensure_schema()
+        except Exception as e:
+            log.excpt("Не удалось подготовить журнал chat_changes: ", e=e)
+
+    def add_change(self, chat_id: int, post_id: int, action: str) -> int | None:
+        """Добавляет изменение (add/edit/delete) в журнал изменений чата.
+
+        Запись идёт в транзакции вызывающего (атомарно с самим постом); уведомление
+        long-poll/SSE ожидающих — только после commit.
 
         Args:
             chat_id (int): ID чата.
             post_id (int): ID поста.
             action (str): Тип действия (add/edit/delete).
-        """
-        if chat_id not in self.changes_history:
-            self.changes_history[chat_id] = []
-        effective_post_id = -post_id if action == "delete" else post_id
-        self.changes_history[chat_id].append(effective_post_id)
-        log.debug("Added change for chat_id=%d, post_id=%d, action=%s", chat_id, effective_post_id, action)
 
-    def get_changes(self, chat_id: int) -> list:
-        """Возвращает список изменений для указанного chat_id.
+        Returns:
+            int | None: chat_seq записи журнала.
+        """
+        now = int(time.time())
+        seq = self.journal.record(chat_id, post_id, action, now)
+        self.db.after_commit(lambda: get_chat_change_hub().notify(chat_id))
+        self._changes_added += 1
+        if self._changes_added % _CHANGES_PRUNE_EVERY == 0:
+            self.db.after_commit(lambda: self.prune_changes(now - _CHANGES_TTL_SEC))
+        log.debug("Added change seq=%s for chat_id=%d, post_id=%d, action=%s", str(seq), chat_id, post_id, action)
+        return seq
+
+    def last_seq(self, chat_id: int) -> int:
+        """Последний закоммиченный chat_seq журнала изменений чата (0, если изменений не было)."""
+        return self.journal.last_seq(chat_id)
+
+    def get_changes_since(self, chat_id: int, since_seq: int = 0) -> tuple[list, int]:
+        """Изменения чата с chat_seq > since_seq (индексный диапазон по (chat_id, chat_seq)).
 
         Args:
             chat_id (int): ID чата.
+            since_seq (int): Последний chat_seq, уже обработанный клиентом.
 
         Returns:
-            list: Список изменений (post_id с учётом действия).
+            tuple[list, int]: post_id с учётом действия (отрицательный — удаление) и последний chat_seq.
         """
-        changes = self.changes_history.get(chat_id, [])
+        changes, last = self.journal.changes_since(chat_id, since_seq)
         if changes:
-            log.debug("Retrieved changes for chat_id=%d: ~%s", chat_id, str(changes))
-        return changes
+            log.debug("Retrieved changes for chat_id=%d since seq=%d: ~%s", chat_id, since_seq, str(changes))
+        return changes, last
 
-    def clear_changes(self, chat_id: int):
-        """Очищает историю изменений для указанного chat_id.
+    def get_changes(self, chat_id: int, since_seq: int = 0) -> list:
+        """Возвращает список изменений для указанного chat_id после since_seq.
 
         Args:
             chat_id (int): ID чата.
+            since_seq (int): Последний обработанный seq.
+
+        Returns:
+            list: Список изменений (post_id с учётом действия).
         """
-        if chat_id in self.changes_history:
-            log.debug("Cleared changes for chat_id=%d", chat_id)
-            self.changes_history[chat_id] = []
+        return self.get_changes_since(chat_id, since_seq)[0]
+
+    def changes_cursor_expired(self, chat_id: int, since_seq: int) -> bool:
+        """Изменения после since_seq частично удалены prune_changes: продолжать по журналу нельзя, нужна полная история."""
+        return self.journal.cursor_expired(chat_id, since_seq)
+
+    def prune_changes(self, older_than_ts: int) -> int:
+        """Удаляет записи журнала старше older_than_ts; курсоры ниже удалённых chat_seq — см. changes_cursor_expired."""
+        try:
+            removed = self.journal.prune(older_than_ts)
+            if removed:
+                log.debug("Pruned %d chat_changes rows older than %d", removed, older_than_ts)
+            return removed
+        except Exception as e:
+            log.excpt("Ошибка очистки chat_changes: ", e=e)
+            return 0
 
     def get_quotes(self, history: dict) -> dict:
         """Извлекает цитаты из истории постов для указанного chat_id.
@@ -258,18 +324,19 @@ class PostManager:
         try:
             timestamp = int(time.time())
             message = message.strip()
-            post_id = self.posts_table.insert_into({
-                'chat_id': chat_id,
-                'user_id': user_id,
-                'message': message,
-                'timestamp': timestamp,
-                'rql': rql,
-                'reply_to': reply_to,
-                'elapsed': elapsed
-            })
-            if post_id is None:
-                raise ValueError("Failed to retrieve inserted post id")
-            self.add_change(chat_id, post_id, "add")
+            with self.posts_table.transaction():
+                post_id = self.posts_table.insert_into({
+                    'chat_id': chat_id,
+                    'user_id': user_id,
+                    'message': message,
+                    'timestamp': timestamp,
+                    'rql': rql,
+                    'reply_to': reply_to,
+                    'elapsed': elapsed
+                })
+                if post_id is None:
+                    raise ValueError("Failed to retrieve inserted post id")
+                self.add_change(chat_id, post_id, "add")
             log.debug("Сохранено сообщение post_id=%d, chat_id=%d, user_id=%d, rql=%d, reply_to=%s, message=%s",
                       post_id, chat_id, user_id, rql, str(reply_to), message[:50])
             post = {
@@ -318,61 +385,24 @@ class PostManager:
                 result[i] = row[i]
         return result
 
-    def scan_history(self, chat_id: int, visited: set = None, before_id: int = None) -> dict:
-        """Рекурсивно собирает историю постов для указанного chat_id, включая родительские чаты.
-
-        Args:
-            chat_id (int): ID чата.
-            visited (set, optional): Множество посещённых chat_id для предотвращения циклов.
-            before_id (int, optional): ID поста, до которого собирается история.
-
-        Returns:
-            dict: История постов с метаданными.
-        """
-        if visited is None:
-            visited = set()
-        if chat_id in visited:
-            log.debug("Цикл обнаружен для chat_id=%d, пропуск", chat_id)
-            return {}
-        visited.add(chat_id)
-        history = {}
-        post_ids = []
-        path = visited.copy()
-        # Проверка наличия родительского чата
-        parent_msg_row = self.db.fetch_one(
-            'SELECT parent_msg_id FROM chats WHERE chat_id = :chat_id',
-            {'chat_id': chat_id}
-        )
-        parent_msg_id = parent_msg_row[0] if parent_msg_row else None
-        if parent_msg_id:
-            # Поиск родительского чата
-            parent_chat_row = self.db.fetch_one(
-                'SELECT chat_id FROM posts WHERE id = :parent_msg_id',
-                {'parent_msg_id': parent_msg_id}
-            )
-            parent_chat_id = parent_chat_row[0] if parent_chat_row else None
-            if parent_chat_id:
-                # Рекурсивный сбор истории родительского чата до parent_msg_id
-                parent_history = self.scan_history(parent_chat_id, visited, before_id=parent_msg_id)
-                history.update(parent_history)
-            else:
-                log.warn("Родительский чат не найден для parent_msg_id=%d, chat_id=%d", parent_msg_id, chat_id)
-        # Сбор постов текущего чата
+    def _read_posts(self, chat_id: int, post_ids=None) -> dict:
+        """Живые (не удалённые) посты чата по возрастанию id; post_ids ограничивает выборку."""
         conditions = [('chat_id', '=', chat_id)]
-        if before_id is not None:
-            conditions.append(('id', '<=', before_id))
+        if post_ids is not None:
+            conditions.append(('id', 'IN', list(post_ids)))
         rows = self.posts_table.select_from(
             columns=['p.id', 'p.chat_id', 'p.user_id', 'p.message', 'p.timestamp', 'u.user_name', 'p.rql', 'p.reply_to', 'p.elapsed', 'p.deleted_at'],
             conditions=conditions,
             joins=[('users', 'u', 'p.user_id = u.user_id')],
             order_by='p.id'
         )
+        posts = {}
         for row in rows:
             if row[9] is not None:
                 continue
             pid = row[0]
             elps = round(row[8], 1) if row[8] else 0
-            history[pid] = {
+            posts[pid] = {
                 "id": pid,
                 "chat_id": row[1],
                 "user_id": row[2],
@@ -384,27 +414,151 @@ class PostManager:
                 "elapsed": elps,
                 "action": "add"
             }
-            post_ids.append(row[0])
+        return posts
+
+    def _parent_link(self, chat_id: int):
+        """(parent_chat_id, parent_msg_id) для подчата или None."""
+        parent_msg_row = self.db.fetch_one(
+            'SELECT parent_msg_id FROM chats WHERE chat_id = :chat_id',
+            {'chat_id': chat_id}
+        )
+        parent_msg_id = parent_msg_row[0] if parent_msg_row else None
+        if not parent_msg_id:
+            return None
+        parent_chat_row = self.db.fetch_one(
+            'SELECT chat_id FROM posts WHERE id = :parent_msg_id',
+            {'parent_msg_id': parent_msg_id}
+        )
+        parent_chat_id = parent_chat_row[0] if parent_chat_row else None
+        if not parent_chat_id:
+            log.warn("Родительский чат не найден для parent_msg_id=%d, chat_id=%d", parent_msg_id, chat_id)
+            return None
+        return parent_chat_id, parent_msg_id
+
+    def _chat_posts_entry(self, chat_id: int) -> dict:
+        """Собственные посты чата из кэша, догнанные по журналу chat_changes до текущего chat_seq.
+
+        Запись: {'seq', 'posts' (pid → post по возрастанию id), 'parent', 'checked'}; seq — курсор
+        ChatChangeJournal, который не опережает закоммиченные изменения, поэтому совпадение с
+        last_seq означает актуальную запись. posts/parent неизменяемы (copy-on-write), а checked
+        и счётчики меняются только под _history_lock.
+        """
+        last = self.last_seq(chat_id)
+        now = time.time()
+        with self._history_lock:
+            entry = self._history_cache.get(chat_id)
+            if entry is not None:
+                self._history_cache.move_to_end(chat_id)
+                # журнал старше _CHANGES_TTL_SEC подрезается: давно не сверявшуюся запись перечитываем целиком
+                if entry['seq'] > last or now - entry['checked'] > _CHANGES_TTL_SEC / 2:
+                    entry = None
+                elif entry['seq'] == last:
+                    entry['checked'] = now
+                    self._history_stats['hits'] += 1
+                    return entry
+        stat = 'misses'
+        if entry is not None and self.changes_cursor_expired(chat_id, entry['seq']):
+            entry = None
+        if entry is not None:
+            changes, new_seq = self.get_changes_since(chat_id, entry['seq'])
+            if new_seq >= last and len(changes) < _CHANGES_FETCH_LIMIT:
+                changed = {abs(pid) for pid in changes}
+                fresh = self._read_posts(chat_id, changed)
+                posts = {pid: post for pid, post in entry['posts'].items() if pid not in changed}
+                posts.update(fresh)
+                if fresh and posts and min(fresh) < max(posts):
+                    posts = dict(sorted(posts.items()))
+                entry = {'seq': new_seq, 'posts': posts, 'parent': entry['parent'], 'checked': now}
+                stat = 'incremental'
+            else:
+                entry = None
+        if entry is None:
+            entry = {'seq': last, 'posts': self._read_posts(chat_id), 'parent': self._parent_link(chat_id),
+                     'checked': now}
+        with self._history_lock:
+            self._history_stats[stat] += 1
+            cur = self._history_cache.get(chat_id)
+            # параллельный читатель мог успеть положить более свежую запись — не откатываем её
+            if cur is None or cur['seq'] <= entry['seq']:
+                self._history_cache[chat_id] = entry
+            self._history_cache.move_to_end(chat_id)
+            while len(self._history_cache) > _HISTORY_CACHE_CHATS:
+                self._history_cache.popitem(last=False)
+        return entry
+
+    def history_cache_stats(self) -> dict:
+        with self._history_lock:
+            return dict(self._history_stats, chats=len(self._history_cache))
+
+    def scan_history(self, chat_id: int, visited: set = None, before_id: int = None) -> dict:
+        """Рекурсивно собирает историю постов для указанного chat_id, включая родительские чаты.
+
+        Посты каждого чата берутся из кэша (_chat_posts_entry), который догоняется по журналу
+        chat_changes; полное чтение — только при первом обращении или вытеснении.
+
+        Args:
+            chat_id (int): ID чата.
+            visited (set, optional): Множество посещённых chat_id для предотвращения циклов.
+            before_id (int, optional): ID поста, до которого собирается история.
+
+        Returns:
+            dict: История постов с метаданными.
+        """
+        if visited is None:
+            visited = set()
+        if chat_id in visited:
+            log.debug("Цикл обнаружен для chat_id=%d, пропуск", chat_id)
+            return {}
+        visited.add(chat_id)
+        history = {}
+        path = visited.copy()
+        entry = self._chat_posts_entry(chat_id)
+        if entry['parent']:
+            # Рекурсивный сбор истории родительского чата до parent_msg_id
+            parent_chat_id, parent_msg_id = entry['parent']
+            history.update(self.scan_history(parent_chat_id, visited, before_id=parent_msg_id))
+        post_ids = []
+        for pid, post in entry['posts'].items():
+            if before_id is not None and pid > before_id:
+                break
+            history[pid] = dict(post)
+            post_ids.append(pid)
         # Логирование собранных post_id и reply_to
         path_str = " -> ".join(str(cid) for cid in sorted(path, reverse=True))
         log.debug("Собрана история для chat_id=%d (path=%s): post_ids=%s, reply_to=%s",
                   chat_id, path_str, str(post_ids), str([history[pid]["reply_to"] for pid in post_ids]))
         return history
 
-    def get_history(self, chat_id: int, only_changes: bool = False) -> dict:
+    def get_history(self, chat_id: int, only_changes: bool = False, since_seq: int = 0) -> dict:
         """Возвращает историю постов для указанного chat_id, включая reply_to.
 
         Args:
             chat_id (int): ID чата.
-            only_changes (bool, optional): Если True, возвращает только изменения. Defaults to False.
+            only_changes (bool, optional): Если True, возвращает только изменения после since_seq. Defaults to False.
+            since_seq (int, optional): Курсор журнала chat_changes для only_changes. Defaults to 0.
 
         Returns:
             dict: История постов или {'chat_history': 'no changes'} или {'error': str}.
         """
+        return self.get_history_since(chat_id, only_changes, since_seq)[0]
+
+    def get_history_since(self, chat_id: int, only_changes: bool = False, since_seq: int = 0) -> tuple[dict, int]:
+        """Как get_history, но дополнительно возвращает seq, с которого клиенту продолжать чтение изменений.
+
+        Для полной истории курсор снимается до чтения постов: изменения во время чтения придут повторно.
+        Курсор старше подрезанного журнала (changes_cursor_expired) тоже получает полную историю.
+        """
         try:
-            changes = self.get_changes(chat_id)
+            if only_changes and self.changes_cursor_expired(chat_id, since_seq):
+                log.debug("Курсор since_seq=%s для chat_id=%d старше подрезанного журнала, отдаётся полная история",
+                          since_seq, chat_id)
+                only_changes = False
+            if only_changes:
+                changes, last_seq = self.get_changes_since(chat_id, since_seq)
+            else:
+                changes, last_seq = [], self.last_seq(chat_id)
             if only_changes and not changes:
-                return {"chat_history": "no changes"}
+                return {"chat_history": "no changes"}, last_seq
             history = {}
             post_ids = [abs(pid) for pid in changes if pid > 0] if only_changes else None
             deleted_ids = [-pid for pid in changes if pid < 0] if only_changes else []
@@ -451,15 +605,13 @@ class PostManager:
                         }
             else:
                 history = self.scan_history(chat_id)
-            if history and only_changes:
-                self.clear_changes(chat_id)
-            log.debug("Получена история для chat_id=%d: %d сообщений, only_changes=%s, reply_to=%s",
-                      chat_id, len(history), str(only_changes),
+            log.debug("Получена история для chat_id=%d: %d сообщений, only_changes=%s, seq=%d, reply_to=%s",
+                      chat_id, len(history), str(only_changes), last_seq,
                       str([history[pid]["reply_to"] for pid in history]))
-            return history
+            return history, last_seq
         except Exception as e:
             log.excpt("Ошибка получения истории для chat_id=%d: ", chat_id, e=e)
-            return {"error": str(e)}
+            return {"error": str(e)}, int(since_seq or 0)
 
     def get_post(self, post_id: int) -> dict:
         """Возвращает пост по его ID.
@@ -513,11 +665,12 @@ class PostManager:
                 if error_result.get("error"):
                     log.warn("Не удалось сохранить сообщение об ошибке доступа: %s", error_result["error"])
                 return {"error": "Permission denied"}
-            self.posts_table.update(
-                conditions={'id': post_id},
-                values={'message': message, 'timestamp': int(time.time()), 'rql': rql}
-            )
-            self.add_change(chat_id, post_id, "edit")
+            with self.posts_table.transaction():
+                self.posts_table.update(
+                    conditions={'id': post_id},
+                    values={'message': message, 'timestamp': int(time.time()), 'rql': rql}
+                )
+                self.add_change(chat_id, post_id, "edit")
             log.debug("Отредактировано сообщение post_id=%d для user_id=%d", post_id, user_id)
             return {"status": "ok"}
         except Exception as e:
@@ -546,15 +699,16 @@ class PostManager:
             if post_user_id != user_id and self.user_manager.get_user_role(user_id) != 'admin':
                 log.info("Пользователь user_id=%d не имеет прав для удаления post_id=%d", user_id, post_id)
                 return {"error": "Permission denied"}
-            self.posts_table.update(
-                conditions={'id': post_id},
-                values={
-                    'deleted_at': int(time.time()),
-                    'tombstone_text': '#deleted_by:user',
-                    'timestamp': int(time.time()),
-                }
-            )
-            self.add_change(chat_id, post_id, "delete")
+            with self.posts_table.transaction():
+                self.posts_table.update(
+                    conditions={'id': post_id},
+                    values={
+                        'deleted_at': int(time.time()),
+                        'tombstone_text': '#deleted_by:user',
+                        'timestamp': int(time.time()),
+                    }
+                )
+                self.add_change(chat_id, post_id, "delete")
             # Принудительно рвём cache-цепочку у LLM-актёров, чтобы следующий ход был FULL
             # и мог безопасно применить tombstone-патчи для удалённых постов.
             try:
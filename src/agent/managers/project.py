@@ -1,20 +1,24 @@
 # /agent/managers/project.py, updated 2025-07-26 17:00 EEST
-import os
+import stat
 import time
 from pathlib import Path
 from .db import Database, DataTable
 from .runtime_config import get_float
 from lib.file_link_prefix import strip_storage_prefix
+from lib.file_type_detector import accept_files, get_file_type_cache
 from lib.project_scan_filter import ProjectScanFilter
+from lib.project_walker import walk_project_files
 from lib.sandwich_pack import SandwichPack
 from lib.basic_logger import BasicLogger
 import globals
 
 log = globals.get_logger("projectman")
 
-# Верхняя граница длительности одного прохода rglob+add_file (сек), с запасом до типичного HTTP-таймаута клиента.
+# Верхняя граница длительности одного прохода обхода+add_file (сек), с запасом до типичного HTTP-таймаута клиента.
 _SCAN_BUDGET_DEFAULT_SEC = 25.0
 _SCAN_BUDGET_MARGIN_SEC = 0.75
+# Сколько найденных файлов копить перед пакетной записью в attached_files.
+_SCAN_REGISTER_BATCH = 2000
 
 
 def _scan_budget_seconds() -> float:
@@ -46,6 +50,10 @@ def _scan_coop_sleep_seconds() -> float:
     )
 
 
+def _fmt_subtrees(items: list[tuple[str, float]]) -> str:
+    return ", ".join(f"{name}={sec:.2f}s" for name, sec in items) or "-"
+
+
 class ProjectManager:
     def __init__(self, project_id=None):
         self.db = Database.get_database()
@@ -296,6 +304,13 @@ class ProjectManager:
         log.debug("Возвращено %d проектов", len(projects))
         return projects
 
+    def _register_scanned(self, entries: list[dict]) -> None:
+        """Пакетная регистрация найденных файлов (FileManager.bulk_reconcile_links вместо add_file на файл)."""
+        try:
+            globals.file_manager.bulk_reconcile_links(self.project_id, entries)
+        except Exception as e:
+            log.warn("scan_project_files: пакетная регистрация %d файлов не удалась: %s", len(entries), e)
+
     def scan_project_files(self, project_name=None):
         if project_name is None:
             project_name = self.project_name
@@ -319,85 +334,71 @@ class ProjectManager:
 
             budget = _scan_budget_seconds()
             deadline = started + max(0.0, budget - _SCAN_BUDGET_MARGIN_SEC)
-            time_limited = False
             coop_interval = _scan_coop_interval_seconds()
             coop_sleep = _scan_coop_sleep_seconds()
-            next_coop_yield = started + coop_interval if coop_interval > 0 and coop_sleep > 0 else 0.0
-
-            _walk = iter(project_dir.rglob('*'))
-            while True:
-                if next_coop_yield and time.monotonic() >= next_coop_yield:
-                    # Кооперативная уступка CPU/GIL: снижает «монополию» длительного скана.
-                    time.sleep(coop_sleep)
-                    next_coop_yield = time.monotonic() + coop_interval
-                try:
-                    file_path = next(_walk)
-                except StopIteration:
-                    break
-                except OSError as e:
-                    log.warn("scan_project_files: пропуск при обходе дерева: %s", e)
-                    continue
 
+            register = self.project_name == project_name
+            if register and self.project_id:
+                globals.file_manager.seed_file_type_cache(self.project_id, self.projects_dir)
+            walked = walk_project_files(
+                project_dir,
+                file_excluded=scan_filter.is_excluded,
+                dir_excluded=scan_filter.is_dir_excluded,
+                deadline=deadline,
+                coop=(coop_interval, coop_sleep),
+                log=log,
+            )
+            type_cache = get_file_type_cache()
+            ignored_count = walked.ignored
+            time_limited = walked.time_limited
+            # BL/WL по расширению и вердикт по содержимому пачками (stat из обхода, один `file` на пачку),
+            # регистрация — теми же пачками; дедлайн проверяется перед каждой, как и в обходе
+            for pos in range(0, len(walked.files), _SCAN_REGISTER_BATCH):
                 if time.monotonic() >= deadline:
                     time_limited = True
-                    log.warn(
-                        "scan_project_files: достигнут лимит времени %.1fs (CQDS_SCAN_MAX_SECONDS), проект=%s, "
-                        "поддерживаемых файлов=%d — остановка до обрыва запроса клиентом",
-                        budget,
-                        project_name,
-                        len(files),
-                    )
                     break
-
-                try:
-                    is_reg = file_path.is_file()
-                except OSError as e:
-                    log.warn("scan_project_files: пропуск (is_file) %s: %s", file_path, e)
-                    continue
-                if not is_reg:
-                    continue
-
-                try:
-                    relative_path = str(file_path.relative_to(project_dir)).replace('\\', '/')
-                except (OSError, ValueError) as e:
-                    log.warn("scan_project_files: пропуск (relative_to) %s: %s", file_path, e)
-                    continue
-
-                if scan_filter.is_excluded(relative_path):
-                    ignored_count += 1
-                    continue
-
-                try:
-                    name = file_path.name
-                    if not globals.file_manager.is_acceptable_file(file_path):
+                chunk = walked.files[pos:pos + _SCAN_REGISTER_BATCH]
+                accepted = accept_files([(Path(wf.path), wf.st) for wf in chunk])
+                pending: list[dict] = []
+                for wf, ok in zip(chunk, accepted):
+                    if not ok:
                         continue
-                    st_mtime = int(file_path.stat().st_mtime)
                     files.append({
-                        'file_name': relative_path,
-                        'full_path': str(file_path),
-                        'ts': st_mtime,
+                        'file_name': wf.rel,
+                        'full_path': wf.path,
+                        'ts': int(wf.st.st_mtime),
                     })
-                    file_mod = os.path.getmtime(file_path)
-                    reg_path = Path(project_name) / relative_path
-                    if self.project_name == project_name:
-                        globals.file_manager.add_file(reg_path, None, file_mod, self.project_id)
-                except (OSError, ValueError) as e:
-                    log.warn("scan_project_files: пропуск %s: %s", relative_path, e)
-                except Exception as e:
-                    log.warn("scan_project_files: пропуск %s: %s", relative_path, e)
+                    if register:
+                        pending.append({
+                            'file_name': f"{project_name}/{wf.rel}",
+                            'ts': wf.st.st_mtime,
+                            'mode': stat.S_IMODE(wf.st.st_mode),
+                            'type_sig': type_cache.signature(wf.path),
+                        })
+                if pending:
+                    self._register_scanned(pending)
+            if time_limited:
+                log.warn(
+                    "scan_project_files: достигнут лимит времени %.1fs (CQDS_SCAN_MAX_SECONDS), проект=%s, "
+                    "поддерживаемых файлов=%d — остановка до обрыва запроса клиентом",
+                    budget,
+                    project_name,
+                    len(files),
+                )
 
             duration = time.monotonic() - started
             if duration >= 10:
-                log.warn("PERF_WARN scan_project_files project_id=%s project_name=%s took=%.2fs files=%d ignored=%d",
-                         str(self.project_id), project_name, duration, len(files), ignored_count)
+                log.warn("PERF_WARN scan_project_files project_id=%s project_name=%s took=%.2fs files=%d ignored=%d slowest=%s",
+                         str(self.project_id), project_name, duration, len(files), ignored_count,
+                         _fmt_subtrees(walked.slowest()))
             if time_limited:
                 log.info(
                     "scan_project_files: проект=%s частичный проход (time_limited), повторите scan при необходимости",
                     project_name,
                 )
             ProjectManager.mark_scan_fresh(self.project_id, len(files), duration, time_limited=time_limited)
-            log.debug("Найдено %d поддерживаемых файлов в проекте %s, пропущено из-за фильтрации %d, duration=%.2fs",
-                      len(files), project_name, ignored_count, duration)
+            log.debug("Найдено %d поддерживаемых файлов в проекте %s, пропущено из-за фильтрации %d, duration=%.2fs, поддеревья: %s",
+                      len(files), project_name, ignored_count, duration, _fmt_subtrees(walked.slowest()))
             return files
         except Exception as e:
             log.excpt("Ошибка сканирования файлов проекта %s: ", project_name, e=e)
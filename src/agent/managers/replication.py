@@ -7,6 +7,8 @@ from pathlib import Path
 from llm_cached_interactor import LLMCachedInteractor
 from llm_interactor import ContextInput
 from managers.chats import ChatLocker
+from managers.runtime_config import get_float, get_int
+from lib.reply_progress import ActiveReplies, ProgressStream
 from chat_actor import ChatActor
 import globals as g
 
@@ -29,11 +31,16 @@ class ReplicationManager(LLMCachedInteractor):
         self.failed_tasks = 0
         self.actors = self._load_actors()
         self.active_replications = set()
+        self.active_streams = ActiveReplies()
         if debug_mode:
             log.debug("Режим отладки репликации включён")
         else:
             log.debug("Репликация активирована")
 
+    def cancel_reply(self, post_id: int, user_id: int) -> dict:
+        """Прервать генерацию ответа, идущего в прогресс-пост post_id, от имени user_id (см. ActiveReplies.cancel)."""
+        return self.active_streams.cancel(post_id, user_id)
+
     def any_llm(self):
         for actor in self.actors:  # need find any LLM in actors
             if actor.llm_connection:
@@ -179,28 +186,57 @@ class ReplicationManager(LLMCachedInteractor):
                     session_id=session_id,
                 )
                 progress_post_id = progress.get('post_id') if isinstance(progress, dict) else None
-            progress_started = time.time()
-            last_heartbeat = None
             interval_ms = g.get_session_option(session_id, 'llm_update_interval_ms', 900)
             try:
                 interval_s = max(0.3, min(int(interval_ms), 5000) / 1000.0)
             except Exception:
                 interval_s = 0.9
 
-            async with ChatLocker(ci.chat_id, actor.user_name):
-                task = asyncio.create_task(self.interact(ci, rql=rql), name=f"llm_interact:{actor.user_name}:{ci.chat_id}")
-                while not task.done():
-                    if progress_post_id:
-                        elapsed_wait = max(0, int(time.time() - progress_started))
-                        heartbeat = (
-                            f"⏳ @{actor.user_name} response in progress... {elapsed_wait}s "
-                            f"(update interval {int(interval_s * 1000)}ms)"
-                        )
-                        if heartbeat != last_heartbeat:
-                            post_man.edit_post(progress_post_id, heartbeat, actor.user_id)
-                            last_heartbeat = heartbeat
-                    await asyncio.sleep(interval_s)
-                original_response = await task
+            # Частичный ответ провайдера (стриминг) идёт в прогресс-пост по мере генерации, а не в самом конце.
+            stream = None
+            if progress_post_id:
+                stream = ProgressStream(
+                    progress_post_id,
+                    actor,
+                    chat_id=ci.chat_id,
+                    trigger_user_id=ci.trigger_user_id,
+                    interval_s=interval_s,
+                    flush_chars=get_int("LLM_STREAM_FLUSH_CHARS", 400, 16, 100_000),
+                    min_gap=get_float("LLM_STREAM_FLUSH_MIN_SEC", 0.25, 0.05, 5.0),
+                )
+                ci.on_delta = stream.feed
+                self.active_streams.add(stream)
+
+            try:
+                async with ChatLocker(ci.chat_id, actor.user_name):
+                    task = asyncio.create_task(self.interact(ci, rql=rql), name=f"llm_interact:{actor.user_name}:{ci.chat_id}")
+                    while not task.done():
+                        if stream is not None:
+                            if stream.cancelled:
+                                task.cancel()
+                                break
+                            stream.tick()
+                        await asyncio.wait({task}, timeout=interval_s)
+                    try:
+                        original_response = await task
+                    except asyncio.CancelledError:
+                        if stream is None or not stream.cancelled:
+                            raise
+                        original_response = None
+            finally:
+                if stream is not None:
+                    self.active_streams.discard(progress_post_id)
+                    await stream.close()
+            if stream is not None and stream.cancelled:
+                partial = "".join(stream.parts)
+                log.info("Ответ actor_id=%d в chat_id=%d прерван пользователем через %.1f с, получено %d символов",
+                         actor.user_id, ci.chat_id, time.time() - t_start, len(partial))
+                post_man.edit_post(
+                    progress_post_id,
+                    (partial + "\n\n" if partial else "") + f"⏹ @{actor.user_name} response cancelled",
+                    actor.user_id,
+                )
+                return
             elapsed = time.time() - t_start
             if original_response:
                 log.debug("Ответ получен после %.1f секунд, проверка возможности обработки агентом...", elapsed)
@@ -349,7 +385,9 @@ class ReplicationManager(LLMCachedInteractor):
             is_broadcast = True
             log.debug("BROADCAST!: Обнаружен триггер @all для широковещательной репликации: chat_id=%d, rql=%d от %s, refs: %s", chat_id, rql, user_name, str(refs))
 
-        content_blocks = []
+        # Блоки контекста собираются один раз на (chat_id, post_id) и разделяются всеми получателями:
+        # входы assemble_posts/files/spans одинаковы, различается только упаковка в build_context.
+        content_blocks = None
         # =================  Цикл по потенциальным получателям нового контекста ========================
         coro_list = []
         for actor in llm_actors:
@@ -372,8 +410,11 @@ class ReplicationManager(LLMCachedInteractor):
             if trigger > 0:
                 action = "Начат" if rql == 0 else "Продолжен"
                 log.debug(f"{action} диалог между %s и %s для chat_id=%d, trigger = %d", user_name, actor.user_name, chat_id, trigger)
-                content_blocks = self.collect_blocks(chat_id, exclude_id)
-                ci = ContextInput(content_blocks, users, chat_id, actor, exclude_id)
+                if content_blocks is None:
+                    content_blocks = tuple(self.collect_blocks(chat_id, exclude_id))
+                    log.debug("Собрано %d блоков контекста для chat_id=%d, post_id=%d", len(content_blocks), chat_id, post_id)
+                ci = ContextInput(list(content_blocks), users, chat_id, actor, exclude_id)  # свой список, общие блоки
+                ci.trigger_user_id = user_id
                 if DEBUG_BYPASS_TAG in (message or "").lower():
                     ci.debug_bypass = True
                 coro = self._recursive_replicate(ci, rql + 1, max_rql=max_rql, session_id=session_id)
@@ -386,7 +427,7 @@ class ReplicationManager(LLMCachedInteractor):
             log.debug(" Параллельный запуск %d репликаций ", len(coro_list))
             await asyncio.gather(*coro_list)
 
-        max_post_id = max([block.post_id for block in content_blocks if block.post_id is not None] or [0])
+        max_post_id = max([block.post_id for block in content_blocks or () if block.post_id is not None] or [0])
         if max_post_id:
             for actor in llm_actors:
                 if actor.user_id in processed_actors:
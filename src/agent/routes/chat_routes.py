@@ -1,19 +1,32 @@
 # /app/agent/routes/chat_routes.py, updated 2025-07-26 15:15 EEST
+import json
 import math
 
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Optional
 import asyncio
 import time
-import re
 import os
 from managers.db import Database
 import globals as g
 from globals import check_session, handle_exception
+from lib.chat_change_hub import get_chat_change_hub
+from lib.log_tail import tail_log
 
 router = APIRouter()
 log = g.get_logger("chatman")
 
+# Страховочная перепроверка long-poll /chat/get, если уведомление пришло мимо хаба (другой процесс и т.п.)
+_WAIT_RECHECK_SEC = max(0.5, float(os.environ.get("CORE_CHAT_WAIT_RECHECK_SEC", "5")))
+# Keep-alive комментарий в SSE /chat/stream, чтобы nginx/прокси не рвали простаивающее соединение
+_STREAM_KEEPALIVE_SEC = max(1.0, float(os.environ.get("CORE_CHAT_STREAM_KEEPALIVE_SEC", "15")))
+
+
+def _adb():
+    """AsyncDatabase ядра: синхронные вызовы менеджеров выполняются в пуле БД, а не на event loop."""
+    return Database.get_database().get_async()
+
 
 def _row_get(row, index: int, key: str, default=None):
     try:
@@ -119,8 +132,8 @@ def _collect_chat_usage_stats(chat_id: int, since_seconds: Optional[int] = None)
 async def list_chats(request: Request):
     log.debug(g.with_session_tag(request, "Запрос GET /chat/list, IP=%s, Cookies=~%s"), request.client.host, str(request.cookies))
     try:
-        user_id = check_session(request)
-        chats = await asyncio.to_thread(g.chat_manager.list_chats, user_id)
+        user_id = await g.acheck_session(request)
+        chats = await _adb().run(g.chat_manager.list_chats, user_id)
         log.debug(g.with_session_tag(request, "Возвращено %d чатов для user_id=%d"), len(chats), user_id)
         return chats
     except Exception as e:
@@ -162,50 +175,107 @@ async def delete_chat(request: Request):
         raise
 
 @router.get("/chat/get")
-async def get_chat(request: Request, chat_id: int, wait_changes: int = 0):
+async def get_chat(request: Request, chat_id: int, wait_changes: int = 0, since_seq: Optional[int] = None):
+    """История чата; с wait_changes — long-poll изменений журнала chat_changes после since_seq.
+
+    Ответ содержит seq — курсор для следующего запроса. Клиент без since_seq использует
+    курсор, сохранённый для сессии (совместимость со старым фронтендом).
+    """
     try:
         # NOLOG!: постоянное логирование запрещено из-за флуда
-        user_id = check_session(request)
+        user_id = await g.acheck_session(request)
+        adb = _adb()
         session_id = request.cookies.get("session_id")
+        cursor_key = f"chat_seq:{chat_id}"
         status = {'status': "nope"}
         if wait_changes:
+            if since_seq is None:
+                since_seq = g.get_session_option(session_id, cursor_key)
+            if since_seq is None:
+                since_seq = await adb.run(g.post_manager.last_seq, chat_id)
+            hub = get_chat_change_hub()
             max_wait = 15
             _elps = 0
             _loops = 0
             _start = time.time()
             while _elps < max_wait:
-                _elps = time.time() - _start
                 _loops += 1
-                status = await asyncio.to_thread(g.chat_manager.chat_status, chat_id)
+                version = hub.version(chat_id)  # снимаем до проверки: изменение после неё разбудит wait()
+                status = await adb.run(g.chat_manager.chat_status, chat_id)
                 if status['status'] == 'busy' and max_wait > 1:
                     log.debug(g.with_session_tag(request, " Ожидание сокращено, поскольку чат занят пользователем %s "), status['actor'])
                     max_wait = 1
-                active = await asyncio.to_thread(g.chat_manager.active_chat, user_id, session_id)
+                active = await adb.run(g.chat_manager.active_chat, user_id, session_id)
                 if active is None:
                     active = 0
 
                 if active <= 0 < chat_id:  # автоматическая активация чата, если не выбран.
                     active = chat_id
-                    await asyncio.to_thread(g.chat_manager.select_chat, session_id, user_id, chat_id)
+                    await adb.run(g.chat_manager.select_chat, session_id, user_id, chat_id)
 
-                history = await asyncio.to_thread(g.post_manager.get_history, chat_id, wait_changes == 1)
+                history, seq = await adb.run(g.post_manager.get_history_since, chat_id, wait_changes == 1, since_seq)
                 if history != {"chat_history": "no changes"}:
-                    quotes = g.post_manager.get_quotes(history)
-                    return {"posts": history, "chat_id": chat_id, "quotes": quotes, "status": status}
+                    g.set_session_option(session_id, cursor_key, seq)
+                    quotes = await adb.run(g.post_manager.get_quotes, history)
+                    return {"posts": history, "chat_id": chat_id, "quotes": quotes, "status": status, "seq": seq}
                 if active != chat_id:
                     log.debug(g.with_session_tag(request, "Chat switch detected for user_id=%d, chat_id=%d, active=%d"), user_id or -1, chat_id or -1, active or 0)
                     return {"chat_id": active, "posts": {"chat_history": "chat switch"}, "status": status}
-                await asyncio.sleep(0.1)
-            return {"chat_id": chat_id, "posts": {"chat_history": "no changes"}, "quotes": {}, "status": status, "wait_loops": _loops, "elapsed": "%.1f" % _elps}
+                remaining = max_wait - (time.time() - _start)
+                if remaining > 0:
+                    # спим до реального изменения чата (add/edit/delete, busy/free, смена активного чата)
+                    await hub.wait(chat_id, version, min(remaining, _WAIT_RECHECK_SEC))
+                _elps = time.time() - _start
+            g.set_session_option(session_id, cursor_key, since_seq)
+            return {"chat_id": chat_id, "posts": {"chat_history": "no changes"}, "quotes": {}, "status": status,
+                    "seq": since_seq, "wait_loops": _loops, "elapsed": "%.1f" % _elps}
         else:
             log.debug(g.with_session_tag(request, "Статус обработки для user_id=%d, chat_id=%d: %s"), user_id, chat_id, status)
-            history = g.post_manager.get_history(chat_id, only_changes=False)
-            quotes = g.post_manager.get_quotes(history)
-            return {"chat_id": chat_id, "posts": history, "quotes": quotes, "status": status}
+            history, seq = await adb.run(g.post_manager.get_history_since, chat_id, False)
+            g.set_session_option(session_id, cursor_key, seq)
+            quotes = await adb.run(g.post_manager.get_quotes, history)
+            return {"chat_id": chat_id, "posts": history, "quotes": quotes, "status": status, "seq": seq}
     except Exception as e:
         handle_exception("Ошибка в GET /chat/get", e)
         raise
 
+@router.get("/chat/stream")
+async def stream_chat(request: Request, chat_id: int, since_seq: int = -1):
+    """SSE-лента изменений чата из журнала chat_changes.
+
+    События: change {seq, changes: [post_id, отрицательный — удаление]}, status {status},
+    reset {seq} — since_seq старше подрезанного журнала, клиенту нужна полная история (/chat/get без wait_changes).
+    Посты клиент дочитывает через /chat/get; since_seq=-1 — начать с текущего seq.
+    """
+    await g.acheck_session(request)
+    adb = _adb()
+    hub = get_chat_change_hub()
+
+    async def _events():
+        seq = await adb.run(g.post_manager.last_seq, chat_id) if since_seq < 0 else since_seq
+        yield f"event: hello\ndata: {json.dumps({'chat_id': chat_id, 'seq': seq})}\n\n"
+        if since_seq >= 0 and await adb.run(g.post_manager.changes_cursor_expired, chat_id, seq):
+            seq = await adb.run(g.post_manager.last_seq, chat_id)
+            yield f"event: reset\ndata: {json.dumps({'chat_id': chat_id, 'seq': seq})}\n\n"
+        woke = False
+        while not await request.is_disconnected():
+            version = hub.version(chat_id)
+            changes, new_seq = await adb.run(g.post_manager.get_changes_since, chat_id, seq)
+            if changes:
+                seq = new_seq
+                yield f"event: change\ndata: {json.dumps({'chat_id': chat_id, 'seq': seq, 'changes': changes})}\n\n"
+                continue
+            if woke:  # пробуждение без записей журнала: busy/free или смена активного чата
+                status = await adb.run(g.chat_manager.chat_status, chat_id)
+                yield f"event: status\ndata: {json.dumps({'chat_id': chat_id, 'status': status})}\n\n"
+            woke = await hub.wait(chat_id, version, _STREAM_KEEPALIVE_SEC)
+            if not woke:
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @router.post("/chat/notify_switch")
 async def notify_chat_switch(request: Request):
     log.debug(g.with_session_tag(request, "Запрос POST /chat/notify_switch, IP=%s, Cookies=~%s"), request.client.host, str(request.cookies))
@@ -219,8 +289,8 @@ async def notify_chat_switch(request: Request):
             raise HTTPException(status_code=400, detail="Missing chat_id")
 
         g.chat_manager.select_chat(session_id, user_id, chat_id)
-        changes = g.post_manager.get_changes(chat_id)
-        log.debug(g.with_session_tag(request, "Уведомление о смене чата chat_id=%d для user_id=%d, changes=~%s"), chat_id, user_id, str(changes))
+        seq = g.post_manager.last_seq(chat_id)
+        log.debug(g.with_session_tag(request, "Уведомление о смене чата chat_id=%d для user_id=%d, seq=%d"), chat_id, user_id, seq)
         return {"chat_history": "chat switch"}
     except Exception as e:
         handle_exception("Ошибка в POST /chat/notify_switch", e)
@@ -270,7 +340,7 @@ async def edit_post(request: Request):
         if not post_id or not message:
             log.info(g.with_session_tag(request, "Неверные параметры post_id=%s или message для IP=%s"), str(post_id) if post_id is not None else "None", request.client.host)
             raise HTTPException(status_code=400, detail="Missing post_id or message")
-        result = g.post_manager.edit_post(post_id, message, user_id)
+        result = await _adb().run(g.post_manager.edit_post, post_id, message, user_id)
         log.debug(g.with_session_tag(request, "Отредактировано сообщение post_id=%d для user_id=%d"), post_id, user_id)
         return result
     except Exception as e:
@@ -288,26 +358,49 @@ async def delete_post(request: Request):
         if not post_id:
             log.info(g.with_session_tag(request, "Неверный параметр post_id=%s для IP=%s"), str(post_id) if post_id is not None else "None", request.client.host)
             raise HTTPException(status_code=400, detail="Missing post_id")
-        result = g.post_manager.delete_post(post_id, user_id)
+        result = await _adb().run(g.post_manager.delete_post, post_id, user_id)
         log.debug(g.with_session_tag(request, "Удалено сообщение post_id=%d от user_id=%d"), post_id, user_id)
         return result
     except Exception as e:
         handle_exception("Ошибка в POST /chat/delete_post", e)
         raise
 
+@router.post("/chat/cancel_reply")
+async def cancel_reply(request: Request):
+    """Прервать генерацию ответа LLM, который сейчас пишется в прогресс-пост post_id."""
+    try:
+        user_id = await g.acheck_session(request)
+        data = await request.json()
+        try:
+            post_id = int(data.get('post_id'))
+        except (TypeError, ValueError):
+            post_id = 0
+        if post_id <= 0:
+            raise HTTPException(status_code=400, detail="Missing or invalid post_id")
+        result = await _adb().run(g.replication_manager.cancel_reply, post_id, user_id)
+        if result.get("status") == "ok":
+            log.info(g.with_session_tag(request, "Ответ в post_id=%d прерван пользователем user_id=%d"), post_id, user_id)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        handle_exception("Ошибка в POST /chat/cancel_reply", e)
+        raise
+
+
 @router.get("/chat/get_stats")
 async def get_chat_stats(request: Request, chat_id: int, since_seconds: Optional[int] = None):
     # NOLOG!
     try:
-        user_id = check_session(request)
-        chat = g.chat_manager.chats_table.select_row(
+        user_id = await g.acheck_session(request)
+        chat = await g.chat_manager.chats_table.aselect_row(
             conditions=[('chat_id', '=', chat_id)],
             columns=['chat_id']
         )
         if not chat:
             log.info(g.with_session_tag(request, "Чат chat_id=%d не найден для user_id=%d"), chat_id, user_id)
             raise HTTPException(status_code=404, detail="Chat not found")
-        aggregated = _collect_chat_usage_stats(chat_id, since_seconds)
+        aggregated = await _adb().run(_collect_chat_usage_stats, chat_id, since_seconds)
         stats = {
             "chat_id": chat_id,
             "tokens": aggregated["total_input_tokens"],
@@ -335,10 +428,10 @@ async def get_chat_stats_new(request: Request, chat_id: int, since_seconds: Opti
     """
     # NOLOG!
     try:
-        user_id = check_session(request)
+        user_id = await g.acheck_session(request)
 
         # Check chat exists
-        chat = g.chat_manager.chats_table.select_row(
+        chat = await g.chat_manager.chats_table.aselect_row(
             conditions=[('chat_id', '=', chat_id)],
             columns=['chat_id', 'chat_description']
         ) if hasattr(g.chat_manager, 'chats_table') else None
@@ -347,7 +440,7 @@ async def get_chat_stats_new(request: Request, chat_id: int, since_seconds: Opti
             log.info(g.with_session_tag(request, "Чат chat_id=%d не найден для user_id=%d"), chat_id, user_id)
             raise HTTPException(status_code=404, detail="Chat not found")
 
-        aggregated = _collect_chat_usage_stats(chat_id, since_seconds)
+        aggregated = await _adb().run(_collect_chat_usage_stats, chat_id, since_seconds)
         chat_description = _row_get(chat, 1, 'chat_description')
         stats = {
             "chat_id": chat_id,
@@ -419,28 +512,25 @@ async def get_parent_msg(request: Request, post_id: int):
         raise
 
 @router.get("/chat/logs")
-async def get_logs(request: Request):
+async def get_logs(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    levels: str = "ERROR,WARNING",
+):
+    """Последние записи g.LOG_FILE нужных уровней; cursor из прошлого ответа — только новые записи."""
     # NOLOG!
     try:
-        user_id = check_session(request)
-        log_file = g.LOG_FILE
-        logs = []
-        if os.path.exists(log_file):
-            with open(log_file, "r", encoding="utf-8") as f:
-                lines = f.readlines()[-100:]  # Последние 100 строк
-                for line in lines:
-                    if "#ERROR" in line or "#WARNING" in line:
-                        match = re.match(r"[(.+?)] #(\w+): (.+)", line)
-                        if match:
-                            timestamp, level, message = match.groups()
-                            timestamp = timestamp.replace(',', '.')
-                            ts = time.strptime(timestamp, g.SQL_TIMESTAMP6)
-                            logs.append({
-                                "timestamp": int(time.mktime(ts)),
-                                "level": level,
-                                "message": message
-                            })
-        return {"logs": logs}
+        check_session(request)
+        wanted = [lv for lv in str(levels or "").split(",") if lv.strip()]
+        limit = max(1, min(int(limit or 100), 1000))
+        # Обратное чтение хвоста без readlines всего файла, и всё равно вне event loop (лог может весить сотни МБ).
+        res = await asyncio.to_thread(tail_log, g.LOG_FILE, limit=limit, levels=wanted or None, cursor=cursor)
+        logs = [
+            {"timestamp": e["timestamp"], "level": e["level"], "message": e["message"]}
+            for e in res["entries"]
+        ]
+        return {"logs": logs, "cursor": res["cursor"], "skipped": res["skipped"]}
     except Exception as e:
         handle_exception("Ошибка в GET /chat/logs", e)
         raise
\ No newline at end of file
@@ -2,7 +2,6 @@
 from fastapi import APIRouter, Request, Response, UploadFile, File, Form, HTTPException, Query
 from fastapi.responses import PlainTextResponse, JSONResponse
 import time, json
-from managers.db import Database
 from managers.project import ProjectManager
 import globals as g
 from lib.basic_logger import BasicLogger
@@ -11,7 +10,6 @@ import routes.project_routes as project_routes
 router = APIRouter()
 
 log = g.get_logger("fileman")
-db = Database.get_database()
 
 @router.post("/chat/upload_file")
 async def upload_file(request: Request, file: UploadFile = File(...), chat_id: int = Form(...), file_name: str = Form(...), project_id: int = Form(None)):
@@ -156,7 +154,7 @@ async def get_chat_index(request: Request, chat_id: int = Query(None), project_i
             pm = ProjectManager.get(project_id)
             if pm is None or pm.project_name is None:
                 raise HTTPException(status_code=404, detail=f"Project {project_id} not found")
-            cached = project_routes.read_project_cached_index(pm.project_name)
+            cached = project_routes.project_index_response(pm.project_name)
             if cached is not None:
                 return cached
             status = project_routes.get_project_index_status(project_id, pm.project_name)
@@ -1,14 +1,16 @@
 # /agent/routes/project_routes.py, updated 2026-03-26 — simplified sync indexing + cache
-import copy
 import json
 import os
 import re
+import struct
 import time
 import asyncio
+from contextlib import aclosing
 from datetime import datetime
 from pathlib import Path
 
 from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from managers.db import Database
 from managers.project import ProjectManager
 from managers.runtime_config import get_int
@@ -18,22 +20,31 @@ from fnmatch import fnmatch
 import globals as g
 from lib.basic_logger import BasicLogger
 from lib.smart_grep_scope_cache import filters_fingerprint, get_scope_cache, normalize_path_prefix
+from lib.smart_grep_trigram_index import get_trigram_index, query_trigrams, trigram_enabled
+from lib.smart_grep_executor import get_smart_grep_executor
 from lib import maint_pool as maint_pool_lib
 from lib.background_task_registry import get_background_task_registry
 from lib.code_index_incremental import (
     attach_full_metadata,
     build_fingerprints,
+    combine_partials,
     compute_dirty,
+    env_dirty_digest,
     env_dirty_use_size,
     env_incremental_enabled,
     env_incremental_mode,
     env_max_inc_revs,
+    file_digest,
+    get_parsed_file_cache,
     merge_index,
     need_fingerprint_seed,
     should_force_full,
     stamp_rebuild_duration,
     validate_cache,
 )
+from lib.code_index_shards import pack_sharded
+from lib.code_index_store import CodeIndexView, open_index_view, write_index_store
+from lib.code_entity_search import MATCH_FIELDS, search_entities
 
 router = APIRouter()
 log = g.get_logger("projectman")
@@ -57,14 +68,41 @@ SMART_GREP_PROFILES = {
 
 
 def project_index_cache_path(project_name: str) -> Path:
+    return Path('/app/projects/.cache') / f'{project_name}_index.cib'
+
+
+def _legacy_index_json_path(project_name: str) -> Path:
     return Path('/app/projects/.cache') / f'{project_name}_index.jsl'
 
 
-def read_project_cached_index(project_name: str) -> dict | None:
+def read_project_index_view(project_name: str) -> CodeIndexView | None:
+    """mmap-view кеша индекса для точечных запросов; старый JSON-кеш конвертируется при первом чтении."""
     cache_path = project_index_cache_path(project_name)
-    if not cache_path.exists():
+    try:
+        view = open_index_view(cache_path)
+        if view is not None:
+            return view
+        legacy = _legacy_index_json_path(project_name)
+        if not legacy.exists():
+            return None
+        cached = json.loads(legacy.read_text(encoding='utf-8'))
+        if not validate_cache(cached):
+            log.warn("project index: старый JSON-кеш %s без entities/files, нужен ребилд", str(legacy))
+            return None
+        write_index_store(cache_path, cached)
+        legacy.unlink(missing_ok=True)
+        return open_index_view(cache_path)
+    except (OSError, ValueError, struct.error) as e:
+        log.warn("project index: повреждённый кеш %s (%s), нужен ребилд", str(cache_path), str(e))
+        return None
+
+
+def project_index_response(project_name: str, extra: dict | None = None) -> StreamingResponse | None:
+    """Кеш индекса как JSON-ответ, отдаваемый кусками из mmap-view (без dict всех строк); None — кеша нет."""
+    view = read_project_index_view(project_name)
+    if view is None:
         return None
-    return json.loads(cache_path.read_text(encoding='utf-8'))
+    return StreamingResponse(view.iter_json(extra), media_type="application/json")
 
 
 def get_project_index_status(project_id: int, project_name: str) -> dict:
@@ -103,10 +141,11 @@ def _resolve_project(project_id: int) -> tuple[ProjectManager, str]:
 
 
 def _write_project_index_cache(project_name: str, index_dict: dict) -> str:
-    cache_path = project_index_cache_path(project_name)
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    cache_path.write_text(json.dumps(index_dict, ensure_ascii=False, indent=2), encoding="utf-8")
-    return str(cache_path)
+    return write_index_store(project_index_cache_path(project_name), index_dict)
+
+
+def _entry_digest(entry: dict) -> str | None:
+    return file_digest(g.file_manager.resolve_disk_path(entry["file_name"], entry["project_id"]))
 
 
 def _build_project_index_full(project_id: int, project_name: str) -> tuple[dict, int, int, int, str]:
@@ -119,20 +158,21 @@ def _build_project_index_full(project_id: int, project_name: str) -> tuple[dict,
 
     assembler = ContextAssembler()
     file_map = {}
-    blocks = assembler.assemble_files(file_ids_set, file_map)
-    if not blocks:
+    specs = assembler.collect_file_specs(file_ids_set, file_map)
+    index_dict, blocks_count, entities_count = pack_sharded(project_name, specs) if specs else (None, 0, 0)
+    if not index_dict:
         raise HTTPException(status_code=404, detail="No supported files to index in project")
 
-    packer = SandwichPack(project_name, max_size=10_000_000, compression=True)
-    result = packer.pack(blocks)
-    entities_count = len(packer.entities) if packer.entities is not None else 0
-    index_dict = json.loads(result["index"])
+    if env_dirty_digest() != "off":
+        for entry in file_entries:
+            entry["digest"] = _entry_digest(entry)
+        get_parsed_file_cache().record(index_dict, specs, {int(e["id"]): e["digest"] for e in file_entries})
     index_dict = attach_full_metadata(
         index_dict, file_entries, duration_sec=time.monotonic() - t0
     )
     g.file_manager.sync_code_file_flags(project_id, index_dict.get("code_base_files") or [])
     cache_path = _write_project_index_cache(project_name, index_dict)
-    return index_dict, len(file_ids_set), len(blocks), entities_count, cache_path
+    return index_dict, len(file_ids_set), blocks_count, entities_count, cache_path
 
 
 def _build_project_index_sync(project_id: int, project_name: str, *, force_full: bool = False) -> tuple[dict, int, int, int, str]:
@@ -140,9 +180,11 @@ def _build_project_index_sync(project_id: int, project_name: str, *, force_full:
     if force_full or not env_incremental_enabled():
         return _build_project_index_full(project_id, project_name)
 
-    cached = read_project_cached_index(project_name)
-    if cached is None or not validate_cache(cached):
+    view = read_project_index_view(project_name)
+    if view is None:
         return _build_project_index_full(project_id, project_name)
+    # только метаданные (отпечатки, revision, code_base_files); строки берутся из mmap при сборке результата
+    cached = view.meta
 
     if need_fingerprint_seed(cached):
         log.info("project index: no file_fingerprints in cache, full rebuild project_id=%s", project_id)
@@ -159,6 +201,8 @@ def _build_project_index_sync(project_id: int, project_name: str, *, force_full:
 
     use_size = env_dirty_use_size()
     mode = env_incremental_mode()
+    digest_mode = env_dirty_digest()
+    digest_kw = {} if digest_mode == "off" else {"digest_of": _entry_digest, "digest_all": digest_mode == "all"}
     file_entries = g.file_manager.file_index(project_id, include_size=use_size, code_only=True)
     if not file_entries:
         raise HTTPException(status_code=404, detail=f"No files in project {project_id}")
@@ -174,18 +218,24 @@ def _build_project_index_sync(project_id: int, project_name: str, *, force_full:
         if isinstance(prev_all_fp, dict):
             dirty_cache = dict(cached)
             dirty_cache["file_fingerprints"] = prev_all_fp
-        dirty_all, removed_all = compute_dirty(dirty_cache, all_file_entries, use_size=use_size)
+        dirty_all, removed_all = compute_dirty(dirty_cache, all_file_entries, use_size=use_size, **digest_kw)
+        all_digests = {int(e["id"]): e.get("digest") for e in all_file_entries}
+        for entry in file_entries:
+            if all_digests.get(int(entry["id"])):
+                entry["digest"] = all_digests[int(entry["id"])]
         dirty = {fid for fid in dirty_all if fid in code_ids}
         prev_code_ids = {int(x) for x in (cached.get("code_base_files") or []) if str(x).isdigit()}
         removed = {fid for fid in removed_all if fid in prev_code_ids}
     else:
-        dirty, removed = compute_dirty(cached, file_entries, use_size=use_size)
+        dirty, removed = compute_dirty(cached, file_entries, use_size=use_size, **digest_kw)
     t_step = time.monotonic()
 
     if not dirty and not removed:
         path = str(project_index_cache_path(project_name))
-        n_ent = len(cached.get("entities") or [])
-        out = copy.deepcopy(cached)
+        n_ent = view.entities_count
+        out = view.to_dict()
+        # touch без правки (digest прежний): обновить ts в отпечатках, чтобы не хэшировать файл снова
+        out["file_fingerprints"] = build_fingerprints(file_entries)
         if mode == "refresh":
             out["all_file_fingerprints"] = build_fingerprints(all_file_entries)
         stamp_rebuild_duration(out, time.monotonic() - t_step)
@@ -195,52 +245,67 @@ def _build_project_index_sync(project_id: int, project_name: str, *, force_full:
     if dirty:
         assembler = ContextAssembler()
         file_map = {}
-        blocks = assembler.assemble_files(set(dirty), file_map)
-        assembled_ids = {getattr(b, "file_id", None) for b in blocks if getattr(b, "file_id", None) is not None}
-        if not blocks or assembled_ids != dirty:
+        specs = assembler.collect_file_specs(set(dirty), file_map)
+        assembled_ids = {int(spec["file_id"]) for spec in specs}
+        if not specs or assembled_ids != dirty:
             log.info(
                 "project index: incremental assemble mismatch or empty (dirty=%s assembled=%s), full rebuild project_id=%s",
                 sorted(dirty),
-                sorted(assembled_ids) if blocks else [],
+                sorted(assembled_ids),
                 project_id,
             )
             return _build_project_index_full(project_id, project_name)
 
-        packer = SandwichPack(project_name, max_size=10_000_000, compression=True)
-        result = packer.pack(blocks)
-        partial = json.loads(result["index"])
+        # файлы с уже разобранным содержимым (этот или другой проект) — из кеша по digest, без pack()
+        parsed_cache = get_parsed_file_cache()
+        digests = {int(e["id"]): e.get("digest") for e in file_entries}
+        reused, to_pack = parsed_cache.take(specs, digests)
+        blocks = ContextAssembler.build_blocks(to_pack, file_map)
+        if len(blocks) != len(to_pack):
+            log.info("project index: incremental block build failed for some files, full rebuild project_id=%s", project_id)
+            return _build_project_index_full(project_id, project_name)
+
+        partial = None
+        if blocks:
+            packer = SandwichPack(project_name, max_size=10_000_000, compression=True)
+            result = packer.pack(blocks)
+            partial = json.loads(result["index"])
+            parsed_cache.record(partial, to_pack, digests)
+        partial = combine_partials(partial, reused)
         try:
             new_rev = int(cached.get("rebuild_revision", 0)) + 1
         except (TypeError, ValueError):
             new_rev = 1
         merged = merge_index(
-            cached,
+            view.without_files(dirty | removed),
             partial,
             dirty_ids=dirty,
             removed_ids=removed,
             file_entries=file_entries,
             new_revision=new_rev,
             duration_sec=time.monotonic() - t_step,
+            prefiltered=True,
         )
         if mode == "refresh":
             merged["all_file_fingerprints"] = build_fingerprints(all_file_entries)
         g.file_manager.sync_code_file_flags(project_id, merged.get("code_base_files") or [])
         cache_path = _write_project_index_cache(project_name, merged)
         n_ent = len(merged.get("entities") or [])
-        return merged, len(file_entries), len(blocks), n_ent, cache_path
+        return merged, len(file_entries), len(specs), n_ent, cache_path
 
     try:
         new_rev = int(cached.get("rebuild_revision", 0)) + 1
     except (TypeError, ValueError):
         new_rev = 1
     merged = merge_index(
-        cached,
+        view.without_files(removed),
         None,
         dirty_ids=set(),
         removed_ids=removed,
         file_entries=file_entries,
         new_revision=new_rev,
         duration_sec=time.monotonic() - t_step,
+        prefiltered=True,
     )
     if mode == "refresh":
         merged["all_file_fingerprints"] = build_fingerprints(all_file_entries)
@@ -478,6 +543,8 @@ def _chunk_max_hits_cap() -> int:
 
 
 _NEXT_FILE_IDS_CAP = 500
+# Сколько file_id чанк читает из attached_files за раз, когда триграммы отсеивают большую часть файлов
+_CHUNK_WINDOW_CAP = 1000
 
 
 def _path_prefix_matches(file_name: str, path_prefix_norm: str) -> bool:
@@ -498,7 +565,10 @@ def _filter_entries_for_smart_grep(
     include_glob: list,
     time_filter,
     path_prefix_norm: str,
+    *,
+    order_by_id: bool = True,
 ) -> list:
+    """Фильтр области smart_grep; order_by_id=False сохраняет порядок entries (file_index — по file_name)."""
     out = []
     for entry in entries:
         file_name = entry.get("file_name") or ""
@@ -525,53 +595,57 @@ def _filter_entries_for_smart_grep(
             if lhs is None or not _cmp(lhs, op, rhs):
                 continue
         out.append(entry)
-    out.sort(key=lambda e: int(e.get("id") or 0))
+    if order_by_id:
+        out.sort(key=lambda e: int(e.get("id") or 0))
     return out
 
 
-def _grep_hits_one_file(
-    entry: dict,
+def _trigram_loader(entry: dict) -> str | None:
+    file_data = g.file_manager.get_file(int(entry["id"]))
+    return file_data.get("content") if file_data else None
+
+
+def _smart_grep_required(query: str, is_regex: bool, flags: int) -> list[bytes]:
+    """Обязательные триграммы запроса; [] — отбор по индексу отключён или невозможен."""
+    if not trigram_enabled():
+        return []
+    return query_trigrams(query, is_regex, flags)
+
+
+def _with_paths(pm: ProjectManager, project_id: int, entries: list) -> list:
+    return [e if e.get("path") else dict(e, path=str(pm.locate_file(e["file_name"], project_id))) for e in entries]
+
+
+def _smart_grep_candidates(pm: ProjectManager, project_id: int, entries: list, required: list[bytes]) -> list:
+    """Файлы, которые могут содержать совпадение (триграммные сигнатуры по stat с диска), в исходном порядке.
+
+    Блокирующий вызов (stat каждого файла) — только из потока, не из event loop.
+    """
+    if not required:
+        return entries
+    return get_trigram_index(project_id).shortlist(_with_paths(pm, project_id, entries), required, _trigram_loader)
+
+
+def _smart_grep_scan(
     pm: ProjectManager,
     project_id: int,
+    entries: list,
     query: str,
-    pattern: re.Pattern | None,
     is_regex: bool,
     case_sensitive: bool,
     context_lines: int,
-) -> list[dict]:
-    file_id = entry["id"]
-    file_name = entry["file_name"]
-    file_data = g.file_manager.get_file(file_id)
-    if not file_data or file_data.get("content") is None:
-        return []
-    lines = str(file_data.get("content") or "").splitlines()
-    hits = []
-    for i, line in enumerate(lines, start=1):
-        if pattern is not None:
-            m = pattern.search(line)
-            matched = m is not None
-            matched_text = m.group(0)[:200] if m else ""
-        else:
-            haystack = line if case_sensitive else line.lower()
-            needle = query if case_sensitive else query.lower()
-            matched = needle in haystack
-            matched_text = query[:200] if matched else ""
-        if not matched:
-            continue
-        before = lines[max(0, i - 1 - context_lines) : i - 1] if context_lines else []
-        after = lines[i : i + context_lines] if context_lines else []
-        hits.append(
-            {
-                "file_id": file_id,
-                "file_name": file_name,
-                "line": i,
-                "line_text": line[:400],
-                "match": matched_text,
-                "context_before": before,
-                "context_after": after,
-            }
-        )
-    return hits
+    max_hits: int,
+):
+    """(entry, hits | None) по файлам в исходном порядке; чтение и поиск — в пуле lib/smart_grep_executor."""
+    items = _with_paths(pm, project_id, entries)
+    return get_smart_grep_executor().scan(
+        items,
+        query=query,
+        is_regex=is_regex,
+        case_sensitive=case_sensitive,
+        context_lines=context_lines,
+        max_hits=max_hits,
+    )
 
 
 def _scan_state_store() -> dict:
@@ -974,6 +1048,49 @@ async def file_tree(
         raise
 
 
+@router.get("/project/file_dir")
+async def file_dir(
+    request: Request,
+    project_id: int = Query(...),
+    path: str = Query(''),
+    cursor: str = Query(None),
+    limit: int = Query(500),
+):
+    """Один уровень дерева (каталоги с числом файлов + файлы) с постраничной выдачей по cursor.
+
+    В отличие от /project/file_tree не читает индекс проекта целиком: раскрытие каталога — один запрос
+    по (project_id, path_seg_count, file_name). project_id < 0 — глобальные файлы (project_id IS NULL).
+    """
+    started = time.monotonic()
+    try:
+        g.check_session(request)
+        effective_project_id = None if project_id < 0 else project_id
+        normalized_path = str(path or '').lstrip('/').rstrip('/')
+        limit = max(1, min(int(limit or 500), 5000))
+        body = await asyncio.to_thread(
+            g.file_manager.list_tree_level, effective_project_id, normalized_path, cursor=cursor, limit=limit
+        )
+        body['project_id'] = effective_project_id
+        duration = time.monotonic() - started
+        n_entries = len(body.get('entries') or [])
+        if duration >= 2:
+            log.warn(
+                g.with_session_tag(request, 'PERF_WARN GET /project/file_dir project_id=%s path=%s took=%.2fs entries=%d'),
+                str(effective_project_id), normalized_path or '/', duration, n_entries
+            )
+        else:
+            log.debug(
+                g.with_session_tag(request, 'GET /project/file_dir project_id=%s path=%s took=%.2fs entries=%d'),
+                str(effective_project_id), normalized_path or '/', duration, n_entries
+            )
+        return body
+    except HTTPException:
+        raise
+    except Exception as e:
+        g.handle_exception('Ошибка в GET /project/file_dir', e)
+        raise
+
+
 @router.get("/project/scan_state")
 async def project_scan_state(request: Request, project_id: int = Query(...)):
     try:
@@ -1114,15 +1231,6 @@ async def project_maint_enqueue(request: Request):
         raise
 
 
-def _merge_rebuilt_now(payload: dict, in_progress: bool) -> dict:
-    """Добавить ``rebuilt_now: 1``, если по проекту ещё идёт пересборка индекса."""
-    if not in_progress:
-        return payload
-    out = dict(payload)
-    out["rebuilt_now"] = 1
-    return out
-
-
 @router.get("/project/code_index")
 def code_index(
     request: Request,
@@ -1160,14 +1268,15 @@ def code_index(
                     project_id,
                 )
                 return ready
-            cached = read_project_cached_index(project_name)
             db = Database.get_database()
             maint_pool_lib.ensure_maint_pool_tables(db.engine)
             maint_busy = maint_pool_lib.code_index_active(db.engine, project_id)
             pending_bg = reg.has_pending(str(sid), "code_index", project_id)
             in_progress = maint_busy or pending_bg
+            # rebuilt_now: 1 — по проекту ещё идёт пересборка индекса
+            cached = project_index_response(project_name, {"rebuilt_now": 1} if in_progress else None)
             if cached is not None:
-                return _merge_rebuilt_now(cached, in_progress)
+                return cached
             if in_progress:
                 return {"rebuilt_now": 1}
             raise HTTPException(
@@ -1253,6 +1362,67 @@ async def project_index_meta(request: Request, project_id: int):
         raise
 
 
+@router.post("/project/entity_search")
+async def project_entity_search(request: Request):
+    """Поиск определений в кеше code_index (cq_grep_entity): в ответе только совпадения, без полного индекса.
+
+    Body: project_id, patterns[], match_field (name|parent|qualified), entity_types?, is_regex, case_sensitive,
+    max_results (1..500). Кеш не пересобирается — при его отсутствии ``index_ready=false``.
+    """
+    try:
+        g.check_session(request)
+        data = await request.json()
+        project_id = int(data.get('project_id') or 0)
+        _, project_name = _resolve_project(project_id)
+        patterns = data.get('patterns') or []
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        patterns = [str(p) for p in patterns if str(p).strip()]
+        if not patterns:
+            raise HTTPException(status_code=400, detail="patterns must be a non-empty array")
+        match_field = str(data.get('match_field') or 'name').lower()
+        if match_field not in MATCH_FIELDS:
+            raise HTTPException(status_code=400, detail="match_field must be one of: name, parent, qualified")
+        type_filter = data.get('entity_types')
+        type_allow = None
+        if type_filter is not None:
+            if not isinstance(type_filter, list):
+                raise HTTPException(status_code=400, detail="entity_types must be an array of strings or omitted")
+            type_allow = {str(t) for t in type_filter if str(t).strip()} or None
+        max_results = max(1, min(int(data.get('max_results', 100)), 500))
+
+        view = await asyncio.to_thread(read_project_index_view, project_name)
+        if view is None or view.entities_count == 0:
+            return {"project_id": project_id, "index_ready": False, "matches": [], "count": 0, "truncated": False}
+        try:
+            matches, truncated = await asyncio.to_thread(
+                search_entities,
+                view,
+                patterns,
+                match_field=match_field,
+                type_allow=type_allow,
+                is_regex=bool(data.get('is_regex', True)),
+                case_sensitive=bool(data.get('case_sensitive', False)),
+                max_results=max_results,
+            )
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid pattern: {e}")
+        return {
+            "project_id": project_id,
+            "index_ready": True,
+            "entities_total": view.entities_count,
+            "matches": matches,
+            "count": len(matches),
+            "truncated": truncated,
+            "max_results": max_results,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        g.handle_exception("Ошибка в POST /project/entity_search", e)
+        raise
+
+
 @router.post("/project/smart_grep/chunk")
 async def smart_grep_chunk(request: Request):
     """Stateless-чанк grep: offset/limit по закэшированному списку file_id (см. docs/search_grep_async_upgrade.md)."""
@@ -1323,7 +1493,7 @@ async def smart_grep_chunk(request: Request):
                     detail="project_refresh in chunk is only allowed with offset=0",
                 )
             scan_started = time.monotonic()
-            pm.scan_project_files()
+            await asyncio.to_thread(pm.scan_project_files)
             current_epoch = g.get_project_index_epoch(project_id)
             log.debug(
                 "smart_grep_chunk project_refresh scan done project_id=%d sec=%.3f epoch=%d",
@@ -1349,39 +1519,61 @@ async def smart_grep_chunk(request: Request):
             return [int(e["id"]) for e in filt]
 
         cache = get_scope_cache()
-        ids_sorted = cache.get_or_build(project_id, path_prefix_norm, fp, current_epoch, _build_id_list)
+        ids_sorted = await asyncio.to_thread(
+            cache.get_or_build, project_id, path_prefix_norm, fp, current_epoch, _build_id_list
+        )
         total_ids = len(ids_sorted)
 
         if offset > total_ids:
             raise HTTPException(status_code=400, detail="offset beyond total_ids_in_scope")
 
-        batch_ids = ids_sorted[offset : offset + limit_files]
         flags = 0 if case_sensitive else re.IGNORECASE
-        pattern = re.compile(query, flags) if is_regex else None
+        if is_regex:
+            re.compile(query, flags)  # ошибка regex → 400 до запуска пула
+        required = _smart_grep_required(query, is_regex, flags)
+        # limit_files считает только реально прочитанные файлы; отсеянные по триграммам пропускаются даром
+        window_size = min(limit_files * 8, _CHUNK_WINDOW_CAP) if required else limit_files
 
         hits: list[dict] = []
-        files_scanned = 0
+        pos = offset
+        files_read = 0
         truncated_by_max_hits = False
-        for fid in batch_ids:
-            rows = g.file_manager.file_index(project_id, file_ids=[fid])
-            if not rows:
-                files_scanned += 1
-                continue
-            entry = rows[0]
-            fh = _grep_hits_one_file(
-                entry, pm, project_id, query, pattern, is_regex, case_sensitive, context_lines
+        while pos < total_ids and files_read < limit_files and not truncated_by_max_hits:
+            window = ids_sorted[pos : pos + window_size]
+            window_rows = await asyncio.to_thread(g.file_manager.file_index, project_id, file_ids=window)
+            rows = {int(r["id"]): r for r in window_rows}
+            window_cands = await asyncio.to_thread(
+                _smart_grep_candidates, pm, project_id, [rows[f] for f in window if f in rows], required
             )
-            if len(hits) + len(fh) > max_hits:
-                remain = max_hits - len(hits)
-                if remain > 0:
-                    hits.extend(fh[:remain])
-                truncated_by_max_hits = True
-                files_scanned += 1
-                break
-            hits.extend(fh)
-            files_scanned += 1
-
-        next_offset = offset + files_scanned
+            cand_ids = {int(e["id"]) for e in window_cands}
+            # кандидаты окна (не больше остатка limit_files) и позиция в окне сразу за каждым из них
+            todo: list[dict] = []
+            advance = len(window)
+            for k, fid in enumerate(window):
+                if fid not in cand_ids:
+                    continue
+                if files_read + len(todo) >= limit_files:
+                    advance = k
+                    break
+                todo.append(dict(rows[fid], _after=k + 1))
+            scan = _smart_grep_scan(pm, project_id, todo, query, is_regex, case_sensitive, context_lines,
+                                    max_hits - len(hits) + 1)
+            async with aclosing(scan):
+                async for item, fh in scan:
+                    files_read += 1
+                    fh = fh or []
+                    if len(hits) + len(fh) > max_hits:
+                        remain = max_hits - len(hits)
+                        if remain > 0:
+                            hits.extend(fh[:remain])
+                        truncated_by_max_hits = True
+                        advance = item["_after"]
+                        break
+                    hits.extend(fh)
+            pos += advance
+
+        files_scanned = pos - offset
+        next_offset = pos
         scan_complete = next_offset >= total_ids and not truncated_by_max_hits
 
         tail = ids_sorted[next_offset : next_offset + _NEXT_FILE_IDS_CAP]
@@ -1409,6 +1601,7 @@ async def smart_grep_chunk(request: Request):
             "offset": offset,
             "limit_files": limit_files,
             "files_scanned": files_scanned,
+            "files_read": files_read,
             "total_ids_in_scope": total_ids,
             "next_offset": next_offset,
             "scan_complete": scan_complete,
@@ -1449,6 +1642,8 @@ async def smart_grep(request: Request):
         if isinstance(include_glob, str):
             include_glob = [x.strip() for x in include_glob.split(',') if x.strip()]
         search_mode = str(data.get('search_mode', 'project_registered') or 'project_registered').strip().lower()
+        # stream=true: ответ NDJSON — строки {"hit": ...} по мере нахождения, в конце {"done": {...}}
+        stream = bool(data.get('stream', False))
         if search_mode not in ('project_registered', 'project_refresh'):
             raise HTTPException(
                 status_code=400,
@@ -1475,86 +1670,27 @@ async def smart_grep(request: Request):
 
         if search_mode == 'project_refresh':
             scan_started = time.monotonic()
-            pm.scan_project_files()
+            await asyncio.to_thread(pm.scan_project_files)
             log.debug(
                 "smart_grep project_refresh scan done project_id=%d sec=%.3f",
                 project_id,
                 time.monotonic() - scan_started,
             )
 
-        entries = g.file_manager.file_index(project_id)
-        hits = []
-        truncated = False
         flags = 0 if case_sensitive else re.IGNORECASE
-        pattern = re.compile(query, flags) if is_regex else None
-
-        for entry in entries:
-            file_id = entry['id']
-            file_name = entry['file_name']
-            if not _is_mode_match(file_name, mode):
-                continue
-            if not _is_profile_match(file_name, profile):
-                continue
-            if include_glob and not any(fnmatch(file_name, gpat) for gpat in include_glob):
-                continue
-
-            if time_filter:
-                field, op, rhs = time_filter
-                lhs = None
-                if field in ('mtime', 'ts'):
-                    lhs = int(entry.get('ts') or 0)
-                elif field == 'ctime':
-                    try:
-                        qfn = pm.locate_file(file_name, project_id)
-                        if qfn and qfn.exists():
-                            lhs = int(qfn.stat().st_ctime)
-                    except Exception:
-                        lhs = None
-                if lhs is None or not _cmp(lhs, op, rhs):
-                    continue
-
-            file_data = g.file_manager.get_file(file_id)
-            if not file_data or file_data.get('content') is None:
-                continue
-            lines = str(file_data.get('content') or '').splitlines()
-
-            for i, line in enumerate(lines, start=1):
-                if pattern is not None:
-                    m = pattern.search(line)
-                    matched = m is not None
-                    matched_text = m.group(0)[:200] if m else ''
-                else:
-                    haystack = line if case_sensitive else line.lower()
-                    needle = query if case_sensitive else query.lower()
-                    matched = needle in haystack
-                    matched_text = query[:200] if matched else ''
-
-                if not matched:
-                    continue
-
-                before = lines[max(0, i - 1 - context_lines):i - 1] if context_lines else []
-                after = lines[i:i + context_lines] if context_lines else []
-                hits.append({
-                    'file_id': file_id,
-                    'file_name': file_name,
-                    'line': i,
-                    'line_text': line[:400],
-                    'match': matched_text,
-                    'context_before': before,
-                    'context_after': after,
-                })
-                if len(hits) >= max_results:
-                    truncated = True
-                    break
+        if is_regex:
+            re.compile(query, flags)  # ошибка regex → 400 до запуска пула
 
-            if truncated:
-                break
+        def _scope_entries() -> list:
+            scoped = _filter_entries_for_smart_grep(
+                g.file_manager.file_index(project_id), pm, project_id, mode, profile, include_glob, time_filter, "",
+                order_by_id=False,
+            )
+            return _smart_grep_candidates(pm, project_id, scoped, _smart_grep_required(query, is_regex, flags))
 
-        log.debug(
-            g.with_session_tag(request, "POST /project/smart_grep user_id=%d project_id=%d mode=%s profile=%s regex=%s time_strict=%s results=%d truncated=%s"),
-            user_id, project_id, mode, profile, str(is_regex), time_strict or '-', len(hits), str(truncated)
-        )
-        return {
+        candidates = await asyncio.to_thread(_scope_entries)
+        scan = _smart_grep_scan(pm, project_id, candidates, query, is_regex, case_sensitive, context_lines, max_results)
+        summary = {
             'status': 'ok',
             'project_id': project_id,
             'search_mode': search_mode,
@@ -1564,10 +1700,48 @@ async def smart_grep(request: Request):
             'is_regex': is_regex,
             'case_sensitive': case_sensitive,
             'time_strict': time_strict or None,
-            'total': len(hits),
-            'truncated': truncated,
-            'hits': hits,
         }
+
+        async def _hits():
+            """Совпадения по мере поступления из пула; последний элемент — (None, truncated)."""
+            n = 0
+            async with aclosing(scan):
+                async for _, fh in scan:
+                    for hit in fh or ():
+                        yield hit, False
+                        n += 1
+                        if n >= max_results:
+                            yield None, True
+                            return
+            yield None, False
+
+        if stream:
+            async def _ndjson():
+                n = 0
+                async for hit, truncated in _hits():
+                    if hit is None:
+                        log.debug(
+                            g.with_session_tag(request, "POST /project/smart_grep stream user_id=%d project_id=%d results=%d truncated=%s"),
+                            user_id, project_id, n, str(truncated)
+                        )
+                        yield json.dumps({'done': dict(summary, total=n, truncated=truncated)}, ensure_ascii=False) + "\n"
+                        return
+                    n += 1
+                    yield json.dumps({'hit': hit}, ensure_ascii=False) + "\n"
+
+            return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+        hits = []
+        truncated = False
+        async for hit, truncated in _hits():
+            if hit is not None:
+                hits.append(hit)
+
+        log.debug(
+            g.with_session_tag(request, "POST /project/smart_grep user_id=%d project_id=%d mode=%s profile=%s regex=%s time_strict=%s results=%d truncated=%s"),
+            user_id, project_id, mode, profile, str(is_regex), time_strict or '-', len(hits), str(truncated)
+        )
+        return dict(summary, total=len(hits), truncated=truncated, hits=hits)
     except re.error as e:
         raise HTTPException(status_code=400, detail=f"Invalid regex: {str(e)}")
     except HTTPException:
@@ -3,11 +3,15 @@
 
 Single process cycle (или пул при CORE_MAINT_POOL_WORKERS>1):
 - choose active projects (sessions.active_project + recent context activity),
-- run find snapshot,
+- run a scandir snapshot (lib.project_walker),
 - compare with attached_files links,
 - optionally mutate DB (degrade/recover/add links; purge @-links when missing_ttl exhausted),
 - optionally trigger lazy project scan with cooldown.
 
+Режим inotify (CORE_MAINT_LIVE_INDEX=1, по умолчанию): inotify в процессе ведёт живой набор путей активных
+проектов и применяет create/delete/modify точечно (ссылки, ts для dirty code_index, TTL); полный тик — при
+старте, новом активном проекте, переполнении очереди. Без inotify в процессе — прежнее пробуждение через inotifywait.
+
 Пул: оркестратор ставит строки в maint_pool_jobs (не более одной queued/running на project_id);
 подпроцессы делают claim + run_tick_for_project; прогресс — строки ``MAINT_POOL_PROGRESS`` в stdout воркера.
 Ленивый scan/find выполняет только воркер с взятым job; без задачи воркер только sleep (``CORE_MAINT_POOL_IDLE_SLEEP_SEC``).
@@ -22,6 +26,7 @@ import json
 import os
 import shutil
 import signal
+import stat
 import subprocess
 import sys
 import time
@@ -37,9 +42,12 @@ if str(_AGENT_ROOT) not in sys.path:
 
 import globals
 from lib.basic_logger import BasicLogger
-from lib.file_type_detector import is_acceptable_file
+from lib.file_type_detector import accept_files
 from lib.file_link_prefix import sql_link_prefixed_params, strip_storage_prefix
+from lib.inotify_watcher import GONE_MASK, PRESENT_MASK, InotifyEvent, InotifyWatcher
+from lib.live_missing_links import MissingLinks, degrade_or_purge_missing
 from lib.project_scan_filter import ProjectScanFilter
+from lib.project_walker import walk_project_files
 from managers.db import Database
 from managers.files import FileManager
 from managers.project import ProjectManager
@@ -170,6 +178,29 @@ def _inotify_timeout_sec() -> float:
     return get_float("CORE_MAINT_INOTIFY_TIMEOUT_SEC", 20.0, 1.0, 3600.0)
 
 
+def _live_index_enabled() -> bool:
+    """Режим inotify: watch в процессе и точечный reconcile по событиям вместо полного тика на каждое событие."""
+    return get_bool("CORE_MAINT_LIVE_INDEX", default=True)
+
+
+def _live_debounce_sec() -> float:
+    """Сколько дособирать события после первого (сохранение редактором, git checkout) перед применением."""
+    return get_float("CORE_MAINT_LIVE_DEBOUNCE_SEC", 0.25, 0.0, 5.0)
+
+
+def _live_refresh_sec() -> float:
+    """Период пересмотра набора активных проектов живого индекса."""
+    return get_float("CORE_MAINT_LIVE_REFRESH_SEC", 60.0, 5.0, 3600.0)
+
+
+def _live_missing_recheck_sec() -> float:
+    """Период шага деградации TTL пропавших файлов живого индекса — независимо от потока событий.
+
+    Фактическая частота ограничена снизу ожиданием событий (CORE_MAINT_INOTIFY_TIMEOUT_SEC).
+    """
+    return get_float("CORE_MAINT_LIVE_MISSING_RECHECK_SEC", 20.0, 1.0, 3600.0)
+
+
 def _inotify_force_active_sec() -> float:
     return get_float("CORE_MAINT_INOTIFY_FORCE_ACTIVE_SEC", 300.0, 5.0, 86_400.0)
 
@@ -282,72 +313,47 @@ def _rel_excluded_from_maint_snapshot(rel: str, scan_filter: ProjectScanFilter |
     return False
 
 
-def _normalize_rel(path: Path, root: Path) -> str | None:
-    try:
-        rel = path.relative_to(root)
-    except Exception:
-        return None
-    s = str(rel).replace("\\", "/").lstrip("/")
-    return s or None
-
-
 def _project_dir(project_name: str) -> Path:
     return Path("/app/projects") / str(project_name)
 
 
-def _subprocess_find_run(
-    cmd: list[str],
-    timeout_sec: float,
-    *,
-    scope: str,
-    path_for_log: str,
-) -> subprocess.CompletedProcess:
+def _walk_snapshot(project_root: Path, start: Path, timeout_sec: float, *, scope: str) -> tuple[set[str], dict[str, float]]:
+    """Общий scandir-обход (lib.project_walker) с фильтрами maint: (пути относительно project_root, сек по поддеревьям).
+
+    Неполный снимок (таймаут) — исключение, как раньше у ``find``: иначе db_only пометил бы живые файлы.
+    """
+    scan_filter = ProjectScanFilter(project_root, logger=log)
     t0 = time.monotonic()
-    proc = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        timeout=max(1.0, timeout_sec),
-        check=False,
+    walked = walk_project_files(
+        project_root,
+        start=start,
+        file_excluded=lambda rel: _rel_excluded_from_maint_snapshot(rel, scan_filter),
+        dir_excluded=lambda rel: rel == "backups" or scan_filter.is_dir_excluded(rel),
+        deadline=t0 + max(1.0, timeout_sec),
+        log=log,
     )
+    accepted = accept_files([(Path(wf.path), wf.st) for wf in walked.files])
+    walked.files = [wf for wf, ok in zip(walked.files, accepted) if ok]
     elapsed = time.monotonic() - t0
     if elapsed >= _find_slow_log_threshold_sec():
         log.info(
-            "CORE_MAINT find_slow scope=%s path=%s elapsed_sec=%.3f find_rc=%d",
+            "CORE_MAINT find_slow scope=%s path=%s elapsed_sec=%.3f files=%d subtrees=%s",
             scope,
-            path_for_log,
+            str(start),
             elapsed,
-            int(proc.returncode),
+            len(walked.files),
+            ", ".join(f"{name}={sec:.2f}s" for name, sec in walked.slowest()) or "-",
         )
-    return proc
+    if walked.time_limited:
+        raise RuntimeError(f"walk timed out after {elapsed:.1f}s: {start}")
+    return {wf.rel for wf in walked.files}, {name: round(sec, 3) for name, sec in walked.slowest()}
 
 
-def _find_files_snapshot(project_root: Path, timeout_sec: float) -> tuple[set[str], bool]:
+def _find_files_snapshot(project_root: Path, timeout_sec: float) -> tuple[set[str], bool, dict[str, float]]:
     if not project_root.exists():
-        return set(), False
-    scan_filter = ProjectScanFilter(project_root, logger=log)
-    cmd = ["find", str(project_root), "-type", "f"]
-    proc = _subprocess_find_run(
-        cmd,
-        timeout_sec,
-        scope="project_root",
-        path_for_log=str(project_root),
-    )
-    if proc.returncode != 0:
-        stderr = (proc.stderr or "").strip()[:400]
-        raise RuntimeError(f"find failed rc={proc.returncode}: {stderr}")
-    rows = set()
-    for line in (proc.stdout or "").splitlines():
-        p = Path(line.strip())
-        rel = _normalize_rel(p, project_root)
-        if not rel:
-            continue
-        if _rel_excluded_from_maint_snapshot(rel, scan_filter):
-            continue
-        if not is_acceptable_file(p):
-            continue
-        rows.add(rel)
-    return rows, True
+        return set(), False, {}
+    rows, subtrees = _walk_snapshot(project_root, project_root, timeout_sec, scope="project_root")
+    return rows, True, subtrees
 
 
 def _find_files_snapshot_under(project_root: Path, subtree: Path, timeout_sec: float) -> tuple[set[str], bool]:
@@ -360,28 +366,7 @@ def _find_files_snapshot_under(project_root: Path, subtree: Path, timeout_sec: f
         subtree.resolve().relative_to(project_root.resolve())
     except Exception:
         raise RuntimeError(f"subtree not under project_root: {subtree} vs {project_root}")
-    scan_filter = ProjectScanFilter(project_root, logger=log)
-    cmd = ["find", str(subtree), "-type", "f"]
-    proc = _subprocess_find_run(
-        cmd,
-        timeout_sec,
-        scope="subtree",
-        path_for_log=str(subtree),
-    )
-    if proc.returncode != 0:
-        stderr = (proc.stderr or "").strip()[:400]
-        raise RuntimeError(f"find failed rc={proc.returncode}: {stderr}")
-    rows: set[str] = set()
-    for line in (proc.stdout or "").splitlines():
-        p = Path(line.strip())
-        rel = _normalize_rel(p, project_root)
-        if not rel:
-            continue
-        if _rel_excluded_from_maint_snapshot(rel, scan_filter):
-            continue
-        if not is_acceptable_file(p):
-            continue
-        rows.add(rel)
+    rows, _subtrees = _walk_snapshot(project_root, subtree, timeout_sec, scope="subtree")
     return rows, True
 
 
@@ -752,55 +737,37 @@ def _fetch_db_links_prefix(db: Database, project_id: int, rel_prefix: str) -> di
     return {k: v for k, v in all_links.items() if k == pfx or k.startswith(pfx + "/")}
 
 
-def _degrade_missing(db: Database, fm: FileManager, file_id: int, ttl_prev: int) -> int:
-    ttl_next = max(0, min(int(ttl_prev), fm.missing_ttl_max) - 1)
-    db.execute(
-        """
-        UPDATE attached_files
-        SET missing_ttl = :ttl, missing_checked_ts = :ts
-        WHERE id = :id
-        """,
-        {"ttl": ttl_next, "ts": _now_ts(), "id": int(file_id)},
-    )
-    return ttl_next
+def _bulk_recover_present(fm: FileManager, db_links: dict[str, tuple[int, int]], both: list[str]) -> int:
+    ttl_max = int(fm.missing_ttl_max)
+    ids = [int(db_links[rel][0]) for rel in both if int(db_links[rel][1]) < ttl_max]
+    if not ids:
+        return 0
+    return fm.bulk_set_missing_ttl({ttl_max: ids}, _now_ts())
 
 
-def _degrade_or_purge_missing(
-    db: Database,
+def _bulk_add_links(
     fm: FileManager,
-    file_id: int,
-    ttl_prev: int,
-    *,
+    project_root: Path,
     project_id: int,
-    rel: str,
-    purge: bool,
-) -> str:
-    """Декремент missing_ttl либо удаление строки, если TTL исчерпан и purge включён. Возвращает purged|degraded."""
-    ttl_next = max(0, min(int(ttl_prev), fm.missing_ttl_max) - 1)
-    if purge and ttl_next == 0:
-        fm.purge_stale_attached_row(int(file_id), int(project_id))
-        log.info(
-            "CORE_MAINT purged TTL-exhausted link project_id=%d file_id=%d rel=%s",
-            int(project_id),
-            int(file_id),
-            rel,
-        )
-        return "purged"
-    _degrade_missing(db, fm, file_id, ttl_prev)
-    return "degraded"
-
-
-def _recover_present(db: Database, fm: FileManager, file_id: int, ttl_prev: int) -> None:
-    if int(ttl_prev) >= int(fm.missing_ttl_max):
-        return
-    db.execute(
-        """
-        UPDATE attached_files
-        SET missing_ttl = :ttl, missing_checked_ts = :ts
-        WHERE id = :id
-        """,
-        {"ttl": int(fm.missing_ttl_max), "ts": _now_ts(), "id": int(file_id)},
-    )
+    fs_only: list[str],
+    *,
+    log_prefix: str,
+) -> int:
+    """fs_only → FileManager.bulk_reconcile_links (stat один раз на файл, executemany вставок)."""
+    entries: list[dict] = []
+    for rel in fs_only:
+        try:
+            st = (project_root / rel).stat()
+            entries.append({"file_name": rel, "ts": int(st.st_mtime), "mode": stat.S_IMODE(st.st_mode)})
+        except OSError:
+            entries.append({"file_name": rel, "ts": _now_ts(), "mode": None})
+    if not entries:
+        return 0
+    try:
+        return int(fm.bulk_reconcile_links(int(project_id), entries).get("added", 0))
+    except Exception as e:
+        log.warn("%s bulk add links failed project_id=%d files=%d: %s", log_prefix, project_id, len(entries), str(e))
+        return 0
 
 
 def _lazy_scan_if_due(project_id: int, last_scan: dict[int, float], cooldown_sec: float, budget_sec: float) -> bool:
@@ -901,13 +868,14 @@ def run_tick_for_project(
     found_ok = False
     try:
         _maybe_pool_progress(progress_cb, "find_begin", force=True, root=str(project_root))
-        fs_set, found_ok = _find_files_snapshot(project_root, timeout_sec)
+        fs_set, found_ok, subtrees = _find_files_snapshot(project_root, timeout_sec)
         _maybe_pool_progress(
             progress_cb,
             "find_done",
             force=True,
             find_count=len(fs_set),
             find_ok=bool(found_ok),
+            subtrees=subtrees,
         )
     except Exception as e:
         log.warn("CORE_MAINT find failed project_id=%d name=%s: %s", project_id, project_name, str(e))
@@ -934,43 +902,17 @@ def run_tick_for_project(
     recovered = 0
     added = 0
     do_purge = _purge_stale_links_enabled()
-    step = 0
     if mutate:
-        for rel in db_only:
-            step += 1
-            if progress_cb and step % 400 == 0:
-                _maybe_pool_progress(progress_cb, "reconcile_db_only", rel=rel, step=step, total=len(db_only))
-            fid, ttl_prev = db_links[rel]
-            if _degrade_or_purge_missing(
-                db, fm, fid, ttl_prev, project_id=project_id, rel=rel, purge=do_purge
-            ) == "purged":
-                purged += 1
-            else:
-                degraded += 1
-        for rel in both:
-            step += 1
-            if progress_cb and step % 400 == 0:
-                _maybe_pool_progress(progress_cb, "reconcile_both", step=step)
-            fid, ttl_prev = db_links[rel]
-            if ttl_prev < fm.missing_ttl_max:
-                _recover_present(db, fm, fid, ttl_prev)
-                recovered += 1
-        for rel in fs_only:
-            step += 1
-            if progress_cb and step % 400 == 0:
-                _maybe_pool_progress(progress_cb, "reconcile_fs_only", step=step)
-            try:
-                fp = project_root / rel
-                ts = int(fp.stat().st_mtime) if fp.exists() else _now_ts()
-                fm.add_file(rel, None, timestamp=ts, project_id=project_id)
-                added += 1
-            except Exception as e:
-                log.warn(
-                    "CORE_MAINT add link failed project_id=%d file=%s: %s",
-                    project_id,
-                    rel,
-                    str(e),
-                )
+        # db_only/both — только UPDATE/DELETE по id: один unit-of-work (одно соединение, один commit).
+        with db.transaction():
+            _maybe_pool_progress(progress_cb, "reconcile_db_only", total=len(db_only))
+            degraded, purged = degrade_or_purge_missing(
+                fm, db_links, db_only, project_id=project_id, purge=do_purge, log=log
+            )
+            _maybe_pool_progress(progress_cb, "reconcile_both", total=len(both))
+            recovered = _bulk_recover_present(fm, db_links, both)
+        _maybe_pool_progress(progress_cb, "reconcile_fs_only", total=len(fs_only))
+        added = _bulk_add_links(fm, project_root, project_id, fs_only, log_prefix="CORE_MAINT")
 
     scanned = False
     if scan_on and (db_only or fs_only):
@@ -1242,32 +1184,12 @@ def run_poll_failed_subtrees(last_scan: dict[int, float]) -> None:
         added = 0
         do_purge = _purge_stale_links_enabled()
         if mutate:
-            for rel in db_only:
-                fid, ttl_prev = db_links[rel]
-                if _degrade_or_purge_missing(
-                    db, fm, fid, ttl_prev, project_id=project_id, rel=rel, purge=do_purge
-                ) == "purged":
-                    purged += 1
-                else:
-                    degraded += 1
-            for rel in both:
-                fid, ttl_prev = db_links[rel]
-                if ttl_prev < fm.missing_ttl_max:
-                    _recover_present(db, fm, fid, ttl_prev)
-                    recovered += 1
-            for rel in fs_only:
-                try:
-                    fp = project_root / rel
-                    ts = int(fp.stat().st_mtime) if fp.exists() else _now_ts()
-                    fm.add_file(rel, None, timestamp=ts, project_id=project_id)
-                    added += 1
-                except Exception as e:
-                    log.warn(
-                        "CORE_MAINT poll add link failed project_id=%d file=%s: %s",
-                        project_id,
-                        rel,
-                        str(e),
-                    )
+            with db.transaction():
+                degraded, purged = degrade_or_purge_missing(
+                    fm, db_links, db_only, project_id=project_id, purge=do_purge, log=log
+                )
+                recovered = _bulk_recover_present(fm, db_links, both)
+            added = _bulk_add_links(fm, project_root, project_id, fs_only, log_prefix="CORE_MAINT poll")
 
         scanned = False
         if scan_on and (db_only or fs_only):
@@ -1306,6 +1228,270 @@ def run_poll_failed_subtrees(last_scan: dict[int, float]) -> None:
         )
 
 
+_PROJECTS_ROOT = "/app/projects"
+
+
+class _LiveProject:
+    """Живое состояние активного проекта: принятые файлы (rel) и события с последнего применения."""
+
+    def __init__(self, project_id: int, project_name: str, fm: FileManager) -> None:
+        self.project_id = int(project_id)
+        self.name = str(project_name)
+        self.root = _project_dir(project_name)
+        self.scan_filter = ProjectScanFilter(self.root, logger=log)
+        self.files: set[str] = set()
+        self.missing = MissingLinks(fm, self.project_id, self.root, log=log)
+        self.touched: set[str] = set()
+        self.new_dirs: set[str] = set()
+        self.gone_dirs: set[str] = set()
+
+    def seed(self, db: Database) -> None:
+        """Снимок файлов с диска; ссылки без файла (в т.ч. пропавшие до старта) — в missing, на шаги TTL по таймеру."""
+        self.files, _subtrees = _walk_snapshot(self.root, self.root, _find_timeout_sec(), scope="live_seed")
+        self.missing.seed(_fetch_db_links(db, self.project_id), self.files)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.touched or self.new_dirs or self.gone_dirs)
+
+
+class _LiveIndex:
+    """inotify в процессе (lib.inotify_watcher) → точечный reconcile изменённых путей активных проектов.
+
+    Вместо «событие → полный обход и diff с attached_files» события сводятся в наборы путей проекта:
+    новые ссылки — bulk_reconcile_links, изменённые — ts в attached_files (вход dirty-набора code_index),
+    удалённые — деградация TTL. Полный run_tick — только при старте, появлении нового активного проекта,
+    переполнении очереди ядра, нехватке watch или «молчащем» heartbeat MCP.
+    """
+
+    def __init__(self, watcher: InotifyWatcher) -> None:
+        self.watcher = watcher
+        self.projects: dict[str, _LiveProject] = {}
+        self.refreshed_mono = 0.0
+        self.missing_checked_mono = time.monotonic()
+        self.fm = FileManager()
+
+    @staticmethod
+    def split(path: str) -> tuple[str, str] | None:
+        """Абсолютный путь → (имя проекта, путь относительно его корня)."""
+        if not path.startswith(_PROJECTS_ROOT + "/"):
+            return None
+        name, _sep, rel = path[len(_PROJECTS_ROOT) + 1:].partition("/")
+        return (name, rel) if name else None
+
+    def dir_excluded(self, path: str) -> bool:
+        sp = self.split(path)
+        if sp is None or not sp[1]:
+            return False
+        name, rel = sp
+        if rel == "backups":
+            return True
+        lp = self.projects.get(name)
+        scan_filter = lp.scan_filter if lp is not None else ProjectScanFilter(_project_dir(name))
+        return scan_filter.is_dir_excluded(rel)
+
+    def refresh_due(self) -> bool:
+        return (time.monotonic() - self.refreshed_mono) >= _live_refresh_sec()
+
+    def refresh(self, db: Database) -> list[str]:
+        """Пересобрать набор активных проектов; возвращает имена новых (их нужно полностью сверить)."""
+        self.refreshed_mono = time.monotonic()
+        selected = _select_active_projects(db, _active_hours(), _max_projects())
+        keep: dict[str, _LiveProject] = {}
+        added: list[str] = []
+        for project_id, project_name, _score in selected:
+            lp = self.projects.get(project_name)
+            if lp is None or lp.project_id != int(project_id):
+                lp = _LiveProject(project_id, project_name, self.fm)
+                try:
+                    lp.seed(db)
+                except Exception as e:
+                    log.warn("CORE_MAINT live seed failed project_id=%d name=%s: %s", project_id, project_name, str(e))
+                    continue
+                added.append(project_name)
+            keep[project_name] = lp
+        self.projects = keep
+        return added
+
+    def resync(self, db: Database) -> None:
+        """После переполнения очереди: вернуть потерянные watch и пересобрать живые наборы с диска."""
+        self.watcher.reset_flags()
+        self.watcher.add_tree(_PROJECTS_ROOT)
+        for lp in self.projects.values():
+            lp.touched.clear()
+            lp.new_dirs.clear()
+            lp.gone_dirs.clear()
+            try:
+                lp.seed(db)
+            except Exception as e:
+                log.warn("CORE_MAINT live reseed failed name=%s: %s", lp.name, str(e))
+
+    def feed(self, events: list[InotifyEvent]) -> None:
+        global _mcp_heartbeat_last_mono
+        for ev in events:
+            sp = self.split(ev.path)
+            if sp is None:
+                continue
+            name, rel = sp
+            if not ev.is_dir and (rel == MCP_HEARTBEAT_FILENAME or rel.endswith("/" + MCP_HEARTBEAT_FILENAME)):
+                if ev.mask & PRESENT_MASK:
+                    _mcp_heartbeat_last_mono = time.monotonic()
+                continue
+            lp = self.projects.get(name)
+            if lp is None or not rel:
+                continue
+            if ev.is_dir:
+                if ev.mask & PRESENT_MASK:
+                    lp.new_dirs.add(rel)
+                elif ev.mask & GONE_MASK:
+                    lp.gone_dirs.add(rel)
+            else:
+                lp.touched.add(rel)
+
+    def apply(self, last_scan: dict[int, float]) -> None:
+        for lp in list(self.projects.values()):
+            if not lp.pending:
+                continue
+            try:
+                self._apply_project(lp, last_scan)
+            except Exception as e:
+                log.warn("CORE_MAINT live apply failed project_id=%d name=%s: %s", lp.project_id, lp.name, str(e))
+
+    def _apply_project(self, lp: _LiveProject, last_scan: dict[int, float]) -> None:
+        t0 = time.monotonic()
+        touched = set(lp.touched)
+        for rel_dir in lp.gone_dirs:
+            pfx = rel_dir + "/"
+            touched.update(r for r in lp.files if r.startswith(pfx))
+        for rel_dir in lp.new_dirs:
+            try:
+                rows, _subtrees = _walk_snapshot(lp.root, lp.root / rel_dir, _find_timeout_sec(), scope="live_dir")
+                touched.update(rows)
+            except Exception as e:
+                log.warn("CORE_MAINT live dir walk failed name=%s dir=%s: %s", lp.name, rel_dir, str(e))
+        lp.touched.clear()
+        lp.new_dirs.clear()
+        lp.gone_dirs.clear()
+
+        present: list[tuple[str, os.stat_result]] = []
+        gone: list[str] = []
+        for rel in sorted(touched):
+            if _rel_excluded_from_maint_snapshot(rel, lp.scan_filter):
+                continue
+            try:
+                st = (lp.root / rel).stat()
+            except OSError:
+                st = None
+            if st is not None and stat.S_ISREG(st.st_mode):
+                present.append((rel, st))
+            elif rel in lp.files:
+                gone.append(rel)
+        accepted = accept_files([(lp.root / rel, st) for rel, st in present])
+        added: list[str] = []
+        modified: dict[str, int] = {}
+        for (rel, st), ok in zip(present, accepted):
+            if not ok:
+                continue
+            if rel in lp.files:
+                modified[rel] = int(st.st_mtime)
+            else:
+                added.append(rel)
+                lp.files.add(rel)
+            lp.missing.discard(rel)
+        lp.files.difference_update(gone)
+
+        n_added = n_touched = degraded = purged = 0
+        mutate = _mutate_enabled()
+        if mutate:
+            if added:
+                n_added = _bulk_add_links(self.fm, lp.root, lp.project_id, added, log_prefix="CORE_MAINT live")
+            if modified:
+                n_touched = self.fm.bulk_touch_links(lp.project_id, modified)
+            if gone:
+                degraded, purged = lp.missing.degrade(gone, purge=_purge_stale_links_enabled())
+        scanned = False
+        if mutate and _scan_enabled() and (added or gone):
+            try:
+                scanned = _lazy_scan_if_due(lp.project_id, last_scan, _scan_cooldown_sec(), _proj_budget_sec())
+            except Exception as e:
+                log.warn("CORE_MAINT live lazy scan failed project_id=%d: %s", lp.project_id, str(e))
+        log.info(
+            "CORE_MAINT live project_id=%d name=%s mode=%s touched=%d added=%d modified=%d removed=%d "
+            "links_added=%d ts_updated=%d degraded=%d purged=%d scanned=%s elapsed_ms=%d",
+            lp.project_id,
+            lp.name,
+            "mutate" if mutate else "dry_run",
+            len(touched),
+            len(added),
+            len(modified),
+            len(gone),
+            n_added,
+            n_touched,
+            degraded,
+            purged,
+            "1" if scanned else "0",
+            int((time.monotonic() - t0) * 1000.0),
+        )
+
+    def missing_recheck_due(self) -> bool:
+        return (time.monotonic() - self.missing_checked_mono) >= _live_missing_recheck_sec()
+
+    def recheck_missing(self) -> None:
+        """По таймеру: пропавшие файлы деградируют дальше (как раньше на каждом тике), вернувшиеся — в touched.
+
+        Не зависит от событий: в проекте, где файлы меняются постоянно, TTL удалённых всё равно истекает.
+        """
+        self.missing_checked_mono = time.monotonic()
+        if not _mutate_enabled():
+            return
+        for lp in self.projects.values():
+            if not lp.missing:
+                continue
+            try:
+                lp.touched.update(lp.missing.recheck(purge=_purge_stale_links_enabled()))
+            except Exception as e:
+                log.warn("CORE_MAINT live degrade failed project_id=%d: %s", lp.project_id, str(e))
+
+
+def _start_live_index(db: Database) -> _LiveIndex | None:
+    if not Path(_PROJECTS_ROOT).is_dir():
+        return None
+    live: _LiveIndex | None = None
+    try:
+        watcher = InotifyWatcher(log=log)
+        live = _LiveIndex(watcher)
+        watcher.dir_excluded = live.dir_excluded
+        t0 = time.monotonic()
+        watcher.add_tree(_PROJECTS_ROOT)  # до seed: изменения во время обхода придут событиями
+        live.refresh(db)
+    except OSError as e:
+        log.warn("CORE_MAINT live index unavailable, fallback to inotifywait wake-up: %s", str(e))
+        return None
+    log.info(
+        "CORE_MAINT live index watches=%d projects=%d incomplete=%s setup_ms=%d",
+        watcher.watch_count,
+        len(live.projects),
+        "1" if watcher.incomplete else "0",
+        int((time.monotonic() - t0) * 1000.0),
+    )
+    return live
+
+
+def _read_live_events(live: _LiveIndex) -> list[InotifyEvent]:
+    events = live.watcher.read(_inotify_timeout_sec())
+    if events:
+        deadline = time.monotonic() + _live_debounce_sec()
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            more = live.watcher.read(left)
+            if not more:
+                break
+            events.extend(more)
+    return events
+
+
 def main() -> int:
     global _maint_process_start_mono
     ap = argparse.ArgumentParser(description="Semi-autonomous core maintenance loop")
@@ -1356,6 +1542,12 @@ def main() -> int:
     last_force_active = time.monotonic()
     last_failed_poll = time.monotonic()
     inotify_warned = False
+    live: _LiveIndex | None = None
+    if _maint_enabled() and eff_loop == "inotify" and _live_index_enabled() and not args.once:
+        live = _start_live_index(db)
+        if live is not None:
+            run_tick(last_scan)  # базовая сверка: дальше только события
+            last_force_active = time.monotonic()
 
     if args.once:
         if _maint_enabled():
@@ -1369,7 +1561,38 @@ def main() -> int:
             _sync_maint_pool_status_file()
             if _maint_enabled():
                 mode = eff_loop
-                if mode == "inotify":
+                if mode == "inotify" and live is not None:
+                    events = _read_live_events(live)
+                    live.feed(events)
+                    if live.refresh_due():
+                        new_projects = live.refresh(db)
+                        if new_projects:
+                            log.info("CORE_MAINT live new active projects=%s → full tick", ",".join(new_projects))
+                            run_tick(last_scan)
+                            last_force_active = time.monotonic()
+                    if live.watcher.overflowed:
+                        log.warn("CORE_MAINT live inotify queue overflow → full tick and resync")
+                        live.resync(db)
+                        run_tick(last_scan)
+                        last_force_active = time.monotonic()
+                    else:
+                        if live.missing_recheck_due():
+                            live.recheck_missing()
+                        # события и вернувшиеся пропавшие файлы; проекты без изменений apply пропускает
+                        live.apply(last_scan)
+                    if _maint_failed_subtrees:
+                        poll_iv = _effective_poll_failed_subtrees_sec()
+                        if (time.monotonic() - last_failed_poll) >= poll_iv:
+                            run_poll_failed_subtrees(last_scan)
+                            last_failed_poll = time.monotonic()
+                    # События могут не доходить (часть дерева без watch, «молчащий» heartbeat MCP) — страховочный тик.
+                    if live.watcher.incomplete or _inotify_heartbeat_stale():
+                        force_age = time.monotonic() - last_force_active
+                        if force_age >= _effective_inotify_force_active_sec():
+                            run_tick(last_scan)
+                            log.info("CORE_MAINT live fallback full tick age=%.1fs", force_age)
+                            last_force_active = time.monotonic()
+                elif mode == "inotify":
                     had_event = False
                     try:
                         had_event = _wait_inotify_event(_inotify_timeout_sec())
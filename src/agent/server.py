@@ -255,6 +255,8 @@ def server_init():
         _schedule_startup_file_maintenance()
         _schedule_core_scheduler()
         _schedule_maint_child()
+        _schedule_smart_grep_pool_shutdown()
+        _schedule_llm_clients_shutdown()
         globals.CORE_SERVER_STARTED_AT = time.time()
         _log_boot_phase("startup_hooks_scheduled", _t_server_init)
 
@@ -360,6 +362,32 @@ def _schedule_core_scheduler() -> None:
             log.warn("Остановка планировщика ядра: %s", str(e))
 
 
+def _schedule_llm_clients_shutdown() -> None:
+    """Общие HTTP-клиенты LLM-провайдеров (keep-alive пул) закрываются вместе с event loop ядра."""
+
+    @app.on_event("shutdown")
+    async def _llm_clients_shutdown() -> None:
+        try:
+            from lib.llm_http_pool import close_llm_clients
+            await close_llm_clients()
+        except Exception as e:
+            log.warn("Закрытие HTTP-клиентов LLM: %s", str(e))
+
+
+def _schedule_smart_grep_pool_shutdown() -> None:
+    """Общий пул процессов (smart_grep, шарды code_index) создаётся лениво при первой задаче; на остановке ядра — гасим."""
+
+    @app.on_event("shutdown")
+    async def _smart_grep_pool_shutdown() -> None:
+        try:
+            from lib.smart_grep_executor import get_smart_grep_executor
+            from lib.worker_pool import get_worker_pool
+            get_smart_grep_executor().shutdown()
+            get_worker_pool().shutdown()
+        except Exception as e:
+            log.warn("Остановка пула процессов: %s", str(e))
+
+
 def _schedule_maint_child() -> None:
     """Запуск maintenance-цикла как дочернего процесса ядра (опционально)."""
     global _maint_child_proc
@@ -453,11 +481,11 @@ def handle_shutdown(signum, frame):
     log.info("Получен сигнал %d, завершение работы", signum)
     asyncio.create_task(shutdown())
 
-signal.signal(signal.SIGTERM, handle_shutdown)
-signal.signal(signal.SIGINT, handle_shutdown)
-signal.signal(signal.SIGQUIT, handle_shutdown)
-
 if __name__ == "__main__":
+    # только в самом сервере: воркеры пула (forkserver/spawn) импортируют этот модуль как __mp_main__
+    signal.signal(signal.SIGTERM, handle_shutdown)
+    signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGQUIT, handle_shutdown)
     server_init()
     uvicorn_config = uvicorn.Config(
         app=app,
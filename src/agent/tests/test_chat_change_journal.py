@@ -0,0 +1,151 @@
+# test_chat_change_journal.py — журнал chat_changes (курсор chat_seq, перенос старых строк) и пробуждение ChatChangeHub.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_chat_change_journal.py -v
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+
+
+def _load(name: str):
+    path = _AGENT / "lib" / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"cannot load {path}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_journal = _load("chat_change_journal")
+_hub = _load("chat_change_hub")
+
+
+class _SqliteDb:
+    """Минимум интерфейса managers.db.Database поверх sqlite3 (одно соединение, вложенные транзакции)."""
+
+    def __init__(self) -> None:
+        self.conn = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+        self.depth = 0
+        self.conn.execute(
+            "CREATE TABLE chat_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER,"
+            " post_id INTEGER, action TEXT, ts INTEGER, chat_seq INTEGER)"
+        )
+
+    def is_postgres(self) -> bool:
+        return False
+
+    def execute(self, query, params=None):
+        return self.conn.execute(query, params or {})
+
+    def fetch_one(self, query, params=None):
+        return self.conn.execute(query, params or {}).fetchone()
+
+    def fetch_all(self, query, params=None):
+        return self.conn.execute(query, params or {}).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        if self.depth == 0:
+            self.conn.execute("BEGIN")
+        self.depth += 1
+        try:
+            yield self.conn
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.conn.execute("ROLLBACK")
+            raise
+        self.depth -= 1
+        if self.depth == 0:
+            self.conn.execute("COMMIT")
+
+
+def test_chat_seq_is_per_chat_and_cursor_reads_in_order():
+    j = _journal.ChatChangeJournal(_SqliteDb(), fetch_limit=2)
+    j.ensure_schema()
+    assert j.last_seq(1) == 0
+    assert [j.record(1, 10, "add"), j.record(2, 20, "add"), j.record(1, 11, "add"), j.record(1, 10, "delete")] == [1, 1, 2, 3]
+    assert j.last_seq(1) == 3 and j.last_seq(2) == 1
+    assert j.changes_since(1, 0) == ([10, 11], 2)  # limit 2: курсор останавливается на последней отданной
+    assert j.changes_since(1, 2) == ([-10], 3)
+    assert j.changes_since(1, 3) == ([], 3)
+
+
+def test_rolled_back_change_does_not_consume_cursor():
+    db = _SqliteDb()
+    j = _journal.ChatChangeJournal(db)
+    j.ensure_schema()
+    j.record(5, 1, "add")
+    try:
+        with db.transaction():
+            j.record(5, 2, "add")
+            raise RuntimeError("post insert failed")
+    except RuntimeError:
+        pass
+    assert j.last_seq(5) == 1
+    assert j.record(5, 3, "add") == 2 and j.changes_since(5, 1) == ([3], 2)
+
+
+def test_legacy_rows_keep_their_cursor_positions():
+    db = _SqliteDb()
+    for chat_id, post_id in [(1, 100), (2, 200), (1, 101)]:
+        db.execute("INSERT INTO chat_changes (chat_id, post_id, action, ts) VALUES (?, ?, 'add', 0)", (chat_id, post_id))
+    j = _journal.ChatChangeJournal(db)
+    j.ensure_schema()
+    assert j.last_seq(1) == 3 and j.last_seq(2) == 2
+    assert j.changes_since(1, 1) == ([101], 3)  # клиент со старым seq=1 получает только новое
+    assert j.record(1, 102, "add") == 4
+    j.ensure_schema()  # повторный запуск ничего не трогает
+    assert j.last_seq(1) == 4 and j.prune(1) == 3  # ts=0 только у перенесённых строк
+
+
+def test_hub_wakes_only_notified_chat():
+    hub = _hub.ChatChangeHub()
+
+    async def scenario():
+        v1, v2 = hub.version(1), hub.version(2)
+        w1 = asyncio.ensure_future(hub.wait(1, v1, 2.0))
+        w2 = asyncio.ensure_future(hub.wait(2, v2, 0.3))
+        await asyncio.sleep(0.05)
+        threading.Thread(target=hub.notify, args=(1,)).start()  # как after_commit из пула БД
+        return await w1, await w2
+
+    assert asyncio.run(scenario()) == (True, False)
+    assert hub.stats()["waiters"] == 0
+
+
+def test_hub_change_between_version_and_wait_is_not_lost():
+    hub = _hub.ChatChangeHub()
+
+    async def scenario():
+        v = hub.version(3)
+        hub.notify(3)
+        return await hub.wait(3, v, 0.1)
+
+    assert asyncio.run(scenario()) is True
+
+
+def test_cursor_below_pruned_rows_is_expired():
+    db = _SqliteDb()
+    j = _journal.ChatChangeJournal(db)
+    j.ensure_schema()
+    j.record(1, 10, "add", ts=100)
+    j.record(1, 10, "delete", ts=100)  # удаление, которое клиент со старым курсором пропустил бы
+    j.record(1, 11, "add", ts=500)
+    j.record(2, 20, "add", ts=500)
+    assert not j.cursor_expired(1, 0)
+    assert j.prune(200) == 2
+    assert j.pruned_seq(1) == 2 and j.pruned_seq(2) == 0
+    assert j.changes_since(1, 1) == ([11], 3)  # журнал сам по себе не видит пропуска -10
+    assert j.cursor_expired(1, 1) and j.cursor_expired(1, 0)
+    assert not j.cursor_expired(1, 2) and not j.cursor_expired(2, 0)
+    j.record(1, 12, "add", ts=600)
+    assert j.prune(200) == 0 and j.pruned_seq(1) == 2  # граница не откатывается
+    assert j.prune(550) == 2 and j.pruned_seq(1) == 3 and j.pruned_seq(2) == 1
@@ -90,6 +90,65 @@ def test_compute_dirty_new_and_removed():
     assert d == set() and r == {2}
 
 
+def test_compute_dirty_digest_touch_and_preserved_mtime():
+    cache = _minimal_cache()
+    cache["file_fingerprints"] = {"1": {"ts": 100, "digest": "aa"}, "2": {"ts": 100, "digest": "bb"}}
+    content = {1: "aa", 2: "cc"}
+    calls = []
+
+    def digest_of(e):
+        calls.append(e["id"])
+        return content[e["id"]]
+
+    # 1: touch без правки (ts сменился, digest прежний); 2: правка с сохранённым ts — не видна в режиме changed
+    entries = [{"id": 1, "ts": 200}, {"id": 2, "ts": 100}]
+    d, r = compute_dirty(cache, entries, use_size=False, digest_of=digest_of)
+    assert d == set() and r == set() and calls == [1]
+    assert build_fingerprints(entries) == {"1": {"ts": 200, "digest": "aa"}, "2": {"ts": 100, "digest": "bb"}}
+
+    entries = [{"id": 1, "ts": 200}, {"id": 2, "ts": 100}]
+    d, r = compute_dirty(cache, entries, use_size=False, digest_of=digest_of, digest_all=True)
+    assert d == {2} and entries[1]["digest"] == "cc"
+
+
+def test_compute_dirty_digest_seeds_legacy_fingerprints():
+    cache = _minimal_cache()
+    entries = [{"id": 1, "ts": 100}, {"id": 3, "ts": 5}]
+    d, r = compute_dirty(cache, entries, use_size=False, digest_of=lambda e: f"h{e['id']}")
+    assert d == {3} and r == set()
+    assert [e["digest"] for e in entries] == ["h1", "h3"]
+
+
+def test_parsed_file_cache_reuses_rows_for_same_path_only():
+    pc = _cii.ParsedFileCache(max_files=10)
+    spec = {"file_id": 1, "file_name": "a.py", "content_type": ".py", "timestamp": "t1"}
+    partial = {
+        "entities": ["pub,function,,foo,1,1-2,10", "prv,method,K,bar,1,3-4,5"],
+        "files": ["1,a.py,md5a,15,t1"],
+        "code_base_files": [1],
+    }
+    pc.record(partial, [spec], {1: "hh"})
+    readded = {"file_id": 9, "file_name": "a.py", "content_type": ".py", "timestamp": "t2"}
+    copied = {"file_id": 11, "file_name": "lib/copy.py", "content_type": ".py", "timestamp": "t2"}
+    fresh = {"file_id": 10, "file_name": "b.py", "content_type": ".py", "timestamp": "t2"}
+    part, rest = pc.take([readded, copied, fresh], {9: "hh", 11: "hh", 10: "zz"})
+    assert rest == [copied, fresh]  # то же содержимое под другим путём — парсер может дать другие строки
+    assert part["entities"] == ["pub,function,,foo,9,1-2,10", "prv,method,K,bar,9,3-4,5"]
+    assert part["files"] == ["9,a.py,md5a,15,t2"]
+    assert part["code_base_files"] == [9]
+    merged = _cii.combine_partials({"entities": [], "files": ["10,b.py,m,1,t2"], "code_base_files": [10]}, part)
+    assert merged["code_base_files"] == [10, 9]
+
+
+def test_max_inc_revs_raised_only_for_digest_all(monkeypatch):
+    monkeypatch.delenv("CORE_INDEX_INCREMENTAL_MAX_REVISION", raising=False)
+    for mode, cap in (("off", 50), ("changed", 50), ("", 50), ("all", 500)):
+        monkeypatch.setenv("CORE_INDEX_DIRTY_DIGEST", mode)
+        assert _cii.env_max_inc_revs() == cap, mode
+    monkeypatch.setenv("CORE_INDEX_INCREMENTAL_MAX_REVISION", "7")
+    assert _cii.env_max_inc_revs() == 7
+
+
 def test_should_force_full():
     assert should_force_full({"rebuild_revision": 49}, 50) is False
     assert should_force_full({"rebuild_revision": 50}, 50) is True
@@ -138,6 +197,28 @@ def test_merge_removes_and_appends():
     assert "3-4" in ents[0]
 
 
+def test_merge_prefiltered_matches_full_filter(tmp_path):
+    spec = importlib.util.spec_from_file_location("code_index_store", _AGENT / "lib" / "code_index_store.py")
+    cis = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cis)
+    prev = {
+        "packer_version": INDEX_PACKER_VERSION,
+        "entities": ["pub,function,,a,1,1-2,1", "pub,function,,b,2,1-2,1", "pub,function,,c,3,1-2,1"],
+        "files": ["1,a.py,x,1,t1", "2,b.py,x,1,t2", "3,c.py,x,1,t3"],
+        "code_base_files": [1, 2, 3],
+        "rebuild_revision": 0,
+        "file_fingerprints": {"1": {"ts": 1}, "2": {"ts": 1}, "3": {"ts": 1}},
+    }
+    path = tmp_path / "p.cib"
+    cis.write_index_store(path, prev)
+    partial = {"entities": ["pub,function,,a,1,3-4,1"], "files": ["1,a.py,y,2,t3"], "code_base_files": [1]}
+    kw = dict(dirty_ids={1}, removed_ids={2}, file_entries=[{"id": 1, "ts": 2}, {"id": 3, "ts": 1}], new_revision=1)
+    expected = merge_index(prev, partial, **kw)
+    got = merge_index(cis.CodeIndexView(path).without_files({1, 2}), partial, prefiltered=True, **kw)
+    expected.pop("context_date"), got.pop("context_date")
+    assert got == expected and got["code_base_files"] == [1, 3]
+
+
 def test_merge_updates_code_base_files():
     prev = {
         "packer_version": INDEX_PACKER_VERSION,
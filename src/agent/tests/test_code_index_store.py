@@ -0,0 +1,119 @@
+# test_code_index_store.py — бинарный кеш code_index: запись, mmap-view, точечные запросы (без ядра БД).
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_code_index_store.py -v
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+_MOD_PATH = _AGENT / "lib" / "code_index_store.py"
+
+
+def _load_cis():
+    spec = importlib.util.spec_from_file_location("code_index_store", _MOD_PATH)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"cannot load {_MOD_PATH}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_cis = _load_cis()
+
+_INDEX = {
+    "packer_version": "0.7",
+    "templates": {"entities": "vis(pub/prv),type,parent,name,file_id,start_line-end_line,tokens"},
+    "file_fingerprints": {"3": {"ts": 100}, "7": {"ts": 200}},
+    "code_base_files": [3, 7],
+    "rebuild_revision": 2,
+    "entities": [
+        "pub,function,,fetchData,3,45-67,120",
+        "pub,class,,Loader,7,1-80,900",
+        "prv,method,Loader,fetch,7,10-20,60",
+        "pub,function,,FetchAll,3,70-90,150",
+        "pub,function,,Привет,7,81-82,5",
+    ],
+    "files": [
+        "7,src/loader.py,abc,900,2026-01-01",
+        "3,src/api.js,def,270,2026-01-02",
+    ],
+}
+
+
+def test_roundtrip_to_dict(tmp_path):
+    path = tmp_path / "demo_index.cib"
+    _cis.write_index_store(path, _INDEX)
+    view = _cis.CodeIndexView(path)
+    assert view.to_dict() == _INDEX
+    assert view.meta["rebuild_revision"] == 2
+
+
+def test_lazy_lookups(tmp_path):
+    path = tmp_path / "demo_index.cib"
+    _cis.write_index_store(path, _INDEX)
+    view = _cis.CodeIndexView(path)
+    assert view.find_entities("FETCHDATA") == ["pub,function,,fetchData,3,45-67,120"]
+    assert sorted(view.find_entities("fetch", prefix=True)) == sorted(
+        ["pub,function,,fetchData,3,45-67,120", "prv,method,Loader,fetch,7,10-20,60", "pub,function,,FetchAll,3,70-90,150"]
+    )
+    assert view.find_entities("привет") == ["pub,function,,Привет,7,81-82,5"]
+    assert view.find_entities("missing") == []
+    assert view.entities_for_file(3) == ["pub,function,,fetchData,3,45-67,120", "pub,function,,FetchAll,3,70-90,150"]
+    assert view.file_row(3) == "3,src/api.js,def,270,2026-01-02"
+    assert view.file_row(5) is None
+
+
+def test_without_files_and_streamed_json(tmp_path):
+    import json
+
+    path = tmp_path / "demo_index.cib"
+    _cis.write_index_store(path, _INDEX)
+    view = _cis.CodeIndexView(path)
+    base = view.without_files({3})
+    assert base["entities"] == [e for e in _INDEX["entities"] if ",7," in e]
+    assert base["files"] == ["7,src/loader.py,abc,900,2026-01-01"]
+    assert base["file_fingerprints"] == _INDEX["file_fingerprints"] and view.without_files(set()) == _INDEX
+    for chunk_lines in (1, 2, 4096):
+        raw = b"".join(view.iter_json({"rebuilt_now": 1}, chunk_lines=chunk_lines))
+        assert json.loads(raw) == dict(_INDEX, rebuilt_now=1)
+    empty = tmp_path / "empty.cib"
+    _cis.write_index_store(empty, {})
+    assert json.loads(b"".join(_cis.CodeIndexView(empty).iter_json())) == {"entities": [], "files": []}
+
+
+def test_open_view_reused_until_rewrite(tmp_path):
+    path = tmp_path / "demo_index.cib"
+    _cis.write_index_store(path, _INDEX)
+    first = _cis.open_index_view(path)
+    assert _cis.open_index_view(path) is first
+    _cis.write_index_store(path, dict(_INDEX, entities=_INDEX["entities"][:1]))
+    second = _cis.open_index_view(path)
+    assert second is not first and second.entities_count == 1
+    assert _cis.open_index_view(tmp_path / "absent.cib") is None
+
+
+def _load_search():
+    path = _AGENT / "lib" / "code_entity_search.py"
+    spec = importlib.util.spec_from_file_location("code_entity_search", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def test_entity_search_fast_path_matches_full_scan(tmp_path):
+    ces = _load_search()
+    path = tmp_path / "demo_index.cib"
+    _cis.write_index_store(path, _INDEX)
+    view = _cis.CodeIndexView(path)
+    assert ces.anchored_prefix(r"^fetch\w*") == "fetch"
+    assert ces.anchored_prefix(r"fetch") is None
+    anchored, _ = ces.search_entities(view, [r"^fetch"])
+    unanchored, _ = ces.search_entities(view, [r"fetch"])
+    assert [r["name"] for r in anchored] == ["fetchData", "FetchAll", "fetch"]
+    assert anchored == unanchored
+    assert anchored[0]["file_name"] == "src/api.js"
+    rows, truncated = ces.search_entities(view, ["Loader::f"], match_field="qualified", is_regex=False)
+    assert [r["name"] for r in rows] == ["fetch"] and not truncated
+    rows, truncated = ces.search_entities(view, ["."], type_allow={"function"}, max_results=2)
+    assert len(rows) == 2 and truncated
@@ -0,0 +1,80 @@
+# test_context_reference_backend.py — слои ContextReferenceStore: LRU по объёму, TTL, общий SQLite-бэкенд.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_context_reference_backend.py -v
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+_MOD_PATH = _AGENT / "lib" / "context_reference_backend.py"
+
+
+def _load():
+    spec = importlib.util.spec_from_file_location("context_reference_backend", _MOD_PATH)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"cannot load {_MOD_PATH}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_crb = _load()
+
+
+def test_layer_evicts_lru_by_size():
+    layer = _crb.BoundedLayer("prefix", max_bytes=4000, ttl_sec=0)  # три записи по ~1.2 КБ
+    body = {"context_body": "x" * 900}
+    for i in range(5):
+        layer.put(f"1:{i}:s", dict(body))
+    assert layer.get("1:1:s") is None and layer.get("1:4:s") is not None
+    layer.get("1:2:s")  # свежий доступ переживает следующую запись
+    layer.put("1:9:s", dict(body))
+    st = layer.stats()
+    assert layer.get("1:2:s") is not None and layer.get("1:3:s") is None
+    assert st["bytes"] <= 4000 and st["evictions"] == 3
+    assert not layer.put("1:big:s", {"context_body": "y" * 5000})
+
+
+def test_layer_ttl_expires_idle_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(_crb.time, "time", lambda: now[0])
+    layer = _crb.BoundedLayer("snapshot", max_bytes=1 << 20, ttl_sec=60)
+    layer.put("1:1:a", {"v": 1})
+    layer.put("1:1:b", {"v": 2})
+    now[0] += 50
+    assert layer.get("1:1:b") == ({"v": 2}, 0)
+    now[0] += 30
+    assert layer.get("1:1:a") is None and layer.get("1:1:b") is not None
+    assert layer.stats()["expired"] == 1
+
+
+def test_sqlite_backend_shared_between_instances(tmp_path):
+    path = str(tmp_path / "ref.db")
+    a = _crb.SqliteReferenceBackend(path, ttl_sec=3600)
+    b = _crb.SqliteReferenceBackend(path, ttl_sec=3600)
+    ver = a.store("snapshot", "5:7:s", {"post_digest": {1: "abc"}, "last_post_id": 1})
+    assert b.version("snapshot", "5:7:s") == ver
+    value, ver_b, size = b.load("snapshot", "5:7:s")
+    assert value == {"post_digest": {"1": "abc"}, "last_post_id": 1} and ver_b == ver and size > 0
+    assert b.store("snapshot", "5:7:s", {"last_post_id": 2}) != ver
+    assert a.load("snapshot", "5:7:s")[0] == {"last_post_id": 2}
+    a.store("prefix", "5:7:s", {"context_body": "z"})
+    assert sorted(b.keys()) == ["5:7:s"] and b.delete(None, ["5:7:s"]) == 2
+    assert a.version("prefix", "5:7:s") is None
+
+
+def test_sqlite_backend_prunes_over_limit(tmp_path):
+    be = _crb.SqliteReferenceBackend(str(tmp_path / "ref.db"), max_bytes={"prefix": 250})
+    for i in range(4):
+        be._last_prune = 0.0
+        be.store("prefix", f"1:{i}:s", {"context_body": "p" * 100})
+    layers = be.stats()["layers"]
+    assert layers["prefix"]["bytes"] <= 250
+    assert be.version("prefix", "1:3:s") is not None and be.version("prefix", "1:0:s") is None
+
+
+def test_scope_match():
+    assert _crb.scope_match("3:10:abc:def", 10, None)
+    assert _crb.scope_match("3:10:abc", 10, 3) and not _crb.scope_match("3:10:abc", 10, 4)
+    assert not _crb.scope_match("3:11:abc", 10, None) and not _crb.scope_match("bad", 10, None)
@@ -0,0 +1,129 @@
+# test_file_content_cache.py — LRU кэш содержимого для FileManager.get_file: ключ по stat, лимит байт, сброс при записи/переносе/удалении.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_file_content_cache.py -v
+from __future__ import annotations
+
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # file_content_cache импортирует managers.runtime_config
+
+from lib.file_content_cache import FileContentCache  # noqa: E402
+
+
+def _stat(path: Path) -> tuple[str, int, int]:
+    st = path.stat()
+    return str(path), st.st_mtime_ns, st.st_size
+
+
+def test_hit_while_stat_unchanged(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n", encoding="utf-8")
+    cache = FileContentCache(max_bytes=1 << 20, max_entry_bytes=1 << 20)
+    assert cache.get(1, *_stat(path)) is None
+    cache.put(1, *_stat(path), "x = 1\n", "utf-8", "lf")
+    assert cache.get(1, *_stat(path)) == ("x = 1\n", "utf-8", "lf")
+    assert cache.get(1, str(tmp_path / "b.py"), *_stat(path)[1:]) is None  # другой путь — промах
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["entries"] == 0
+
+
+def test_miss_after_rewrite(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\n", encoding="utf-8")
+    cache = FileContentCache(max_bytes=1 << 20, max_entry_bytes=1 << 20)
+    cache.put(1, *_stat(path), "x = 1\n", "utf-8", "lf")
+    path.write_text("x = 22\n", encoding="utf-8")
+    assert cache.get(1, *_stat(path)) is None
+    path.write_text("x = 3\n", encoding="utf-8")  # тот же размер, что в записи кэша
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    cache.put(1, *_stat(path), "x = 3\n", "utf-8", "lf")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 2_000_000))
+    assert cache.get(1, *_stat(path)) is None and cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_at_byte_limit():
+    text = "y" * 1000
+    weight = sys.getsizeof(text)
+    cache = FileContentCache(max_bytes=weight * 3, max_entry_bytes=weight * 3)
+    for fid in (1, 2, 3):
+        cache.put(fid, f"/p/{fid}", 1, 1000, text, "utf-8", "lf")
+    assert cache.get(1, "/p/1", 1, 1000) is not None  # 1 — самый свежий, вытесняется 2
+    cache.put(4, "/p/4", 1, 1000, text, "utf-8", "lf")
+    assert cache.get(2, "/p/2", 1, 1000) is None
+    assert all(cache.get(fid, f"/p/{fid}", 1, 1000) is not None for fid in (1, 3, 4))
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["bytes"] == weight * 3
+    cache.put(5, "/p/5", 1, 4000, "z" * 4000, "utf-8", "lf")  # больше лимита — не кэшируется
+    assert cache.get(5, "/p/5", 1, 4000) is None and cache.stats()["entries"] == 3
+
+
+class _Table:
+    def __init__(self) -> None:
+        self.updates: list[dict] = []
+
+    def update(self, conditions, values):
+        self.updates.append(values)
+
+    def delete_from(self, conditions):
+        pass
+
+
+class _Db:
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def execute(self, query, params=None):
+        pass
+
+
+@pytest.fixture
+def fm_env(tmp_path, monkeypatch):
+    """FileManager без БД: _qfn → tmp_path, записи attached_files — заглушки; кэш — отдельный экземпляр."""
+    files = pytest.importorskip("managers.files")
+    cache = FileContentCache(max_bytes=1 << 20, max_entry_bytes=1 << 20)
+    monkeypatch.setattr(files, "get_file_content_cache", lambda: cache)
+    monkeypatch.setattr(files, "_qfn", lambda name, project_id: tmp_path / str(name).lstrip("/"))
+    monkeypatch.setattr(files, "_mark_project_scan_stale", lambda *a, **kw: None)
+    monkeypatch.setattr(files.pwd, "getpwnam", lambda name: SimpleNamespace(pw_uid=os.getuid()))
+    fm = object.__new__(files.FileManager)
+    names = {7: "a.py"}
+    fm.db = _Db()
+    fm.files_table = _Table()
+    fm.link_valid = lambda file_id: True
+    fm.get_file_name = lambda file_id: names[file_id]
+    fm.find = lambda name, project_id=None: None
+    fm.backup_file = lambda file_id: str(tmp_path / "backup")
+    fm._resolve_write_text_format = lambda file_id: ("utf-8", "lf")
+    fm._high_bits_for_file_id = lambda file_id: 0
+    fm._disk_mode_bits = lambda name, project_id: 0
+    (tmp_path / "a.py").write_text("x = 1\n", encoding="utf-8")
+    cache.put(7, *_stat(tmp_path / "a.py"), "x = 1\n", "utf-8", "lf")
+    return fm, cache, tmp_path
+
+
+def test_filemanager_write_invalidates(fm_env):
+    fm, cache, root = fm_env
+    assert fm.write_file("a.py", "x = 2\n", 1, file_id=7) == 6
+    assert cache.stats()["entries"] == 0
+
+
+def test_filemanager_rename_invalidates(fm_env):
+    fm, cache, root = fm_env
+    assert fm.move_file(7, "b.py", 1) == 7
+    assert (root / "b.py").exists() and cache.stats()["entries"] == 0
+
+
+def test_filemanager_unlink_invalidates(fm_env):
+    fm, cache, root = fm_env
+    fm.unlink(7)
+    assert cache.stats()["entries"] == 0
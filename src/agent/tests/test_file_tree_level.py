@@ -0,0 +1,110 @@
+# test_file_tree_level.py — срез одного уровня дерева (list_tree_level): маркеры ®/@, страницы по cursor, ветки SQLite/PG.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_file_tree_level.py -v
+from __future__ import annotations
+
+import importlib.util
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # file_tree_level импортирует lib.file_link_prefix
+
+
+def _load_ftl():
+    path = _AGENT / "lib" / "file_tree_level.py"
+    spec = importlib.util.spec_from_file_location("file_tree_level", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_ftl = _load_ftl()
+REF = "®"
+
+_ROWS = [  # (project_id, file_name, missing_ttl)
+    (1, f"{REF}src/a.py", 3),
+    (1, f"{REF}src/b.py", 3),
+    (1, f"{REF}src/lib/x.py", 3),
+    (1, f"{REF}src/lib/y.py", None),
+    (1, f"{REF}src/lib/deep/z.py", 3),
+    (1, "@src/legacy.py", 3),
+    (1, "src/plain.py", 3),
+    (1, f"{REF}src/gone.py", 0),
+    (1, f"{REF}src_x/q.py", 3),
+    (1, f"{REF}README.md", 3),
+    (1, f"{REF}docs/guide.md", 3),
+    (2, f"{REF}src/other.py", 3),
+]
+
+
+def _split_part(s, sep, n):
+    parts = str(s).split(sep)
+    return parts[n - 1] if 0 < n <= len(parts) else ""
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def level(request):
+    """list_tree_level поверх sqlite3; для ветки PG — split_part как пользовательская функция."""
+    conn = sqlite3.connect(":memory:")
+    conn.create_function("split_part", 3, _split_part)
+    conn.execute(
+        "CREATE TABLE attached_files (id INTEGER PRIMARY KEY, project_id INTEGER, file_name TEXT,"
+        " path_seg_count INTEGER, missing_ttl INTEGER, ts INTEGER)"
+    )
+    for i, (pid, name, ttl) in enumerate(_ROWS, start=1):
+        segs = len([p for p in name.lstrip(REF + "@").split("/") if p])
+        conn.execute(
+            "INSERT INTO attached_files (id, project_id, file_name, path_seg_count, missing_ttl, ts)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (i, pid, name, segs, ttl, 1000 + i),
+        )
+    postgres = request.param == "postgres"
+
+    def _level(path="", cursor=None, limit=500, project_id=1):
+        query, params, pn = _ftl.level_query(project_id, path, cursor=cursor, limit=limit, ttl_max=3, postgres=postgres)
+        assert ("split_part(" in query) == postgres
+        return _ftl.level_entries(conn.execute(query, params).fetchall(), pn, limit)
+
+    return _level
+
+
+def _names(page):
+    return [(e["type"][0], e["name"]) for e in page["entries"]]
+
+
+def test_root_level_counts_and_prefix_offsets(level):
+    page = level("")
+    assert _names(page) == [("d", "docs"), ("d", "src"), ("d", "src_x"), ("f", "README.md")]
+    src = next(e for e in page["entries"] if e["name"] == "src")
+    assert src["files"] == 7 and src["path"] == "src/" and src["ts"] == 1007  # gone.py (ttl 0) не считается
+    assert page["next_cursor"] is None
+
+
+def test_nested_level_mixes_ref_legacy_at_and_plain_names(level):
+    page = level("/src/")
+    assert page["path"] == "src"
+    assert _names(page) == [("d", "lib"), ("f", "a.py"), ("f", "b.py"), ("f", "legacy.py"), ("f", "plain.py")]
+    files = {e["name"]: e for e in page["entries"] if e["type"] == "file"}
+    assert files["legacy.py"]["id"] == 6 and files["plain.py"]["path"] == "src/plain.py"
+    assert _names(level("src/lib")) == [("d", "deep"), ("f", "x.py"), ("f", "y.py")]
+    assert _names(level("src", project_id=2)) == [("f", "other.py")]
+
+
+def test_cursor_pages_cross_dir_file_boundary(level):
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = level("src", cursor=cursor, limit=2)
+        seen += _names(page)
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+        assert cursor[0] in "df" and len(page["entries"]) == 2
+    assert pages == 3 and seen == _names(level("src"))
+    assert level("", limit=1)["next_cursor"] == "d:docs"
+    assert _names(level("", cursor="d:src_x", limit=5)) == [("f", "README.md")]
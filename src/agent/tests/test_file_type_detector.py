@@ -0,0 +1,53 @@
+# test_file_type_detector.py — вердикт «текст/двоичный» без `file`: сниффер, кеш по (size, mtime_ns), сигнатуры.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_file_type_detector.py -v
+from __future__ import annotations
+
+import importlib.util
+import os
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+
+
+def _load_ftd():
+    path = _AGENT / "lib" / "file_type_detector.py"
+    spec = importlib.util.spec_from_file_location("file_type_detector", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_ftd = _load_ftd()
+
+
+def test_sniff_mime():
+    assert _ftd.sniff_mime(b"\x7fELF\x02\x01\x01\x00") == "application/x-executable"
+    assert _ftd.sniff_mime(b"\x89PNG\r\n\x1a\n\x00\x00") == "image/png"
+    assert _ftd.sniff_mime(b"#!/bin/sh\necho hi\n") == "text/plain"
+    assert _ftd.sniff_mime(b"BMW service notes\n") == "text/plain"  # печатная сигнатура не перебивает текст
+    assert _ftd.sniff_mime(b"\xff\xfeh\x00i\x00") == "text/plain"
+    assert _ftd.sniff_mime(b"") == "inode/x-empty"
+    assert _ftd.sniff_mime(b"\x01\x00\x02\x03") is None
+
+
+def test_classify_uses_cache_until_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv("FILE_TYPE_EXTERNAL_MIME", "0")
+    monkeypatch.setattr(_ftd, "_type_cache", _ftd.FileTypeCache(max_entries=10))
+    text, blob = tmp_path / "README", tmp_path / "data"
+    text.write_text("plain text\n", encoding="utf-8")
+    blob.write_bytes(b"\x01\x00\x02\x03" * 64)
+    items = [(text, None), (blob, None), (tmp_path / "absent", None)]
+    assert _ftd.classify_text_files(items) == {str(text): True, str(blob): False, str(tmp_path / "absent"): False}
+    cache = _ftd.get_file_type_cache()
+    assert cache.stats()["sniffed"] == 2
+    _ftd.classify_text_files(items[:2])
+    assert cache.stats()["sniffed"] == 2 and cache.hits == 2
+    sig = cache.signature(str(text))
+    assert sig.endswith(":t")
+    blob.write_text("now text\n", encoding="utf-8")
+    os.utime(blob, ns=(1, 1))
+    assert _ftd.classify_text_files([(blob, None)]) == {str(blob): True}
+    fresh = _ftd.FileTypeCache()
+    assert fresh.seed([(str(text), sig), (str(blob), "bad")]) == 1
+    assert fresh.get(str(text), text.stat()) is True
@@ -0,0 +1,55 @@
+# test_inotify_watcher.py — inotify в процессе: рекурсивные watch, новые подкаталоги, отсечение каталогов.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_inotify_watcher.py -v
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # inotify_watcher импортирует lib.file_type_detector
+
+
+def _load_watcher():
+    path = _AGENT / "lib" / "inotify_watcher.py"
+    spec = importlib.util.spec_from_file_location("inotify_watcher", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_iw = _load_watcher()
+
+
+@pytest.fixture
+def watcher():
+    try:
+        w = _iw.InotifyWatcher(dir_excluded=lambda p: p.endswith("/node_modules"))
+    except OSError as e:
+        pytest.skip(f"inotify unavailable: {e}")
+    yield w
+    w.close()
+
+
+def test_tree_events_and_new_subdirs(tmp_path, watcher):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+    assert watcher.add_tree(str(tmp_path)) == 2  # корень и src; node_modules отсечён
+    (tmp_path / "src" / "a.py").write_text("x\n", encoding="utf-8")
+    (tmp_path / "node_modules" / "pkg" / "i.js").write_text("y\n", encoding="utf-8")
+    (tmp_path / "new").mkdir()
+    events = watcher.read(1.0)
+    paths = {os.path.relpath(e.path, tmp_path) for e in events}
+    assert "src/a.py" in paths and "new" in paths
+    assert not any(p.startswith("node_modules/") for p in paths)
+    assert any(e.is_dir and e.mask & _iw.PRESENT_MASK for e in events)
+    (tmp_path / "new" / "b.py").write_text("z\n", encoding="utf-8")  # watch на new поставлен при чтении события
+    (tmp_path / "src" / "a.py").unlink()
+    gone = {(os.path.relpath(e.path, tmp_path), bool(e.mask & _iw.GONE_MASK)) for e in watcher.read(1.0)}
+    assert ("new/b.py", False) in gone and ("src/a.py", True) in gone
+    assert not watcher.overflowed and not watcher.incomplete
@@ -0,0 +1,84 @@
+# test_live_missing_links.py — ссылки без файла в живом индексе maint: шаги TTL по таймеру до purge, возврат файла.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_live_missing_links.py -v
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+
+
+def _load():
+    path = _AGENT / "lib" / "live_missing_links.py"
+    spec = importlib.util.spec_from_file_location("live_missing_links", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_lml = _load()
+
+
+class _Log:
+    def info(self, *args) -> None:
+        pass
+
+
+class _Files:
+    """attached_files одного проекта для методов FileManager, которые вызывает шаг TTL."""
+
+    missing_ttl_max = 3
+
+    def __init__(self, links: dict[str, int]) -> None:
+        self.rows = {rel: [i, ttl] for i, (rel, ttl) in enumerate(sorted(links.items()), start=1)}
+        self.purged: list[int] = []
+
+    def db_links(self) -> dict[str, tuple[int, int]]:
+        return {rel: (fid, ttl) for rel, (fid, ttl) in self.rows.items()}
+
+    def links_missing_ttl(self, project_id, names):
+        return {rel: (self.rows[rel][0], self.rows[rel][1]) for rel in names if rel in self.rows}
+
+    def bulk_set_missing_ttl(self, ids_by_ttl, checked_ts=None):
+        by_id = {row[0]: row for row in self.rows.values()}
+        for ttl, ids in ids_by_ttl.items():
+            for fid in ids:
+                by_id[fid][1] = ttl
+        return sum(len(ids) for ids in ids_by_ttl.values())
+
+    def bulk_purge_links(self, project_id, ids):
+        self.purged.extend(ids)
+        self.rows = {rel: row for rel, row in self.rows.items() if row[0] not in ids}
+        return len(ids)
+
+
+def test_link_missing_at_seed_is_purged_by_recheck_alone(tmp_path):
+    (tmp_path / "a.py").write_text("x = 1\n", encoding="utf-8")
+    fm = _Files({"a.py": 3, "gone.py": 3})
+    missing = _lml.MissingLinks(fm, 1, tmp_path, log=_Log())
+    missing.seed(fm.db_links(), {"a.py"})
+    assert "gone.py" in missing and len(missing) == 1
+
+    # базовый run_tick после seed: один шаг TTL по db_only
+    _lml.degrade_or_purge_missing(fm, fm.db_links(), ["gone.py"], project_id=1, purge=True, log=_Log())
+    assert fm.rows["gone.py"][1] == 2
+
+    # дальше событий нет и полного тика нет — только таймер recheck
+    assert missing.recheck(purge=True) == set()
+    assert fm.rows["gone.py"][1] == 1 and "gone.py" in missing
+    missing.recheck(purge=True)
+    assert "gone.py" not in fm.rows and fm.purged == [2] and not missing
+    assert fm.rows["a.py"][1] == 3
+
+
+def test_returned_file_leaves_the_set_and_ttl_stops_without_purge(tmp_path):
+    fm = _Files({"back.py": 3, "old.py": 1})
+    missing = _lml.MissingLinks(fm, 1, tmp_path, log=_Log())
+    missing.seed(fm.db_links(), set())
+    assert missing.recheck(purge=False) == set()
+    assert fm.rows["back.py"][1] == 2 and fm.rows["old.py"][1] == 0
+    assert "old.py" not in missing  # TTL 0 без purge: дальше не трогается
+    (tmp_path / "back.py").write_text("y = 2\n", encoding="utf-8")
+    assert missing.recheck(purge=False) == {"back.py"} and not missing
+    assert fm.rows["back.py"][1] == 2 and fm.purged == []
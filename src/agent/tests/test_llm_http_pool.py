@@ -0,0 +1,134 @@
+# test_llm_http_pool.py — общие LLM-клиенты (по одному на loop/провайдера) и сборка потокового ответа.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_llm_http_pool.py -v
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # llm_stream импортирует globals
+
+from lib import llm_http_pool as _pool  # noqa: E402
+from lib import llm_stream as _stream  # noqa: E402
+
+
+def test_pool_limits_clamp_env(monkeypatch):
+    monkeypatch.setenv("LLM_HTTP_POOL_MAX", "4")
+    monkeypatch.setenv("LLM_HTTP_KEEPALIVE_MAX", "99")
+    monkeypatch.setenv("LLM_HTTP_KEEPALIVE_SEC", "junk")
+    assert _pool.pool_limits() == (4, 4, 60.0)  # keepalive не больше пула, мусор → умолчание
+
+
+def test_aiohttp_session_is_shared_per_loop_and_dropped_with_loop():
+    async def twice():
+        a, b = _pool.get_aiohttp_session(), _pool.get_aiohttp_session()
+        return a, b
+
+    loop1 = asyncio.new_event_loop()
+    s1, s1b = loop1.run_until_complete(twice())
+    assert s1 is s1b and _pool.llm_client_pool_stats()["aiohttp_sessions"] >= 1
+    loop1.run_until_complete(s1.close())
+    loop1.close()
+
+    async def fresh_then_close():
+        s = _pool.get_aiohttp_session()
+        assert id(asyncio.get_running_loop()) in _pool._sessions
+        await _pool.close_llm_clients()
+        return s
+
+    s2 = asyncio.run(fresh_then_close())
+    assert s2 is not s1 and s2.closed
+    assert all(not lp.is_closed() for lp, _s in _pool._sessions.values())  # клиенты закрытого loop1 выброшены
+
+
+def test_openai_client_reused_per_provider_key_and_timeouts():
+    pytest.importorskip("httpx")
+    pytest.importorskip("openai")
+
+    async def scenario():
+        a = _pool.get_openai_client("http://llm.local/v1", "k1", timeout=600, connect=45)
+        b = _pool.get_openai_client("http://llm.local/v1", "k1", timeout=600, connect=45)
+        c = _pool.get_openai_client("http://llm.local/v1", "k2", timeout=600, connect=45)
+        d = _pool.get_openai_client("http://llm.local/v1", "k1", timeout=60, connect=45)
+        await _pool.close_llm_clients()
+        return a, b, c, d
+
+    a, b, c, d = asyncio.run(scenario())
+    assert a is b and a is not c and a is not d
+
+
+class _Chunk:
+    def __init__(self, data: dict) -> None:
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return self.data
+
+
+async def _aiter(items):
+    for item in items:
+        yield _Chunk(item)
+
+
+def test_assemble_stream_joins_deltas_and_keeps_last_usage():
+    chunks = [
+        {"id": "c1", "model": "m", "choices": [{"delta": {"role": "assistant"}}]},
+        {"id": "c1", "choices": [{"delta": {"content": "При"}}]},
+        {"model": "other", "choices": [{"delta": {"content": "вет"}, "finish_reason": "stop"}]},
+        {"choices": [], "usage": {"prompt_tokens": 3, "completion_tokens": 2}},
+    ]
+    seen: list[str] = []
+
+    async def on_delta(piece):
+        seen.append(piece)
+
+    result = asyncio.run(_stream.assemble_stream(_aiter(chunks), on_delta))
+    assert seen == ["При", "вет"]
+    assert result["id"] == "c1" and result["model"] == "m"
+    assert result["usage"] == {"prompt_tokens": 3, "completion_tokens": 2}
+    assert result["choices"] == [
+        {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Привет"}}
+    ]
+
+
+def test_assemble_stream_survives_failing_handler_and_keeps_error():
+    chunks = [
+        {"choices": [{"delta": {"content": "a"}}]},
+        {"choices": [{"delta": {"content": "b"}, "error": {"message": "upstream"}}]},
+    ]
+
+    def on_delta(piece):
+        raise RuntimeError("ui gone")
+
+    result = asyncio.run(_stream.assemble_stream(_aiter(chunks), on_delta))
+    choice = result["choices"][0]
+    assert choice["message"]["content"] == "ab" and choice["error"] == {"message": "upstream"}
+    assert result["usage"] == {}
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int, message: str, body=None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.body = body
+
+
+@pytest.mark.parametrize(
+    "err, expected",
+    [
+        (_StatusError(400, "Unrecognized request argument supplied: stream_options"), True),
+        (_StatusError(422, "Unprocessable", {"detail": [{"loc": ["body", "stream"]}]}), True),
+        (_StatusError(404, "streaming is not supported for this model"), True),
+        (_StatusError(400, "max_tokens is too large"), False),
+        (_StatusError(422, "messages: field required", {"detail": "messages"}), False),
+        (_StatusError(500, "stream broke"), False),
+    ],
+)
+def test_stream_rejected_only_for_stream_errors(err, expected):
+    assert _stream.stream_rejected(err) is expected
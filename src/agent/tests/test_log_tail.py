@@ -0,0 +1,76 @@
+# test_log_tail.py — хвост лога: обратное чтение блоками/mmap, фильтр уровней, курсор, многострочные записи.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_log_tail.py -v
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+_MOD_PATH = _AGENT / "lib" / "log_tail.py"
+
+
+def _load():
+    spec = importlib.util.spec_from_file_location("log_tail", _MOD_PATH)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"cannot load {_MOD_PATH}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_lt = _load()
+
+
+def _line(i: int, level: str = "WARNING") -> str:
+    return f"[2026-01-02 10:11:{i % 60:02d},{i % 1000:03d}]. #{level}(core): msg {i}\n"
+
+
+def test_reverse_lines_blocks_and_mmap_agree(tmp_path):
+    path = tmp_path / "a.log"
+    data = "".join(f"line {i} " + "x" * (i % 37) + "\n" for i in range(500))
+    path.write_text(data)
+    expected = list(reversed(data.splitlines()))
+    for use_mmap in (False, True):
+        got = [raw.decode() for _off, raw in _lt.reverse_lines(str(path), path.stat().st_size, block_size=61, use_mmap=use_mmap)]
+        assert got == expected
+    offs = [off for off, _raw in _lt.reverse_lines(str(path), path.stat().st_size, block_size=61)]
+    assert data[offs[0]:].startswith("line 499 ")
+
+
+def test_parse_formats():
+    e = _lt.parse_log_line("[2026-01-02 10:11:12,345]. #WARNING(chatman): disk low")
+    assert e["level"] == "WARNING" and e["logger"] == "chatman" and e["message"] == "disk low"
+    assert abs(e["timestamp"] % 1 - 0.345) < 1e-6
+    e = _lt.parse_log_line("[2026-01-02 10:11:12.345]. ~C91#ERROR:~C00 boom ~C93x~C00")
+    assert e["level"] == "ERROR" and e["message"] == "boom x"
+    assert _lt.parse_log_line("Traceback (most recent call last):") is None
+
+
+def test_tail_levels_multiline_and_cursor(tmp_path):
+    path = tmp_path / "core.log"
+    text = "".join(_line(i, "INFO" if i % 2 else "WARNING") for i in range(40))
+    text += _line(40, "ERROR") + "Traceback:\n  File x\n"
+    path.write_text(text)
+    res = _lt.tail_log(str(path), limit=3, levels=["ERROR", "WARN"])
+    assert [e["message"] for e in res["entries"]] == ["msg 36", "msg 38", "msg 40\nTraceback:\n  File x"]
+    assert _lt.tail_log(str(path), cursor=res["cursor"])["entries"] == []
+    with open(path, "a") as f:
+        f.write(_line(41, "ERROR") + "[2026-01-02 10:12:00,000]. #ERROR(core): half")
+    nxt = _lt.tail_log(str(path), cursor=res["cursor"], levels={"ERROR"})
+    assert [e["message"] for e in nxt["entries"]] == ["msg 41"]
+    with open(path, "a") as f:
+        f.write(" done\n")
+    last = _lt.tail_log(str(path), cursor=nxt["cursor"])
+    assert [e["message"] for e in last["entries"]] == ["half done"]
+    path.write_text(_line(1, "ERROR"))  # усечение: курсор больше размера — читаем с начала
+    assert [e["message"] for e in _lt.tail_log(str(path), cursor=last["cursor"])["entries"]] == ["msg 1"]
+
+
+def test_scan_window_drops_cut_line(tmp_path):
+    path = tmp_path / "big.log"
+    path.write_text("".join(_line(i) for i in range(1000)))
+    res = _lt.tail_log(str(path), limit=10_000, max_scan_bytes=4096)
+    assert res["skipped"] > 0 and res["entries"]
+    assert res["entries"][-1]["message"] == "msg 999"
+    assert all(e["message"].startswith("msg ") for e in res["entries"])
@@ -0,0 +1,72 @@
+# test_project_scan_filter.py — правила .scan_ignore.txt: regex, gitignore-шаблоны, отсечение каталогов, кеш.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_project_scan_filter.py -v
+from __future__ import annotations
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # project_scan_filter импортирует lib.basic_logger
+
+
+def _load_psf():
+    path = _AGENT / "lib" / "project_scan_filter.py"
+    spec = importlib.util.spec_from_file_location("project_scan_filter", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_psf = _load_psf()
+
+_RULES = [
+    r"\.log$",
+    r"^tmp/",
+    "# syntax: glob",
+    "node_modules/",
+    "*.pyc",
+    "/build",
+    "docs/**/draft-?.md",
+    "re:^cache\\d+/",
+]
+
+
+def test_regex_and_glob_rules(tmp_path):
+    (tmp_path / ".scan_ignore.txt").write_text("\n".join(_RULES), encoding="utf-8")
+    f = _psf.ProjectScanFilter(tmp_path)
+    assert f.pattern_count == 7
+    excluded = ["a/b.log", "tmp/x.py", "web/node_modules/pkg/i.js", "m/x.pyc", "build/out.o",
+                "docs/api/v1/draft-2.md", "docs/draft-1.md", "cache12/k"]
+    kept = ["logs/a.py", "src/tmp/x.py", "node_modules", "src/build/x.py", "docs/draft-10.md", "cache/k"]
+    assert [p for p in excluded if not f.is_excluded(p)] == []
+    assert [p for p in kept if f.is_excluded(p)] == []
+    assert f.is_dir_excluded("web/node_modules") and f.is_dir_excluded("build") and f.is_dir_excluded("tmp")
+    assert not f.is_dir_excluded("logs")  # «\.log$» с якорем конца каталоги не отсекает
+    assert not f.is_dir_excluded("src/build")
+
+
+def test_negation_and_matcher_cache(tmp_path):
+    ignore = tmp_path / ".scan_ignore.txt"
+    ignore.write_text("# syntax: glob\n*.md\n!README.md\nvendor/\n!vendor/keep.py\n", encoding="utf-8")
+    f = _psf.ProjectScanFilter(tmp_path)
+    assert f.is_excluded("docs/a.md") and not f.is_excluded("docs/README.md")
+    assert f.is_excluded("vendor/keep.py") and f.is_dir_excluded("vendor/lib")  # как в git: каталог уже исключён
+    assert _psf.ProjectScanFilter(tmp_path)._matcher is f._matcher
+    ignore.write_text("# syntax: glob\n*.md\n", encoding="utf-8")
+    os.utime(ignore, ns=(1, 1))
+    g = _psf.ProjectScanFilter(tmp_path)
+    assert g._matcher is not f._matcher and g.is_excluded("README.md")
+
+
+def test_wildcard_segment_does_not_exclude_parent_dir(tmp_path):
+    (tmp_path / ".scan_ignore.txt").write_text("# syntax: glob\nfoo/*\n!foo/bar\nout/**\n", encoding="utf-8")
+    f = _psf.ProjectScanFilter(tmp_path)
+    assert not f.is_dir_excluded("foo") and not f.is_excluded("foo/bar/x.py")
+    assert f.is_excluded("foo/baz.py") and f.is_dir_excluded("foo/baz") and not f.is_dir_excluded("foo/bar")
+    assert not f.is_dir_excluded("out") and f.is_excluded("out/a.o") and f.is_dir_excluded("out/x")
+    plain = _psf.IgnoreMatcher(["# syntax: glob", "foo/*"])  # без «!»: быстрый путь через объединённый regex
+    assert not plain.dir_excluded("foo") and plain.excluded("foo/a.py") and plain.dir_excluded("foo/sub")
@@ -0,0 +1,59 @@
+# test_project_walker.py — общий scandir-обход проекта: пути, отсечение каталогов, поддеревья.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_project_walker.py -v
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # project_walker импортирует lib.file_type_detector
+
+
+def _load_walker():
+    path = _AGENT / "lib" / "project_walker.py"
+    spec = importlib.util.spec_from_file_location("project_walker", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_pw = _load_walker()
+
+
+def _tree(root: Path) -> None:
+    for rel in ("a.py", "src/m.py", "src/deep/n.py", "logs/x.log", ".git/HEAD", "docs/r.md"):
+        p = root / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(rel, encoding="utf-8")
+
+
+def test_walk_prunes_and_keeps_rel_paths(tmp_path):
+    _tree(tmp_path)
+    seen_dirs: list[str] = []
+
+    def _dir_excluded(rel: str) -> bool:
+        seen_dirs.append(rel)
+        return rel == "logs"
+
+    res = _pw.walk_project_files(
+        tmp_path,
+        dir_excluded=_dir_excluded,
+        file_excluded=lambda rel: rel.endswith(".md"),
+        workers=2,
+    )
+    assert [f.rel for f in res.files] == ["a.py", "src/deep/n.py", "src/m.py"]
+    assert res.files[0].st.st_size == len("a.py")
+    assert res.ignored == 3  # .git (маркер), logs (dir_excluded), docs/r.md
+    assert ".git" not in seen_dirs and "src/deep" in seen_dirs
+    assert {".", "src", "docs"} <= set(res.subtrees)
+
+
+def test_walk_start_subtree_and_deadline(tmp_path):
+    _tree(tmp_path)
+    res = _pw.walk_project_files(tmp_path, start=tmp_path / "src", workers=1)
+    assert [f.rel for f in res.files] == ["src/deep/n.py", "src/m.py"]
+    res = _pw.walk_project_files(tmp_path, deadline=0.0)
+    assert res.time_limited and not res.files
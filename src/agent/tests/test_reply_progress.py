@@ -0,0 +1,130 @@
+# test_reply_progress.py — прогресс-пост ответа LLM: склейка потоковых правок и права /chat/cancel_reply.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_reply_progress.py -v
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # reply_progress импортирует globals
+
+import globals as g  # noqa: E402
+from lib import reply_progress as _rp  # noqa: E402
+
+ACTOR = SimpleNamespace(user_id=7, user_name="gpt")
+
+
+class _Posts:
+    """edit_post через db.get_async().run, как у PostManager; delay — запись «в полёте»."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.edits: list[str] = []
+        self.db = SimpleNamespace(get_async=lambda: self)
+
+    async def run(self, fn, *args):
+        await asyncio.sleep(self.delay)
+        return fn(*args)
+
+    def edit_post(self, post_id, text, user_id):
+        assert (post_id, user_id) == (100, ACTOR.user_id)
+        self.edits.append(text)
+        return {"status": "ok"}
+
+
+def _stream(**kw) -> _rp.ProgressStream:
+    opts = {"chat_id": 5, "trigger_user_id": 3, "interval_s": 60.0, "flush_chars": 5, "min_gap": 0.0}
+    opts.update(kw)
+    return _rp.ProgressStream(100, ACTOR, **opts)
+
+
+def test_feed_coalesces_small_pieces_until_flush_chars(monkeypatch):
+    posts = _Posts()
+    monkeypatch.setattr(g, "post_manager", posts, raising=False)
+
+    async def scenario():
+        s = _stream()
+        s.feed("He")  # первый фрагмент — сразу
+        await asyncio.sleep(0)
+        s.feed("ll")
+        s.feed("o")  # 3 символа после записи < flush_chars
+        await asyncio.sleep(0)
+        assert len(posts.edits) == 1
+        s.feed(" world")  # накопилось 9 ≥ 5
+        await s.close()
+        s.feed("!")  # после close не пишется
+        await asyncio.sleep(0)
+        return s
+
+    s = asyncio.run(scenario())
+    assert len(posts.edits) == 2 and s.writes == 2
+    assert posts.edits[0].endswith("\nHe") and posts.edits[1].endswith("\nHello world")
+    assert posts.edits[0].startswith("⏳ @gpt response in progress...")
+
+
+def test_min_gap_and_heartbeat_tick(monkeypatch):
+    posts = _Posts()
+    monkeypatch.setattr(g, "post_manager", posts, raising=False)
+
+    async def scenario():
+        s = _stream(min_gap=30.0)
+        s.tick()  # heartbeat без текста: счётчик секунд
+        await asyncio.sleep(0)
+        s.feed("abcdefgh")  # flush_chars набрано, но min_gap не прошёл
+        s.tick()  # interval_s не прошёл
+        await asyncio.sleep(0)
+        assert len(posts.edits) == 1 and "(update interval 60000ms)" in posts.edits[0]
+        s.last_write -= 60.0  # прошёл interval_s
+        s.tick()
+        await s.close()
+
+    asyncio.run(scenario())
+    assert len(posts.edits) == 2 and posts.edits[1].endswith("\nabcdefgh")
+
+
+def test_only_one_write_in_flight(monkeypatch):
+    posts = _Posts(delay=0.05)
+    monkeypatch.setattr(g, "post_manager", posts, raising=False)
+
+    async def scenario():
+        s = _stream(flush_chars=1)
+        s.feed("a")
+        await asyncio.sleep(0)
+        s.feed("b")  # запись «a» ещё в полёте — новая не запускается
+        s.feed("c")
+        await s.close()  # ждёт запись в полёте
+
+    asyncio.run(scenario())
+    assert len(posts.edits) == 1 and posts.edits[0].endswith("\na")
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    monkeypatch.setattr(g, "user_manager", SimpleNamespace(get_user_role=lambda uid: "admin" if uid == 1 else "developer"), raising=False)
+    owners = {5: {4}}
+    monkeypatch.setattr(g, "chat_manager", SimpleNamespace(is_chat_owner=lambda chat_id, uid: uid in owners.get(chat_id, ())), raising=False)
+    reg = _rp.ActiveReplies()
+    reg.add(_stream())
+    return reg
+
+
+@pytest.mark.parametrize("user_id, allowed", [(3, True), (4, True), (1, True), (9, False)])
+def test_cancel_requires_trigger_author_owner_or_admin(replies, user_id, allowed):
+    result = replies.cancel(100, user_id)
+    if allowed:
+        assert result == {"status": "ok"}
+    else:
+        assert result == {"error": "Permission denied"}
+    assert replies._streams[100].cancelled is allowed
+
+
+def test_cancel_unknown_or_finished_reply(replies):
+    assert replies.cancel(101, 1) == {"error": "No active reply for this post"}
+    replies.discard(100)
+    assert 100 not in replies and replies.cancel(100, 3) == {"error": "No active reply for this post"}
@@ -0,0 +1,99 @@
+# test_sandwich_render.py — однократный рендер блоков: кеш на блоке, инвалидация по полям, отпечаток набора.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_sandwich_render.py -v
+from __future__ import annotations
+
+import importlib.util
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+_MOD_PATH = _AGENT / "lib" / "sandwich_render.py"
+
+
+def _load():
+    spec = importlib.util.spec_from_file_location("sandwich_render", _MOD_PATH)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"cannot load {_MOD_PATH}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+_sr = _load()
+
+
+def _estimate(text: str) -> int:
+    return len(text) // 4
+
+
+class _Block:
+    def __init__(self, text: str, file_id: int = 1) -> None:
+        self.content_type = ".py"
+        self.content_text = text
+        self.file_id = file_id
+        self.post_id = None
+        self.file_name = f"f{file_id}.py"
+        self.timestamp = 100
+        self.renders = 0
+
+    def to_sandwich_block(self) -> str:
+        self.renders += 1
+        return f"<code file_id={self.file_id}>{self.content_text}</code>"
+
+
+def test_render_once_until_fields_change():
+    b = _Block("x = 1\n" * 40)
+    text = _sr.render_text(b, estimate=_estimate)
+    assert _sr.render_tokens(b, estimate=_estimate) == len(text) // 4
+    assert _sr.render_text(b, estimate=_estimate) == text and b.renders == 1
+    b.content_text = "y = 2\n"
+    assert "y = 2" in _sr.render_text(b, estimate=_estimate) and b.renders == 2
+    b.timestamp = 200
+    _sr.render_tokens(b, estimate=_estimate)
+    assert b.renders == 3
+
+
+def test_blocks_digest_tracks_order_and_content():
+    a, b = _Block("a", 1), _Block("b", 2)
+    d1 = _sr.blocks_digest([a, b], estimate=_estimate)
+    assert d1 == _sr.blocks_digest([a, b], estimate=_estimate)
+    assert d1 != _sr.blocks_digest([b, a], estimate=_estimate)
+    b.content_text = "bb"
+    assert d1 != _sr.blocks_digest([a, b], estimate=_estimate)
+    assert a.renders == 1
+
+
+class _Post:
+    renders = 0
+
+    def __init__(self, text: str, relevance: int = 50) -> None:
+        self.content_type = ":post"
+        self.content_text = text
+        self.post_id = 7
+        self.relevance = relevance
+
+    def to_sandwich_block(self) -> str:
+        _Post.renders += 1
+        return f"<post id={self.post_id} rel={self.relevance}>{self.content_text}</post>"
+
+
+def test_memo_shares_renders_across_block_instances():
+    _sr.get_block_render_memo().clear()
+    _Post.renders = 0
+    _sr.begin_render_window()
+    first = _sr.render_text(_Post("hello"), estimate=_estimate)
+    again = _Post("hello")
+    assert _sr.render_text(again, estimate=_estimate) == first and _Post.renders == 1
+    assert _sr.render_tokens(again, estimate=_estimate) == len(first) // 4
+    assert "rel=10" in _sr.render_text(_Post("hello", relevance=10), estimate=_estimate)
+    assert _Post.renders == 2
+    assert _sr.render_window() == {"hits": 2, "misses": 2}
+
+
+def test_memo_evicts_by_size():
+    memo = _sr.BlockRenderMemo(max_bytes=600)
+    for i in range(10):
+        memo.put(f"k{i}", "x" * 100, 25)
+    st = memo.stats()
+    assert st["bytes"] <= 600 and st["evictions"] > 0
+    assert memo.get("k9") == ("x" * 100, 25) and memo.get("k0") is None
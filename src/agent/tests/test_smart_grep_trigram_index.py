@@ -0,0 +1,124 @@
+# test_smart_grep_trigram_index.py — отбор кандидатов smart_grep по триграммным сигнатурам (без ядра БД).
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_smart_grep_trigram_index.py -v
+from __future__ import annotations
+
+import importlib.util
+import os
+import re
+from pathlib import Path
+
+_AGENT = Path(__file__).resolve().parents[1]
+_MOD_PATH = _AGENT / "lib" / "smart_grep_trigram_index.py"
+
+
+def _load_tgi():
+    spec = importlib.util.spec_from_file_location("smart_grep_trigram_index", _MOD_PATH)
+    if spec is None or spec.loader is None:
+        raise RuntimeError(f"cannot load {_MOD_PATH}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    # без таблицы config: фиксированный предел размера сигнатуры
+    mod._bits_max = lambda: 16384
+    return mod
+
+
+_tgi = _load_tgi()
+query_trigrams = _tgi.query_trigrams
+TrigramIndex = _tgi.TrigramIndex
+
+_FILES = {
+    1: "def load_config(path):\n    return json.loads(Path(path).read_text())\n",
+    2: "class ProjectManager:\n    def scan_project_files(self):\n        pass\n",
+    3: "SELECT id FROM attached_files WHERE project_id = :pid\n",
+    4: "",
+}
+
+
+def _index(tmp_path) -> tuple[TrigramIndex, list[dict]]:
+    idx = TrigramIndex(1)
+    entries = []
+    for fid, text in _FILES.items():
+        path = tmp_path / f"f{fid}.py"
+        path.write_text(text)
+        idx.update(fid, _tgi.disk_stamp(str(path)), text)
+        entries.append({"id": fid, "ts": 100, "path": str(path)})
+    return idx, entries
+
+
+def _expected(query: str, is_regex: bool, flags: int) -> set[int]:
+    if is_regex:
+        rx = re.compile(query, flags)
+        return {fid for fid, text in _FILES.items() if any(rx.search(ln) for ln in text.splitlines())}
+    q = query if not flags & re.IGNORECASE else query.lower()
+    return {fid for fid, text in _FILES.items()
+            if any(q in (ln if not flags & re.IGNORECASE else ln.lower()) for ln in text.splitlines())}
+
+
+def test_literal_query_trigrams_casefolded():
+    assert query_trigrams("AbCd", False) == [b"abc", b"bcd"]
+    assert query_trigrams("ab", False) == []
+
+
+def test_regex_only_mandatory_literals():
+    assert query_trigrams(r"load_\w+\(", True) == sorted({b"loa", b"oad", b"ad_"})
+    # альтернатива верхнего уровня — обязательных литералов нет
+    assert query_trigrams(r"foo|bar", True) == []
+    # необязательная часть не участвует
+    assert query_trigrams(r"scan(_project)?_files", True) == sorted({b"sca", b"can", b"_fi", b"fil", b"ile", b"les"})
+    assert query_trigrams(r"(", True) == []
+
+
+def test_shortlist_never_drops_matches(tmp_path):
+    idx, entries = _index(tmp_path)
+    cases = [
+        ("load_config", False, 0),
+        ("PROJECTMANAGER", False, re.IGNORECASE),
+        (r"scan_\w+_files", True, 0),
+        (r"attached_(files|links)", True, re.IGNORECASE),
+        ("zzz_not_there", False, 0),
+    ]
+    for query, is_regex, flags in cases:
+        got = {e["id"] for e in idx.shortlist(entries, query_trigrams(query, is_regex, flags))}
+        assert _expected(query, is_regex, flags) <= got, query
+    assert {e["id"] for e in idx.shortlist(entries, query_trigrams("zzz_not_there", False))} == set()
+
+
+def test_file_edited_outside_app_is_candidate_while_ts_unchanged(tmp_path):
+    idx, entries = _index(tmp_path)
+    path = entries[2]["path"]
+    st = os.stat(path)
+    with open(path, "a") as f:
+        f.write("cfg = load_config('x')\n")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    # ts записи тот же (100), но stat файла другой — сигнатура устарела
+    got = {e["id"] for e in idx.shortlist(entries, query_trigrams("load_config", False))}
+    assert got == {1, 3}
+
+
+def test_missing_file_or_path_stays_candidate(tmp_path):
+    idx, entries = _index(tmp_path)
+    os.unlink(entries[1]["path"])
+    entries[2] = {"id": 3, "ts": 100}
+    got = {e["id"] for e in idx.shortlist(entries, query_trigrams("load_config", False))}
+    assert got == {1, 2, 3}
+
+
+def test_rebuild_uses_stamp_taken_before_read(tmp_path):
+    idx, entries = _index(tmp_path)
+    path = entries[1]["path"]
+
+    def loader(entry):
+        text = open(entry["path"]).read()
+        with open(entry["path"], "a") as f:  # правка во время чтения
+            f.write("load_config()\n")
+        return text
+
+    os.utime(path, ns=(0, 1))
+    idx.shortlist(entries, query_trigrams("load_config", False), loader)
+    builder = idx._builder
+    if builder is not None:
+        builder.join(5.0)
+    assert idx.stats()["built_files"] == 1
+    got = {e["id"] for e in idx.shortlist(entries, query_trigrams("load_config", False))}
+    assert 2 in got  # сигнатура без load_config, но stamp старый — файл остаётся кандидатом
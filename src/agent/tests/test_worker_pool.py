@@ -0,0 +1,45 @@
+# test_worker_pool.py — общий пул процессов: метод запуска (не fork), задачи smart_grep, пересоздание после сбоя.
+#
+# Запуск из каталога agent: PYTHONPATH=. python -m pytest tests/test_worker_pool.py -v
+from __future__ import annotations
+
+import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+_AGENT = Path(__file__).resolve().parents[1]
+if str(_AGENT) not in sys.path:
+    sys.path.insert(0, str(_AGENT))  # воркеры forkserver импортируют lib.* по sys.path родителя
+
+from lib import worker_pool as _wp  # noqa: E402
+from lib.smart_grep_worker import grep_batch  # noqa: E402
+
+
+def test_default_start_method_is_not_fork(monkeypatch):
+    monkeypatch.delenv("CQDS_WORKER_MP_START", raising=False)
+    assert _wp.start_method() in ("forkserver", "spawn")
+    monkeypatch.setenv("CQDS_WORKER_MP_START", "spawn")
+    assert _wp.start_method() == "spawn"
+    monkeypatch.setenv("CQDS_WORKER_MP_START", "bogus")
+    assert _wp.start_method() != "bogus"
+
+
+def test_pool_is_reused_and_restarts_after_reset(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("x = 1\nneedle = 2\n", encoding="utf-8")
+    pool = _wp.WorkerPool(workers=1)
+    try:
+        ex = pool.executor()
+        assert pool.executor() is ex
+        hits = ex.submit(grep_batch, [(7, "a.py", str(path))], "needle", False, True, 0, 10).result(timeout=60)
+        assert [h["line"] for h in hits[0]] == [2]
+        with pytest.raises(BrokenProcessPool):
+            ex.submit(os._exit, 1).result(timeout=60)
+        pool.reset()
+        assert pool.executor() is not ex and pool.stats()["starts"] == 2
+        assert pool.executor().submit(grep_batch, [], "needle", False, True, 0, 10).result(timeout=60) == []
+    finally:
+        pool.shutdown()
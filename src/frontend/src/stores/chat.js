@@ -27,6 +27,7 @@ export const useChatStore = defineStore('chat', {
     apiUrl: import.meta.env.VITE_API_URL || './api',
     waitChanges: false,
     need_full_history: false,
+    changeSeq: null,
     stats: { tokens: null, num_sources_used: null },
     status: { status: 'free', actor: null, elapsed: 0 },
     llmPending: false,
@@ -80,7 +81,8 @@ export const useChatStore = defineStore('chat', {
       try {
         const url = this.need_full_history
           ? `${this.apiUrl}/chat/get?chat_id=${this.selectedChatId}`
-          : `${this.apiUrl}/chat/get?chat_id=${this.selectedChatId}&wait_changes=1`
+          : `${this.apiUrl}/chat/get?chat_id=${this.selectedChatId}&wait_changes=1` +
+            (this.changeSeq !== null ? `&since_seq=${this.changeSeq}` : '')
         log_msg('CHAT', 'Polling with wait_changes:', !this.need_full_history)
         log_msg('CHAT', 'Fetching history:', url)
         const res = await fetch(url, {
@@ -97,6 +99,9 @@ export const useChatStore = defineStore('chat', {
             log_msg('CHAT', 'Ignoring history response for outdated chat_id:', data.chat_id, 'Current:', this.selectedChatId)
             return
           }
+          if (typeof data.seq === 'number') {
+            this.changeSeq = data.seq
+          }
           if (data.posts && data.posts.chat_history === 'chat switch') {
             log_msg('CHAT', 'Chat switch detected, fetching full history')
             this.waitChanges = false
@@ -284,6 +289,25 @@ export const useChatStore = defineStore('chat', {
         this.chatError = 'Failed to edit post'
       }
     },
+    async cancelReply(postId) {
+      try {
+        log_msg('CHAT', 'Cancelling reply:', this.apiUrl + '/chat/cancel_reply', 'PostId:', postId)
+        const res = await fetch(this.apiUrl + '/chat/cancel_reply', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ post_id: postId }),
+          credentials: 'include'
+        })
+        const { failed, body } = await handleChatServerFailure(res, this, 'cancel reply')
+        if (failed) return
+        const data = body.json
+        if (data && data.error) {
+          log_error(null, new Error(data.error), 'cancel reply')
+        }
+      } catch (e) {
+        log_error(null, e, 'cancel reply')
+      }
+    },
     async deletePost(postId, postUserId, userId, userRole) {
       if (userRole !== 'admin' && postUserId !== userId) {
         log_error(null, new Error('Only admins can delete posts by other users'), 'delete post')
@@ -375,6 +399,7 @@ export const useChatStore = defineStore('chat', {
       this.quotes = {}
       this.waitChanges = false
       this.need_full_history = true
+      this.changeSeq = null
       log_msg('CHAT', 'Selected chat ID:', chatId)
       await this.fetchHistory()
       await this.fetchChatStats()
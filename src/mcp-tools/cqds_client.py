@@ -518,6 +518,13 @@ class ColloquiumClient:
         resp.raise_for_status()
         return resp.json()
 
+    async def entity_search(self, payload: dict[str, Any]) -> dict:
+        """POST /api/project/entity_search — совпадения по entities кеша code_index (без загрузки индекса)."""
+        await self._ensure_login()
+        resp = await self._client.post("/api/project/entity_search", json=payload)
+        resp.raise_for_status()
+        return resp.json()
+
     async def smart_grep_chunk(self, payload: dict[str, Any]) -> tuple[int, Any]:
         """POST /api/project/smart_grep/chunk; возвращает (status_code, body dict или текст ошибки)."""
         await self._ensure_login()
@@ -19,11 +19,8 @@ from cqds_smart_grep_host import smart_grep_host_fs
 from cqds_helpers import (
     LOGGER,
     _build_file_tree_from_index,
-    _file_id_to_name_map,
     _index_counts,
-    _index_file_rows,
     _json_text,
-    _parse_entity_csv_row,
     _text,
     _xml_code_file,
     _xml_patch,
@@ -154,7 +151,7 @@ TOOLS: list[Tool] = [
             "Build the rich entity index for a project on demand — no prior LLM interaction needed.\n"
             "Runs context assembly (loads all project files → SandwichPack.pack) and returns\n"
             "the full sandwiches_index.jsl format JSON with 'entities' and 'filelist'.\n"
-            "When background=true, MCP tool queues or reports a background build and stores the result in /app/projects/.cache/{project_name}_index.jsl.\n"
+            "When background=true, MCP tool queues or reports a background build and stores the result in /app/projects/.cache/{project_name}_index.cib.\n"
             "When cache_only=true, no full rebuild: GET /project/code_index?cache_only=true — try-retrieve session result, else file cache; may include rebuilt_now:1 while maint code_index is active.\n"
             "По умолчанию фон = maint_enqueue на ядре — опрос cq_help#core_status (maint_pool.active_jobs). Fallback = локальная очередь MCP; тогда опрос cq_files_ctl#index_job_status. CQDS_MCP_INDEX_BACKGROUND_VIA_MAINT=0 отключает maint-путь.\n"
             "Use this to understand project structure, find functions/classes, or plan edits.\n"
@@ -166,7 +163,7 @@ TOOLS: list[Tool] = [
             "type": "object",
             "properties": {
                 "project_id": {"type": "integer", "description": "Project ID (use cq_list_projects to get IDs)."},
-                "background": {"type": "boolean", "description": "If true, queue/report a background build and save cache to /app/projects/.cache/{project_name}_index.jsl.", "default": False},
+                "background": {"type": "boolean", "description": "If true, queue/report a background build and save cache to /app/projects/.cache/{project_name}_index.cib.", "default": False},
                 "cache_only": {
                     "type": "boolean",
                     "description": "If true, no scan/full build: backend returns cached index and/or rebuilt_now (see GET /project/code_index?cache_only=true). Ignores background.",
@@ -187,7 +184,7 @@ TOOLS: list[Tool] = [
             "type": "object",
             "properties": {
                 "project_id": {"type": "integer", "description": "Project ID (use cq_list_projects to get IDs)."},
-                "background": {"type": "boolean", "description": "If true, queue/report a background build and save cache to /app/projects/.cache/{project_name}_index.jsl.", "default": False},
+                "background": {"type": "boolean", "description": "If true, queue/report a background build and save cache to /app/projects/.cache/{project_name}_index.cib.", "default": False},
                 "cache_only": {
                     "type": "boolean",
                     "description": "If true, no scan/full build: backend returns cached index and/or rebuilt_now (see GET /project/code_index?cache_only=true). Ignores background.",
@@ -204,7 +201,7 @@ TOOLS: list[Tool] = [
             "Search parsed definition entries in the project code index (sandwiches_index entities). "
             "The index lists declaration sites (function, class, method, variable, …) — not call sites. "
             "Supply one or more regex patterns; a row matches if any pattern matches the chosen field. "
-            "Uses cached project index from cq_get_index unless ensure_index triggers cq_rebuild_index. "
+            "Search runs in the core over the cached project index (only matches are transferred); ensure_index triggers cq_rebuild_index when the cache is missing. "
             "Limitation: entity CSV rows must split cleanly on commas (names/parents with commas are not supported)."
         ),
         inputSchema={
@@ -659,13 +656,28 @@ async def handle(name: str, arguments: dict[str, Any], ctx: RunContext) -> CallT
         ensure_index = bool(arguments.get("ensure_index", False))
         ensure_timeout = max(30, min(int(arguments.get("ensure_index_timeout", 120)), 300))
 
-        index_payload = await client.get_index(project_id=project_id)
-        entities = index_payload.get("entities") if isinstance(index_payload, dict) else None
-        if (not isinstance(entities, list) or len(entities) == 0) and ensure_index:
-            index_payload = await client.get_code_index(project_id, timeout=ensure_timeout)
-            entities = index_payload.get("entities") if isinstance(index_payload, dict) else None
+        payload: dict[str, Any] = {
+            "project_id": project_id,
+            "patterns": patterns_list,
+            "match_field": match_field,
+            "entity_types": sorted(type_allow) if type_allow is not None else None,
+            "is_regex": is_regex,
+            "case_sensitive": case_sensitive,
+            "max_results": max_results,
+        }
+        if is_regex:
+            for pat in patterns_list:
+                try:
+                    re.compile(pat, 0 if case_sensitive else re.IGNORECASE)
+                except re.error as exc:
+                    raise ValueError(f"Invalid pattern {pat!r}: {exc}") from exc
+
+        result = await client.entity_search(payload)
+        if not result.get("index_ready") and ensure_index:
+            await client.get_code_index(project_id, timeout=ensure_timeout)
+            result = await client.entity_search(payload)
 
-        if not isinstance(entities, list) or len(entities) == 0:
+        if not result.get("index_ready"):
             return _json_text(
                 {
                     "matches": [],
@@ -676,51 +688,11 @@ async def handle(name: str, arguments: dict[str, Any], ctx: RunContext) -> CallT
                 }
             )
 
-        flags = 0 if case_sensitive else re.IGNORECASE
-        compiled: list[re.Pattern[str]] = []
-        for pat in patterns_list:
-            try:
-                compiled.append(re.compile(pat if is_regex else re.escape(pat), flags))
-            except re.error as exc:
-                raise ValueError(f"Invalid pattern {pat!r}: {exc}") from exc
-
-        def qualified_name(row: dict[str, Any]) -> str:
-            parent, name_val = row.get("parent") or "", row.get("name") or ""
-            return f"{parent}::{name_val}" if parent else name_val
-
-        def text_for_match(row: dict[str, Any]) -> str:
-            if match_field == "parent":
-                return row.get("parent") or ""
-            if match_field == "qualified":
-                return qualified_name(row)
-            return row.get("name") or ""
-
-        file_rows = _index_file_rows(index_payload)
-        fid_to_name = _file_id_to_name_map(file_rows)
-
-        matches: list[dict[str, Any]] = []
-        truncated = False
-        for line in entities:
-            if not isinstance(line, str):
-                continue
-            row = _parse_entity_csv_row(line)
-            if row is None:
-                continue
-            if type_allow is not None and row["type"] not in type_allow:
-                continue
-            if not any(c.search(text_for_match(row)) for c in compiled):
-                continue
-            matches.append({**row, "file_name": fid_to_name.get(row["file_id"])})
-            if len(matches) >= max_results:
-                truncated = True
-                break
-
-        matches.sort(key=lambda r: (r.get("file_id", 0), r.get("start_line", 0), r.get("name", "")))
         return _json_text(
             {
-                "matches": matches,
-                "count": len(matches),
-                "truncated": truncated,
+                "matches": result.get("matches") or [],
+                "count": int(result.get("count") or 0),
+                "truncated": bool(result.get("truncated")),
                 "max_results": max_results,
                 "project_id": project_id,
                 "note": "Matches are definition rows from the sandwiches index only (not call-site grep).",
@@ -301,63 +301,6 @@ def _index_counts(index_payload: dict[str, Any]) -> tuple[int | None, int | None
     return entities_count, files_count
 
 
-def _index_file_rows(index_payload: dict[str, Any]) -> list[str]:
-    files = index_payload.get("files") if isinstance(index_payload, dict) else None
-    if files is None and isinstance(index_payload, dict):
-        files = index_payload.get("filelist")
-    if isinstance(files, list):
-        return [r for r in files if isinstance(r, str)]
-    return []
-
-
-def _file_id_to_name_map(rows: list[str]) -> dict[int, str]:
-    out: dict[int, str] = {}
-    for row in rows:
-        parts = row.split(",")
-        if not parts:
-            continue
-        try:
-            fid = int(parts[0].strip())
-        except ValueError:
-            continue
-        if len(parts) > 1:
-            out[fid] = parts[1]
-    return out
-
-
-def _parse_entity_csv_row(line: str) -> dict[str, Any] | None:
-    """Parse one sandwiches_index entities CSV row: vis,type,parent,name,file_id,start-end,tokens."""
-    if not isinstance(line, str) or not line.strip():
-        return None
-    parts = line.split(",")
-    if len(parts) < 7:
-        return None
-    vis, e_type, parent, name = parts[0], parts[1], parts[2], parts[3]
-    file_id_s, span_s, tokens_s = parts[4], parts[5], parts[6]
-    try:
-        file_id = int(file_id_s.strip())
-    except ValueError:
-        return None
-    m = re.match(r"^(\d+)-(\d+)$", span_s.strip())
-    if not m:
-        return None
-    start_line, end_line = int(m.group(1)), int(m.group(2))
-    try:
-        tokens = int(tokens_s.strip())
-    except ValueError:
-        tokens = 0
-    return {
-        "vis": vis,
-        "type": e_type,
-        "parent": parent,
-        "name": name,
-        "file_id": file_id,
-        "start_line": start_line,
-        "end_line": end_line,
-        "tokens": tokens,
-    }
-
-
 def _build_file_tree_from_index(entries: list[dict[str, Any]]) -> dict[str, Any]:
     """Nest flat file_index rows by file_name path segments (posix-style)."""
     root: dict[str, Any] = {"kind": "dir", "name": "", "path": "", "children": []}